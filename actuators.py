@@ -0,0 +1,417 @@
+import os
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import counter, histogram
+
+# 액추에이터 전송 설정
+ACTUATOR_TIMEOUT = float(os.getenv('ACTUATOR_TIMEOUT', '3'))          # 기본 요청 타임아웃 (초)
+ACTUATOR_COALESCE = float(os.getenv('ACTUATOR_COALESCE', '0.25'))     # desired 변경을 모으는 시간 (초)
+
+# 회로 차단기 / 헬스 체크 설정
+BREAKER_FAILURES = int(os.getenv('BREAKER_FAILURES', '3'))             # 연속 실패 횟수 -> open
+BREAKER_SLOW_MS = float(os.getenv('BREAKER_SLOW_MS', '2000'))          # 이보다 느린 응답도 실패로 계산
+BREAKER_RESET = float(os.getenv('BREAKER_RESET', '30'))                # open 유지 시간 후 half-open 시도 (초)
+ACTUATOR_PROBE_INTERVAL = float(os.getenv('ACTUATOR_PROBE_INTERVAL', '10'))   # /state(/health) 확인 주기 (초)
+
+
+def parse_timeouts(text):
+    """'led=2,motor=10' 형식 -> {장치: 타임아웃(초)}"""
+    timeouts = {}
+    for item in text.split(','):
+        if '=' not in item:
+            continue
+        device, seconds = item.split('=', 1)
+        timeouts[device.strip()] = float(seconds)
+    return timeouts
+
+
+# 장치별 타임아웃 (없으면 ACTUATOR_TIMEOUT)
+ACTUATOR_TIMEOUTS = parse_timeouts(os.getenv('ACTUATOR_TIMEOUTS', ''))
+
+# 장치별 요청 본문 키 (기본 'action')
+PAYLOAD_KEYS = {'led': 'color'}
+
+ACTUATOR_REQUEST_SECONDS = histogram('iot_actuator_request_seconds', 'Actuator HTTP request time',
+                                     ('room', 'device', 'kind'))
+ACTUATOR_FAILURES = counter('iot_actuator_failures_total', 'Failed actuator requests',
+                            ('room', 'device', 'reason'))
+
+
+def health_url(url):
+    """제어 엔드포인트와 같은 호스트의 /health"""
+    parts = urlsplit(url)
+    return f'{parts.scheme}://{parts.netloc}/health'
+
+
+def state_url(url):
+    """제어 엔드포인트와 같은 호스트의 /state (현재 상태 조회)"""
+    parts = urlsplit(url)
+    return f'{parts.scheme}://{parts.netloc}/state'
+
+
+class CircuitBreaker:
+    """closed -> (연속 실패/지연) -> open -> (reset 경과) -> half-open -> (시험 요청 성공) -> closed"""
+
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+    def __init__(self, name, failures=BREAKER_FAILURES, slow_ms=BREAKER_SLOW_MS,
+                 reset=BREAKER_RESET, clock=time.monotonic):
+        self.name = name
+        self.max_failures = failures
+        self.slow_ms = slow_ms
+        self.reset = reset
+        self.clock = clock
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """지금 요청을 보내도 되는지 (open이면 보내지 않는다)"""
+        with self._lock:
+            if self.state == self.OPEN and self.clock() - self.opened_at >= self.reset:
+                self.state = self.HALF_OPEN
+            return self.state != self.OPEN
+
+    def record(self, ok, latency_ms):
+        """요청 결과 반영 - 상태가 바뀌었으면 새 상태 반환"""
+        if ok and latency_ms > self.slow_ms:
+            ok = False
+        with self._lock:
+            previous = self.state
+            if ok:
+                self.failures = 0
+                self.state = self.CLOSED
+            else:
+                self.failures += 1
+                if self.state == self.HALF_OPEN or self.failures >= self.max_failures:
+                    self.state = self.OPEN
+                    self.opened_at = self.clock()
+            if self.state != previous:
+                return self.state
+        return None
+
+
+class ActuatorWorker:
+    """장치 하나의 상태 조정(reconcile) 스레드
+
+    마지막으로 요청된 상태(desired)와 장치가 실제로 수락한 상태(confirmed)를 따로 관리한다.
+    desired가 바뀌면 coalesce초 동안 더 모은 뒤 그 시점의 desired만 전송하므로, 규칙이 짧게
+    흔들려도(ON -> OFF -> ON) confirmed와 같으면 아무것도 보내지 않는다.
+    회로가 열려 있는 동안에는 네트워크 요청 없이 desired만 기록했다가 복구되면 맞춰 준다.
+    """
+
+    def __init__(self, device, url, timeout, on_result, coalesce=ACTUATOR_COALESCE, room=''):
+        self.device = device
+        self.room = room
+        self.url = url
+        self.health_url = health_url(url)
+        self.state_url = state_url(url)
+        self.timeout = timeout
+        self.coalesce = coalesce
+        self.on_result = on_result
+        self.payload_key = PAYLOAD_KEYS.get(device, 'action')
+        self.breaker = CircuitBreaker(device)
+        self.desired = None         # (action, reason)
+        self.confirmed = None       # 장치가 마지막으로 수락(또는 /state로 보고)한 action
+        self.supports_state = True  # /state가 404면 /health로 대체
+
+        # 장치마다 keep-alive 연결 하나를 재사용
+        self.session = requests.Session()
+        self.session.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=1))
+        self.session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=1))
+
+        self._cond = threading.Condition()
+        self._due_at = None         # desired를 전송할 시각 (monotonic)
+        self._probe_requested = False
+        self._stopped = False
+        self._thread = None
+        self.stats = {'requested': 0, 'sent': 0, 'failed': 0, 'coalesced': 0, 'skipped': 0,
+                      'probes': 0, 'corrected': 0, 'last_latency_ms': 0.0, 'last_error': None}
+
+    def submit(self, action, reason):
+        """desired 갱신 후 즉시 반환 - 실제 전송은 작업 스레드가 coalesce 후에
+
+        회로가 열려 있으면 전송을 예약하지 않는다 (복구 시 reconcile).
+        """
+        with self._cond:
+            self.desired = (action, reason)
+            self.stats['requested'] += 1
+            if not self.breaker.allow():
+                self.stats['skipped'] += 1
+                return
+            self._schedule(self.coalesce)
+
+    def probe(self):
+        """상태 확인 요청 (이미 대기 중이면 생략)"""
+        with self._cond:
+            self._probe_requested = True
+            self._cond.notify()
+
+    def reconcile(self):
+        """desired와 confirmed가 다르면 바로 전송 예약"""
+        with self._cond:
+            if self.desired is not None and self.desired[0] != self.confirmed:
+                self._schedule(0)
+
+    def _schedule(self, delay):
+        """호출자가 _cond를 잡고 있어야 함 - 이미 예약돼 있으면 더 이르게만 바꾼다"""
+        due = time.monotonic() + delay
+        if self._due_at is None or due < self._due_at:
+            self._due_at = due
+            self._cond.notify()
+
+    def pending(self):
+        return 1 if self._due_at is not None else 0
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name=f'actuator-{self.device}', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+
+    def _next_task(self):
+        """('probe' | 'send' | None(종료)) - 할 일이 생길 때까지 대기"""
+        with self._cond:
+            while not self._stopped:
+                if self._probe_requested:
+                    self._probe_requested = False
+                    return 'probe'
+                if self._due_at is not None:
+                    remaining = self._due_at - time.monotonic()
+                    if remaining <= 0:
+                        self._due_at = None
+                        return 'send'
+                    self._cond.wait(remaining)
+                else:
+                    self._cond.wait()
+            return None
+
+    def _run(self):
+        while True:
+            task = self._next_task()
+            if task is None:
+                break
+            if task == 'probe':
+                self._run_probe()
+            else:
+                self._send_desired()
+        self.session.close()
+
+    def _send_desired(self):
+        """coalesce 구간이 끝난 시점의 desired만 전송 (confirmed와 같으면 생략)"""
+        with self._cond:
+            desired = self.desired
+        if desired is None or desired[0] == self.confirmed:
+            self.stats['coalesced'] += 1
+            return
+        if not self.breaker.allow():
+            self.stats['skipped'] += 1
+            return
+
+        action, reason = desired
+        ok, error = self.send(action)
+        if ok:
+            self.confirmed = action
+        if self.on_result is not None:
+            try:
+                self.on_result(self.device, action, reason, ok, error)
+            except Exception as e:
+                print(f"[ACTUATOR ERROR] Result handler failed for {self.device}: {e}", flush=True)
+
+    def _run_probe(self):
+        """장치 상태 확인 - /state로 실제 상태를 읽어(없으면 /health) 다르면 desired를 다시 전송"""
+        self.stats['probes'] += 1
+        was_open = self.breaker.state != CircuitBreaker.CLOSED
+        if self.supports_state:
+            ok, response = self._request('get', self.state_url)
+            if not ok and response is not None and response.status_code == 404:
+                self.supports_state = False
+            elif ok:
+                self._observe(response)
+        if not self.supports_state:
+            ok, _ = self._request('get', self.health_url)
+        if not ok:
+            return
+        if was_open:
+            print(f"[CIRCUIT] {self.device} is healthy again, reconciling", flush=True)
+        self.reconcile()
+
+    def _observe(self, response):
+        """/state 응답의 실제 상태를 confirmed에 반영
+
+        state가 없거나 None이면(컨트롤러 재시작 직후 등) 실제 상태를 모르는 것이므로
+        confirmed를 그대로 둔다 - 이미 그 위치에 있는 장치를 다시 움직이지 않도록.
+        """
+        try:
+            body = response.json()
+        except ValueError:
+            return
+        actual = body.get('state') if isinstance(body, dict) else None
+        if actual is None:
+            return
+        if actual != self.confirmed:
+            if self.confirmed is not None:
+                self.stats['corrected'] += 1
+                print(f"[RECONCILE] {self.device} reports {actual}, expected {self.confirmed}", flush=True)
+            self.confirmed = actual
+
+    def send(self, action):
+        """명령 한 건 전송 - (성공 여부, 오류 메시지)"""
+        ok, response = self._request('post', self.url, json={self.payload_key: action}, kind='control')
+        if ok:
+            self.stats['sent'] += 1
+            return True, None
+        self.stats['failed'] += 1
+        return False, self.stats['last_error']
+
+    def _request(self, method, url, kind='probe', **kwargs):
+        """요청 한 건 - 결과를 회로 차단기에 반영하고 (성공 여부, 응답 또는 None) 반환"""
+        started = time.perf_counter()
+        response = None
+        reason = None
+        try:
+            response = self.session.request(method, url, timeout=self.timeout, **kwargs)
+        except requests.exceptions.Timeout:
+            error, reason = f"Timeout after {self.timeout}s", 'timeout'
+        except requests.exceptions.ConnectionError:
+            error, reason = "Cannot connect", 'connect'
+        except requests.exceptions.RequestException as e:
+            error, reason = str(e), 'error'
+        else:
+            if response.status_code < 300:
+                error = None
+            else:
+                error, reason = f"Status {response.status_code}", 'status'
+
+        elapsed = time.perf_counter() - started
+        ACTUATOR_REQUEST_SECONDS.observe(elapsed, self.room, self.device, kind)
+        if reason is not None and not (reason == 'status' and response.status_code == 404):
+            ACTUATOR_FAILURES.inc(self.room, self.device, reason)
+        latency_ms = elapsed * 1000
+        self.stats['last_latency_ms'] = round(latency_ms, 3)
+        if error is not None:
+            self.stats['last_error'] = error
+        # 404(/state 미지원)는 장치 장애가 아니다
+        if response is None or response.status_code != 404:
+            changed = self.breaker.record(error is None, latency_ms)
+            if changed == CircuitBreaker.OPEN:
+                print(f"[CIRCUIT] {self.device} circuit open ({error or f'slow: {latency_ms:.0f}ms'})", flush=True)
+            elif changed == CircuitBreaker.CLOSED:
+                print(f"[CIRCUIT] {self.device} circuit closed", flush=True)
+        return error is None, response
+
+    def state(self):
+        return {
+            'desired': self.desired[0] if self.desired else None,
+            'confirmed': self.confirmed,
+            'circuit': self.breaker.state,
+        }
+
+
+class ActuatorDispatcher:
+    """장치별 작업 스레드로 제어 명령을 병렬 전송 (결정 엔진은 네트워크 I/O를 기다리지 않는다)
+
+    on_result(device, action, reason, ok, error)는 전송이 끝난 뒤 해당 장치의 작업 스레드에서 호출된다.
+    백그라운드 스레드가 probe_interval마다 각 장치의 실제 상태(/state, 없으면 /health)를 확인해
+    desired와 다르면 다시 전송한다.
+
+    workers는 copy-on-write dict라 add()/remove()로 장치가 바뀌어도 전송 경로는 잠금을 잡지 않는다.
+    """
+
+    def __init__(self, endpoints, on_result=None, timeouts=ACTUATOR_TIMEOUTS,
+                 default_timeout=ACTUATOR_TIMEOUT, probe_interval=ACTUATOR_PROBE_INTERVAL, room=''):
+        self.room = room
+        self.on_result = on_result
+        self.timeouts = timeouts
+        self.default_timeout = default_timeout
+        self.workers = {device: self._worker(device, url) for device, url in endpoints.items()}
+        self.probe_interval = probe_interval
+        self._lock = threading.Lock()
+        self._started = False
+        self._stop = threading.Event()
+        self._prober = None
+
+    def _worker(self, device, url):
+        return ActuatorWorker(device, url, self.timeouts.get(device, self.default_timeout), self.on_result,
+                              room=self.room)
+
+    def add(self, device, url):
+        """장치 추가 또는 주소 변경 (재시작 없이) - 기존 작업 스레드는 정리"""
+        worker = self._worker(device, url)
+        with self._lock:
+            old = self.workers.get(device)
+            self.workers = {**self.workers, device: worker}
+            if self._started:
+                worker.start()
+                self._start_prober()
+        if old is not None:
+            old.stop()
+
+    def remove(self, device):
+        """장치 제거, 있었으면 True"""
+        with self._lock:
+            workers = dict(self.workers)
+            old = workers.pop(device, None)
+            self.workers = workers
+        if old is None:
+            return False
+        old.stop()
+        return True
+
+    def desired(self, device):
+        """device에 마지막으로 요청된 action"""
+        worker = self.workers.get(device)
+        if worker is None or worker.desired is None:
+            return None
+        return worker.desired[0]
+
+    def states(self):
+        """장치별 desired / confirmed / 회로 상태"""
+        return {device: worker.state() for device, worker in self.workers.items()}
+
+    def dispatch(self, device, action, reason):
+        """device의 desired 상태 변경 - 알 수 없는 장치면 False"""
+        worker = self.workers.get(device)
+        if worker is None:
+            print(f"[WARNING] Unknown device: {device}", flush=True)
+            return False
+        worker.submit(action, reason)
+        return True
+
+    def start(self):
+        with self._lock:
+            self._started = True
+            for worker in self.workers.values():
+                worker.start()
+            if self.workers:
+                self._start_prober()
+
+    def _start_prober(self):
+        if self._prober is None and self.probe_interval > 0:
+            self._prober = threading.Thread(target=self._probe_loop, name='actuator-prober', daemon=True)
+            self._prober.start()
+
+    def stop(self):
+        self._stop.set()
+        for worker in self.workers.values():
+            worker.stop()
+
+    def _probe_loop(self):
+        while not self._stop.wait(self.probe_interval):
+            for worker in self.workers.values():
+                worker.probe()
+
+    def stats(self):
+        return {device: dict(worker.stats, pending=worker.pending(), **worker.state())
+                for device, worker in self.workers.items()}
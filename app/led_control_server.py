@@ -3,6 +3,12 @@ import RPi.GPIO as GPIO
 from flask import Flask, request, jsonify
 import time
 
+try:
+    from device_agent import DeviceAgent
+except ImportError as e:
+    print(f"Warning: device_agent not available ({e}) - not registering with the central server", flush=True)
+    DeviceAgent = None
+
 # GPIO 핀 설정
 RED_PIN = 4
 BLUE_PIN = 17
@@ -17,8 +23,12 @@ GPIO.setup(GREEN_PIN, GPIO.OUT)
 
 app = Flask(__name__)
 
+# 현재 LED 색상 (중앙 서버의 상태 확인용)
+current_color = 'OFF'
+
 def set_led_color(color):
     """지정된 색상에 따라 LED를 켜고 끕니다."""
+    global current_color
     # 모든 LED를 끈다
     GPIO.output(RED_PIN, GPIO.LOW)
     GPIO.output(BLUE_PIN, GPIO.LOW)
@@ -35,6 +45,7 @@ def set_led_color(color):
     else:
         return False # 지원하지 않는 색상
     
+    current_color = color
     print(f"[LED] Set to {color}", flush=True)
     return True
 
@@ -49,6 +60,11 @@ def control_led():
     else:
         return jsonify({'status': 'error', 'message': 'Invalid color specified'}), 400
 
+@app.route('/state', methods=['GET'])
+def get_state():
+    """현재 LED 색상"""
+    return jsonify({'state': current_color}), 200
+
 @app.route('/health', methods=['GET'])
 def health_check():
     """헬스 체크 엔드포인트"""
@@ -68,6 +84,12 @@ if __name__ == '__main__':
         
         # 서버 시작 시 모든 LED 끄기
         set_led_color('OFF')
+
+        # 중앙 서버 장치 레지스트리에 등록 (heartbeat는 백그라운드 스레드)
+        if DeviceAgent is not None:
+            DeviceAgent('actuator', 'led', port=5002, capabilities={
+                'actions': ['RED', 'BLUE', 'GREEN', 'OFF'], 'payload_key': 'color', 'state': True,
+            }).start()
         
         app.run(host='0.0.0.0', port=5002, debug=False)
         
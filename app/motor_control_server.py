@@ -3,6 +3,12 @@ import RPi.GPIO as GPIO
 import time
 import threading
 
+try:
+    from device_agent import DeviceAgent
+except ImportError as e:
+    print(f"Warning: device_agent not available ({e}) - not registering with the central server", flush=True)
+    DeviceAgent = None
+
 # === 설정 영역 ===
 IN1 = 6
 IN2 = 13
@@ -26,6 +32,9 @@ app = Flask(__name__)
 motor_is_busy = False
 motor_lock = threading.Lock()
 
+# 마지막으로 수락한 동작 ('open' / 'close', 시작 직후에는 알 수 없음)
+last_action = None
+
 def setup_gpio():
     """GPIO 초기화"""
     GPIO.setmode(GPIO.BCM)
@@ -66,6 +75,7 @@ def rotate(direction):
 @app.route('/control', methods=['POST'])
 def control_motor():
     """모터 제어 엔드포인트. action: 'open' 또는 'close'"""
+    global last_action
     data = request.json
     action = data.get('action')
 
@@ -75,6 +85,7 @@ def control_motor():
     if motor_is_busy:
         return jsonify({'status': 'busy', 'message': 'Motor is currently operating.'}), 503
 
+    last_action = action
     direction = 'right' if action == 'open' else 'left'
     
     # 백그라운드에서 모터 회전 실행
@@ -83,6 +94,11 @@ def control_motor():
     
     return jsonify({'status': 'success', 'action': action}), 200
 
+@app.route('/state', methods=['GET'])
+def get_state():
+    """마지막으로 수락한 동작 (회전 중에는 busy=True)"""
+    return jsonify({'state': last_action, 'busy': motor_is_busy}), 200
+
 @app.route('/health', methods=['GET'])
 def health_check():
     """헬스 체크 엔드포인트"""
@@ -103,6 +119,12 @@ if __name__ == "__main__":
         print("="*40, flush=True)
         print("  Server ready on http://0.0.0.0:5003", flush=True)
         print("="*40, flush=True)
+
+        # 중앙 서버 장치 레지스트리에 등록 (heartbeat는 백그라운드 스레드)
+        if DeviceAgent is not None:
+            DeviceAgent('actuator', 'motor', port=5003, capabilities={
+                'actions': ['open', 'close'], 'state': True,
+            }).start()
         
         app.run(host='0.0.0.0', port=5003, debug=False)
         
@@ -0,0 +1,271 @@
+import argparse
+import contextlib
+import functools
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+
+try:
+    from starlette.applications import Starlette
+    from starlette.concurrency import run_in_threadpool
+    from starlette.responses import JSONResponse, Response, StreamingResponse
+    from starlette.routing import Mount, Route
+    import uvicorn
+    try:
+        from a2wsgi import WSGIMiddleware
+    except ImportError:
+        from starlette.middleware.wsgi import WSGIMiddleware
+    ASGI_AVAILABLE = True
+except ImportError:
+    ASGI_AVAILABLE = False
+
+import central_server as core
+from batch import check_batch_size, decode_batch_body, BatchError
+from registry import RegistryError
+from thresholds import ThresholdError
+from rooms import RoomError, RoomMoved, WORKER_COUNT, WORKER_INDEX
+from storage import DEFAULT_ROOM
+from stream import sse_stream_async, parse_last_id, STREAM_MAX_CLIENTS
+
+# 운영용 ASGI 모드: 수신/상태/로그/스트림은 이벤트 루프에서 처리하고, 나머지 API와 대시보드는
+# 기존 Flask 앱을 그대로 마운트한다. 상태(방, 레지스트리, 기록 큐)는 central_server 모듈 것을 쓴다.
+ASGI_WORKERS = int(os.getenv('ASGI_WORKERS', '1'))
+ASGI_INLINE_BATCH = int(os.getenv('ASGI_INLINE_BATCH', '200'))   # 이보다 큰 배치는 스레드 풀에서 처리
+
+
+def instrumented(endpoint):
+    """요청 지표 기록 (Flask 쪽과 같은 이름) - endpoint는 경로 템플릿 또는 request -> 이름 함수"""
+    def decorator(handler):
+        @functools.wraps(handler)
+        async def wrapper(request):
+            name = endpoint(request) if callable(endpoint) else endpoint
+            started = time.perf_counter()
+            try:
+                response = await handler(request)
+            except Exception as e:
+                core.observe_request(name, request.method, getattr(e, 'status', 500), started)
+                raise
+            core.observe_request(name, request.method, response.status_code, started)
+            return response
+        return wrapper
+    return decorator
+
+
+def sensor_endpoint(request):
+    kind = request.path_params['kind']
+    return f'/sensor/{kind}' if kind in core.INGESTORS else 'unmatched'
+
+
+def error(message, status):
+    return JSONResponse({'status': 'error', 'message': message}, status)
+
+
+def query_room(request):
+    return core.rooms.get(request.query_params.get('room') or DEFAULT_ROOM)
+
+
+@instrumented(sensor_endpoint)
+async def receive_sensor(request):
+    """단일 센서 수신 - 기록 큐가 가득 차도 기다리지 않고 503 (루프를 막지 않는다)"""
+    kind = request.path_params['kind']
+    if kind not in core.INGESTORS:
+        return error(f'Unknown sensor kind: {kind}', 404)
+    try:
+        data = json.loads(await request.body())
+    except ValueError:
+        data = None
+    response, status = core.ingest(kind, data, request.query_params.get('room'), block=False)
+    return JSONResponse(response, status)
+
+
+@instrumented('/sensor/batch')
+async def receive_batch(request):
+    """배치 수신 - 큰 배치는 파싱/평가가 길어 스레드 풀로 넘긴다"""
+    try:
+        check_batch_size(int(request.headers.get('content-length') or 0))
+        mimetype = request.headers.get('content-type', '').split(';')[0].strip()
+        readings, batch_room = decode_batch_body(await request.body(), mimetype)
+    except BatchError as e:
+        return error(str(e), e.status)
+    room_id = batch_room or request.query_params.get('room')
+    if len(readings) > ASGI_INLINE_BATCH:
+        response, status = await run_in_threadpool(core.ingest_batch, readings, room_id, False)
+    else:
+        response, status = core.ingest_batch(readings, room_id, block=False)
+    return JSONResponse(response, status)
+
+
+@instrumented('/status')
+async def get_status(request):
+    """방 하나의 현재 상태 (central_server의 /status와 같은 ETag/delta 규칙)"""
+    params = request.query_params
+    body, etag, status = core.status_response(query_room(request), params.get('since'),
+                                              params.get('instance'),
+                                              request.headers.get('if-none-match'))
+    return Response(body, status, media_type='application/json',
+                    headers={'ETag': f'"{etag}"', 'Cache-Control': 'no-cache'})
+
+
+@instrumented('/logs/<log_type>')
+async def get_logs(request):
+    params = request.query_params
+    try:
+        limit = int(params.get('limit', 50))
+    except ValueError:
+        limit = 50
+    logs = await run_in_threadpool(core.query_logs, request.path_params['log_type'], limit,
+                                   params.get('type'), params.get('device'), params.get('room'))
+    if logs is None:
+        return JSONResponse({'error': 'Invalid log type'}, 400)
+    return JSONResponse({'logs': logs})
+
+
+@instrumented('/stream')
+async def stream(request):
+    """상태 변경 푸시 (SSE) - 구독자마다 스레드 대신 코루틴 하나"""
+    room = query_room(request)
+    if sum(r.change_feed.clients for r in core.rooms) >= STREAM_MAX_CLIENTS:
+        return error('Too many stream clients', 503)
+    last_id = parse_last_id(request.headers.get('last-event-id', request.query_params.get('since')))
+    return StreamingResponse(sse_stream_async(room.change_feed, last_id, room.snapshot),
+                             media_type='text/event-stream',
+                             headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@instrumented('/devices/<device_id>/heartbeat')
+async def device_heartbeat(request):
+    if not core.registry.heartbeat(request.path_params['device_id']):
+        return error('Unknown device, register again', 404)
+    return JSONResponse({'status': 'success'})
+
+
+async def room_error(request, exc):
+    return error(str(exc), exc.status)
+
+
+async def room_moved(request, exc):
+    """다른 워커가 맡은 방 - 그 워커 포트로 307 (본문과 메서드 유지)"""
+    return JSONResponse({'status': 'error', 'message': str(exc), 'worker': exc.worker}, exc.status,
+                        headers={'Location': core.worker_url(str(request.url), exc.worker)})
+
+
+def start():
+    """central_server의 __main__과 같은 순서로 백그라운드 작업 시작"""
+    core.init_db()
+    core.db_writer.start()
+    # 보존 작업은 DB 전체 대상이라 워커 0만 돌린다
+    if WORKER_INDEX == 0:
+        core.retention.start()
+    core.thresholds.load()
+    core.thresholds.start()
+    core.registry.load(core.storage, owns=core.rooms.owns)
+    core.registry.start()
+    core.rooms.start()
+    print(f"✓ Worker {WORKER_INDEX}/{WORKER_COUNT} serving rooms: {', '.join(core.rooms.ids()) or '-'}",
+          flush=True)
+
+
+def stop():
+    core.registry.stop()
+    core.thresholds.stop()
+    core.rooms.stop()
+    if WORKER_INDEX == 0:
+        core.retention.stop()
+    core.db_writer.stop()
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    start()
+    try:
+        yield
+    finally:
+        stop()
+
+
+def create_app():
+    return Starlette(
+        routes=[
+            Route('/sensor/batch', receive_batch, methods=['POST']),
+            Route('/sensor/{kind}', receive_sensor, methods=['POST']),
+            Route('/status', get_status, methods=['GET']),
+            Route('/logs/{log_type}', get_logs, methods=['GET']),
+            Route('/stream', stream, methods=['GET']),
+            Route('/devices/{device_id}/heartbeat', device_heartbeat, methods=['POST']),
+            # 그 밖의 API(임계값, 규칙, 장치 등록, 이력 ...)와 대시보드는 Flask 앱 그대로
+            Mount('/', WSGIMiddleware(core.app)),
+        ],
+        exception_handlers={
+            RoomMoved: room_moved,
+            RoomError: room_error,
+            RegistryError: room_error,
+            ThresholdError: room_error,
+        },
+        lifespan=lifespan,
+    )
+
+
+app = create_app() if ASGI_AVAILABLE else None
+
+
+def run_workers(host, port, workers):
+    """워커 프로세스 여러 개 실행 - 워커 i는 port + i에서 방 id 해시가 i인 방을 맡는다
+
+    방 상태(상태 저장소, 규칙 엔진, 액추에이터)는 프로세스 사이에 공유할 수 없으므로 방마다 한 워커에만 두고,
+    다른 워커로 온 요청은 307로 넘긴다. SIGTERM/SIGINT는 모든 워커에 전달하고, 하나라도 죽으면 모두 내린다.
+    """
+    core.init_db()      # 워커들이 동시에 마이그레이션하지 않도록 먼저
+    processes = []
+    for index in range(workers):
+        env = dict(os.environ, WORKER_INDEX=str(index), WORKER_COUNT=str(workers), SERVER_PORT=str(port))
+        processes.append(subprocess.Popen(
+            [sys.executable, '-u', os.path.abspath(__file__), '--host', host, '--port', str(port + index),
+             '--workers', '1'], env=env))
+
+    stopping = []
+
+    def forward(signum, frame):
+        stopping.append(signum)
+        for process in processes:
+            if process.poll() is None:
+                process.send_signal(signum)
+
+    signal.signal(signal.SIGTERM, forward)
+    signal.signal(signal.SIGINT, forward)
+    try:
+        while all(process.poll() is None for process in processes):
+            time.sleep(0.5)
+    finally:
+        for process in processes:
+            if process.poll() is None:
+                process.terminate()
+        for process in processes:
+            process.wait()
+    # 요청된 종료면 0, 워커가 스스로 죽었으면 실패로
+    return 0 if stopping else 1
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='IoT Central Server (ASGI mode)')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=core.SERVER_PORT + WORKER_INDEX)
+    parser.add_argument('--workers', type=int, default=ASGI_WORKERS)
+    args = parser.parse_args(argv)
+
+    if not ASGI_AVAILABLE:
+        print("[ASGI] starlette/uvicorn are not installed - pip install -r requirements.txt "
+              "or run central_server.py (threaded mode)", flush=True)
+        return 1
+    if args.workers > 1:
+        return run_workers(args.host, args.port, args.workers)
+
+    print(f"        ASGI server ready on http://{args.host}:{args.port}", flush=True)
+    uvicorn.run(app, host=args.host, port=args.port, access_log=False, log_level='warning')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,94 @@
+import json
+import os
+
+try:
+    import msgpack
+    MSGPACK_AVAILABLE = True
+except ImportError:
+    msgpack = None
+    MSGPACK_AVAILABLE = False
+
+BATCH_MAX_READINGS = int(os.getenv('BATCH_MAX_READINGS', '5000'))
+BATCH_MAX_BYTES = int(os.getenv('BATCH_MAX_BYTES', str(4 * 1024 * 1024)))
+
+MSGPACK_MIMETYPES = ('application/msgpack', 'application/x-msgpack')
+
+# 간단한 [ts, type, value] 형식의 type -> (센서 종류, payload 키)
+COMPACT_FIELDS = {
+    'temperature': ('environment', 'temperature'),
+    'pressure': ('environment', 'pressure'),
+    'humidity': ('environment', 'humidity'),
+    'co2': ('co2', 'co2_level'),
+    'noise': ('noise', 'noise_level'),
+    'motion': ('motion', 'motion_detected'),
+}
+
+SENSOR_KINDS = ('environment', 'co2', 'motion', 'noise')
+
+
+class BatchError(ValueError):
+    """잘못된 /sensor/batch 요청"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def check_batch_size(content_length):
+    """본문을 읽기 전에 Content-Length로 크기 제한 확인"""
+    if content_length and content_length > BATCH_MAX_BYTES:
+        raise BatchError(f"Batch too large (max {BATCH_MAX_BYTES} bytes)", 413)
+
+
+def decode_batch(req):
+    """Flask 요청 본문(JSON 또는 msgpack) -> (readings 목록, 본문의 room 또는 None)"""
+    check_batch_size(req.content_length)
+    return decode_batch_body(req.get_data(), req.mimetype)
+
+
+def decode_batch_body(body, mimetype):
+    """본문 bytes -> (readings 목록, 본문의 room 또는 None) - 프레임워크와 무관 (ASGI 모드 공용)"""
+    check_batch_size(len(body))
+    if mimetype in MSGPACK_MIMETYPES:
+        if not MSGPACK_AVAILABLE:
+            raise BatchError("msgpack is not installed on the server", 415)
+        try:
+            payload = msgpack.unpackb(body, raw=False)
+        except Exception as e:
+            raise BatchError(f"Invalid msgpack body: {e}")
+    else:
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            raise BatchError("Invalid JSON body")
+
+    readings = payload.get('readings') if isinstance(payload, dict) else payload
+    room = payload.get('room') if isinstance(payload, dict) else None
+    if not isinstance(readings, list):
+        raise BatchError("Expected a list of readings")
+    if len(readings) > BATCH_MAX_READINGS:
+        raise BatchError(f"Too many readings (max {BATCH_MAX_READINGS})", 413)
+    return readings, room
+
+
+def normalize_reading(reading):
+    """reading 하나 -> (센서 종류, 단일 엔드포인트와 같은 payload dict)"""
+    if isinstance(reading, dict):
+        kind = reading.get('type')
+        if kind in SENSOR_KINDS:
+            return kind, reading
+        if kind in COMPACT_FIELDS:
+            # {"type": "temperature", "value": 23.4, "ts": ...} 형식도 허용
+            kind, key = COMPACT_FIELDS[kind]
+            return kind, {key: reading['value'], 'ts': reading.get('ts', reading.get('timestamp')),
+                          'room': reading.get('room')}
+        raise BatchError(f"Unknown reading type: {kind}")
+
+    if isinstance(reading, (list, tuple)) and len(reading) == 3:
+        ts, name, value = reading
+        if name not in COMPACT_FIELDS:
+            raise BatchError(f"Unknown reading type: {name}")
+        kind, key = COMPACT_FIELDS[name]
+        return kind, {key: value, 'ts': ts}
+
+    raise BatchError("Reading must be an object or a [ts, type, value] array")
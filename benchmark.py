@@ -0,0 +1,441 @@
+#!/usr/bin/env python3
+"""중앙 서버 부하 생성/벤치마크 (오프라인, 로컬에서 서버를 직접 띄운다)
+
+사용법:
+    python benchmark.py [--mode threaded|asgi] [--sensors 50] [--rate 1] [--dashboards 5]
+                        [--duration 30] [--actuator-latency 0.02] [--actuator-failures 0]
+                        [--seed-rows 0] [--output benchmark-results.json] [--compare 이전결과.json]
+
+- 센서 에이전트 N개가 /sensor/*에 초당 rate건씩 보내고, 대시보드 M개가 /status(ETag 재검증)와
+  /logs를 주기적으로 조회한다.
+- 액추에이터는 led/motor 컨트롤러처럼 /control, /state, /health를 제공하는 로컬 스텁으로 대신하며
+  응답 지연과 실패 비율을 주입할 수 있다.
+- 결정->구동 지연은 측정용 방(bench-probe)의 temp_high를 번갈아 바꾼 시점부터 스텁이
+  airconditioner 명령을 받은 시점까지로 잰다.
+- 결과(처리량, p50/p95/p99, DB 크기 증가, 결정->구동 지연)는 JSON으로 남겨 커밋 간 비교한다.
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+from flask import Flask, jsonify, request
+from werkzeug.serving import make_server
+
+from storage import Storage, INSERT_SENSOR_DATA, now_ms
+
+DEVICES = ['airconditioner', 'heater', 'ventilator', 'light', 'alarm', 'led', 'motor']
+ENDPOINT_ENV = {
+    'airconditioner': 'AC_ENDPOINT',
+    'heater': 'HEATER_ENDPOINT',
+    'ventilator': 'VENT_ENDPOINT',
+    'light': 'LIGHT_ENDPOINT',
+    'alarm': 'ALARM_ENDPOINT',
+    'led': 'LED_ENDPOINT',
+    'motor': 'MOTOR_ENDPOINT',
+}
+PROBE_ROOM = 'bench-probe'
+PROBE_TEMPERATURE = 23.0
+SENSOR_KINDS = ['environment', 'co2', 'motion', 'noise']
+SERVERS = {'threaded': 'central_server.py', 'asgi': 'asgi_server.py'}
+
+
+def percentile(ordered, p):
+    """정렬된 목록의 p 백분위수 (nearest-rank)"""
+    if not ordered:
+        return None
+    index = max(0, min(len(ordered) - 1, int(round(p / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def summarize(latencies, errors, duration):
+    """지연 시간(초) 목록 -> 건수/처리량/백분위수(ms)"""
+    ordered = sorted(latencies)
+    ms = lambda value: round(value * 1000, 3) if value is not None else None
+    return {
+        'count': len(ordered),
+        'errors': errors,
+        'per_second': round(len(ordered) / duration, 1) if duration else None,
+        'p50_ms': ms(percentile(ordered, 50)),
+        'p95_ms': ms(percentile(ordered, 95)),
+        'p99_ms': ms(percentile(ordered, 99)),
+        'max_ms': ms(ordered[-1] if ordered else None),
+    }
+
+
+class Recorder:
+    """엔드포인트별 지연 시간/오류 수집 (워밍업 구간은 버린다)"""
+
+    def __init__(self):
+        self.measuring = False
+        self.latencies = {}
+        self.errors = {}
+        self._lock = threading.Lock()
+
+    def record(self, name, latency, ok):
+        if not self.measuring:
+            return
+        with self._lock:
+            if ok:
+                self.latencies.setdefault(name, []).append(latency)
+            else:
+                self.errors[name] = self.errors.get(name, 0) + 1
+
+    def results(self, duration):
+        names = set(self.latencies) | set(self.errors)
+        return {name: summarize(self.latencies.get(name, []), self.errors.get(name, 0), duration)
+                for name in sorted(names)}
+
+
+class StubActuator:
+    """led/motor 컨트롤러를 흉내 내는 로컬 액추에이터 (장치 하나 = 포트 하나, /state가 호스트 단위라서)"""
+
+    def __init__(self, room, device, latency=0.0, failures=0.0):
+        self.room = room
+        self.device = device
+        self.latency = latency
+        self.failures = failures
+        self.state = 'OFF'
+        self.commands = []          # (수신 시각 perf_counter, action)
+        self.injected_failures = 0
+        self._cond = threading.Condition()
+
+        app = Flask(f'stub-{room}-{device}')
+        app.add_url_rule('/control', 'control', self.control, methods=['POST'])
+        app.add_url_rule('/state', 'state', lambda: jsonify({'state': self.state}))
+        app.add_url_rule('/health', 'health', lambda: jsonify({'status': 'healthy'}))
+        self.server = make_server('127.0.0.1', 0, app, threaded=True)
+        self.url = f'http://127.0.0.1:{self.server.server_port}/control'
+
+    def control(self):
+        received = time.perf_counter()
+        data = request.get_json(silent=True) or {}
+        action = next(iter(data.values()), None)
+        if self.latency:
+            time.sleep(self.latency)
+        if self.failures and random.random() < self.failures:
+            self.injected_failures += 1
+            return jsonify({'status': 'error', 'message': 'Injected failure'}), 500
+        with self._cond:
+            self.state = action
+            self.commands.append((received, action))
+            self._cond.notify_all()
+        return jsonify({'status': 'success', 'state': action}), 200
+
+    def wait_for(self, action, after, timeout):
+        """after 이후에 action 명령을 받은 시각 (timeout이면 None)"""
+        deadline = time.perf_counter() + timeout
+        with self._cond:
+            while True:
+                for received, value in reversed(self.commands):
+                    if received < after:
+                        break
+                    if value == action:
+                        return received
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, name=f'stub-{self.device}', daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+
+
+def sensor_payload(kind, state):
+    """종류별로 정상 범위 안에서 조금씩 움직이는 측정값"""
+    if kind == 'environment':
+        state['temperature'] = min(max(state.get('temperature', 22.0) + random.uniform(-0.1, 0.1), 19), 24)
+        return {'temperature': round(state['temperature'], 2), 'humidity': round(random.uniform(40, 50), 1),
+                'pressure': round(random.uniform(1005, 1015), 1)}
+    if kind == 'co2':
+        state['co2'] = min(max(state.get('co2', 600.0) + random.uniform(-10, 10), 450), 900)
+        return {'co2_level': round(state['co2'])}
+    if kind == 'motion':
+        return {'motion_detected': random.random() < 0.5, 'idle_duration': random.randint(0, 120)}
+    return {'noise_level': round(random.uniform(30, 55), 1), 'duration': 1}
+
+
+def run_sensor(base, index, rate, recorder, stop):
+    """센서 에이전트 하나 - 종류를 돌아가며 rate건/초 (시작 시점은 에이전트마다 흩어 놓는다)"""
+    session = requests.Session()
+    state = {}
+    interval = 1.0 / rate
+    next_at = time.perf_counter() + random.uniform(0, interval)
+    count = index
+    while not stop.is_set():
+        delay = next_at - time.perf_counter()
+        if delay > 0 and stop.wait(delay):
+            break
+        next_at += interval
+        kind = SENSOR_KINDS[count % len(SENSOR_KINDS)]
+        count += 1
+        started = time.perf_counter()
+        try:
+            response = session.post(f'{base}/sensor/{kind}', json=sensor_payload(kind, state), timeout=10)
+            ok = response.status_code == 200
+        except requests.exceptions.RequestException:
+            ok = False
+        recorder.record(f'sensor/{kind}', time.perf_counter() - started, ok)
+
+
+def run_dashboard(base, interval, logs_every, recorder, stop):
+    """대시보드 하나 - /status를 ETag로 재검증하며 폴링, logs_every번마다 /logs/sensor"""
+    session = requests.Session()
+    etag = None
+    polls = 0
+    while not stop.wait(interval * random.uniform(0.9, 1.1)):
+        polls += 1
+        started = time.perf_counter()
+        try:
+            response = session.get(f'{base}/status', headers={'If-None-Match': etag} if etag else {},
+                                   timeout=10)
+            ok = response.status_code in (200, 304)
+            etag = response.headers.get('ETag', etag)
+        except requests.exceptions.RequestException:
+            ok = False
+        recorder.record('status', time.perf_counter() - started, ok)
+
+        if logs_every and polls % logs_every == 0:
+            started = time.perf_counter()
+            try:
+                ok = session.get(f'{base}/logs/sensor?limit=50', timeout=10).status_code == 200
+            except requests.exceptions.RequestException:
+                ok = False
+            recorder.record('logs/sensor', time.perf_counter() - started, ok)
+
+
+def run_actuation_probe(base, stub, interval, probe, stop):
+    """bench-probe 방의 temp_high를 온도 위/아래로 번갈아 바꿔 airconditioner ON/OFF를 일으키고 지연을 잰다"""
+    session = requests.Session()
+    session.post(f'{base}/sensor/environment?room={PROBE_ROOM}', json={'temperature': PROBE_TEMPERATURE})
+    high = True
+    while not stop.wait(interval):
+        temp_high, action = (PROBE_TEMPERATURE - 10, 'ON') if high else (PROBE_TEMPERATURE + 10, 'OFF')
+        high = not high
+        sent = time.perf_counter()
+        try:
+            session.post(f'{base}/thresholds?room={PROBE_ROOM}', json={'temp_high': temp_high}, timeout=10)
+        except requests.exceptions.RequestException:
+            probe['missed'] += 1
+            continue
+        received = stub.wait_for(action, sent, timeout=interval * 5)
+        if received is None:
+            probe['missed'] += 1
+        else:
+            probe['latencies'].append(received - sent)
+
+
+def db_size(path):
+    return sum(os.path.getsize(f) for f in (path, path + '-wal') if os.path.exists(f))
+
+
+def seed_database(path, rows):
+    """/status, /logs가 DB 크기에 따라 어떻게 느려지는지 보려고 과거 측정값을 미리 채운다"""
+    storage = Storage(path)
+    storage.migrate()
+    type_ids = [storage.sensor_type_id(name, unit) for name, unit in
+                [('temperature', '°C'), ('humidity', '%'), ('co2', 'ppm'), ('noise', 'dB')]]
+    start = now_ms() - rows * 1000
+    with storage.connection() as conn:
+        with conn:
+            conn.executemany(INSERT_SENSOR_DATA,
+                             ((start + i * 1000, type_ids[i % len(type_ids)], random.uniform(20, 60))
+                              for i in range(rows)))
+    storage.close_all()
+
+
+def wait_ready(base, process, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            return False
+        try:
+            if requests.get(f'{base}/health', timeout=1).status_code == 200:
+                return True
+        except requests.exceptions.RequestException:
+            pass
+        time.sleep(0.2)
+    return False
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)     # 스텁 액추에이터의 요청 로그
+    workdir = tempfile.mkdtemp(prefix='iot-bench-')
+    db_path = os.path.join(workdir, 'iot_system.db')
+    if args.db:
+        shutil.copy(args.db, db_path)      # 원본은 건드리지 않는다
+    if args.seed_rows:
+        seed_database(db_path, args.seed_rows)
+
+    stubs = {(room, device): StubActuator(room, device, args.actuator_latency, args.actuator_failures).start()
+             for room in ('default', PROBE_ROOM) for device in DEVICES}
+    with open(os.path.join(workdir, 'rooms.json'), 'w', encoding='utf-8') as f:
+        json.dump({'rooms': {
+            'default': {},
+            PROBE_ROOM: {'actuators': {device: stubs[PROBE_ROOM, device].url for device in DEVICES}},
+        }}, f)
+
+    env = dict(os.environ, DB_PATH=db_path, ROOMS_PATH=os.path.join(workdir, 'rooms.json'),
+               SERVER_PORT=str(args.port), PYTHONUNBUFFERED='1')
+    env.update({ENDPOINT_ENV[device]: stubs['default', device].url for device in DEVICES})
+    log_path = os.path.join(workdir, 'server.log')
+    base = f'http://127.0.0.1:{args.port}'
+    recorder = Recorder()
+    stop = threading.Event()
+    probe = {'latencies': [], 'missed': 0}
+
+    with open(log_path, 'w') as log:
+        process = subprocess.Popen([sys.executable, SERVERS[args.mode]], env=env, stdout=log,
+                                   stderr=subprocess.STDOUT, cwd=os.path.dirname(os.path.abspath(__file__)))
+    try:
+        if not wait_ready(base, process):
+            print(f"✗ Server did not start ({args.mode}), see {log_path}")
+            return None
+        start_bytes = db_size(db_path)
+
+        threads = [threading.Thread(target=run_sensor, args=(base, i, args.rate, recorder, stop), daemon=True)
+                   for i in range(args.sensors)]
+        threads += [threading.Thread(target=run_dashboard, args=(base, args.poll, args.logs_every, recorder, stop),
+                                     daemon=True) for _ in range(args.dashboards)]
+        threads.append(threading.Thread(
+            target=run_actuation_probe,
+            args=(base, stubs[PROBE_ROOM, 'airconditioner'], args.probe_interval, probe, stop), daemon=True))
+        for thread in threads:
+            thread.start()
+
+        time.sleep(args.warmup)
+        recorder.measuring = True
+        probe['latencies'].clear()
+        probe['missed'] = 0
+        started = time.perf_counter()
+        time.sleep(args.duration)
+        recorder.measuring = False
+        duration = time.perf_counter() - started
+        stop.set()
+        for thread in threads:
+            thread.join(timeout=10)
+    finally:
+        stop.set()
+        process.terminate()     # SIGTERM - 기록 큐를 비우고 종료
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+        for stub in stubs.values():
+            stub.stop()
+
+    end_bytes = db_size(db_path)
+    requests_summary = recorder.results(duration)
+    readings = sum(summary['count'] for name, summary in requests_summary.items() if name.startswith('sensor/'))
+    results = {
+        'commit': git_commit(),
+        'mode': args.mode,
+        'started_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'config': {
+            'sensors': args.sensors,
+            'rate': args.rate,
+            'dashboards': args.dashboards,
+            'poll': args.poll,
+            'duration': args.duration,
+            'actuator_latency': args.actuator_latency,
+            'actuator_failures': args.actuator_failures,
+            'seed_rows': args.seed_rows,
+        },
+        'duration_s': round(duration, 3),
+        'ingest': {
+            'offered_per_second': args.sensors * args.rate,
+            'accepted_per_second': round(readings / duration, 1),
+        },
+        'requests': requests_summary,
+        'actuation': summarize(probe['latencies'], probe['missed'], duration),
+        'db': {
+            'start_bytes': start_bytes,
+            'end_bytes': end_bytes,
+            'growth_bytes': end_bytes - start_bytes,
+            'bytes_per_reading': round((end_bytes - start_bytes) / readings, 1) if readings else None,
+        },
+        'actuator_stub': {
+            'commands': sum(len(stub.commands) for stub in stubs.values()),
+            'injected_failures': sum(stub.injected_failures for stub in stubs.values()),
+        },
+        'server_log': log_path,
+    }
+    if process.returncode not in (0, -15):
+        results['server_exit_code'] = process.returncode
+    return results
+
+
+def print_summary(results, baseline=None):
+    print(f"Mode: {results['mode']}  commit: {results['commit']}  duration: {results['duration_s']}s")
+    print(f"Ingest: {results['ingest']['accepted_per_second']}/s accepted "
+          f"(offered {results['ingest']['offered_per_second']}/s)")
+    rows = dict(results['requests'], actuation=results['actuation'])
+    before_rows = dict(baseline['requests'], actuation=baseline['actuation']) if baseline else {}
+    for name, summary in rows.items():
+        line = (f"  {name:20s} n={summary['count']:<7d} err={summary['errors']:<5d} "
+                f"p50={summary['p50_ms']}ms p95={summary['p95_ms']}ms p99={summary['p99_ms']}ms")
+        before = before_rows.get(name)
+        if before and before.get('p99_ms') and summary['p99_ms'] is not None:
+            line += f"  (p99 {summary['p99_ms'] / before['p99_ms'] - 1:+.0%} vs {baseline.get('commit')})"
+        print(line)
+    db = results['db']
+    print(f"DB: {db['start_bytes']} -> {db['end_bytes']} bytes ({db['bytes_per_reading']} bytes/reading)")
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description='IoT central server benchmark')
+    parser.add_argument('--mode', choices=sorted(SERVERS), default='threaded')
+    parser.add_argument('--port', type=int, default=5400)
+    parser.add_argument('--sensors', type=int, default=50, help='센서 에이전트 수')
+    parser.add_argument('--rate', type=float, default=1.0, help='에이전트당 초당 전송 수')
+    parser.add_argument('--dashboards', type=int, default=5, help='/status 폴링 대시보드 수')
+    parser.add_argument('--poll', type=float, default=1.0, help='대시보드 폴링 주기 (초)')
+    parser.add_argument('--logs-every', type=int, default=5, help='폴링 몇 번마다 /logs 조회 (0 = 안 함)')
+    parser.add_argument('--duration', type=float, default=30, help='측정 시간 (초)')
+    parser.add_argument('--warmup', type=float, default=3, help='측정 전 워밍업 (초)')
+    parser.add_argument('--probe-interval', type=float, default=2.0, help='결정->구동 측정 주기 (초)')
+    parser.add_argument('--actuator-latency', type=float, default=0.02, help='스텁 응답 지연 (초)')
+    parser.add_argument('--actuator-failures', type=float, default=0.0, help='스텁 실패 비율 (0~1)')
+    parser.add_argument('--db', help='이 DB의 사본으로 시작 (원본은 그대로)')
+    parser.add_argument('--seed-rows', type=int, default=0, help='시작 전에 채워 둘 과거 측정값 수')
+    parser.add_argument('--output', default='benchmark-results.json')
+    parser.add_argument('--compare', help='비교할 이전 결과 JSON')
+    args = parser.parse_args(argv)
+
+    results = run(args)
+    if results is None:
+        return 1
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+    print_summary(results, baseline)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
+    print(f"✓ Results written: {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -1,33 +1,61 @@
-from flask import Flask, request, jsonify, render_template, send_from_directory
-import sqlite3
-import requests
+from flask import Flask, Response, request, jsonify, render_template, send_from_directory, stream_with_context
 from datetime import datetime
-import threading
-import time
+import json
 import os
+import sys
+import atexit
+import signal
+import time
+
+from db_writer import WriteBehindWriter
+from storage import (Storage, now_ms, to_epoch_ms, INSERT_SENSOR_DATA, INSERT_MOTION_LOG,
+                     INSERT_NOISE_LOG, INSERT_CONTROL_LOG, LOG_QUERIES, LOG_QUERIES_BY_ROOM,
+                     SENSOR_LOG_BY_TYPE_QUERY, CONTROL_LOG_BY_DEVICE_QUERY, DEFAULT_ROOM)
+from history import query_history, HistoryError
+from rollups import Rollups
+from retention import RetentionJob
+from batch import decode_batch, normalize_reading, BatchError
+from rooms import RoomRegistry, RoomError, RoomMoved
+from thresholds import ThresholdConfig, ThresholdError
+from registry import DeviceRegistry, RegistryError
+from stream import sse_stream, merge_changes, parse_last_id, etag_matches, STREAM_MAX_CLIENTS
+from metrics import counter, histogram, gauge, REGISTRY, CONTENT_TYPE
+from log import get_logger
+from urllib.parse import urlsplit, urlunsplit
 
 
 # BMP180 sensor is removed, as this server will now receive data from other sensors.
 SENSOR_AVAILABLE = False
 app = Flask(__name__)
 
-DB_PATH = '/app/data/iot_system.db'
-
-latest_sensor_data = {
-    'temperature': None,
-    'humidity': None,
-    'pressure': None,
-    'co2_level': None,
-    'motion_detected': False,
-    'motion_timestamp': None,
-    'is_drowsy_alert': False,
-    'idle_duration': 0.0,
-    'noise_level': None,
-    'noise_timestamp': None,
-    'led_state': 'OFF' # LED 상태 추가
-}
+DB_PATH = os.getenv('DB_PATH', '/app/data/iot_system.db')
+SERVER_PORT = int(os.getenv('SERVER_PORT', '5000'))   # 다중 워커면 워커 i는 SERVER_PORT + i
+
+# WAL 모드 연결 풀 (조회용) + 쓰기 지연 큐 (기록용)
+storage = Storage(DB_PATH)
+db_writer = WriteBehindWriter(storage)
+
+# 1m/1h/1d rollup은 원시 데이터와 같은 배치 트랜잭션에서 갱신
+rollups = Rollups()
+db_writer.add_flush_hook(rollups.on_flush)
 
-# 액추에이터 엔드포인트 (모터 추가)
+# 보존 기간이 지난 데이터 보관(gzip CSV) 후 삭제
+retention = RetentionJob(storage)
+
+# 환경 센서 payload 키 -> (sensor_type, 단위)
+ENVIRONMENT_FIELDS = [
+    ('temperature', 'temperature', '°C'),
+    ('pressure', 'pressure', 'hPa'),
+    ('humidity', 'humidity', '%'),
+]
+
+# sensor_data에 기록되는 (sensor_type, 단위) - 시작 시 방마다 sensor_types에 미리 등록
+SENSOR_TYPES = [(sensor_type, unit) for _, sensor_type, unit in ENVIRONMENT_FIELDS] + [('co2', 'ppm')]
+
+# 센서 시각이 서버보다 이만큼 이상 앞서 있으면 수신 시각을 사용
+MAX_CLOCK_SKEW_MS = int(os.getenv('MAX_CLOCK_SKEW', '300')) * 1000
+
+# 기본 방의 액추에이터 엔드포인트 (모터 추가) - 다른 방은 ROOMS_PATH 설정 파일에서 지정
 ACTUATOR_ENDPOINTS = {
     'airconditioner': os.getenv('AC_ENDPOINT', 'http://192.168.0.101:5001/control'),
     'heater': os.getenv('HEATER_ENDPOINT', 'http://192.168.0.102:5001/control'),
@@ -38,371 +66,395 @@ ACTUATOR_ENDPOINTS = {
     'motor': os.getenv('MOTOR_ENDPOINT', 'http://motor-controller:5003/control')
 }
 
-THRESHOLDS = {
-    'temp_high': float(os.getenv('TEMP_HIGH', '28.0')),
-    'temp_low': float(os.getenv('TEMP_LOW', '18.0')),
-    'humidity_high': float(os.getenv('HUMIDITY_HIGH', '70.0')),
-    'co2_high': float(os.getenv('CO2_HIGH', '1000.0')),
-    'noise_high': float(os.getenv('NOISE_HIGH', '70.0')),
-    'motion_timeout': int(os.getenv('MOTION_TIMEOUT', '300'))
-}
-
-co2_high_start_time = None
-co2_normal_start_time = None
+# 임계값: 기본값 <- 전체 <- 방 <- 방/장치 덮어쓰기, 버전마다 DB에 기록 (이력/되돌리기)
+thresholds = ThresholdConfig(storage)
 
 def init_db():
-    """데이터베이스 초기화"""
-    os.makedirs('/app/data', exist_ok=True)
-    
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    
-    c.execute('''CREATE TABLE IF NOT EXISTS sensor_data
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                  timestamp TEXT,
-                  sensor_type TEXT,
-                  value REAL,
-                  unit TEXT)''')
-    
-    c.execute('''CREATE TABLE IF NOT EXISTS motion_log
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                  timestamp TEXT,
-                  detected BOOLEAN,
-                  is_drowsy_alert BOOLEAN,
-                  idle_duration REAL)''')
-    
-    c.execute('''CREATE TABLE IF NOT EXISTS noise_log
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                  timestamp TEXT,
-                  noise_level REAL,
-                  duration REAL)''')
-    
-    c.execute('''CREATE TABLE IF NOT EXISTS control_log
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                  timestamp TEXT,
-                  device TEXT,
-                  action TEXT,
-                  reason TEXT)''')
-    
-    conn.commit()
-    conn.close()
-    print("✓ Database initialized", flush=True)
+    """데이터베이스 초기화 (스키마 마이그레이션 적용, 센서 종류 캐시 채우기)"""
+    version = storage.migrate()
+    # 수집 경로(ASGI 모드에서는 이벤트 루프)가 처음 보는 센서 종류 때문에 DB를 기다리지 않도록
+    storage.preload_sensor_types(SENSOR_TYPES, rooms.ids())
+    print(f"✓ Database initialized (schema v{version})", flush=True)
+
+def sensor_row(room, sensor_type, value, unit, ts):
+    """sensor_data INSERT 한 건 (sql, params) - 시계열은 (방, 센서 종류)마다 따로"""
+    return (INSERT_SENSOR_DATA, (ts, storage.sensor_type_id(sensor_type, unit, room.id), value))
+
+def save_control_log(room_id, device, action, reason):
+    """제어 로그를 DB 기록 큐에 추가"""
+    db_writer.submit(INSERT_CONTROL_LOG,
+                     (now_ms(), room_id, device, action, reason))
+
+# 방(zone)별 상태 저장소/필터/임계값/액추에이터/결정 엔진 - 방마다 독립적으로 평가된다
+rooms = RoomRegistry(ACTUATOR_ENDPOINTS, thresholds, on_control=save_control_log).load()
+
+def request_room(data=None):
+    """요청 대상 방 - payload의 room, ?room=, 둘 다 없으면 기본 방 (모르는 방이면 RoomError)"""
+    room_id = data.get('room') if isinstance(data, dict) else None
+    return rooms.get(room_id or request.args.get('room') or DEFAULT_ROOM)
+
+def attach_device(record):
+    """등록된 장치를 방에 반영 - 액추에이터는 디스패처에 붙인다
+
+    방은 rooms.json에 선언된 것만 - 인증 없는 등록 요청이 방(결정 엔진/스레드)을
+    계속 늘리지 못하게, 모르는 방이면 RoomError(404)로 등록을 거절한다.
+    """
+    room = rooms.get(record.room)
+    if record.kind == 'actuator':
+        room.attach_actuator(record.device, record.url)
+
+def detach_device(record):
+    if record.kind == 'actuator':
+        rooms.get(record.room).detach_actuator(record.device, record.url)
+
+# 컨트롤러/센서 에이전트가 스스로 등록하고 heartbeat를 보내는 장치 레지스트리 (DB에 영속)
+registry = DeviceRegistry(db_writer, on_attach=attach_device, on_detach=detach_device,
+                          device_types=ACTUATOR_ENDPOINTS)
+
+# /metrics - 수집 경로는 카운터/히스토그램 갱신만, 큐 길이 등은 수집 시점에 읽는다
+READINGS = counter('iot_readings_total', 'Sensor readings accepted', ('room', 'type'))
+READINGS_REJECTED = counter('iot_readings_rejected_total', 'Sensor readings rejected', ('type', 'reason'))
+HTTP_REQUESTS = counter('iot_http_requests_total', 'HTTP requests', ('endpoint', 'method', 'status'))
+HTTP_REQUEST_SECONDS = histogram('iot_http_request_seconds', 'HTTP request time until the response is ready',
+                                 ('endpoint',))
+gauge('iot_db_queue_depth', 'Write-behind queue depth (items)', lambda: db_writer.stats()['queue_depth'])
+gauge('iot_db_queue_capacity', 'Write-behind queue capacity', lambda: db_writer.stats()['queue_capacity'])
+gauge('iot_actuator_pending', 'Actuator commands waiting to be sent', lambda: {
+    (room.id, device): worker.pending() for room in rooms for device, worker in room.actuators.workers.items()
+}, ('room', 'device'))
+gauge('iot_stream_clients', 'Connected /stream clients', lambda: {
+    (room.id,): room.change_feed.clients for room in rooms}, ('room',))
+gauge('iot_registry_devices', 'Registered devices', lambda: len(registry))
+
+log = get_logger('INGEST')
+
+def observe_request(endpoint, method, status, started):
+    """요청 하나의 지표 기록 (Flask 훅과 ASGI 핸들러 공용)"""
+    HTTP_REQUESTS.inc(endpoint, method, str(status))
+    HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint)
+
+@app.before_request
+def start_timer():
+    request.environ['iot.started'] = time.perf_counter()
+
+@app.after_request
+def record_request(response):
+    started = request.environ.get('iot.started')
+    if started is not None:
+        endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        observe_request(endpoint, request.method, response.status_code, started)
+    return response
+
+@app.errorhandler(RoomError)
+@app.errorhandler(RegistryError)
+@app.errorhandler(ThresholdError)
+def room_error(e):
+    return jsonify({'status': 'error', 'message': str(e)}), e.status
+
+def worker_url(url, worker):
+    """같은 호스트에서 다른 워커가 받는 URL (워커 i는 SERVER_PORT + i 포트)"""
+    parts = urlsplit(url)
+    netloc = f'{parts.hostname}:{SERVER_PORT + worker}'
+    if parts.hostname and ':' in parts.hostname:
+        netloc = f'[{parts.hostname}]:{SERVER_PORT + worker}'
+    return urlunsplit((parts.scheme, netloc, parts.path, parts.query, ''))
+
+@app.errorhandler(RoomMoved)
+def room_moved(e):
+    """다른 워커가 맡은 방 - 307이라 POST 본문도 그대로 다시 보낸다"""
+    response = jsonify({'status': 'error', 'message': str(e), 'worker': e.worker})
+    response.headers['Location'] = worker_url(request.url, e.worker)
+    return response, e.status
+
+def reading_time(data):
+    """센서가 보낸 측정 시각(ts 또는 timestamp), 없거나 미래로 너무 앞서면 수신 시각"""
+    received = now_ms()
+    ts = to_epoch_ms(data.get('ts', data.get('timestamp')), received)
+    if ts - received > MAX_CLOCK_SKEW_MS:
+        return received
+    return ts
+
+def iso_time(ts):
+    return datetime.fromtimestamp(ts / 1000).isoformat()
+
+# 센서 종류별 처리 함수: (room, payload, ts) -> (상태에 반영할 필드, DB에 기록할 (sql, params) 목록)
+# 상태 반영(제어/스트림)은 기록 큐에 들어간 뒤에 한다 - 503으로 거절한 값이 제어에 쓰이지 않도록
+def ingest_environment(room, data, ts):
+    rows = []
+    fields = {}
+    for key, sensor_type, unit in ENVIRONMENT_FIELDS:
+        value = data.get(key)
+        if value is not None:
+            fields[key] = float(value)
+            rows.append(sensor_row(room, sensor_type, fields[key], unit, ts))
+    return fields, rows
+
+def ingest_co2(room, data, ts):
+    co2_level = float(data.get('co2_level'))
+    return {'co2_level': co2_level}, [sensor_row(room, 'co2', co2_level, 'ppm', ts)]
+
+def ingest_motion(room, data, ts):
+    motion_detected = bool(data.get('motion_detected', False))
+    is_drowsy_alert = bool(data.get('is_drowsy_alert', False))
+    idle_duration = float(data.get('idle_duration', 0))
+    return {
+        'motion_detected': motion_detected,
+        'is_drowsy_alert': is_drowsy_alert,
+        'idle_duration': idle_duration,
+        'motion_timestamp': iso_time(ts),
+    }, [(INSERT_MOTION_LOG, (ts, room.id, motion_detected, is_drowsy_alert, idle_duration))]
+
+def ingest_noise(room, data, ts):
+    noise_level = float(data.get('noise_level'))
+    duration = float(data.get('duration', 0))
+    return {'noise_level': noise_level, 'noise_timestamp': iso_time(ts)}, [(INSERT_NOISE_LOG, (ts, room.id, noise_level, duration))]
+
+INGESTORS = {
+    'environment': ingest_environment,
+    'co2': ingest_co2,
+    'motion': ingest_motion,
+    'noise': ingest_noise,
+}
 
-def save_sensor_data(sensor_type, value, unit):
-    """센서 데이터를 DB에 저장"""
-    try:
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
-        c.execute('''INSERT INTO sensor_data (timestamp, sensor_type, value, unit)
-                     VALUES (?, ?, ?, ?)''',
-                  (datetime.now().isoformat(), sensor_type, value, unit))
-        conn.commit()
-        conn.close()
-    except Exception as e:
-        print(f"[DB ERROR] {e}", flush=True)
-
-def save_control_log(device, action, reason):
-    """제어 로그 저장"""
-    try:
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
-        c.execute('''INSERT INTO control_log (timestamp, device, action, reason)
-                     VALUES (?, ?, ?, ?)''',
-                  (datetime.now().isoformat(), device, action, reason))
-        conn.commit()
-        conn.close()
-    except Exception as e:
-        print(f"[DB ERROR] {e}", flush=True)
+def ingest(kind, data, room_id=None, block=None):
+    """단일 엔드포인트 공통 처리 -> (응답 dict, status)
 
+    잘못된 값이면 400, 모르는 방이면 RoomError(404), 기록 큐가 가득 차면 503 (상태는 그대로).
+    방은 payload의 room, room_id(?room=), 기본 방 순서. Flask/ASGI 모드가 같이 쓴다.
+    """
+    if not isinstance(data, dict):
+        READINGS_REJECTED.inc(kind, 'invalid')
+        return {'status': 'error', 'message': f'Invalid {kind} payload: expected a JSON object'}, 400
+    room = rooms.get(data.get('room') or room_id or DEFAULT_ROOM)
+    try:
+        ts = reading_time(data)
+        fields, rows = INGESTORS[kind](room, data, ts)
+        room.validate(fields)
+    except (TypeError, ValueError) as e:
+        READINGS_REJECTED.inc(kind, 'invalid')
+        return {'status': 'error', 'message': f'Invalid {kind} payload: {e}'}, 400
+    if not db_writer.submit_many(rows, block=block):
+        READINGS_REJECTED.inc(kind, 'queue_full')
+        return {'status': 'error', 'message': 'Ingest queue full'}, 503
+    room.update_latest(fields, ts)
+    READINGS.inc(room.id, kind)
+    log_reading(room, kind, data)
+    return {'status': 'success'}, 200
+
+def log_reading(room, kind, data):
+    """측정값 한 건 로그 - DEBUG 수준에서만 (기본 INFO면 문자열도 만들지 않는다)"""
+    if not log.enabled('DEBUG'):
+        return
+    if kind == 'environment':
+        log.debug('environment', 'Received environment', room=room.id,
+                  **{key: data[key] for key, _, _ in ENVIRONMENT_FIELDS if data.get(key) is not None})
+    elif kind == 'co2':
+        log.debug('co2', 'Received CO2', room=room.id, ppm=data['co2_level'])
+    elif kind == 'motion':
+        log.debug('motion', 'Received motion', room=room.id, detected=data.get('motion_detected', False),
+                  drowsy_alert=data.get('is_drowsy_alert', False), idle=data.get('idle_duration', 0))
+    elif kind == 'noise':
+        log.debug('noise', 'Received noise', room=room.id, db=data['noise_level'],
+                  duration=data.get('duration', 0))
+
+def receive(kind):
+    response, status = ingest(kind, request.get_json(force=True, silent=True), request.args.get('room'))
+    return jsonify(response), status
 
 
 # API 엔드포인트들 (동일)
 @app.route('/sensor/environment', methods=['POST'])
 def receive_environment():
-    data = request.json
-    temperature = data.get('temperature')
-    pressure = data.get('pressure')
-    humidity = data.get('humidity')
-
-    if temperature is not None:
-        latest_sensor_data['temperature'] = temperature
-        save_sensor_data('temperature', temperature, '°C')
-        print(f"[ENV] Received Temperature: {temperature}°C", flush=True)
-
-    if pressure is not None:
-        latest_sensor_data['pressure'] = pressure
-        save_sensor_data('pressure', pressure, 'hPa')
-        print(f"[ENV] Received Pressure: {pressure}hPa", flush=True)
-
-    if humidity is not None:
-        latest_sensor_data['humidity'] = humidity
-        save_sensor_data('humidity', humidity, '%')
-        print(f"[ENV] Received Humidity: {humidity}%", flush=True)
-
-    return jsonify({'status': 'success'}), 200
-
+    return receive('environment')
 
 @app.route('/sensor/co2', methods=['POST'])
 def receive_co2():
-    data = request.json
-    co2_level = float(data.get('co2_level'))
-    
-    latest_sensor_data['co2_level'] = co2_level
-    save_sensor_data('co2', co2_level, 'ppm')
-    
-    print(f"[CO2] Received: {co2_level} ppm", flush=True)
-    return jsonify({'status': 'success'}), 200
+    return receive('co2')
 
 @app.route('/sensor/motion', methods=['POST'])
 def receive_motion():
-    data = request.json
-    motion_detected = data.get('motion_detected', False)
-    is_drowsy_alert = data.get('is_drowsy_alert', False)
-    idle_duration = data.get('idle_duration', 0)
-    
-    # Update latest sensor data cache
-    latest_sensor_data['motion_detected'] = motion_detected
-    latest_sensor_data['is_drowsy_alert'] = is_drowsy_alert
-    latest_sensor_data['idle_duration'] = idle_duration
-    latest_sensor_data['motion_timestamp'] = datetime.now().isoformat()
-    
-    try:
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
-        c.execute('''INSERT INTO motion_log (timestamp, detected, is_drowsy_alert, idle_duration)
-                     VALUES (?, ?, ?, ?)''',
-                  (datetime.now().isoformat(), motion_detected, is_drowsy_alert, idle_duration))
-        conn.commit()
-        conn.close()
-    except Exception as e:
-        print(f"[DB ERROR] {e}", flush=True)
-    
-    print(f"[MOTION] Detected: {motion_detected}, Drowsy Alert: {is_drowsy_alert}, Idle: {idle_duration}s", flush=True)
-    return jsonify({'status': 'success'}), 200
+    return receive('motion')
 
 @app.route('/sensor/noise', methods=['POST'])
 def receive_noise():
-    data = request.json
-    noise_level = data.get('noise_level')
-    duration = data.get('duration', 0)
-    
-    latest_sensor_data['noise_level'] = noise_level
-    latest_sensor_data['noise_timestamp'] = datetime.now().isoformat()
-    
-    try:
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
-        c.execute('''INSERT INTO noise_log (timestamp, noise_level, duration)
-                     VALUES (?, ?, ?)''',
-                  (datetime.now().isoformat(), noise_level, duration))
-        conn.commit()
-        conn.close()
-    except Exception as e:
-        print(f"[DB ERROR] {e}", flush=True)
-    
-    print(f"[NOISE] Level: {noise_level} dB, Duration: {duration}s", flush=True)
-    return jsonify({'status': 'success'}), 200
+    return receive('noise')
 
+@app.route('/sensor/batch', methods=['POST'])
+def receive_batch():
+    """여러 센서의 측정값을 한 번에 수신 (JSON 또는 msgpack), 한 트랜잭션으로 기록
 
+    readings 항목 형식:
+      - {"type": "co2", "ts": 1760000000.5, "co2_level": 812}   (단일 엔드포인트와 같은 payload)
+      - [ts, "temperature", 23.4]                                 (간단한 스칼라 값)
 
-def control_device(device, action, reason):
-    """액추에이터 제어 명령 전송"""
-    if device not in ACTUATOR_ENDPOINTS:
-        print(f"[WARNING] Unknown device: {device}", flush=True)
-        return False
-    
+    방은 항목의 room, 본문의 room, ?room= 순서로 정한다.
+    """
     try:
-        response = requests.post(
-            ACTUATOR_ENDPOINTS[device],
-            json={'action': action},
-            timeout=5
-        )
-        
-        save_control_log(device, action, reason)
-        print(f"[CONTROL] {device} → {action} (Reason: {reason})", flush=True)
-        return True
-        
-    except requests.exceptions.Timeout:
-        print(f"[WARNING] Timeout controlling {device}", flush=True)
-        return False
-    except requests.exceptions.ConnectionError:
-        print(f"[WARNING] Cannot connect to {device}", flush=True)
-        return False
-    except Exception as e:
-        print(f"[ERROR] Failed to control {device}: {e}", flush=True)
-        return False
-
-def control_led(color, reason):
-    """LED 제어를 위해 led_controller에 HTTP 요청을 전송"""
-    global latest_sensor_data
-    
-    if latest_sensor_data['led_state'] == color:
-        return False # 상태 변경이 없으면 요청 안함
-        
-    try:
-        response = requests.post(
-            ACTUATOR_ENDPOINTS['led'],
-            json={'color': color},
-            timeout=5
-        )
-        if response.status_code == 200:
-            latest_sensor_data['led_state'] = color
-            print(f"[LED CONTROL] LED set to {color} (Reason: {reason})", flush=True)
-            save_control_log('led', color, reason)
-            return True
-        else:
-            print(f"[LED ERROR] Failed to set LED color. Status: {response.status_code}", flush=True)
-            return False
-            
-    except requests.exceptions.RequestException as e:
-        print(f"[LED ERROR] Cannot connect to led-controller: {e}", flush=True)
-        return False
-
-def decision_making_loop():
-    """주기적으로 센서 데이터를 분석하고 제어 결정"""
-    global co2_high_start_time, co2_normal_start_time
-    print("[DECISION] Starting decision making loop...", flush=True)
-    
-    previous_state = {
-        'airconditioner': None,
-        'heater': None,
-        'ventilator': None,
-        'light': None,
-        'alarm': None,
-        'motor': None,
-        'led': None
-    }
-    
-    while True:
+        readings, batch_room = decode_batch(request)
+    except BatchError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), e.status
+    response, status = ingest_batch(readings, batch_room or request.args.get('room'))
+    return jsonify(response), status
+
+def ingest_batch(readings, room_id=None, block=None):
+    """디코딩된 배치 처리 -> (응답 dict, status), Flask/ASGI 모드 공용"""
+    default_room = room_id or DEFAULT_ROOM
+    # 배치 전체가 다른 워커의 방이면 통째로 그 워커로 보낸다 (RoomMoved)
+    rooms.check_owner(default_room)
+    parsed = []
+    errors = []
+    for index, reading in enumerate(readings):
         try:
-            temp = latest_sensor_data['temperature']
-            humidity = latest_sensor_data['humidity']
-            co2 = latest_sensor_data['co2_level']
-            motion = latest_sensor_data['motion_detected']
-            motion_time = latest_sensor_data['motion_timestamp']
-            noise = latest_sensor_data['noise_level']
-            
-            # 1. 온도 기반 냉난방 제어
-            if temp is not None:
-                if temp > THRESHOLDS['temp_high']:
-                    if previous_state['airconditioner'] != 'ON':
-                        control_device('airconditioner', 'ON', f'Temperature too high: {temp:.1f}°C')
-                        previous_state['airconditioner'] = 'ON'
-                    if previous_state['heater'] != 'OFF':
-                        control_device('heater', 'OFF', f'Temperature too high: {temp:.1f}°C')
-                        previous_state['heater'] = 'OFF'
-                elif temp < THRESHOLDS['temp_low']:
-                    if previous_state['heater'] != 'ON':
-                        control_device('heater', 'ON', f'Temperature too low: {temp:.1f}°C')
-                        previous_state['heater'] = 'ON'
-                    if previous_state['airconditioner'] != 'OFF':
-                        control_device('airconditioner', 'OFF', f'Temperature too low: {temp:.1f}°C')
-                        previous_state['airconditioner'] = 'OFF'
-                else:
-                    if previous_state['airconditioner'] != 'OFF':
-                        control_device('airconditioner', 'OFF', f'Temperature normal: {temp:.1f}°C')
-                        previous_state['airconditioner'] = 'OFF'
-                    if previous_state['heater'] != 'OFF':
-                        control_device('heater', 'OFF', f'Temperature normal: {temp:.1f}°C')
-                        previous_state['heater'] = 'OFF'
-
-            # 2. CO2 기반 환기 및 모터 제어 (5초 지연)
-            if co2 is not None:
-                if co2 > THRESHOLDS['co2_high']:
-                    co2_normal_start_time = None
-                    if co2_high_start_time is None:
-                        co2_high_start_time = time.time()
-                    
-                    if (time.time() - co2_high_start_time) >= 5:
-                        if previous_state['ventilator'] != 'ON':
-                            control_device('ventilator', 'ON', f'CO2 high for >=5s: {co2:.0f} ppm')
-                            previous_state['ventilator'] = 'ON'
-                        if previous_state['motor'] != 'open':
-                            control_device('motor', 'open', f'CO2 high for >=5s: {co2:.0f} ppm')
-                            previous_state['motor'] = 'open'
-                else:
-                    co2_high_start_time = None
-                    if co2_normal_start_time is None:
-                        co2_normal_start_time = time.time()
-
-                    if (time.time() - co2_normal_start_time) >= 5:
-                        if previous_state['ventilator'] != 'OFF':
-                            control_device('ventilator', 'OFF', f'CO2 normal for >=5s: {co2:.0f} ppm')
-                            previous_state['ventilator'] = 'OFF'
-                        if previous_state['motor'] != 'close':
-                            control_device('motor', 'close', f'CO2 normal for >=5s: {co2:.0f} ppm')
-                            previous_state['motor'] = 'close'
-
-            # 3. 습도 기반 환기 제어
-            if humidity is not None and humidity > THRESHOLDS['humidity_high']:
-                if previous_state['ventilator'] != 'ON':
-                    control_device('ventilator', 'ON', f'Humidity too high: {humidity:.1f}%')
-                    previous_state['ventilator'] = 'ON'
-
-            # 4. 움직임 감지 조명 제어
-            if motion:
-                if previous_state['light'] != 'ON':
-                    control_device('light', 'ON', 'Motion detected')
-                    previous_state['light'] = 'ON'
-            elif motion_time:
-                try:
-                    last_motion = datetime.fromisoformat(motion_time)
-                    if (datetime.now() - last_motion).total_seconds() > THRESHOLDS['motion_timeout']:
-                        if previous_state['light'] != 'OFF':
-                            control_device('light', 'OFF', f'No motion for {THRESHOLDS["motion_timeout"]}s')
-                            previous_state['light'] = 'OFF'
-                except Exception:
-                    pass
-
-            # 5. 소음 기반 알람 제어
-            if noise is not None:
-                if noise > THRESHOLDS['noise_high']:
-                    if previous_state['alarm'] != 'ON':
-                        control_device('alarm', 'ON', f'Noise level too high: {noise:.0f} dB')
-                        previous_state['alarm'] = 'ON'
-                else:
-                    if previous_state['alarm'] != 'OFF':
-                        control_device('alarm', 'OFF', f'Noise level normal: {noise:.0f} dB')
-                        previous_state['alarm'] = 'OFF'
-
-            # 6. LED 상태 결정 로직 (우선순위 기반)
-            desired_led_color = 'OFF'
-            led_reason = 'All systems normal'
-            
-            if temp is not None:
-                if temp > THRESHOLDS['temp_high']:
-                    desired_led_color = 'BLUE'
-                    led_reason = f'Temperature too high: {temp:.1f}°C'
-                elif temp < THRESHOLDS['temp_low']:
-                    desired_led_color = 'RED'
-                    led_reason = f'Temperature too low: {temp:.1f}°C'
-                elif noise is not None and noise > THRESHOLDS['noise_high']:
-                    desired_led_color = 'GREEN'
-                    led_reason = f'Noise level too high: {noise:.0f} dB'
-            
-            if previous_state['led'] != desired_led_color:
-                control_led(desired_led_color, led_reason)
-                previous_state['led'] = desired_led_color
-
-        except Exception as e:
-            print(f"[DECISION ERROR] {e}", flush=True)
-            import traceback
-            traceback.print_exc()
-        
-        time.sleep(5)
+            kind, data = normalize_reading(reading)
+            room = rooms.get(data.get('room') or default_room)
+            parsed.append((reading_time(data), room, kind, data))
+        except (BatchError, TypeError, ValueError, KeyError, IndexError) as e:
+            errors.append({'index': index, 'error': str(e)})
+            READINGS_REJECTED.inc('batch', 'invalid')
+
+    # 측정 시각 순서대로 반영해 최신 값이 올바르게 남도록 한다
+    parsed.sort(key=lambda item: item[0])
+    rows = []
+    updates = []
+    counts = {}
+    for ts, room, kind, data in parsed:
+        try:
+            fields, reading_rows = INGESTORS[kind](room, data, ts)
+            room.validate(fields)
+        except (TypeError, ValueError) as e:
+            errors.append({'type': kind, 'ts': ts, 'error': str(e)})
+            READINGS_REJECTED.inc(kind, 'invalid')
+            continue
+        rows.extend(reading_rows)
+        updates.append((room, fields, ts))
+        counts[room.id, kind] = counts.get((room.id, kind), 0) + 1
+
+    # 큐에 못 넣으면 아무것도 반영하지 않는다 - 업링크가 재전송해도 두 번 적용되지 않도록
+    if not db_writer.submit_many(rows, block=block):
+        READINGS_REJECTED.inc('batch', 'queue_full', amount=len(readings))
+        return {'status': 'error', 'message': 'Ingest queue full'}, 503
+    for room, fields, ts in updates:
+        room.update_latest(fields, ts)
+
+    for (room_id, kind), count in counts.items():
+        READINGS.inc(room_id, kind, amount=count)
+    accepted = len(readings) - len(errors)
+    log.debug('batch', f"Accepted {accepted}/{len(readings)} readings", room=default_room)
+    return {
+        'status': 'success',
+        'accepted': accepted,
+        'rejected': len(errors),
+        'errors': errors[:20],
+    }, 200
+
+
 
 @app.route('/thresholds', methods=['GET', 'POST'])
 def manage_thresholds():
+    """방별 임계값 조회/변경 (?room=, 기본 방 / ?device=이면 그 장치 단계)
+
+    POST 본문은 {이름: 값} (null이면 그 단계의 덮어쓰기 해제). ?version=을 주면 현재 설정 버전이
+    그 번호일 때만 바꾼다 (아니면 409).
+    """
+    room = request_room()
+    device = request.args.get('device')
+    if request.method == 'POST':
+        expected = request.args.get('version', type=int)
+        room.update_thresholds(request.get_json(silent=True), device=device, expected=expected)
+    snapshot = room.threshold_snapshot()
+    values = dict(snapshot.for_device(device) if device else snapshot.values)
     if request.method == 'GET':
-        return jsonify(THRESHOLDS), 200
-    
-    data = request.json
-    for key, value in data.items():
-        if key in THRESHOLDS:
-            THRESHOLDS[key] = value
-            print(f"[CONFIG] Updated {key} = {value}", flush=True)
-    
-    return jsonify({'status': 'success', 'thresholds': THRESHOLDS}), 200
+        return jsonify(values), 200
+    return jsonify({'status': 'success', 'room': room.id, 'device': device, 'version': snapshot.version,
+                    'thresholds': values}), 200
+
+@app.route('/config/thresholds', methods=['GET', 'POST'])
+def threshold_config():
+    """단계별 덮어쓰기 문서 조회/변경
+
+    POST 본문: {"changes": {"*" | "방" | "방/장치": {이름: 값 또는 null}}, "version": 기대 버전(선택),
+    "note": 메모(선택)} - 여러 단계를 한 버전으로 한꺼번에 바꾼다.
+    """
+    if request.method == 'POST':
+        body = request.get_json(silent=True)
+        if not isinstance(body, dict):
+            raise ThresholdError("Body must be a JSON object with 'changes'")
+        version = thresholds.update(body.get('changes'), note=body.get('note'), expected=body.get('version'))
+        return jsonify({'status': 'success', 'version': version}), 200
+    return jsonify(thresholds.describe()), 200
+
+@app.route('/config/thresholds/history', methods=['GET'])
+def threshold_history():
+    """임계값 변경 이력 (새 버전부터)"""
+    limit = max(1, min(request.args.get('limit', 50, type=int), 1000))
+    return jsonify({'version': thresholds.version, 'history': thresholds.history(limit)}), 200
+
+@app.route('/config/thresholds/rollback', methods=['POST'])
+def threshold_rollback():
+    """{"version": N}의 설정으로 되돌린다 (새 버전으로 기록, 0이면 기본값)"""
+    body = request.get_json(silent=True)
+    version = body.get('version') if isinstance(body, dict) else None
+    if isinstance(version, bool) or not isinstance(version, int):
+        raise ThresholdError("Body must be {\"version\": <number>}")
+    new_version = thresholds.rollback(version, note=body.get('note'))
+    return jsonify({'status': 'success', 'version': new_version, 'rolled_back_to': version}), 200
+
+@app.route('/rooms', methods=['GET'])
+def list_rooms():
+    """등록된 방 목록"""
+    return jsonify({room.id: room.info() for room in rooms}), 200
+
+@app.route('/devices', methods=['GET'])
+def list_devices():
+    """등록된 장치 목록 (?room=, ?kind=)"""
+    return jsonify({'devices': registry.devices(request.args.get('room'), request.args.get('kind')),
+                    'ttl_ms': registry.ttl_ms}), 200
+
+@app.route('/devices/register', methods=['POST'])
+def register_device():
+    """장치 자기 등록 - 액추에이터는 재시작 없이 바로 제어 대상이 된다"""
+    record = registry.register(request.get_json(silent=True))
+    return jsonify({
+        'status': 'success',
+        'id': record.id,
+        'room': record.room,
+        'heartbeat_interval': registry.heartbeat_interval,
+        'ttl_ms': registry.ttl_ms,
+    }), 200
+
+@app.route('/devices/<device_id>/heartbeat', methods=['POST'])
+def device_heartbeat(device_id):
+    """장치 heartbeat - 모르는 장치면 404 (장치가 다시 등록한다)"""
+    if not registry.heartbeat(device_id):
+        return jsonify({'status': 'error', 'message': 'Unknown device, register again'}), 404
+    return jsonify({'status': 'success'}), 200
+
+@app.route('/devices/<device_id>', methods=['DELETE'])
+def deregister_device(device_id):
+    if not registry.remove(device_id):
+        return jsonify({'status': 'error', 'message': 'Unknown device'}), 404
+    return jsonify({'status': 'success'}), 200
+
+@app.route('/rules', methods=['GET'])
+def get_rules():
+    """방에 적용 중인 제어 규칙과 장치별 선택된 규칙"""
+    loader = request_room().rule_loader
+    if loader.ruleset is None:
+        return jsonify({'status': 'error', 'message': 'No rules loaded',
+                        'last_error': loader.stats['last_error']}), 503
+    return jsonify(loader.ruleset.describe()), 200
+
+@app.route('/rules/reload', methods=['POST'])
+def reload_rules():
+    """규칙 파일 즉시 다시 적재 (?room=이 없으면 모든 방)"""
+    targets = [request_room()] if request.args.get('room') else list(rooms)
+    errors = {}
+    for room in targets:
+        if not room.rule_loader.load():
+            errors[room.id] = room.rule_loader.stats['last_error']
+    if errors:
+        return jsonify({'status': 'error', 'message': errors}), 400
+    return jsonify({'status': 'success', 'rooms': [room.id for room in targets]}), 200
 
 @app.route('/health', methods=['GET'])
 def health():
@@ -410,28 +462,51 @@ def health():
 
 @app.route('/logs/<log_type>', methods=['GET'])
 def get_logs(log_type):
-    limit = request.args.get('limit', 50, type=int)
-    
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    
-    if log_type == 'motion':
-        c.execute('SELECT * FROM motion_log ORDER BY timestamp DESC LIMIT ?', (limit,))
-    elif log_type == 'noise':
-        c.execute('SELECT * FROM noise_log ORDER BY timestamp DESC LIMIT ?', (limit,))
-    elif log_type == 'control':
-        c.execute('SELECT * FROM control_log ORDER BY timestamp DESC LIMIT ?', (limit,))
-    elif log_type == 'sensor':
-        c.execute('SELECT * FROM sensor_data ORDER BY timestamp DESC LIMIT ?', (limit,))
-    else:
-        conn.close()
+    logs = query_logs(log_type, request.args.get('limit', 50, type=int), request.args.get('type'),
+                      request.args.get('device'), request.args.get('room'))
+    if logs is None:
         return jsonify({'error': 'Invalid log type'}), 400
-    
-    logs = c.fetchall()
-    conn.close()
-    
     return jsonify({'logs': logs}), 200
 
+def query_logs(log_type, limit, sensor_type=None, device=None, room_id=None):
+    """로그 조회 (모르는 로그 종류면 None), Flask/ASGI 모드 공용
+
+    ?type=<sensor_type> / ?device=<device> / ?room=<room> 필터는 복합 인덱스로 조회
+    (type/device는 방 단위 - room이 없으면 기본 방, 필터가 없으면 모든 방)
+    """
+    if log_type not in LOG_QUERIES:
+        return None
+    if log_type == 'sensor' and sensor_type:
+        return storage.query(SENSOR_LOG_BY_TYPE_QUERY, (sensor_type, room_id or DEFAULT_ROOM, limit))
+    if log_type == 'control' and device:
+        return storage.query(CONTROL_LOG_BY_DEVICE_QUERY, (room_id or DEFAULT_ROOM, device, limit))
+    if room_id:
+        return storage.query(LOG_QUERIES_BY_ROOM[log_type], (room_id, limit))
+    return storage.query(LOG_QUERIES[log_type], (limit,))
+
+@app.route('/history', methods=['GET'])
+def get_history():
+    """센서 이력 다운샘플링 API (버킷별 min/max/avg/count/last, 컬럼 형식)"""
+    sensor_type = request.args.get('sensor_type') or request.args.get('type')
+    if not sensor_type:
+        return jsonify({'error': 'sensor_type is required'}), 400
+
+    try:
+        result = query_history(
+            storage,
+            sensor_type,
+            start=request.args.get('start'),
+            end=request.args.get('end'),
+            bucket=request.args.get('bucket'),
+            room=request.args.get('room', DEFAULT_ROOM),
+        )
+    except HistoryError as e:
+        return jsonify({'error': str(e)}), 400
+
+    if result is None:
+        return jsonify({'error': f'Unknown sensor type: {sensor_type}'}), 404
+    return jsonify(result), 200
+
 @app.route('/')
 def home():
     """메인 페이지 - 대시보드"""
@@ -448,15 +523,70 @@ def send_static(path):
     return send_from_directory('static', path)
 
 
+def json_response(body, etag):
+    response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    # 캐시는 하되 매번 ETag로 재검증하도록
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
 @app.route('/status', methods=['GET'])
 def get_status():
-    """현재 상태 API"""
-    return jsonify({
-        'sensor_data': latest_sensor_data,
-        'thresholds': THRESHOLDS,
-        'actuator_endpoints': ACTUATOR_ENDPOINTS,
-        'timestamp': datetime.now().isoformat()
-    }), 200
+    """방 하나의 현재 상태 API (?room=, 기본 방)
+
+    - If-None-Match가 현재 ETag와 같으면 304
+    - ?since=<version>(&instance=<id>)면 그 버전 이후 바뀐 필드만 changes로 반환
+      (버퍼에서 밀려났거나 서버가 재시작됐으면 전체 문서)
+    """
+    body, etag, status = status_response(request_room(), request.args.get('since'),
+                                         request.args.get('instance'),
+                                         request.headers.get('If-None-Match'))
+    return json_response(body, etag), status
+
+def status_response(room, since, instance, if_none_match):
+    """/status 응답 (body, etag, status) - Flask/ASGI 모드 공용"""
+    status_document = room.status_document
+    version, body, etag = status_document.get()
+    since = parse_last_id(since)
+
+    if since is None or (instance or status_document.instance) != status_document.instance:
+        if etag_matches(if_none_match, etag):
+            return b'', etag, 304
+        return body, etag, 200
+
+    delta_etag = f'{etag}-since-{since}'
+    if since == version or etag_matches(if_none_match, delta_etag):
+        return b'', delta_etag, 304
+    events = room.change_feed.since(since)
+    if events is None:
+        return body, etag, 200
+    delta = {
+        'version': events[-1][0] if events else since,
+        'instance': status_document.instance,
+        'since': since,
+        'changes': merge_changes(events),
+    }
+    return json.dumps(delta, default=str), delta_etag, 200
+
+@app.route('/stream', methods=['GET'])
+def stream():
+    """방 하나의 상태 변경 푸시 (Server-Sent Events, ?room=, 기본 방)
+
+    첫 이벤트는 전체 상태(snapshot), 이후에는 바뀐 필드만(change) 보낸다.
+    재접속 시 브라우저가 보내는 Last-Event-ID(또는 ?since=) 이후 변경부터 이어서 보낸다.
+    """
+    room = request_room()
+    if sum(r.change_feed.clients for r in rooms) >= STREAM_MAX_CLIENTS:
+        return jsonify({'status': 'error', 'message': 'Too many stream clients'}), 503
+    last_id = parse_last_id(request.headers.get('Last-Event-ID', request.args.get('since')))
+    return Response(stream_with_context(sse_stream(room.change_feed, last_id, room.snapshot)),
+                    mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus 형식 지표 (수신량, DB 커밋, 결정 루프, 액추에이터, 큐 길이, HTTP 요청)"""
+    return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
 
 @app.route('/api/info', methods=['GET'])
 def api_info():
@@ -465,7 +595,16 @@ def api_info():
         'service': 'IoT Central Server',
         'status': 'running',
         'sensor_available': SENSOR_AVAILABLE,
-        'version': '1.0.0'
+        'version': '1.0.0',
+        'db_writer': db_writer.stats(),
+        'rollups': rollups.stats,
+        'retention': retention.stats,
+        'rooms': {room.id: room.info() for room in rooms},
+        'registry': dict(registry.stats, devices=len(registry)),
+        'thresholds': dict(thresholds.stats, version=thresholds.version),
+        'actuators': {room.id: room.actuators.stats() for room in rooms},
+        'freshness': {room.id: room.freshness.status() for room in rooms},
+        'filters': {room.id: room.signals.stats() for room in rooms}
     }), 200
 
 if __name__ == '__main__':
@@ -475,17 +614,44 @@ if __name__ == '__main__':
     
     print(f"Sensor Available: {SENSOR_AVAILABLE}", flush=True)
     print(f"Database Path: {DB_PATH}", flush=True)
-    print(f"Thresholds: {THRESHOLDS}", flush=True)
+    print(f"Thresholds: {thresholds.resolve()}", flush=True)
+    print(f"Rooms: {', '.join(rooms.ids())}", flush=True)
     print("=" * 60, flush=True)
     
     init_db()
+
+    db_writer.start()
+    atexit.register(db_writer.stop)
+    # docker stop(SIGTERM) 시에도 큐에 남은 데이터를 기록하도록 정상 종료 경로로 전환
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    print("✓ DB writer thread started", flush=True)
+
+    retention.start()
+    print("✓ Retention job started", flush=True)
+
+    # 저장된 최신 임계값 버전 적용 (다른 워커가 바꾼 버전은 주기적으로 따라간다)
+    thresholds.load()
+    thresholds.start()
+    print(f"✓ Threshold config v{thresholds.version} loaded", flush=True)
     
-    decision_thread = threading.Thread(target=decision_making_loop)
-    decision_thread.start()
-    print("✓ Decision making thread started", flush=True)
+    # 등록돼 있던 장치를 방에 다시 붙인 뒤 시작 (heartbeat가 없으면 TTL 뒤 evict)
+    registry.load(storage, owns=rooms.owns)
+    registry.start()
+    print("✓ Device registry started", flush=True)
+
+    # 방마다 액추에이터 디스패처와 결정 엔진 스레드가 따로 돈다
+    rooms.start()
+    print(f"✓ Decision engines started for {len(rooms)} rooms", flush=True)
         
     print("=" * 60, flush=True)
-    print("        Server ready on http://0.0.0.0:5000", flush=True)
+    print(f"        Server ready on http://0.0.0.0:{SERVER_PORT}", flush=True)
     print("=" * 60, flush=True)
     
-    app.run(host='0.0.0.0', port=5000, debug=False, threaded=True)
+    try:
+        app.run(host='0.0.0.0', port=SERVER_PORT, debug=False, threaded=True)
+    finally:
+        registry.stop()
+        thresholds.stop()
+        rooms.stop()
+        db_writer.stop()
+        storage.close_all()
@@ -1,10 +1,19 @@
 import serial
 import time
-import requests
-from datetime import datetime
+import os
+
+from sensor_uplink import SensorUplink
+from device_agent import DeviceAgent
 
 # 중앙 서버 주소
-CENTRAL_SERVER = 'http://192.168.0.146:5000/sensor/co2'
+CENTRAL_SERVER = os.getenv('CENTRAL_SERVER_URL', 'http://192.168.0.146:5000')
+
+# 측정값은 버퍼에 모아 /sensor/batch로 전송 (서버 장애 시 디스크 스풀 후 재전송)
+uplink = SensorUplink(CENTRAL_SERVER, name='co2')
+
+# 중앙 서버 장치 레지스트리에 등록 + heartbeat
+agent = DeviceAgent('sensor', 'co2', server_url=CENTRAL_SERVER, room=uplink.room,
+                    capabilities={'signals': ['co2_level'], 'interval': 10})
 
 # 시리얼 포트 설정
 SERIAL_PORT = '/dev/serial0'  # 또는 /dev/ttyS0, /dev/ttyAMA0
@@ -82,35 +91,14 @@ def read_co2_sensor():
         return None
 
 def send_data(co2_level):
-    """중앙 서버로 데이터 전송"""
-    try:
-        data = {
-            'co2_level': co2_level,
-            'timestamp': datetime.now().isoformat()
-        }
-        
-        response = requests.post(
-            CENTRAL_SERVER,
-            json=data,
-            timeout=5
-        )
-        
-        if response.status_code == 200:
-            print(f"✓ CO2 data sent: {co2_level} ppm")
-            return True
-        else:
-            print(f"✗ Server error: {response.status_code}")
-            return False
-            
-    except requests.exceptions.ConnectionError:
-        print("✗ Cannot connect to central server")
-        return False
-    except requests.exceptions.Timeout:
-        print("✗ Request timeout")
-        return False
-    except Exception as e:
-        print(f"✗ Error: {e}")
-        return False
+    """측정값을 업링크 버퍼에 추가 (측정 시각 포함)"""
+    uplink.add({
+        'type': 'co2',
+        'co2_level': co2_level,
+        'ts': time.time()
+    })
+    print(f"✓ CO2 data queued: {co2_level} ppm")
+    return True
 
 def main():
     print("=" * 60)
@@ -126,6 +114,9 @@ def main():
         print(f"   {i} seconds remaining...", end='\r')
         time.sleep(10)
     print("\n✓ Warm-up complete!\n")
+
+    uplink.start()
+    agent.start()
     
     while True:
         try:
@@ -133,18 +124,16 @@ def main():
             co2_level = read_co2_sensor()
             
             if co2_level is not None:
-                # 유효성 검사 (400~5000 ppm 범위)
-                if 400 <= co2_level <= 5000:
-                    # 데이터 전송
-                    send_data(co2_level)
-                else:
-                    print(f"⚠️  Invalid CO2 value: {co2_level} ppm (out of range)")
+                # 데이터 전송 (허용 범위 검사는 중앙 서버 필터 설정에서)
+                send_data(co2_level)
             
             # 10초마다 측정
             time.sleep(10)
             
         except KeyboardInterrupt:
             print("\n\n✓ Shutting down...")
+            agent.stop()
+            uplink.stop()
             if ser:
                 ser.close()
             break
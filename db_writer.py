@@ -0,0 +1,211 @@
+import os
+import queue
+import threading
+import time
+
+from metrics import counter, histogram
+
+# 쓰기 지연(write-behind) 설정
+DB_FLUSH_INTERVAL = float(os.getenv('DB_FLUSH_INTERVAL', '1.0'))   # 초
+DB_BATCH_SIZE = int(os.getenv('DB_BATCH_SIZE', '500'))             # 한 트랜잭션 최대 행 수
+DB_QUEUE_SIZE = int(os.getenv('DB_QUEUE_SIZE', '10000'))           # 메모리 큐 최대 길이
+DB_QUEUE_POLICY = os.getenv('DB_QUEUE_POLICY', 'block')            # 'block' 또는 'drop'
+DB_QUEUE_BLOCK_TIMEOUT = float(os.getenv('DB_QUEUE_BLOCK_TIMEOUT', '0.5'))
+
+_STOP = object()
+
+DB_COMMIT_SECONDS = histogram('iot_db_commit_seconds', 'Write-behind batch commit time (one transaction)')
+DB_ROWS = counter('iot_db_rows_total', 'Rows handled by the write-behind writer', ('result',))
+
+
+class WriteBehindWriter:
+    """INSERT 요청을 큐에 모아 단일 스레드에서 executemany로 일괄 기록
+
+    큐 항목은 (sql, params) 목록이며, 한 항목은 항상 하나의 트랜잭션 안에 기록된다.
+    """
+
+    def __init__(self, storage,
+                 flush_interval=DB_FLUSH_INTERVAL,
+                 batch_size=DB_BATCH_SIZE,
+                 max_queue=DB_QUEUE_SIZE,
+                 policy=DB_QUEUE_POLICY,
+                 block_timeout=DB_QUEUE_BLOCK_TIMEOUT):
+        if policy not in ('block', 'drop'):
+            raise ValueError(f"Unknown queue policy: {policy}")
+
+        self.storage = storage
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.policy = policy
+        self.block_timeout = block_timeout
+
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._hooks = []
+        self._thread = None
+        self._stopped = False
+        self._lock = threading.Lock()
+        self._counters = {
+            'enqueued': 0,
+            'written': 0,
+            'dropped': 0,
+            'failed': 0,
+            'flushes': 0,
+            'max_queue_depth': 0,
+            'last_batch_size': 0,
+            'last_flush_ms': 0.0,
+            'max_flush_ms': 0.0,
+            'total_flush_ms': 0.0,
+        }
+
+    def start(self):
+        """기록 스레드 시작"""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name='db-writer', daemon=True)
+        self._thread.start()
+
+    def add_flush_hook(self, hook):
+        """hook(conn, grouped)을 매 배치 트랜잭션 안에서 호출 (grouped: SQL -> 행 목록)"""
+        self._hooks.append(hook)
+
+    def submit(self, sql, params):
+        """INSERT 한 건을 큐에 넣는다. 큐가 가득 차서 버려지면 False"""
+        return self.submit_many([(sql, params)])
+
+    def submit_many(self, rows, block=None):
+        """(sql, params) 목록을 한 항목으로 큐에 넣는다 - 항상 같은 트랜잭션에 기록됨
+
+        block=False면 정책과 관계없이 기다리지 않는다 (이벤트 루프에서 호출할 때).
+        """
+        if self._stopped:
+            return False
+        if not rows:
+            return True
+
+        try:
+            if self.policy == 'block' and block is not False:
+                self._queue.put(rows, timeout=self.block_timeout)
+            else:
+                self._queue.put_nowait(rows)
+        except queue.Full:
+            with self._lock:
+                self._counters['dropped'] += len(rows)
+            DB_ROWS.inc('dropped', amount=len(rows))
+            return False
+
+        depth = self._queue.qsize()
+        with self._lock:
+            self._counters['enqueued'] += len(rows)
+            if depth > self._counters['max_queue_depth']:
+                self._counters['max_queue_depth'] = depth
+        return True
+
+    def stop(self, timeout=10):
+        """남은 큐를 모두 기록한 뒤 스레드 종료"""
+        if self._stopped:
+            return
+        self._stopped = True
+        if self._thread is None:
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+        print(f"✓ DB writer stopped ({self._counters['written']} rows written, "
+              f"{self._counters['dropped']} dropped)", flush=True)
+
+    def stats(self):
+        """큐 깊이와 flush 지연 카운터"""
+        with self._lock:
+            stats = dict(self._counters)
+        flushes = stats.pop('flushes')
+        total_ms = stats.pop('total_flush_ms')
+        stats['flushes'] = flushes
+        stats['avg_flush_ms'] = round(total_ms / flushes, 3) if flushes else 0.0
+        stats['queue_depth'] = self._queue.qsize()
+        stats['queue_capacity'] = self._queue.maxsize
+        return stats
+
+    def _collect(self, first):
+        """첫 항목 이후 batch_size 행 또는 flush_interval까지 모은다 (항목은 쪼개지 않음)"""
+        batch = list(first)
+        stop = False
+        deadline = time.monotonic() + self.flush_interval
+
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is _STOP:
+                stop = True
+                break
+            batch.extend(item)
+
+        return batch, stop
+
+    def _write(self, conn, batch):
+        """같은 SQL끼리 묶어 한 트랜잭션으로 기록"""
+        grouped = {}
+        for sql, params in batch:
+            grouped.setdefault(sql, []).append(params)
+
+        started = time.perf_counter()
+        try:
+            with conn:
+                for sql, rows in grouped.items():
+                    conn.executemany(sql, rows)
+                for hook in self._hooks:
+                    hook(conn, grouped)
+        except Exception as e:
+            with self._lock:
+                self._counters['failed'] += len(batch)
+            DB_ROWS.inc('failed', amount=len(batch))
+            print(f"[DB ERROR] Batch of {len(batch)} rows failed: {e}", flush=True)
+            return
+
+        elapsed = time.perf_counter() - started
+        DB_COMMIT_SECONDS.observe(elapsed)
+        DB_ROWS.inc('written', amount=len(batch))
+        elapsed_ms = elapsed * 1000
+        with self._lock:
+            c = self._counters
+            c['written'] += len(batch)
+            c['flushes'] += 1
+            c['last_batch_size'] = len(batch)
+            c['last_flush_ms'] = round(elapsed_ms, 3)
+            c['total_flush_ms'] += elapsed_ms
+            if elapsed_ms > c['max_flush_ms']:
+                c['max_flush_ms'] = round(elapsed_ms, 3)
+
+    def _run(self):
+        # 기록 전용 연결은 풀과 별도로 스레드가 계속 소유
+        conn = self.storage.connect()
+        try:
+            while True:
+                first = self._queue.get()
+                if first is _STOP:
+                    break
+                batch, stop = self._collect(first)
+                self._write(conn, batch)
+                if stop:
+                    break
+
+            # 종료 시 남은 항목 모두 기록
+            batch = []
+            while True:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    continue
+                batch.extend(item)
+                if len(batch) >= self.batch_size:
+                    self._write(conn, batch)
+                    batch = []
+            if batch:
+                self._write(conn, batch)
+        finally:
+            conn.close()
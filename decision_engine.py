@@ -0,0 +1,185 @@
+import heapq
+import itertools
+import threading
+import time
+import traceback
+
+from metrics import counter, histogram
+
+DECISION_ITERATION_SECONDS = histogram('iot_decision_iteration_seconds',
+                                       'Decision loop iteration time (pending rules evaluated)', ('engine',))
+DECISION_EVALUATIONS = counter('iot_decision_evaluations_total', 'Rule evaluations', ('engine',))
+
+
+class DecisionEngine:
+    """센서 변경 이벤트로 구동되는 결정 엔진
+
+    규칙은 자신이 의존하는 신호(signal) 이름과 함께 등록하고, 수신 핸들러가 값이 바뀐
+    신호를 notify()로 알리면 해당 신호에 의존하는 규칙만 전용 스레드에서 실행된다.
+    CO2 지연이나 움직임 타임아웃처럼 시간에 의존하는 조건은 규칙이 call_at()으로
+    재평가 시각을 예약한다.
+    """
+
+    def __init__(self, clock=time.time, name='decision-engine'):
+        self.clock = clock
+        self.name = name
+        self._rules = []               # 등록 순서 = 평가 순서
+        self._by_signal = {}           # signal -> 규칙 목록
+        self._pending = set()          # 재평가가 필요한 규칙
+        self._timers = []              # (시각, 순번, 규칙) 힙
+        self._deadlines = {}           # 규칙 -> 가장 최근에 예약된 시각
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._thread = None
+        self.stats = {'events': 0, 'evaluations': 0, 'timer_fires': 0, 'last_latency_ms': 0.0}
+        self._event_times = {}
+
+    def register(self, rule, signals):
+        """규칙 등록 - rule(engine)은 signals 중 하나가 바뀔 때 실행"""
+        self._rules.append(rule)
+        for signal in signals:
+            self._by_signal.setdefault(signal, []).append(rule)
+
+    def replace(self, registrations):
+        """등록된 규칙을 [(rule, signals), ...]로 통째로 교체 (규칙 파일 재적재)
+
+        이전 규칙의 예약은 버리고, 시작된 뒤라면 새 규칙 전체를 한 번 평가한다.
+        """
+        with self._cond:
+            self._rules = []
+            self._by_signal = {}
+            for rule, signals in registrations:
+                self.register(rule, signals)
+            self._timers = []
+            self._deadlines = {}
+            self._event_times = {}
+            self._pending = set(self._rules) if self._thread is not None else set()
+            self._cond.notify()
+
+    def notify(self, *signals):
+        """값이 바뀐 신호 알림 (수신 스레드에서 호출, 즉시 반환)"""
+        now = time.perf_counter()
+        with self._cond:
+            for signal in signals:
+                for rule in self._by_signal.get(signal, ()):
+                    self._pending.add(rule)
+                    self._event_times.setdefault(rule, now)
+            self.stats['events'] += 1
+            self._cond.notify()
+
+    def notify_all(self):
+        """모든 규칙 재평가 (임계값 변경 등)"""
+        with self._cond:
+            self._pending.update(self._rules)
+            self._cond.notify()
+
+    def call_at(self, when, rule):
+        """when(clock 기준 시각)에 rule 재평가 예약 - 규칙당 가장 최근 예약만 유효"""
+        with self._cond:
+            if self._deadlines.get(rule) == when:
+                return
+            self._deadlines[rule] = when
+            heapq.heappush(self._timers, (when, next(self._seq), rule))
+            self._cond.notify()
+
+    def cancel(self, rule):
+        """rule의 예약된 재평가 취소"""
+        with self._cond:
+            self._deadlines.pop(rule, None)
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._pending.update(self._rules)   # 시작 시 한 번 전체 평가
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+
+    def _due_timers(self, now):
+        """만료된 타이머의 규칙을 꺼낸다 (취소/재예약된 항목은 무시)"""
+        fired = []
+        while self._timers and self._timers[0][0] <= now:
+            when, _, rule = heapq.heappop(self._timers)
+            if self._deadlines.get(rule) == when:
+                del self._deadlines[rule]
+                fired.append(rule)
+        return fired
+
+    def _wait_timeout(self, now):
+        while self._timers and self._deadlines.get(self._timers[0][2]) != self._timers[0][0]:
+            heapq.heappop(self._timers)    # 무효가 된 예약 정리
+        if not self._timers:
+            return None
+        return max(0.0, self._timers[0][0] - now)
+
+    def next_deadline(self):
+        """가장 이른 유효 예약 시각 (clock 기준) 또는 None"""
+        with self._cond:
+            while self._timers and self._deadlines.get(self._timers[0][2]) != self._timers[0][0]:
+                heapq.heappop(self._timers)
+            return self._timers[0][0] if self._timers else None
+
+    def run_pending(self):
+        """만료된 타이머와 대기 중인 규칙을 호출한 스레드에서 바로 평가 (start() 없이 쓰는 재생/시뮬레이션용)
+
+        평가한 규칙 수 반환. 규칙이 notify/call_at으로 새 평가를 만들면 없어질 때까지 반복한다.
+        """
+        total = 0
+        while True:
+            with self._cond:
+                fired = self._due_timers(self.clock())
+                if fired:
+                    self._pending.update(fired)
+                    self.stats['timer_fires'] += len(fired)
+                if not self._pending:
+                    return total
+                pending, self._pending = self._pending, set()
+                event_times, self._event_times = self._event_times, {}
+                rules = self._rules
+            total += self._evaluate(rules, pending, event_times)
+
+    def _evaluate(self, rules, pending, event_times):
+        """등록 순서대로 실행해 같은 이벤트에 대한 제어 명령 순서를 일정하게 유지"""
+        iteration_started = time.perf_counter()
+        evaluated = 0
+        for rule in rules:
+            if rule not in pending:
+                continue
+            try:
+                rule(self)
+            except Exception as e:
+                print(f"[DECISION ERROR] {e}", flush=True)
+                traceback.print_exc()
+            self.stats['evaluations'] += 1
+            evaluated += 1
+            started = event_times.get(rule)
+            if started is not None:
+                self.stats['last_latency_ms'] = round((time.perf_counter() - started) * 1000, 3)
+        DECISION_ITERATION_SECONDS.observe(time.perf_counter() - iteration_started, self.name)
+        DECISION_EVALUATIONS.inc(self.name, amount=evaluated)
+        return evaluated
+
+    def _run(self):
+        print("[DECISION] Event-driven decision engine started", flush=True)
+        while True:
+            with self._cond:
+                while not self._stopped:
+                    now = self.clock()
+                    fired = self._due_timers(now)
+                    if fired:
+                        self._pending.update(fired)
+                        self.stats['timer_fires'] += len(fired)
+                    if self._pending:
+                        break
+                    self._cond.wait(self._wait_timeout(now))
+                if self._stopped:
+                    return
+                pending, self._pending = self._pending, set()
+                event_times, self._event_times = self._event_times, {}
+                rules = self._rules
+            self._evaluate(rules, pending, event_times)
@@ -0,0 +1,109 @@
+import os
+import socket
+import threading
+
+import requests
+
+# 장치(컨트롤러/센서 에이전트)가 스스로 중앙 서버 레지스트리에 등록하고 heartbeat를 보낸다
+CENTRAL_SERVER_URL = os.getenv('CENTRAL_SERVER_URL', 'http://iot-central-server:5000')
+DEVICE_ROOM = os.getenv('DEVICE_ROOM') or None                                # 설치된 방 (없으면 기본 방)
+DEVICE_HEARTBEAT_INTERVAL = float(os.getenv('DEVICE_HEARTBEAT_INTERVAL', '10'))  # 서버 응답 값이 우선
+AGENT_TIMEOUT = float(os.getenv('AGENT_TIMEOUT', '3'))
+AGENT_BACKOFF_MAX = float(os.getenv('AGENT_BACKOFF_MAX', '60'))
+
+
+class AgentError(requests.exceptions.RequestException):
+    """서버가 응답은 했지만 등록/heartbeat를 받아들이지 않음 (이유는 이미 출력됨, 백오프 대상)"""
+
+
+class DeviceAgent:
+    """장치 자기 등록 + 주기적 heartbeat (백그라운드 스레드)
+
+    서버가 장치를 모르면(404 - 서버 DB 초기화, 만료로 evict 등) 다시 등록하고, 그 밖의 2xx가 아닌
+    응답은 연결 실패와 같이 지수 백오프 후 다시 등록한다.
+    중앙 서버에 닿지 않아도 장치 자체 동작에는 영향이 없고, 지수 백오프로 재시도만 한다.
+    """
+
+    def __init__(self, kind, device, capabilities=None, port=None, url=None, device_id=None,
+                 room=DEVICE_ROOM, server_url=CENTRAL_SERVER_URL, interval=DEVICE_HEARTBEAT_INTERVAL):
+        host = socket.gethostname()
+        self.kind = kind
+        self.device = device
+        self.capabilities = capabilities or {}
+        self.device_id = device_id or os.getenv('DEVICE_ID') or f'{device}-{host}'
+        # 중앙 서버가 이 장치에 제어 명령을 보낼 주소 (컨테이너라면 DEVICE_URL에 서비스 이름으로 지정)
+        self.url = url or os.getenv('DEVICE_URL') or (f'http://{host}:{port}/control' if port else None)
+        self.room = room
+        self.server_url = server_url.rstrip('/')
+        self.worker_url = self.server_url      # 다중 워커 서버면 방을 맡은 워커 (등록 리다이렉트로 알게 됨)
+        self.interval = interval
+        self.registered = False
+        self.session = requests.Session()
+        self._failures = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='device-agent', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        """heartbeat 중단 후 등록 해제 (실패해도 서버가 만료 시간 뒤에 정리한다)"""
+        self._stop.set()
+        if self.registered:
+            try:
+                self.session.delete(f'{self.worker_url}/devices/{self.device_id}', timeout=AGENT_TIMEOUT)
+            except requests.exceptions.RequestException:
+                pass
+
+    def _run(self):
+        delay = 0
+        while not self._stop.wait(delay):
+            try:
+                if not self.registered:
+                    self._register()
+                if self.registered and not self._heartbeat():
+                    continue        # 서버가 장치를 잊었다 - 바로 다시 등록
+                self._failures = 0
+                delay = self.interval
+            except requests.exceptions.RequestException as e:
+                self.worker_url = self.server_url
+                self._failures += 1
+                delay = min(self.interval * 2 ** self._failures, AGENT_BACKOFF_MAX)
+                if self._failures == 1 and not isinstance(e, AgentError):
+                    print(f"[AGENT] Cannot reach central server: {e.__class__.__name__}", flush=True)
+
+    def _register(self):
+        response = self.session.post(f'{self.server_url}/devices/register', json={
+            'id': self.device_id,
+            'kind': self.kind,
+            'device': self.device,
+            'room': self.room,
+            'url': self.url,
+            'capabilities': self.capabilities,
+        }, timeout=AGENT_TIMEOUT)
+        if response.status_code >= 400:
+            # 설정 오류는 재시도해도 같으므로 오래 기다렸다가 다시 시도
+            print(f"[AGENT] Registration rejected ({response.status_code}): {response.text[:200]}", flush=True)
+            raise AgentError('registration rejected')
+        self.interval = response.json().get('heartbeat_interval', self.interval)
+        if response.history:
+            self.worker_url = response.url.rsplit('/devices/register', 1)[0]
+        self.registered = True
+        print(f"[AGENT] Registered {self.device_id} ({self.kind}/{self.device})", flush=True)
+
+    def _heartbeat(self):
+        response = self.session.post(f'{self.worker_url}/devices/{self.device_id}/heartbeat',
+                                     timeout=AGENT_TIMEOUT)
+        if response.status_code == 404:
+            self.registered = False
+            return False
+        if not 200 <= response.status_code < 300:
+            # 서버 오류 등 - 백오프 후 등록부터 다시 (같은 id 재등록은 정보 갱신이라 안전)
+            self.registered = False
+            if self._failures == 0:
+                print(f"[AGENT] Heartbeat failed ({response.status_code}): {response.text[:200]}", flush=True)
+            raise AgentError(f'heartbeat failed ({response.status_code})')
+        return True
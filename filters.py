@@ -0,0 +1,165 @@
+import json
+import os
+import threading
+from bisect import bisect_left, insort
+from collections import deque
+
+FILTERS_PATH = os.getenv('FILTERS_PATH', 'config/filters.json')
+
+# 변화율 이상치를 이만큼 연속으로 버리면 실제 급변으로 보고 새 기준으로 받아들인다
+FILTER_REJECT_LIMIT = int(os.getenv('FILTER_REJECT_LIMIT', '3'))
+# 이상치가 서로 일관된 새 수준을 이 시간(초) 이상 유지하면 횟수와 관계없이 급변으로 받아들인다
+FILTER_STEP_CONFIRM = float(os.getenv('FILTER_STEP_CONFIRM', '1.0'))
+
+
+class FilterRejected(ValueError):
+    """허용 범위를 벗어난 측정값"""
+
+
+class SignalFilter:
+    """신호 하나의 스트리밍 필터 (고정 크기 창, 샘플당 정렬 없음)
+
+    범위 검사 -> 변화율 이상치 제거 -> 중앙값 창 -> EMA -> deadband 순서로 처리한다.
+    중앙값 창은 정렬된 사본을 bisect로 한 값씩 넣고 빼서 유지한다 (샘플마다 다시 정렬하지 않음).
+
+    변화율을 넘는 값은 바로 버리지 않고 급변 후보로 본다. 후보들이 서로 일관된 새 수준을
+    step_confirm초 이상 유지하거나 reject_limit번 연속되면 실제 급변으로 보고 창과 EMA를 새 값으로
+    다시 맞춰(re-anchor) 출력이 곧바로 새 수준이 된다. 급변이 출력에 반영되는 지연은
+    min(step_confirm초 이후 첫 샘플, reject_limit 샘플)이고, 한 샘플짜리 튐은 반영되지 않는다.
+
+    spec 키 (모두 선택):
+      min / max   허용 범위, 벗어나면 FilterRejected (기록하지 않음)
+      max_rate    초당 최대 변화량, 넘으면 이상치로 필터 입력에서 제외
+      median      중앙값 창 크기 (샘플 수)
+      ema         EMA 가중치 (0~1, 클수록 최근 값 비중이 큼)
+      deadband    출력이 이만큼 이상 바뀔 때만 새 값 반영
+    """
+
+    def __init__(self, name, spec, reject_limit=FILTER_REJECT_LIMIT, step_confirm=FILTER_STEP_CONFIRM):
+        self.name = name
+        self.min = spec.get('min')
+        self.max = spec.get('max')
+        self.max_rate = spec.get('max_rate')
+        self.alpha = spec.get('ema')
+        self.deadband = float(spec.get('deadband', 0))
+        self.reject_limit = reject_limit
+        self.step_confirm_ms = step_confirm * 1000
+        window = int(spec.get('median', 0))
+        self._window = deque(maxlen=window) if window > 1 else None
+        self._sorted = []           # _window와 같은 값들의 정렬된 사본
+        self._ema = None
+        self._last_value = None
+        self._last_ts = None
+        self._rejects = 0
+        self._step_ts = None        # 급변 후보가 처음 나온 시각
+        self._step_value = None     # 마지막 급변 후보 값
+        self._step_last_ts = None
+        self.output = None
+        self.stats = {'samples': 0, 'out_of_range': 0, 'outliers': 0, 'steps': 0}
+
+    def check_range(self, value):
+        if (self.min is not None and value < self.min) or (self.max is not None and value > self.max):
+            self.stats['out_of_range'] += 1
+            raise FilterRejected(f"{self.name}={value} is outside [{self.min}, {self.max}]")
+
+    def process(self, value, ts):
+        """샘플 하나 처리 - 출력이 바뀌었으면 새 출력, 아니면 None"""
+        if self._last_ts is not None and ts <= self._last_ts:
+            return None         # 재전송된 과거 값은 필터 상태에 넣지 않는다
+        self.stats['samples'] += 1
+
+        step = False
+        if self.max_rate is not None and self._last_value is not None and self._exceeds(value, ts):
+            step = self._confirm_step(value, ts)
+            if not step:
+                self._rejects += 1
+                self.stats['outliers'] += 1
+                return None
+        self._rejects = 0
+        self._step_ts = None
+        self._last_value = value
+        self._last_ts = ts
+
+        if step:
+            # 실제 급변 - 예전 수준의 값이 남은 창/EMA가 출력을 붙잡지 않도록 새 값으로 다시 시작
+            self.stats['steps'] += 1
+            if self._window is not None:
+                self._window.clear()
+                self._sorted.clear()
+            self._ema = None
+
+        x = value
+        if self._window is not None:
+            if len(self._window) == self._window.maxlen:
+                del self._sorted[bisect_left(self._sorted, self._window[0])]
+            self._window.append(value)
+            insort(self._sorted, value)
+            x = self._sorted[len(self._sorted) // 2]
+        if self.alpha is not None:
+            self._ema = x if self._ema is None else self.alpha * x + (1 - self.alpha) * self._ema
+            x = self._ema
+
+        x = round(x, 3)
+        if self.output is None or abs(x - self.output) >= self.deadband:
+            if x != self.output:
+                self.output = x
+                return x
+        return None
+
+    def _exceeds(self, value, ts):
+        """마지막으로 받아들인 값 대비 변화율이 max_rate를 넘는지"""
+        dt = max((ts - self._last_ts) / 1000, 0.001)
+        return abs(value - self._last_value) / dt > self.max_rate
+
+    def _confirm_step(self, value, ts):
+        """변화율을 넘은 값이 실제 급변인지 - 후보 상태를 갱신하고 받아들일지 반환"""
+        consistent = self._step_ts is not None and (
+            abs(value - self._step_value) / max((ts - self._step_last_ts) / 1000, 0.001) <= self.max_rate)
+        if not consistent:
+            self._step_ts = ts          # 새 후보 (앞 후보와 다른 수준이면 처음부터)
+        self._step_value = value
+        self._step_last_ts = ts
+        held = consistent and ts - self._step_ts >= self.step_confirm_ms
+        return held or self._rejects >= self.reject_limit
+
+
+class SignalPipeline:
+    """필드별 필터 모음 - 설정이 없는 필드는 그대로 통과"""
+
+    def __init__(self, config):
+        self.filters = {name: SignalFilter(name, spec) for name, spec in config.items()
+                        if not name.startswith('_')}
+        self._lock = threading.Lock()
+
+    def validate(self, fields):
+        """허용 범위 검사 - 하나라도 벗어나면 FilterRejected"""
+        for key, value in fields.items():
+            signal_filter = self.filters.get(key)
+            if signal_filter is not None and value is not None:
+                signal_filter.check_range(value)
+
+    def process(self, fields, ts):
+        """원시 값 -> 반영할 필터링된 값 (출력이 바뀐 필드와 필터가 없는 필드)"""
+        filtered = {}
+        with self._lock:
+            for key, value in fields.items():
+                signal_filter = self.filters.get(key)
+                if signal_filter is None or value is None:
+                    filtered[key] = value
+                    continue
+                output = signal_filter.process(value, ts)
+                if output is not None:
+                    filtered[key] = output
+        return filtered
+
+    def stats(self):
+        return {name: dict(f.stats, output=f.output) for name, f in self.filters.items()}
+
+
+def load_filters(path=FILTERS_PATH):
+    """필터 설정 파일 읽기 - 없으면 필터 없이 통과"""
+    if not os.path.exists(path):
+        print(f"[FILTER] {path} not found, signals are not filtered", flush=True)
+        return SignalPipeline({})
+    with open(path, encoding='utf-8') as f:
+        return SignalPipeline(json.load(f))
@@ -0,0 +1,113 @@
+import os
+import threading
+
+from storage import now_ms
+
+# 도착 간격 EWMA의 FRESHNESS_FACTOR배 동안 새 측정값이 없으면 stale
+FRESHNESS_FACTOR = float(os.getenv('FRESHNESS_FACTOR', '3'))
+FRESHNESS_ALPHA = float(os.getenv('FRESHNESS_ALPHA', '0.2'))                        # EWMA 가중치
+FRESHNESS_MIN_MS = int(float(os.getenv('FRESHNESS_MIN', '15')) * 1000)            # stale 판정 최소 시간
+FRESHNESS_DEFAULT_MS = int(float(os.getenv('FRESHNESS_DEFAULT_INTERVAL', '60')) * 1000)  # 간격을 모를 때
+FRESHNESS_MAX_INTERVAL_MS = int(float(os.getenv('FRESHNESS_MAX_INTERVAL', '600')) * 1000)  # 장애 구간 반영 상한
+FRESHNESS_CHECK_INTERVAL = float(os.getenv('FRESHNESS_CHECK_INTERVAL', '1'))      # stale 전환 확인 주기 (초, RoomRegistry)
+
+# 측정 주기를 추적할 필드
+FRESHNESS_FIELDS = os.getenv(
+    'FRESHNESS_FIELDS', 'temperature,humidity,pressure,co2_level,noise_level,motion_detected').split(',')
+
+
+class FreshnessTracker:
+    """필드별 마지막 측정 시각과 도착 간격(EWMA)으로 값이 오래됐는지 판단
+
+    observe()는 수신 경로에서 필드당 O(1)로 갱신하고, check()는 주기적으로 stale 전환을 찾는다.
+    아직 한 번도 들어오지 않은 필드는 stale로 보지 않는다 (설치되지 않은 센서).
+    """
+
+    def __init__(self, fields=FRESHNESS_FIELDS, factor=FRESHNESS_FACTOR, alpha=FRESHNESS_ALPHA,
+                 min_ms=FRESHNESS_MIN_MS, default_ms=FRESHNESS_DEFAULT_MS,
+                 max_interval_ms=FRESHNESS_MAX_INTERVAL_MS):
+        self.fields = set(fields)
+        self.factor = factor
+        self.alpha = alpha
+        self.min_ms = min_ms
+        self.default_ms = default_ms
+        self.max_interval_ms = max_interval_ms
+        self._last_seen = {}
+        self._interval = {}         # 필드 -> EWMA 도착 간격 (ms)
+        self._stale = {}            # 필드 -> 마지막으로 알린 stale 여부
+        self._lock = threading.Lock()
+
+    def observe(self, fields, ts):
+        """측정값 도착 기록 - stale에서 fresh로 돌아온 필드 목록 반환"""
+        recovered = []
+        with self._lock:
+            for key in fields:
+                if key not in self.fields:
+                    continue
+                last = self._last_seen.get(key)
+                if last is not None and ts <= last:
+                    continue        # 재전송된 과거 값
+                if last is not None:
+                    interval = min(ts - last, self.max_interval_ms)
+                    previous = self._interval.get(key)
+                    self._interval[key] = interval if previous is None else (
+                        self.alpha * interval + (1 - self.alpha) * previous)
+                self._last_seen[key] = ts
+                if self._stale.get(key):
+                    self._stale[key] = False
+                    recovered.append(key)
+        return recovered
+
+    def limit_ms(self, key):
+        """key가 stale로 판정되기까지의 시간"""
+        return max(self.min_ms, self.factor * self._interval.get(key, self.default_ms))
+
+    def is_stale(self, key, now=None):
+        last = self._last_seen.get(key)
+        if last is None:
+            return False
+        now = now_ms() if now is None else now
+        return now - last > self.limit_ms(key)
+
+    def check(self, now=None):
+        """stale로 새로 바뀐 필드 목록"""
+        now = now_ms() if now is None else now
+        expired = []
+        with self._lock:
+            for key in self._last_seen:
+                if not self._stale.get(key) and self.is_stale(key, now):
+                    self._stale[key] = True
+                    expired.append(key)
+        return expired
+
+    def next_expiry(self):
+        """아직 stale이 아닌 필드 중 가장 먼저 stale이 되는 시각 (epoch ms) 또는 None"""
+        with self._lock:
+            times = [last + self.limit_ms(key) for key, last in self._last_seen.items()
+                     if not self._stale.get(key)]
+        return min(times) if times else None
+
+    def flagged(self, key):
+        """마지막 check/observe 기준 stale 여부 (규칙 평가용, 시계를 읽지 않는다)"""
+        return bool(self._stale.get(key))
+
+    def flags(self):
+        """필드 -> stale 여부 (마지막 check/observe 기준)"""
+        with self._lock:
+            return {key: bool(self._stale.get(key)) for key in self._last_seen}
+
+    def status(self, now=None):
+        now = now_ms() if now is None else now
+        with self._lock:
+            seen = list(self._last_seen.items())
+        return {
+            key: {
+                'last_seen': last,
+                'age_ms': now - last,
+                'expected_interval_ms': round(self._interval[key]) if key in self._interval else None,
+                'stale_after_ms': round(self.limit_ms(key)),
+                'stale': bool(self._stale.get(key)),
+            }
+            for key, last in seen
+        }
+
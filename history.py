@@ -0,0 +1,133 @@
+from storage import now_ms, to_epoch_ms, ROLLUP_RESOLUTIONS, DEFAULT_ROOM
+from rollups import ROLLUP_TABLES
+
+# 버킷 크기를 지정하지 않으면 이 정도 포인트 수가 되도록 자동 선택
+HISTORY_TARGET_POINTS = 300
+HISTORY_MAX_POINTS = 5000
+HISTORY_DEFAULT_RANGE_MS = 24 * 3600 * 1000
+
+# 자동 선택 시 사용하는 버킷 크기 (초)
+NICE_BUCKETS = [1, 5, 10, 30, 60, 300, 600, 900, 1800, 3600,
+                3 * 3600, 6 * 3600, 12 * 3600, 86400, 7 * 86400]
+
+_UNIT_SECONDS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 7 * 86400}
+
+# 버킷별 min/max/avg/count - (sensor_type_id, ts, value) 커버링 인덱스 범위 스캔
+HISTORY_QUERY = '''SELECT ts / :bucket_ms, MIN(value), MAX(value), AVG(value), COUNT(*)
+                   FROM sensor_data
+                   WHERE sensor_type_id = :type_id AND ts >= :start AND ts < :end
+                   GROUP BY ts / :bucket_ms ORDER BY 1'''
+
+# 버킷별 마지막 값 - 집계 함수가 MAX(ts) 하나뿐이면 SQLite는 그 행의 value를 돌려준다
+HISTORY_LAST_QUERY = '''SELECT ts / :bucket_ms, value, MAX(ts)
+                        FROM sensor_data
+                        WHERE sensor_type_id = :type_id AND ts >= :start AND ts < :end
+                        GROUP BY ts / :bucket_ms'''
+
+# rollup 테이블에서 같은 집계 - 버킷 크기가 rollup 해상도의 배수일 때 사용
+ROLLUP_HISTORY_QUERY = '''SELECT bucket / :bucket_ms, MIN(min), MAX(max), SUM(sum) / SUM(count), SUM(count)
+                          FROM {table}
+                          WHERE sensor_type_id = :type_id AND bucket >= :start AND bucket < :end
+                          GROUP BY bucket / :bucket_ms ORDER BY 1'''
+
+ROLLUP_LAST_QUERY = '''SELECT bucket / :bucket_ms, last_value, MAX(last_ts)
+                       FROM {table}
+                       WHERE sensor_type_id = :type_id AND bucket >= :start AND bucket < :end
+                       GROUP BY bucket / :bucket_ms'''
+
+SENSOR_TYPE_QUERY = 'SELECT id, unit FROM sensor_types WHERE room = ? AND name = ?'
+
+
+class HistoryError(ValueError):
+    """잘못된 /history 요청 파라미터"""
+
+
+def parse_time(value, default):
+    """epoch(초/밀리초) 또는 ISO 8601 문자열 -> epoch 밀리초"""
+    try:
+        return to_epoch_ms(value, default)
+    except ValueError as e:
+        raise HistoryError(str(e))
+
+
+def parse_bucket(value):
+    """'60', '5m', '1h', '1d' 형식 -> 초"""
+    text = str(value).strip().lower()
+    try:
+        if text and text[-1] in _UNIT_SECONDS:
+            seconds = float(text[:-1]) * _UNIT_SECONDS[text[-1]]
+        else:
+            seconds = float(text)
+    except ValueError:
+        raise HistoryError(f"Invalid bucket: {value}")
+    if seconds < 1:
+        raise HistoryError("Bucket must be at least 1 second")
+    return int(seconds)
+
+
+def auto_bucket(start_ms, end_ms, target=HISTORY_TARGET_POINTS):
+    """구간 길이에 맞는 가장 작은 버킷 크기(초) 선택"""
+    span_s = max(1, (end_ms - start_ms) // 1000)
+    for bucket in NICE_BUCKETS:
+        if span_s / bucket <= target:
+            return bucket
+    return NICE_BUCKETS[-1]
+
+
+def pick_source(bucket_ms):
+    """버킷 크기를 나누어 떨어지게 하는 가장 큰 rollup 해상도, 없으면 원시 데이터"""
+    for name, resolution_ms in reversed(ROLLUP_RESOLUTIONS):
+        if bucket_ms % resolution_ms == 0:
+            return name
+    return None
+
+
+def query_history(storage, sensor_type, start=None, end=None, bucket=None, room=DEFAULT_ROOM):
+    """방 하나의 센서 이력을 버킷별로 집계해 컬럼 형식 dict로 반환"""
+    end_ms = parse_time(end, now_ms())
+    start_ms = parse_time(start, end_ms - HISTORY_DEFAULT_RANGE_MS)
+    if start_ms >= end_ms:
+        raise HistoryError("start must be before end")
+
+    bucket_s = parse_bucket(bucket) if bucket else auto_bucket(start_ms, end_ms)
+    bucket_ms = bucket_s * 1000
+    if (end_ms - start_ms) / bucket_ms > HISTORY_MAX_POINTS:
+        raise HistoryError(f"Too many buckets (max {HISTORY_MAX_POINTS}), use a larger bucket")
+
+    # 버킷 경계에 맞춰 구간을 넓힌다 (첫/마지막 버킷도 온전한 집계가 되도록)
+    start_ms -= start_ms % bucket_ms
+    end_ms += -end_ms % bucket_ms
+
+    rows = storage.query(SENSOR_TYPE_QUERY, (room, sensor_type))
+    if not rows:
+        return None
+    type_id, unit = rows[0]
+
+    result = {
+        'sensor_type': sensor_type,
+        'room': room,
+        'unit': unit,
+        'start': start_ms,
+        'end': end_ms,
+        'bucket': bucket_s,
+        'source': 'raw',
+        't': [], 'min': [], 'max': [], 'avg': [], 'count': [], 'last': [],
+    }
+    params = {'bucket_ms': bucket_ms, 'type_id': type_id, 'start': start_ms, 'end': end_ms}
+    aggregate_sql, last_sql = HISTORY_QUERY, HISTORY_LAST_QUERY
+    rollup = pick_source(bucket_ms)
+    if rollup is not None:
+        table = ROLLUP_TABLES[rollup]
+        aggregate_sql = ROLLUP_HISTORY_QUERY.format(table=table)
+        last_sql = ROLLUP_LAST_QUERY.format(table=table)
+        result['source'] = f'rollup_{rollup}'
+
+    last = {k: value for k, value, _ in storage.query(last_sql, params)}
+    for k, mn, mx, avg, count in storage.query(aggregate_sql, params):
+        result['t'].append(k * bucket_ms)
+        result['min'].append(mn)
+        result['max'].append(mx)
+        result['avg'].append(round(avg, 3))
+        result['count'].append(count)
+        result['last'].append(last.get(k))
+    return result
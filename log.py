@@ -0,0 +1,107 @@
+import json
+import os
+import sys
+import threading
+import time
+
+# 수준별 + 이벤트별 속도 제한 구조화 로그 (수신/제어 경로에서 콘솔 출력이 병목이 되지 않도록)
+LEVELS = {'DEBUG': 10, 'INFO': 20, 'WARNING': 30, 'ERROR': 40}
+LOG_LEVEL = LEVELS.get(os.getenv('LOG_LEVEL', 'INFO').upper(), 20)
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'text')          # text: [TAG] 메시지 key=value / json: 한 줄 JSON
+LOG_RATE = float(os.getenv('LOG_RATE', '5'))          # 이벤트별 초당 허용 줄 수 (0 = 제한 없음)
+LOG_BURST = float(os.getenv('LOG_BURST', '20'))       # 순간적으로 허용하는 줄 수
+
+_write_lock = threading.Lock()
+
+
+def _field(value):
+    """text 형식 필드 값 - 공백/따옴표/=가 있으면 따옴표로 감싼다"""
+    text = str(value)
+    if not text or any(c in text for c in ' "='):
+        return json.dumps(text, ensure_ascii=False)
+    return text
+
+
+class Logger:
+    """컴포넌트(tag) 하나의 로거
+
+    log.info('control', '...', room=..., device=...)처럼 이벤트 이름과 필드를 따로 받는다.
+    수준이 낮으면 문자열을 만들기 전에 버리고, 이벤트마다 토큰 버킷으로 초당 줄 수를 제한한다.
+    버려진 줄 수는 그 이벤트가 다음에 출력될 때 suppressed=N으로 붙는다.
+    """
+
+    def __init__(self, tag, level=None, rate=LOG_RATE, burst=LOG_BURST, fmt=LOG_FORMAT, stream=None):
+        self.tag = tag
+        self.level = LOG_LEVEL if level is None else level
+        self.rate = rate
+        self.burst = burst
+        self.format = fmt
+        self.stream = stream
+        self._buckets = {}          # 이벤트 -> [토큰, 마지막 시각, 버린 줄 수]
+        self._lock = threading.Lock()
+
+    def enabled(self, level):
+        return LEVELS[level] >= self.level
+
+    def debug(self, event, message, **fields):
+        if self.level <= 10:
+            self._log('DEBUG', event, message, fields)
+
+    def info(self, event, message, **fields):
+        if self.level <= 20:
+            self._log('INFO', event, message, fields)
+
+    def warning(self, event, message, **fields):
+        if self.level <= 30:
+            self._log('WARNING', event, message, fields)
+
+    def error(self, event, message, **fields):
+        self._log('ERROR', event, message, fields)
+
+    def _allow(self, event):
+        """토큰 버킷 - (출력 여부, 그동안 버린 줄 수)"""
+        if self.rate <= 0:
+            return True, 0
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(event)
+            if bucket is None:
+                bucket = self._buckets[event] = [self.burst, now, 0]
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            if bucket[0] < 1:
+                bucket[2] += 1
+                return False, 0
+            bucket[0] -= 1
+            suppressed, bucket[2] = bucket[2], 0
+            return True, suppressed
+
+    def _log(self, level, event, message, fields):
+        allowed, suppressed = self._allow(event)
+        if not allowed:
+            return
+        if suppressed:
+            fields['suppressed'] = suppressed
+        if self.format == 'json':
+            line = json.dumps({'ts': round(time.time(), 3), 'level': level, 'tag': self.tag,
+                               'event': event, 'msg': message, **fields},
+                              default=str, ensure_ascii=False)
+        else:
+            prefix = f'[{self.tag}]' if level in ('DEBUG', 'INFO') else f'[{self.tag} {level}]'
+            extra = ''.join(f' {key}={_field(value)}' for key, value in fields.items())
+            line = f'{prefix} {message}{extra}'
+        with _write_lock:
+            stream = self.stream or sys.stdout
+            stream.write(line + '\n')
+            stream.flush()
+
+
+_loggers = {}
+
+
+def get_logger(tag):
+    """tag별 로거 (같은 tag면 같은 로거 - 속도 제한 상태를 공유)"""
+    logger = _loggers.get(tag)
+    if logger is None:
+        logger = _loggers.setdefault(tag, Logger(tag))
+    return logger
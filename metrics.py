@@ -0,0 +1,157 @@
+import bisect
+import threading
+
+# Prometheus 텍스트 형식(0.0.4) 지표 - 외부 패키지 없이 수집 경로는 잠금 한 번 + dict 갱신만 한다
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# 초 단위 지연 버킷 (1ms ~ 10s)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra is not None:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    if isinstance(value, bool):
+        return str(int(value))
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """단조 증가 카운터 - inc(*라벨 값)"""
+
+    kind = 'counter'
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels):
+        return self._values.get(labels, 0)
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        return [(self.name, _labels(self.label_names, labels), value) for labels, value in items]
+
+
+class Histogram:
+    """누적 버킷 히스토그램 - observe(값, *라벨 값)"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}           # 라벨 -> [버킷별 개수..., 합계, 개수]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def samples(self):
+        with self._lock:
+            items = [(labels, list(series)) for labels, series in self._series.items()]
+        samples = []
+        for labels, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                samples.append((f'{self.name}_bucket',
+                                _labels(self.label_names, labels, ('le', _number(float(bound)))),
+                                cumulative))
+            samples.append((f'{self.name}_bucket', _labels(self.label_names, labels, ('le', '+Inf')),
+                            series[-1]))
+            samples.append((f'{self.name}_sum', _labels(self.label_names, labels), series[-2]))
+            samples.append((f'{self.name}_count', _labels(self.label_names, labels), series[-1]))
+        return samples
+
+
+class Gauge:
+    """수집(scrape) 시점에 callback()으로 값을 읽는 게이지 - 수신 경로 비용 없음
+
+    callback은 숫자 하나 또는 {라벨 값 튜플: 숫자}를 돌려준다.
+    """
+
+    kind = 'gauge'
+
+    def __init__(self, name, help_text, callback, labels=()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self.callback = callback
+
+    def samples(self):
+        value = self.callback()
+        if not isinstance(value, dict):
+            return [(self.name, '', value)]
+        return [(self.name, _labels(self.label_names, labels), v) for labels, v in value.items()]
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        """같은 이름이 이미 있으면 그것을 돌려준다 (모듈 재적재/방마다 호출돼도 한 시계열)"""
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def render(self):
+        lines = []
+        for metric in list(self._metrics.values()):
+            try:
+                samples = metric.samples()
+            except Exception as e:
+                lines.append(f'# {metric.name} collection failed: {_escape(e)}')
+                continue
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(f'{name}{labels} {_number(value)}' for name, labels, value in samples)
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+def counter(name, help_text, labels=()):
+    return REGISTRY.register(Counter(name, help_text, labels))
+
+
+def histogram(name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+    return REGISTRY.register(Histogram(name, help_text, labels, buckets))
+
+
+def gauge(name, help_text, callback, labels=()):
+    """callback을 바꿔 다시 등록하면 새 callback을 쓴다"""
+    metric = REGISTRY.register(Gauge(name, help_text, callback, labels))
+    metric.callback = callback
+    return metric
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""기존 iot_system.db 파일을 최신 스키마로 제자리(in-place) 마이그레이션
+
+사용법:
+    python migrate_db.py [DB 경로] [--no-backup]
+
+기본 경로는 DB_PATH 환경변수 또는 ./data/iot_system.db 이며,
+마이그레이션 전에 <DB 경로>.bak-<버전> 으로 백업본을 만든다.
+"""
+import os
+import sqlite3
+import sys
+
+from storage import Storage, MIGRATIONS
+
+TABLES = ['sensor_data', 'motion_log', 'noise_log', 'control_log']
+
+
+def row_counts(storage):
+    """테이블별 행 수"""
+    counts = {}
+    with storage.connection() as conn:
+        for table in TABLES:
+            try:
+                counts[table] = conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+            except sqlite3.OperationalError:
+                counts[table] = None
+    return counts
+
+
+def backup(db_path, version):
+    """SQLite 온라인 백업 API로 사본 생성"""
+    backup_path = f"{db_path}.bak-v{version}"
+    src = sqlite3.connect(db_path)
+    dst = sqlite3.connect(backup_path)
+    try:
+        src.backup(dst)
+    finally:
+        dst.close()
+        src.close()
+    return backup_path
+
+
+def main(argv):
+    args = [a for a in argv if not a.startswith('--')]
+    db_path = args[0] if args else os.getenv('DB_PATH', os.path.join('data', 'iot_system.db'))
+    make_backup = '--no-backup' not in argv
+
+    if not os.path.exists(db_path):
+        print(f"✗ Database not found: {db_path}")
+        return 1
+
+    storage = Storage(db_path, pool_size=1)
+    current = storage.schema_version()
+    latest = MIGRATIONS[-1][0]
+    print(f"Database: {db_path}")
+    print(f"Schema version: v{current} (latest v{latest})")
+
+    if current >= latest:
+        print("✓ Already up to date")
+        storage.close_all()
+        return 0
+
+    before = row_counts(storage)
+    storage.close_all()
+
+    if make_backup:
+        print(f"✓ Backup written: {backup(db_path, current)}")
+
+    storage.migrate()
+    after = row_counts(storage)
+
+    for table in TABLES:
+        print(f"  {table:12s} {before[table]} -> {after[table]} rows")
+
+    with storage.connection() as conn:
+        ok = conn.execute('PRAGMA integrity_check').fetchone()[0]
+    storage.close_all()
+
+    print(f"✓ Migrated to v{latest} (integrity: {ok})")
+    return 0 if ok == 'ok' else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,230 @@
+import json
+import os
+import re
+import threading
+
+from storage import now_ms, DEFAULT_ROOM
+
+DEVICE_HEARTBEAT_INTERVAL = float(os.getenv('DEVICE_HEARTBEAT_INTERVAL', '10'))   # 장치에 알려주는 주기 (초)
+DEVICE_TTL_MS = int(float(os.getenv('DEVICE_TTL', '30')) * 1000)                 # heartbeat가 없으면 evict
+REGISTRY_SWEEP_INTERVAL = float(os.getenv('REGISTRY_SWEEP_INTERVAL', '5'))       # 만료 확인/last_seen 기록 주기
+
+DEVICE_KINDS = ('actuator', 'sensor')
+DEVICE_ID_PATTERN = re.compile(r'^[A-Za-z0-9_.:-]{1,128}$')
+
+SAVE_DEVICE = '''INSERT OR REPLACE INTO devices
+                 (id, kind, room, device, url, capabilities, registered_at, last_seen)
+                 VALUES (?, ?, ?, ?, ?, ?, ?, ?)'''
+UPDATE_DEVICE_SEEN = 'UPDATE devices SET last_seen = ? WHERE id = ?'
+DELETE_DEVICE = 'DELETE FROM devices WHERE id = ?'
+DEVICES_QUERY = '''SELECT id, kind, room, device, url, capabilities, registered_at, last_seen
+                   FROM devices'''
+
+
+class RegistryError(ValueError):
+    """잘못된 장치 등록 요청"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+class DeviceRecord:
+    """등록된 장치 하나"""
+
+    __slots__ = ('id', 'kind', 'room', 'device', 'url', 'capabilities', 'registered_at',
+                 'last_seen', 'saved_seen')
+
+    def __init__(self, device_id, kind, room, device, url, capabilities, registered_at, last_seen):
+        self.id = device_id
+        self.kind = kind
+        self.room = room
+        self.device = device
+        self.url = url
+        self.capabilities = capabilities
+        self.registered_at = registered_at
+        self.last_seen = last_seen
+        self.saved_seen = last_seen     # DB에 마지막으로 기록한 last_seen
+
+    def row(self):
+        return (self.id, self.kind, self.room, self.device, self.url,
+                json.dumps(self.capabilities), self.registered_at, self.last_seen)
+
+    def describe(self, now=None):
+        now = now_ms() if now is None else now
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'room': self.room,
+            'device': self.device,
+            'url': self.url,
+            'capabilities': self.capabilities,
+            'registered_at': self.registered_at,
+            'last_seen': self.last_seen,
+            'age_ms': now - self.last_seen,
+        }
+
+
+class DeviceRegistry:
+    """장치(액추에이터 컨트롤러/센서 에이전트) 레지스트리 - 메모리 + DB 영속
+
+    장치는 시작할 때 register()로 등록하고 heartbeat_interval마다 heartbeat()를 보낸다.
+    ttl 동안 heartbeat가 없으면 백그라운드 sweep이 evict한다. 등록/해제는 on_attach(record) /
+    on_detach(record)로 방과 액추에이터 디스패처에 반영되며, 제어 경로는 레지스트리 잠금을 잡지 않는다.
+
+    heartbeat는 메모리의 last_seen만 바꾸고, DB에는 sweep 때 바뀐 것만 모아 쓰기 큐로 기록한다.
+    """
+
+    def __init__(self, writer, on_attach=None, on_detach=None, device_types=None,
+                 ttl_ms=DEVICE_TTL_MS, heartbeat_interval=DEVICE_HEARTBEAT_INTERVAL,
+                 sweep_interval=REGISTRY_SWEEP_INTERVAL):
+        self.writer = writer
+        self.on_attach = on_attach
+        self.on_detach = on_detach
+        self.device_types = set(device_types) if device_types is not None else None
+        self.ttl_ms = ttl_ms
+        self.heartbeat_interval = heartbeat_interval
+        self.sweep_interval = sweep_interval
+        self._devices = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.stats = {'registered': 0, 'evicted': 0, 'deregistered': 0, 'heartbeats': 0,
+                      'unknown_heartbeats': 0}
+
+    def __len__(self):
+        return len(self._devices)
+
+    def get(self, device_id):
+        return self._devices.get(device_id)
+
+    def devices(self, room=None, kind=None):
+        now = now_ms()
+        return [record.describe(now) for record in list(self._devices.values())
+                if (room is None or record.room == room) and (kind is None or record.kind == kind)]
+
+    def validate(self, spec):
+        """등록 요청 dict -> DeviceRecord (잘못되면 RegistryError)"""
+        if not isinstance(spec, dict):
+            raise RegistryError("Registration must be a JSON object")
+        device_id = spec.get('id')
+        kind = spec.get('kind')
+        device = spec.get('device')
+        room = spec.get('room') or DEFAULT_ROOM
+        url = spec.get('url')
+        capabilities = spec.get('capabilities') or {}
+        if not isinstance(device_id, str) or not DEVICE_ID_PATTERN.match(device_id):
+            raise RegistryError(f"Invalid device id: {device_id!r}")
+        if kind not in DEVICE_KINDS:
+            raise RegistryError(f"kind must be one of {DEVICE_KINDS}")
+        if not isinstance(device, str) or not device:
+            raise RegistryError("device is required")
+        if not isinstance(capabilities, dict):
+            raise RegistryError("capabilities must be an object")
+        if kind == 'actuator':
+            if self.device_types is not None and device not in self.device_types:
+                raise RegistryError(f"Unknown actuator type: {device}")
+            if not isinstance(url, str) or not url.startswith(('http://', 'https://')):
+                raise RegistryError("Actuators must register an http(s) control url")
+        now = now_ms()
+        return DeviceRecord(device_id, kind, room, device, url, capabilities, now, now)
+
+    def register(self, spec):
+        """장치 등록 (같은 id로 다시 등록하면 정보 갱신), 등록된 DeviceRecord 반환"""
+        record = self.validate(spec)
+        with self._lock:
+            old = self._devices.get(record.id)
+            if old is not None:
+                record.registered_at = old.registered_at
+            # 방 생성 등 on_attach의 검증이 실패하면 기존 등록을 그대로 둔다
+            if self.on_attach is not None:
+                self.on_attach(record)
+            if old is not None and self.on_detach is not None and (
+                    old.room, old.device, old.url) != (record.room, record.device, record.url):
+                self.on_detach(old)
+            self._devices = {**self._devices, record.id: record}
+            self.stats['registered'] += 1
+        self.writer.submit(SAVE_DEVICE, record.row())
+        print(f"[REGISTRY] {record.id} registered ({record.kind}/{record.device} in {record.room}"
+              f"{', ' + record.url if record.url else ''})", flush=True)
+        return record
+
+    def heartbeat(self, device_id):
+        """등록된 장치면 last_seen 갱신 후 True (잠금 없음)"""
+        record = self._devices.get(device_id)
+        if record is None:
+            self.stats['unknown_heartbeats'] += 1
+            return False
+        record.last_seen = now_ms()
+        self.stats['heartbeats'] += 1
+        return True
+
+    def remove(self, device_id, reason='deregistered', seen_before=None):
+        """장치 등록 해제, 있었으면 True (seen_before가 있으면 그 전부터 소식이 없을 때만)"""
+        with self._lock:
+            devices = dict(self._devices)
+            record = devices.pop(device_id, None)
+            if record is None or (seen_before is not None and record.last_seen >= seen_before):
+                return False
+            self._devices = devices
+            if self.on_detach is not None:
+                self.on_detach(record)
+            self.stats[reason] += 1
+        self.writer.submit(DELETE_DEVICE, (device_id,))
+        print(f"[REGISTRY] {device_id} {reason}", flush=True)
+        return True
+
+    def sweep(self, now=None):
+        """만료된 장치 evict + 바뀐 last_seen 기록, evict된 id 목록 반환"""
+        now = now_ms() if now is None else now
+        expired = []
+        seen = []
+        for record in list(self._devices.values()):
+            if now - record.last_seen > self.ttl_ms:
+                expired.append(record.id)
+            elif record.last_seen != record.saved_seen:
+                record.saved_seen = record.last_seen
+                seen.append((UPDATE_DEVICE_SEEN, (record.last_seen, record.id)))
+        if seen:
+            self.writer.submit_many(seen)
+        for device_id in expired:
+            # 확인 직후에 heartbeat가 들어왔으면 evict하지 않는다
+            self.remove(device_id, 'evicted', seen_before=now - self.ttl_ms)
+        return expired
+
+    def load(self, storage, owns=None):
+        """DB에 저장된 장치 복원 - 서버 재시작 동안 heartbeat를 못 받았으므로 last_seen은 지금으로
+
+        owns(room)이 있으면 그 방의 장치만 (다중 워커에서 이 워커가 맡은 방).
+        """
+        now = now_ms()
+        restored = 0
+        for device_id, kind, room, device, url, capabilities, registered_at, _ in storage.query(DEVICES_QUERY):
+            if owns is not None and not owns(room):
+                continue
+            record = DeviceRecord(device_id, kind, room, device, url,
+                                  json.loads(capabilities or '{}'), registered_at, now)
+            try:
+                if self.on_attach is not None:
+                    self.on_attach(record)
+            except ValueError as e:
+                print(f"[REGISTRY] Cannot restore {device_id}: {e}", flush=True)
+                continue
+            with self._lock:
+                self._devices = {**self._devices, device_id: record}
+            restored += 1
+        if restored:
+            print(f"[REGISTRY] Restored {restored} devices", flush=True)
+        return restored
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='device-registry', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.sweep_interval):
+            self.sweep()
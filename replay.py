@@ -0,0 +1,519 @@
+#!/usr/bin/env python3
+"""기록된 센서 데이터를 가상 시계로 결정 로직에 다시 흘려 제어 명령을 재현 (임계값/규칙 백테스트)
+
+사용법:
+    python replay.py [--db DB 경로 | --archive 보관 디렉터리] [--room default]
+                     [--start 시각] [--end 시각] [--set temp_high=26 ...] [--rules 규칙 파일]
+                     [--output 명령.csv|명령.json] [--tolerance 5]
+
+sensor_data / motion_log / noise_log 행(또는 보존 작업이 내보낸 CSV.gz)을 시각 순서로 읽어
+운영과 같은 필터, freshness 추적, 규칙(RuleSet)과 결정 엔진으로 평가한다. 시계는 측정 시각을
+따라 이벤트와 예약(hold, stale 전환) 사이를 바로 건너뛰므로 기다리는 시간이 없다.
+재현한 명령은 같은 구간의 control_log와 장치별로 비교해 요약을 출력한다.
+시작 시점의 상태는 비어 있으므로 구간 첫 부분은 운영과 다를 수 있다.
+"""
+import argparse
+import csv
+import functools
+import glob
+import gzip
+import heapq
+import json
+import os
+import sqlite3
+import sys
+import time
+from datetime import datetime, timezone
+
+from actuators import ACTUATOR_COALESCE
+from decision_engine import DecisionEngine
+from filters import load_filters, FilterRejected, FILTERS_PATH
+from freshness import FreshnessTracker
+from rooms import load_room_specs, INITIAL_STATE, ROOMS_PATH
+from rules import load_rules, RULES_PATH
+from storage import Storage, DEFAULT_ROOM, now_ms, to_epoch_ms
+from thresholds import ThresholdConfig, ThresholdError
+
+DAY_MS = 86400 * 1000
+
+# sensor_types.name -> 상태 필드
+SENSOR_FIELDS = {
+    'temperature': 'temperature',
+    'pressure': 'pressure',
+    'humidity': 'humidity',
+    'co2': 'co2_level',
+}
+
+# 같은 시각이면 이 순서로 적용 (merge 입력 순서)
+SOURCES = ('sensor_data', 'motion_log', 'noise_log')
+
+QUERIES = {
+    'sensor_data': '''SELECT d.ts, t.name, d.value
+                      FROM sensor_data d JOIN sensor_types t ON t.id = d.sensor_type_id
+                      WHERE t.room = ? AND d.ts >= ? AND d.ts < ? ORDER BY d.ts''',
+    'motion_log': '''SELECT ts, detected, is_drowsy_alert, idle_duration
+                     FROM motion_log WHERE room = ? AND ts >= ? AND ts < ? ORDER BY ts''',
+    'noise_log': '''SELECT ts, noise_level, duration
+                    FROM noise_log WHERE room = ? AND ts >= ? AND ts < ? ORDER BY ts''',
+    'control_log': '''SELECT ts, device, action, reason
+                      FROM control_log WHERE room = ? AND ts >= ? AND ts < ? ORDER BY ts''',
+}
+
+# 보존 작업 CSV 열 -> 위 쿼리와 같은 행 모양
+ARCHIVE_COLUMNS = {
+    'sensor_data': ('ts', 'sensor_type', 'value'),
+    'motion_log': ('ts', 'detected', 'is_drowsy_alert', 'idle_duration'),
+    'noise_log': ('ts', 'noise_level', 'duration'),
+    'control_log': ('ts', 'device', 'action', 'reason'),
+}
+
+
+def iso_time(ts):
+    return datetime.fromtimestamp(ts / 1000).isoformat()
+
+
+def _bool(value):
+    if isinstance(value, str):
+        return value.strip().lower() in ('1', 'true')
+    return bool(value)
+
+
+def _float(value):
+    return None if value is None or value == '' else float(value)
+
+
+def to_fields(source, row):
+    """행 하나 -> (ts, 상태 필드) - 수신 핸들러(ingest_*)와 같은 필드로 (모르는 센서면 None)"""
+    ts = int(row[0])
+    if source == 'sensor_data':
+        key = SENSOR_FIELDS.get(row[1])
+        value = _float(row[2])
+        return (ts, {key: value}) if key is not None and value is not None else None
+    if source == 'motion_log':
+        return ts, {
+            'motion_detected': _bool(row[1]),
+            'is_drowsy_alert': _bool(row[2]),
+            'idle_duration': _float(row[3]) or 0.0,
+            'motion_timestamp': iso_time(ts),
+        }
+    level = _float(row[1])
+    return (ts, {'noise_level': level, 'noise_timestamp': iso_time(ts)}) if level is not None else None
+
+
+def _converted(source, rows):
+    for row in rows:
+        event = to_fields(source, row)
+        if event is not None:
+            yield event[0], source, event[1]
+
+
+def group_events(streams):
+    """시각순 (ts, source, fields) 스트림들을 합쳐, 같은 시각/출처의 행을 한 번의 갱신으로 묶는다
+
+    환경 센서 한 번의 측정은 sensor_data에 필드마다 한 행씩 같은 ts로 기록된다.
+    """
+    current = None
+    for ts, source, fields in heapq.merge(*streams, key=lambda event: event[0]):
+        if current is not None and current[0] == ts and current[1] == source:
+            current[2].update(fields)
+            continue
+        if current is not None:
+            yield current[0], current[2]
+        current = (ts, source, dict(fields))
+    if current is not None:
+        yield current[0], current[2]
+
+
+def db_rows(storage, table, room, start, end):
+    """테이블 행을 시각순으로 (커서를 그대로 흘려 메모리에 다 올리지 않는다)"""
+    with storage.connection() as conn:
+        yield from conn.execute(QUERIES[table], (room, start, end))
+
+
+def db_events(storage, room, start, end):
+    """세 테이블의 커서를 한 연결에서 동시에 열어 시각순으로 합친다"""
+    with storage.connection() as conn:
+        yield from group_events([_converted(table, conn.execute(QUERIES[table], (room, start, end)))
+                                 for table in SOURCES])
+
+
+def archive_rows(archive_dir, table, room, start, end):
+    """보존 작업이 내보낸 <table>-YYYY-MM-DD[.N].csv.gz 중 구간에 걸친 파일의 행 (시각순)
+
+    같은 날 파일이 여럿일 수 있어 파일별 스트림을 시각으로 합친다.
+    """
+    files = []
+    for path in sorted(glob.glob(os.path.join(archive_dir, table, f'{table}-*.csv.gz'))):
+        day = os.path.basename(path)[len(table) + 1:len(table) + 11]
+        try:
+            day_start = int(datetime.strptime(day, '%Y-%m-%d').replace(tzinfo=timezone.utc).timestamp() * 1000)
+        except ValueError:
+            continue
+        if day_start + DAY_MS > start and day_start < end:
+            files.append(path)
+    columns = ARCHIVE_COLUMNS[table]
+
+    def read(path):
+        with gzip.open(path, 'rt', newline='', encoding='utf-8') as f:
+            for record in csv.DictReader(f):
+                ts = int(record['ts'])
+                if record.get('room', DEFAULT_ROOM) == room and start <= ts < end:
+                    yield (ts,) + tuple(record[column] for column in columns[1:])
+
+    return heapq.merge(*(read(path) for path in files), key=lambda row: row[0])
+
+
+def archive_events(archive_dir, room, start, end):
+    return group_events([_converted(table, archive_rows(archive_dir, table, room, start, end))
+                         for table in SOURCES])
+
+
+class Replay:
+    """방 하나의 결정 로직을 가상 시계로 구동 (Room과 같은 상태 저장소/필터/freshness/규칙)
+
+    시계는 초 단위로 DecisionEngine에 넘기고, 다음 이벤트 전까지 예약된 재평가(hold)와
+    stale 전환 시각을 차례로 건너뛰며 처리한다. skip_unchanged이면 새 값으로 결과가 바뀌는
+    조건이 없는 신호는 엔진에 알리지 않는다 (평가 결과는 같고 평가 횟수만 줄어든다).
+    평가는 feed()를 호출한 스레드에서 바로 끝나므로 상태는 StateStore 대신 dict 하나에 둔다.
+    임계값은 thresholds(ThresholdConfig)의 room 스냅샷 (장치별 덮어쓰기 포함).
+    """
+
+    def __init__(self, rules_path, thresholds, room=DEFAULT_ROOM, filters_path=FILTERS_PATH,
+                 skip_unchanged=True):
+        self.clock = 0.0                # 가상 시각 (epoch 초)
+        self.snapshot = thresholds.snapshot(room)
+        self.skip_unchanged = skip_unchanged
+        self.values = dict(INITIAL_STATE)
+        self.timestamps = {}
+        self.signals = load_filters(filters_path)
+        self.freshness = FreshnessTracker()
+        self.engine = DecisionEngine(clock=lambda: self.clock, name='replay')
+        self.ruleset = load_rules(rules_path, lambda: self.values, lambda: self.snapshot,
+                                  self.set_device, is_stale=self.freshness.flagged)
+        self.ruleset.install(self.engine)
+        self.conditions = {}            # signal -> 그 신호를 비교하는 (조건, 장치 임계값) (op "stale" 제외)
+        for rule in self.ruleset.rules:
+            for condition in rule.conditions:
+                if condition.op != 'stale':
+                    self.conditions.setdefault(condition.signal, []).append(
+                        (condition, self.snapshot.for_device(rule.device)))
+        self.desired = {}
+        self.commands = []              # (ts, device, action, reason) - desired가 바뀐 순서
+        self.stats = {'events': 0, 'rejected': 0, 'notified': 0, 'skipped': 0, 'stale_changes': 0}
+        self._started = False
+        self._expiry_bound = float('-inf')     # 다음 stale 전환 시각의 하한 (이보다 이르면 다시 계산하지 않는다)
+
+    @property
+    def now(self):
+        """가상 시각 (epoch ms)"""
+        return int(round(self.clock * 1000))
+
+    def set_device(self, device, action, reason):
+        """Room.set_device와 같이 desired가 바뀔 때만 명령으로 기록"""
+        if self.desired.get(device) == action:
+            return
+        self.desired[device] = action
+        self.commands.append((self.now, device, action, reason))
+        if device == 'led':
+            self.update_state({'led_state': action}, self.now)
+
+    def update_state(self, fields, ts):
+        """StateStore.update와 같은 규칙 (과거 시각 값은 무시), 바뀐 필드 dict 반환"""
+        changed = {}
+        for key, value in fields.items():
+            if ts < self.timestamps.get(key, 0):
+                continue
+            self.timestamps[key] = ts
+            if self.values.get(key) != value:
+                changed[key] = value
+        self.values.update(changed)
+        return changed
+
+    def affects(self, key, value):
+        """새 값으로 결과가 바뀌는 조건이 있는지"""
+        return any(c.peek(value, thresholds) != c._active for c, thresholds in self.conditions.get(key, ()))
+
+    def advance(self, ts):
+        """ts(epoch ms) 직전까지 예약된 재평가와 stale 전환을 시각 순서대로 처리"""
+        while True:
+            deadline = self.engine.next_deadline()
+            expiry = None
+            if self._expiry_bound < ts:
+                expiry = self.freshness.next_expiry()
+                self._expiry_bound = float('inf') if expiry is None else expiry
+                # is_stale은 한계를 "넘어야" stale이므로 1ms 뒤에 확인
+                expiry = None if expiry is None else int(expiry) + 1
+            if deadline is not None and deadline * 1000 < ts and (expiry is None or deadline * 1000 <= expiry):
+                self.clock = deadline
+            elif expiry is not None and expiry < ts:
+                self.clock = expiry / 1000
+                expired = self.freshness.check(expiry)
+                self._expiry_bound = float('-inf')
+                if expired:
+                    self.stats['stale_changes'] += len(expired)
+                    self.engine.notify(*expired)
+            else:
+                break
+            self.engine.run_pending()
+        self.clock = ts / 1000
+
+    def feed(self, ts, fields):
+        """측정값 한 건 적용 (Room.update_latest와 같은 순서)"""
+        if not self._started:
+            # 운영의 엔진 시작과 같이 첫 시각에 전체 규칙을 한 번 평가
+            self._started = True
+            self.clock = ts / 1000
+            self.engine.notify_all()
+            self.engine.run_pending()
+        self.advance(ts)
+        self.stats['events'] += 1
+        try:
+            self.signals.validate(fields)
+        except FilterRejected:
+            self.stats['rejected'] += 1
+            return
+        filtered = self.signals.process(fields, ts)
+        if self.skip_unchanged:
+            relevant = [key for key, value in filtered.items() if self.affects(key, value)]
+        else:
+            relevant = list(filtered)
+        changed = self.update_state(filtered, ts)
+        notify = [key for key in relevant if key in changed]
+        self.stats['skipped'] += len(changed) - len(notify)
+        recovered = self.freshness.observe(fields, ts)
+        # 새로 관측한 필드는 빨라도 min_ms 뒤에 stale이 된다
+        self._expiry_bound = min(self._expiry_bound, ts + self.freshness.min_ms)
+        if recovered:
+            self.stats['stale_changes'] += len(recovered)
+            notify.extend(recovered)
+        if notify:
+            self.stats['notified'] += 1
+            self.engine.notify(*notify)
+            self.engine.run_pending()
+
+    def run(self, events, end=None):
+        """이벤트 (ts, fields) 전체 재생 - end(epoch ms)가 있으면 그 시각까지 예약도 처리"""
+        for ts, fields in events:
+            self.feed(ts, fields)
+        if end is not None and self._started:
+            self.advance(end)
+        return self.commands
+
+
+def coalesce(commands, window_ms=ACTUATOR_COALESCE * 1000):
+    """ActuatorWorker와 같이 첫 변경부터 window_ms 동안 모은 뒤, 그 시점의 desired가
+    마지막으로 보낸 상태와 다를 때만 보낸 것으로 본다 (ts는 전송 시각)"""
+    sent = []
+    pending = {}            # device -> [전송 시각, action, reason]
+    confirmed = {}
+
+    def flush(device):
+        due, action, reason = pending.pop(device)
+        if confirmed.get(device) != action:
+            confirmed[device] = action
+            sent.append((due, device, action, reason))
+
+    for ts, device, action, reason in commands:
+        for other in [d for d, entry in pending.items() if entry[0] <= ts]:
+            flush(other)
+        entry = pending.get(device)
+        if entry is None:
+            pending[device] = [ts + int(window_ms), action, reason]
+        else:
+            entry[1:] = [action, reason]
+    for device in list(pending):
+        flush(device)
+    sent.sort(key=lambda command: command[0])
+    return sent
+
+
+def diff_commands(replayed, actual, tolerance_ms):
+    """장치별로 순서를 지키며 같은 action을 tolerance_ms 안에서 짝짓는다
+
+    반환: matched 수, 평균 지연(실제 - 재현), 한쪽에만 있는 명령 목록, 장치별 개수.
+    """
+    by_device = {}
+    for side, commands in (('replay', replayed), ('actual', actual)):
+        for command in commands:
+            by_device.setdefault(command[1], {'replay': [], 'actual': []})[side].append(command)
+
+    matched = 0
+    lag_total = 0
+    only_replay = []
+    only_actual = []
+    devices = {}
+    for device, sides in sorted(by_device.items()):
+        real = sides['actual']
+        j = 0
+        count = 0
+        for command in sides['replay']:
+            ts, action = command[0], command[2]
+            while j < len(real) and real[j][0] < ts - tolerance_ms:
+                only_actual.append(real[j])
+                j += 1
+            k = j
+            while k < len(real) and real[k][0] <= ts + tolerance_ms and real[k][2] != action:
+                k += 1
+            if k < len(real) and real[k][0] <= ts + tolerance_ms:
+                only_actual.extend(real[j:k])
+                lag_total += real[k][0] - ts
+                count += 1
+                j = k + 1
+            else:
+                only_replay.append(command)
+        only_actual.extend(real[j:])
+        matched += count
+        devices[device] = {'replay': len(sides['replay']), 'actual': len(real), 'matched': count}
+
+    return {
+        'matched': matched,
+        'mean_lag_ms': round(lag_total / matched, 1) if matched else None,
+        'only_replay': sorted(only_replay),
+        'only_actual': sorted(only_actual),
+        'devices': devices,
+    }
+
+
+def parse_overrides(items, room):
+    """["temp_high=26", "heater.temp_low=16", ...] -> ThresholdConfig.update용 {scope: {이름: 값}}"""
+    changes = {}
+    for item in items:
+        name, sep, value = item.partition('=')
+        device, _, key = name.rpartition('.')
+        try:
+            number = float(value) if sep else None
+        except ValueError:
+            number = None
+        if number is None:
+            raise ThresholdError(f"Invalid threshold override: {item} (use [device.]name=number)")
+        changes.setdefault(f'{room}/{device}' if device else room, {})[key] = number
+    return changes
+
+
+def load_stored_document(storage, version=None):
+    """DB에 저장된 임계값 덮어쓰기 문서 (기본: 최신 버전)"""
+    config = ThresholdConfig(storage)
+    try:
+        if version is None:
+            config.load()
+            return config.document()
+        document = config.document(version)
+    except sqlite3.OperationalError:
+        document = {} if not version else None      # threshold_config 테이블이 없는 이전 스키마
+    if document is None:
+        raise ThresholdError(f"Unknown configuration version: {version}")
+    return document
+
+
+def write_commands(path, commands, result):
+    """.json이면 명령/비교 결과/통계 전체, 그 밖에는 명령 CSV"""
+    if path.endswith('.json'):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        return
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['ts', 'time', 'device', 'action', 'reason'])
+        writer.writerows((ts, iso_time(ts), device, action, reason)
+                         for ts, device, action, reason in commands)
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description='Replay recorded sensor data through the decision rules')
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument('--db', default=os.getenv('DB_PATH', os.path.join('data', 'iot_system.db')))
+    source.add_argument('--archive', help='retention archive directory (CSV.gz exports)')
+    parser.add_argument('--room', default=DEFAULT_ROOM)
+    parser.add_argument('--start', help='epoch seconds/ms or ISO 8601 (default: earliest row)')
+    parser.add_argument('--end', help='epoch seconds/ms or ISO 8601 (default: now)')
+    parser.add_argument('--rooms', default=ROOMS_PATH, help='room config for per-room thresholds/rules')
+    parser.add_argument('--rules', help='rule file (default: the room\'s rules)')
+    parser.add_argument('--filters', default=FILTERS_PATH)
+    parser.add_argument('--config-version', type=int,
+                        help='stored threshold config version to start from (default: latest, --db only)')
+    parser.add_argument('--set', action='append', default=[], metavar='[DEVICE.]KEY=VALUE',
+                        help='room (or device) threshold override on top, repeatable')
+    parser.add_argument('--coalesce', type=float, default=ACTUATOR_COALESCE,
+                        help='actuator coalesce window in seconds (0 = every desired change)')
+    parser.add_argument('--tolerance', type=float, default=5.0,
+                        help='seconds a replayed command may differ from control_log and still match')
+    parser.add_argument('--no-skip', action='store_true',
+                        help='evaluate rules on every change (slower, same result)')
+    parser.add_argument('--no-diff', action='store_true', help='do not compare with control_log')
+    parser.add_argument('--output', help='write commands to .csv or full result to .json')
+    args = parser.parse_args(argv)
+
+    try:
+        start = to_epoch_ms(args.start, 0)
+        end = to_epoch_ms(args.end, now_ms())
+        spec = load_room_specs(args.rooms).get(args.room, {})
+        overrides = parse_overrides(args.set, args.room)
+    except ValueError as e:
+        print(f"✗ {e}")
+        return 2
+    rules_path = args.rules or spec.get('rules', RULES_PATH)
+
+    # 운영과 같은 단계(기본값 <- 전체 <- 방 설정 파일 <- 방 <- 방/장치)로, 저장된 문서 위에 --set을 얹는다
+    thresholds = ThresholdConfig()
+    document = {}
+    if args.archive:
+        events = archive_events(args.archive, args.room, start, end)
+        control_log = functools.partial(archive_rows, args.archive, 'control_log', args.room, start, end)
+        print(f"Archive: {args.archive}")
+    else:
+        if not os.path.exists(args.db):
+            print(f"✗ Database not found: {args.db}")
+            return 1
+        storage = Storage(args.db, pool_size=1)
+        document = None
+        events = db_events(storage, args.room, start, end)
+        control_log = functools.partial(db_rows, storage, 'control_log', args.room, start, end)
+        print(f"Database: {args.db}")
+    try:
+        if document is None:
+            document = load_stored_document(storage, args.config_version)
+        thresholds.set_static(args.room, spec.get('thresholds', {}))
+        for changes in (document, overrides):
+            if changes:
+                thresholds.update(changes, source='replay')
+    except ValueError as e:
+        print(f"✗ {e}")
+        return 2
+    print(f"Room: {args.room}, rules: {rules_path}")
+    print(f"Thresholds: {thresholds.resolve(args.room)}")
+
+    replay = Replay(rules_path, thresholds, args.room, args.filters, skip_unchanged=not args.no_skip)
+    started = time.perf_counter()
+    desired = replay.run(events, end if args.end else None)
+    elapsed = time.perf_counter() - started
+    commands = coalesce(desired, args.coalesce * 1000) if args.coalesce > 0 else desired
+
+    stats = dict(replay.stats, evaluations=replay.engine.stats['evaluations'],
+                 timer_fires=replay.engine.stats['timer_fires'], desired_changes=len(desired),
+                 commands=len(commands), elapsed_s=round(elapsed, 3),
+                 events_per_s=round(replay.stats['events'] / elapsed) if elapsed > 0 else None)
+    print(f"Replayed {stats['events']} events in {elapsed:.2f}s ({stats['events_per_s']} events/s), "
+          f"{stats['evaluations']} evaluations, {stats['commands']} commands")
+
+    result = {'room': args.room, 'start': start, 'end': end, 'rules': rules_path,
+              'thresholds': dict(replay.snapshot.values), 'threshold_overrides': thresholds.document(),
+              'stats': stats,
+              'commands': [{'ts': ts, 'device': device, 'action': action, 'reason': reason}
+                           for ts, device, action, reason in commands]}
+    if not args.no_diff:
+        diff = diff_commands(commands, [tuple(row) for row in control_log()], args.tolerance * 1000)
+        result['diff'] = diff
+        print(f"control_log: {diff['matched']} matched (mean lag {diff['mean_lag_ms']} ms), "
+              f"{len(diff['only_replay'])} only in replay, {len(diff['only_actual'])} only in control_log")
+        for device, counts in diff['devices'].items():
+            print(f"  {device:<16} replay {counts['replay']:>6}  actual {counts['actual']:>6}  "
+                  f"matched {counts['matched']:>6}")
+
+    if args.output:
+        write_commands(args.output, commands, result)
+        print(f"✓ Wrote {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
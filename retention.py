@@ -0,0 +1,219 @@
+import csv
+import gzip
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+from storage import now_ms
+from rollups import ROLLUP_TABLES
+
+DAY_MS = 86400 * 1000
+
+# 보존 정책 (일 단위, 0이면 삭제하지 않음)
+RETENTION_RAW_DAYS = int(os.getenv('RETENTION_RAW_DAYS', '30'))
+RETENTION_CONTROL_LOG_DAYS = int(os.getenv('RETENTION_CONTROL_LOG_DAYS', '90'))
+RETENTION_ROLLUP_1M_DAYS = int(os.getenv('RETENTION_ROLLUP_1M_DAYS', '90'))
+RETENTION_ROLLUP_1H_DAYS = int(os.getenv('RETENTION_ROLLUP_1H_DAYS', '730'))
+RETENTION_ROLLUP_1D_DAYS = int(os.getenv('RETENTION_ROLLUP_1D_DAYS', '0'))
+
+RETENTION_INTERVAL = float(os.getenv('RETENTION_INTERVAL', '3600'))        # 작업 주기 (초)
+RETENTION_DELETE_CHUNK = int(os.getenv('RETENTION_DELETE_CHUNK', '5000'))   # 삭제 트랜잭션당 행 수
+RETENTION_VACUUM_PAGES = int(os.getenv('RETENTION_VACUUM_PAGES', '2000'))   # incremental_vacuum 1회 페이지 수
+ARCHIVE_DIR = os.getenv('ARCHIVE_DIR', '/app/data/archive')
+
+_ROLLUP_COLUMNS = ['room', 'sensor_type', 'bucket', 'count', 'sum', 'min', 'max', 'last_ts', 'last_value']
+
+
+def _rollup_table(name, days):
+    table = ROLLUP_TABLES[name]
+    return {
+        'table': table,
+        'days': days,
+        'ts': 'bucket',
+        'columns': _ROLLUP_COLUMNS,
+        'export': f'''SELECT t.room, t.name, r.bucket, r.count, r.sum, r.min, r.max, r.last_ts, r.last_value
+                      FROM {table} r JOIN sensor_types t ON t.id = r.sensor_type_id
+                      WHERE r.bucket >= ? AND r.bucket < ? ORDER BY r.bucket''',
+        # WITHOUT ROWID 테이블이고 하루치 행 수가 작으므로 구간 단위로 한 번에 삭제
+        'delete': f'DELETE FROM {table} WHERE bucket >= ? AND bucket < ?',
+    }
+
+
+def _log_table(table, days, columns, export):
+    return {
+        'table': table,
+        'days': days,
+        'ts': 'ts',
+        'columns': columns,
+        'export': export,
+        'delete': f'''DELETE FROM {table} WHERE id IN
+                      (SELECT id FROM {table} WHERE ts >= ? AND ts < ? LIMIT {RETENTION_DELETE_CHUNK})''',
+    }
+
+
+RETENTION_TABLES = [
+    _log_table('sensor_data', RETENTION_RAW_DAYS,
+               ['id', 'ts', 'room', 'sensor_type', 'value', 'unit'],
+               '''SELECT d.id, d.ts, t.room, t.name, d.value, t.unit
+                  FROM sensor_data d JOIN sensor_types t ON t.id = d.sensor_type_id
+                  WHERE d.ts >= ? AND d.ts < ? ORDER BY d.ts'''),
+    _log_table('motion_log', RETENTION_RAW_DAYS,
+               ['id', 'ts', 'room', 'detected', 'is_drowsy_alert', 'idle_duration'],
+               '''SELECT id, ts, room, detected, is_drowsy_alert, idle_duration
+                  FROM motion_log WHERE ts >= ? AND ts < ? ORDER BY ts'''),
+    _log_table('noise_log', RETENTION_RAW_DAYS,
+               ['id', 'ts', 'room', 'noise_level', 'duration'],
+               '''SELECT id, ts, room, noise_level, duration
+                  FROM noise_log WHERE ts >= ? AND ts < ? ORDER BY ts'''),
+    _log_table('control_log', RETENTION_CONTROL_LOG_DAYS,
+               ['id', 'ts', 'room', 'device', 'action', 'reason'],
+               '''SELECT id, ts, room, device, action, reason
+                  FROM control_log WHERE ts >= ? AND ts < ? ORDER BY ts'''),
+    _rollup_table('1m', RETENTION_ROLLUP_1M_DAYS),
+    _rollup_table('1h', RETENTION_ROLLUP_1H_DAYS),
+    _rollup_table('1d', RETENTION_ROLLUP_1D_DAYS),
+]
+
+
+def archive_path(archive_dir, table, day_start):
+    """<archive_dir>/<table>/<table>-YYYY-MM-DD[.N].csv.gz (이미 있으면 번호를 붙인다)"""
+    day = datetime.fromtimestamp(day_start / 1000, tz=timezone.utc).strftime('%Y-%m-%d')
+    directory = os.path.join(archive_dir, table)
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f'{table}-{day}.csv.gz')
+    n = 1
+    while os.path.exists(path):
+        path = os.path.join(directory, f'{table}-{day}.{n}.csv.gz')
+        n += 1
+    return path
+
+
+class RetentionJob:
+    """보존 기간이 지난 일(day) 단위 파티션을 gzip CSV로 내보낸 뒤 삭제하고 incremental vacuum"""
+
+    def __init__(self, storage, tables=RETENTION_TABLES,
+                 interval=RETENTION_INTERVAL, archive_dir=ARCHIVE_DIR,
+                 vacuum_pages=RETENTION_VACUUM_PAGES):
+        self.storage = storage
+        self.tables = tables
+        self.interval = interval
+        self.archive_dir = archive_dir
+        self.vacuum_pages = vacuum_pages
+        self._stop = threading.Event()
+        self._thread = None
+        self.stats = {'runs': 0, 'archived_rows': 0, 'deleted_rows': 0,
+                      'archive_files': 0, 'vacuumed_pages': 0,
+                      'last_run': None, 'last_run_ms': 0.0, 'last_error': None}
+
+    def run_once(self, now=None):
+        """한 번의 정리 작업 실행, 테이블별 삭제 행 수 반환"""
+        now = now_ms() if now is None else now
+        started = time.perf_counter()
+        summary = {}
+
+        for spec in self.tables:
+            if spec['days'] <= 0:
+                continue
+            # 하루 단위로 정렬된 경계 이전의 온전한 날짜만 정리
+            cutoff = now - spec['days'] * DAY_MS
+            cutoff -= cutoff % DAY_MS
+            deleted = self._expire(spec, cutoff)
+            if deleted:
+                summary[spec['table']] = deleted
+
+        self.stats['vacuumed_pages'] += self._vacuum()
+        self.stats['runs'] += 1
+        self.stats['last_run'] = now
+        self.stats['last_run_ms'] = round((time.perf_counter() - started) * 1000, 3)
+        if summary:
+            print(f"[RETENTION] Archived and deleted: {summary}", flush=True)
+        return summary
+
+    def _expire(self, spec, cutoff):
+        table, ts = spec['table'], spec['ts']
+        with self.storage.connection() as conn:
+            oldest = conn.execute(f'SELECT MIN({ts}) FROM {table}').fetchone()[0]
+        if oldest is None or oldest >= cutoff:
+            return 0
+
+        deleted = 0
+        day_start = oldest - oldest % DAY_MS
+        while day_start < cutoff:
+            day_end = day_start + DAY_MS
+            if self._archive(spec, day_start, day_end):
+                deleted += self._delete(spec, day_start, day_end)
+            day_start = day_end
+        return deleted
+
+    def _archive(self, spec, day_start, day_end):
+        """하루치 파티션을 임시 파일에 쓰고 rename - 성공한 경우에만 삭제 진행"""
+        with self.storage.connection() as conn:
+            rows = conn.execute(spec['export'], (day_start, day_end)).fetchall()
+        if not rows:
+            return True
+
+        path = archive_path(self.archive_dir, spec['table'], day_start)
+        tmp_path = path + '.tmp'
+        try:
+            with gzip.open(tmp_path, 'wt', newline='', encoding='utf-8') as f:
+                writer = csv.writer(f)
+                writer.writerow(spec['columns'])
+                writer.writerows(rows)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            self.stats['last_error'] = str(e)
+            print(f"[RETENTION ERROR] Failed to archive {spec['table']}: {e}", flush=True)
+            return False
+
+        self.stats['archived_rows'] += len(rows)
+        self.stats['archive_files'] += 1
+        return True
+
+    def _delete(self, spec, day_start, day_end):
+        """짧은 트랜잭션 여러 번으로 나눠 삭제 (기록 스레드가 오래 기다리지 않도록)"""
+        deleted = 0
+        with self.storage.connection() as conn:
+            while True:
+                with conn:
+                    count = conn.execute(spec['delete'], (day_start, day_end)).rowcount
+                deleted += count
+                if count < RETENTION_DELETE_CHUNK:
+                    break
+        self.stats['deleted_rows'] += deleted
+        return deleted
+
+    def _vacuum(self):
+        """빈 페이지를 조금씩 반환해 긴 배타 잠금 없이 파일 크기를 줄인다"""
+        reclaimed = 0
+        with self.storage.connection() as conn:
+            while True:
+                free = conn.execute('PRAGMA freelist_count').fetchone()[0]
+                if free == 0:
+                    break
+                # execute()는 한 step(한 페이지)만 진행하므로 executescript로 끝까지 실행
+                conn.executescript(f'PRAGMA incremental_vacuum({self.vacuum_pages});')
+                reclaimed += min(free, self.vacuum_pages)
+                time.sleep(0.01)
+            conn.execute('PRAGMA wal_checkpoint(TRUNCATE)').fetchall()
+        return reclaimed
+
+    def start(self):
+        """백그라운드 보존 작업 시작"""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name='retention', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while True:
+            try:
+                self.run_once()
+            except Exception as e:
+                self.stats['last_error'] = str(e)
+                print(f"[RETENTION ERROR] {e}", flush=True)
+            if self._stop.wait(self.interval):
+                break
@@ -0,0 +1,62 @@
+from storage import INSERT_SENSOR_DATA, ROLLUP_RESOLUTIONS
+
+# 배치 단위 부분 집계를 기존 버킷에 더한다 (UPDATE 우변은 모두 갱신 전 값)
+_UPSERT = '''INSERT INTO {table} (sensor_type_id, bucket, count, sum, min, max, last_ts, last_value)
+             VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+             ON CONFLICT (sensor_type_id, bucket) DO UPDATE SET
+                 count = count + excluded.count,
+                 sum = sum + excluded.sum,
+                 min = MIN(min, excluded.min),
+                 max = MAX(max, excluded.max),
+                 last_value = CASE WHEN excluded.last_ts >= last_ts
+                                   THEN excluded.last_value ELSE last_value END,
+                 last_ts = MAX(last_ts, excluded.last_ts)'''
+
+ROLLUP_TABLES = {name: f'sensor_rollup_{name}' for name, _ in ROLLUP_RESOLUTIONS}
+ROLLUP_UPSERTS = {name: _UPSERT.format(table=table) for name, table in ROLLUP_TABLES.items()}
+
+
+def aggregate(rows, bucket_ms):
+    """(ts, sensor_type_id, value) 행 -> {(type_id, bucket): [count, sum, min, max, last_ts, last_value]}"""
+    buckets = {}
+    for ts, type_id, value in rows:
+        if value is None:
+            continue
+        key = (type_id, ts - ts % bucket_ms)
+        agg = buckets.get(key)
+        if agg is None:
+            buckets[key] = [1, value, value, value, ts, value]
+            continue
+        agg[0] += 1
+        agg[1] += value
+        if value < agg[2]:
+            agg[2] = value
+        if value > agg[3]:
+            agg[3] = value
+        if ts >= agg[4]:
+            agg[4] = ts
+            agg[5] = value
+    return buckets
+
+
+class Rollups:
+    """원시 센서 데이터 기록 시 1m/1h/1d rollup을 같은 트랜잭션에서 증분 갱신
+
+    늦게 도착한 샘플(스풀 재전송 등)도 같은 upsert로 해당 버킷에 더해지므로 따로 닫는 단계가 없다.
+    """
+
+    def __init__(self):
+        self.stats = {'upserts': 0}
+
+    def on_flush(self, conn, grouped):
+        """WriteBehindWriter flush hook - 이번 배치의 sensor_data 행만 집계"""
+        rows = grouped.get(INSERT_SENSOR_DATA)
+        if not rows:
+            return
+        for name, bucket_ms in ROLLUP_RESOLUTIONS:
+            buckets = aggregate(rows, bucket_ms)
+            conn.executemany(
+                ROLLUP_UPSERTS[name],
+                [(type_id, bucket, *agg) for (type_id, bucket), agg in buckets.items()],
+            )
+            self.stats['upserts'] += len(buckets)
@@ -0,0 +1,412 @@
+import json
+import os
+import re
+import threading
+import zlib
+from datetime import datetime
+
+from actuators import ActuatorDispatcher
+from decision_engine import DecisionEngine
+from filters import load_filters, FILTERS_PATH
+from freshness import FreshnessTracker, FRESHNESS_CHECK_INTERVAL
+from log import get_logger, Logger
+from rules import RuleReloader, RULES_PATH
+from state_store import StateStore
+from storage import DEFAULT_ROOM
+from thresholds import ThresholdError, GLOBAL_SCOPE
+from stream import ChangeFeed, CachedDocument
+
+ROOMS_PATH = os.getenv('ROOMS_PATH', 'config/rooms.json')
+RULES_RELOAD_INTERVAL = float(os.getenv('RULES_RELOAD_INTERVAL', '2'))   # 방별 규칙 파일 변경 확인 주기 (초)
+
+log = get_logger('CONTROL')
+# 유지보수 루프 오류는 방마다 분당 한 줄까지 (나머지는 suppressed=N으로)
+maintenance_log = Logger('ROOMS', rate=1 / 60, burst=1)
+
+# 다중 워커(ASGI 모드): 방마다 상태를 가진 워커는 하나 - 방 id 해시로 나눠 갖는다
+WORKER_COUNT = int(os.getenv('WORKER_COUNT', '1'))
+WORKER_INDEX = int(os.getenv('WORKER_INDEX', '0'))
+
+# URL 쿼리, DB 값, 로그에 그대로 쓰이므로 단순한 이름만 허용
+ROOM_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+
+# 방마다 같은 필드로 시작하는 최신 센서 상태
+INITIAL_STATE = {
+    'temperature': None,
+    'humidity': None,
+    'pressure': None,
+    'co2_level': None,
+    'motion_detected': False,
+    'motion_timestamp': None,
+    'is_drowsy_alert': False,
+    'idle_duration': 0.0,
+    'noise_level': None,
+    'noise_timestamp': None,
+    'led_state': 'OFF' # LED 상태 추가
+}
+
+
+class RoomError(ValueError):
+    """잘못된 방 id 또는 방 설정"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+class RoomMoved(RoomError):
+    """다른 워커가 맡은 방 - 요청을 그 워커로 보내야 한다"""
+
+    def __init__(self, room_id, worker):
+        super().__init__(f"Room {room_id} is served by worker {worker}", 307)
+        self.worker = worker
+
+
+def room_owner(room_id, count=WORKER_COUNT):
+    """방을 맡는 워커 번호 (프로세스/재시작과 무관하게 같은 값)"""
+    return zlib.crc32(room_id.encode('utf-8')) % count if count > 1 else 0
+
+
+def load_room_specs(path=ROOMS_PATH):
+    """방 설정 파일 -> {방 id: spec} (파일이 없으면 기본 방만, 기본 방은 항상 포함)"""
+    rooms = {}
+    if os.path.exists(path):
+        with open(path, encoding='utf-8') as f:
+            config = json.load(f)
+        rooms = config.get('rooms', {}) if isinstance(config, dict) else None
+        if not isinstance(rooms, dict):
+            raise RoomError(f"{path}: 'rooms' must be an object of room id -> spec")
+    rooms.setdefault(DEFAULT_ROOM, {})
+    return rooms
+
+
+def check_room_id(room_id):
+    if not isinstance(room_id, str) or not ROOM_ID_PATTERN.match(room_id):
+        raise RoomError(f"Invalid room id: {room_id!r}")
+    return room_id
+
+
+class Room:
+    """방(zone) 하나 - 센서 상태, 필터, 임계값, 액추에이터, 결정 엔진을 방마다 따로 둔다
+
+    방끼리는 상태를 공유하지 않으므로 각 방의 결정 엔진 스레드가 독립적으로(병렬로) 평가하고,
+    상태 변경은 방별 ChangeFeed로만 퍼진다. on_control(room_id, device, action, reason)은
+    성공한 제어 명령마다 호출된다 (제어 로그 기록).
+
+    규칙은 device_types(알려진 장치 종류) 기준으로 검증하고, 방에 아직 없는 장치의 규칙은
+    장치가 붙을 때(attach_actuator)까지 결과를 보내지 않는다.
+    """
+
+    def __init__(self, room_id, endpoints, thresholds, name=None, rules_path=RULES_PATH,
+                 filters_path=FILTERS_PATH, on_control=None, device_types=None):
+        self.id = room_id
+        self.name = name or room_id
+        self.endpoints = dict(endpoints)
+        self.static_endpoints = dict(endpoints)     # 설정 파일/환경 변수로 지정된 주소
+        self.threshold_config = thresholds          # ThresholdConfig (모든 방 공유)
+        self.on_control = on_control
+
+        self.sensor_state = StateStore(INITIAL_STATE)   # 필터링된 값 (규칙이 보는 값)
+        self.raw_state = StateStore({})                 # 필터를 거치기 전의 원시 값
+        self.signals = load_filters(filters_path)
+        self.freshness = FreshnessTracker()
+        self.change_feed = ChangeFeed()
+        self.status_document = CachedDocument(self.change_feed, self.build_status)
+
+        self.actuators = ActuatorDispatcher(self.endpoints, on_result=self.on_actuator_result, room=room_id)
+        self.decision_engine = DecisionEngine(name=f'decision-engine-{room_id}')
+        self.rule_loader = RuleReloader(self.decision_engine, rules_path,
+                                        lambda: self.sensor_state.snapshot().values,
+                                        self.threshold_snapshot, self.set_device,
+                                        devices=set(device_types or ()) | set(self.endpoints),
+                                        is_stale=self.freshness.flagged)
+
+        self.sensor_state.subscribe(self.on_state_change)
+        self.raw_state.subscribe(lambda changed, version: self.change_feed.publish({'raw': changed}))
+
+    # --- 센서 값 ---
+
+    def validate(self, fields):
+        """허용 범위 검사 - 벗어난 값은 FilterRejected(ValueError) (기록/반영 전에 호출)"""
+        self.signals.validate(fields)
+
+    def update_latest(self, fields, ts):
+        """최신 값 갱신 (여러 필드를 원자적으로) - 과거 측정값은 더 최근 값을 덮어쓰지 않는다
+
+        범위 검사는 validate()로 먼저 하고, 규칙이 보는 상태에는 필터링된 값만 반영한다.
+        """
+        self.raw_state.update(fields, ts)
+        changed = self.sensor_state.update(self.signals.process(fields, ts), ts)
+        recovered = self.freshness.observe(fields, ts)
+        if recovered:
+            self.on_freshness_change({key: False for key in recovered})
+        return changed
+
+    def on_state_change(self, changed, version):
+        """값이 바뀐 신호를 결정 엔진과 스트림에 알린다"""
+        self.decision_engine.notify(*changed)
+        self.change_feed.publish({'sensor_data': changed})
+
+    def on_freshness_change(self, changes):
+        """stale 여부가 바뀐 신호를 결정 엔진과 스트림에 알린다"""
+        self.decision_engine.notify(*changes)
+        self.change_feed.publish({'stale': changes})
+
+    def check_freshness(self):
+        expired = self.freshness.check()
+        if expired:
+            print(f"[FRESHNESS] {self.id}: no recent readings for: {', '.join(expired)}", flush=True)
+            self.on_freshness_change({key: True for key in expired})
+
+    # --- 임계값 / 제어 ---
+
+    def threshold_snapshot(self):
+        """이 방의 현재 임계값 스냅샷 (불변, 잠금 없음)"""
+        return self.threshold_config.snapshot(self.id)
+
+    @property
+    def thresholds(self):
+        """이 방의 현재 임계값 (장치별 덮어쓰기 제외) dict"""
+        return dict(self.threshold_snapshot().values)
+
+    def update_thresholds(self, values, device=None, expected=None):
+        """방(또는 방/장치) 단계의 임계값 변경 - 검증 후 새 버전으로 적용, 버전 번호 반환
+
+        잘못된 값이면 ThresholdError. 재평가는 on_thresholds_change에서.
+        """
+        scope = self.id if device is None else f'{self.id}/{device}'
+        return self.threshold_config.update({scope: values}, expected=expected)
+
+    def on_thresholds_change(self):
+        """새 임계값 버전으로 전체 재평가하고 스트림에 알린다"""
+        self.decision_engine.notify_all()
+        self.change_feed.publish({'thresholds': self.thresholds})
+
+    def set_device(self, device, action, reason):
+        """요청 상태(desired)가 바뀔 때만 제어 명령 전송 - 실제 반영 여부는 디스패처가 추적"""
+        if device in self.actuators.workers and self.actuators.desired(device) != action:
+            self.actuators.dispatch(device, action, reason)
+
+    def attach_actuator(self, device, url):
+        """장치 추가 또는 주소 변경 (재시작 없이) - 새 장치가 현재 규칙 결과를 받도록 전체 재평가"""
+        if self.endpoints.get(device) == url:
+            return False
+        self.endpoints = {**self.endpoints, device: url}
+        self.actuators.add(device, url)
+        self.change_feed.publish({'devices': {device: self.actuators.workers[device].state()}})
+        self.decision_engine.notify_all()
+        print(f"[ROOMS] {self.id}/{device} attached at {url}", flush=True)
+        return True
+
+    def detach_actuator(self, device, url):
+        """url로 붙어 있던 장치 분리 - 설정 파일에 지정된 주소가 있으면 그 주소로 되돌린다"""
+        if self.endpoints.get(device) != url:
+            return False        # 이미 다른 주소로 바뀌었다
+        static = self.static_endpoints.get(device)
+        if static is not None:
+            return self.attach_actuator(device, static)
+        endpoints = dict(self.endpoints)
+        del endpoints[device]
+        self.endpoints = endpoints
+        self.actuators.remove(device)
+        self.change_feed.publish({'devices': {device: None}})
+        print(f"[ROOMS] {self.id}/{device} detached", flush=True)
+        return True
+
+    def on_actuator_result(self, device, action, reason, ok, error):
+        """제어 명령 전송 결과 (장치별 작업 스레드에서 호출) - 성공한 명령만 제어 로그에 기록"""
+        if not ok:
+            log.warning(f'failed:{self.id}/{device}', f"Failed to control {self.id}/{device} → {action}",
+                        error=error)
+            return
+        worker = self.actuators.workers.get(device)
+        if worker is not None:
+            self.change_feed.publish({'devices': {device: worker.state()}})
+        if device == 'led':
+            self.sensor_state.update({'led_state': action})
+        if self.on_control is not None:
+            self.on_control(self.id, device, action, reason)
+        log.info(f'applied:{self.id}/{device}', f"{self.id}/{device} → {action}", reason=reason)
+
+    # --- 상태 문서 ---
+
+    def build_status(self, version):
+        """/status 전체 문서 (상태 버전이 바뀔 때만 만든다)"""
+        return {
+            'version': version,
+            'instance': self.status_document.instance,
+            'room': self.id,
+            'sensor_data': dict(self.sensor_state.snapshot().values),
+            'raw': dict(self.raw_state.snapshot().values),
+            'stale': self.freshness.flags(),
+            'thresholds': self.thresholds,
+            'thresholds_version': self.threshold_config.version,
+            'actuator_endpoints': self.endpoints,
+            'devices': self.actuators.states(),
+            'timestamp': datetime.now().isoformat()
+        }
+
+    def snapshot(self):
+        """스트림 첫 이벤트로 보내는 전체 상태"""
+        return {
+            'room': self.id,
+            'sensor_data': dict(self.sensor_state.snapshot().values),
+            'raw': dict(self.raw_state.snapshot().values),
+            'stale': self.freshness.flags(),
+            'thresholds': self.thresholds,
+            'devices': self.actuators.states(),
+        }
+
+    def info(self):
+        return {
+            'name': self.name,
+            'devices': sorted(self.endpoints),
+            'state_version': self.sensor_state.version,
+            'stream_clients': self.change_feed.clients,
+            'decision_engine': self.decision_engine.stats,
+            'rules': self.rule_loader.stats,
+        }
+
+    # --- 수명 주기 ---
+
+    def start(self):
+        self.actuators.start()
+        self.rule_loader.load()
+        self.decision_engine.start()
+
+    def stop(self):
+        self.decision_engine.stop()
+        self.actuators.stop()
+
+
+class RoomRegistry:
+    """방 id -> Room
+
+    방 목록은 copy-on-write dict라 수신 경로의 조회는 잠금을 잡지 않는다.
+    워커가 여럿이면 room_owner()가 이 워커(worker_index)인 방만 갖고, 나머지는 RoomMoved로 넘긴다.
+    stale 확인과 규칙 파일 변경 확인은 방마다 스레드를 두지 않고 스레드 하나가 모든 방을 돈다.
+    device_types는 규칙에 쓸 수 있는 장치 종류 (기본: 기본 방의 장치들).
+    thresholds(ThresholdConfig)는 모든 방이 공유하고, 버전이 바뀌면 영향받는 방만 재평가한다.
+    """
+
+    def __init__(self, default_endpoints, thresholds, on_control=None, device_types=None,
+                 worker_index=WORKER_INDEX, worker_count=WORKER_COUNT):
+        self.worker_index = worker_index
+        self.worker_count = worker_count
+        self.default_endpoints = dict(default_endpoints)
+        self.thresholds = thresholds
+        thresholds.subscribe(self.on_thresholds_change)
+        self.on_control = on_control
+        self.device_types = set(device_types if device_types is not None else default_endpoints)
+        self._rooms = {}
+        self._lock = threading.Lock()
+        self._started = False
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __iter__(self):
+        return iter(self._rooms.values())
+
+    def __len__(self):
+        return len(self._rooms)
+
+    def ids(self):
+        return list(self._rooms)
+
+    def owns(self, room_id):
+        return room_owner(room_id, self.worker_count) == self.worker_index
+
+    def check_owner(self, room_id):
+        if not self.owns(room_id):
+            raise RoomMoved(room_id, room_owner(room_id, self.worker_count))
+
+    def get(self, room_id):
+        """등록된 방 - 없으면 RoomError(404), 다른 워커의 방이면 RoomMoved(307)"""
+        room = self._rooms.get(room_id)
+        if room is None:
+            check_room_id(room_id)
+            self.check_owner(room_id)
+            raise RoomError(f"Unknown room: {room_id}", 404)
+        return room
+
+    def add(self, room_id, spec=None):
+        """방 설정(spec)으로 방 등록 - 이미 있으면 기존 방
+
+        spec 키 (모두 선택):
+          name        표시 이름
+          actuators   장치 -> 제어 URL (기본 방은 생략하면 *_ENDPOINT 환경 변수 값,
+                      나머지는 장치 레지스트리 등록으로도 붙일 수 있다)
+          thresholds  기본 임계값에서 바꿀 항목 (API로 바꾼 방/장치 단계 값이 우선)
+          rules       규칙 파일 (장치 구성이 다른 방용, 기본 RULES_PATH)
+        """
+        check_room_id(room_id)
+        self.check_owner(room_id)
+        spec = spec or {}
+        with self._lock:
+            if room_id in self._rooms:
+                return self._rooms[room_id]
+            default_endpoints = self.default_endpoints if room_id == DEFAULT_ROOM else {}
+            endpoints = spec.get('actuators', default_endpoints)
+            if not isinstance(endpoints, dict):
+                raise RoomError(f"Room {room_id}: actuators must be an object")
+            if 'thresholds' in spec:
+                try:
+                    self.thresholds.set_static(room_id, spec['thresholds'])
+                except ThresholdError as e:
+                    raise RoomError(str(e))
+
+            room = Room(room_id, endpoints, self.thresholds,
+                        name=spec.get('name'), rules_path=spec.get('rules', RULES_PATH),
+                        on_control=self.on_control, device_types=self.device_types)
+            self._rooms = {**self._rooms, room_id: room}
+            if self._started:
+                room.start()
+        print(f"[ROOMS] Registered room {room_id} ({len(room.endpoints)} actuators)", flush=True)
+        return room
+
+    def load(self, path=ROOMS_PATH):
+        """방 설정 파일의 방 등록 (파일이 없으면 기본 방만)"""
+        for room_id, spec in load_room_specs(path).items():
+            if not room_id.startswith('_') and self.owns(room_id):
+                self.add(room_id, spec)
+        return self
+
+    def on_thresholds_change(self, scopes):
+        """바뀐 단계(*, 방, 방/장치)에 해당하는 방만 재평가"""
+        rooms = {scope.split('/')[0] for scope in scopes}
+        for room in self:
+            if GLOBAL_SCOPE in rooms or room.id in rooms:
+                room.on_thresholds_change()
+
+    def start(self, interval=FRESHNESS_CHECK_INTERVAL, rules_interval=RULES_RELOAD_INTERVAL):
+        with self._lock:
+            self._started = True
+            rooms = list(self._rooms.values())
+        for room in rooms:
+            room.start()
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, args=(interval, rules_interval),
+                                            name='rooms-maintenance', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        for room in self:
+            room.stop()
+
+    def _run(self, interval, rules_interval):
+        elapsed = 0.0
+        while not self._stop.wait(interval):
+            elapsed += interval
+            check_rules = elapsed >= rules_interval
+            if check_rules:
+                elapsed = 0.0
+            for room in self:
+                # 한 방의 오류가 모든 방이 함께 쓰는 이 스레드를 멈추지 않도록
+                try:
+                    room.check_freshness()
+                    if check_rules:
+                        room.rule_loader.check()
+                except Exception as e:
+                    maintenance_log.error(f'maintenance:{room.id}', f"Maintenance failed for room {room.id}",
+                                          error=f'{e.__class__.__name__}: {e}')
@@ -0,0 +1,336 @@
+import json
+import math
+import operator
+import os
+
+RULES_PATH = os.getenv('RULES_PATH', 'config/rules.json')
+
+OPERATORS = {
+    '>': operator.gt,
+    '>=': operator.ge,
+    '<': operator.lt,
+    '<=': operator.le,
+    '==': operator.eq,
+    '!=': operator.ne,
+    'known': lambda value, _: True,      # 값이 한 번이라도 들어왔는지
+    'stale': None,                       # 값이 오래됐는지 (Condition.test에서 따로 처리)
+}
+ORDERING_OPERATORS = ('>', '>=', '<', '<=')     # value가 숫자(또는 "$임계값")여야 하는 연산자
+
+# 입력 신호가 오래됐을 때 규칙 동작
+#   ignore - 마지막 값으로 그대로 평가
+#   hold   - 마지막 평가 결과 유지 (상태를 바꾸지 않음)
+#   drop   - 만족하지 않은 것으로 처리 (op "stale" 조건을 가진 fail-safe 규칙이 대신 선택되도록)
+STALE_MODES = ('ignore', 'hold', 'drop')
+
+
+class RuleConfigError(ValueError):
+    """잘못된 규칙 설정"""
+
+
+class Condition:
+    """signal op value 비교 하나 - hysteresis가 있으면 참인 동안 임계값을 그만큼 완화"""
+
+    __slots__ = ('signal', 'op', 'value', 'hysteresis', '_compare', '_active')
+
+    def __init__(self, spec, thresholds):
+        try:
+            self.signal = spec['signal']
+            self.op = spec.get('op', '==')
+        except (TypeError, KeyError):
+            raise RuleConfigError(f"Condition needs a signal: {spec}")
+        if not isinstance(self.signal, str):
+            raise RuleConfigError(f"Condition signal must be a string: {spec}")
+        if not isinstance(self.op, str) or self.op not in OPERATORS:
+            raise RuleConfigError(f"Unknown operator: {self.op}")
+        self.value = spec.get('value')
+        if self.op in ORDERING_OPERATORS:
+            self.value = _number(self.value, f"{self.signal} {self.op} value", thresholds)
+        elif self.op in ('==', '!='):
+            if not isinstance(self.value, (str, int, float, bool, type(None))):
+                raise RuleConfigError(f"{self.signal} {self.op} value must be a scalar, got {self.value!r}")
+            _check_reference(self.value, thresholds)
+        self.hysteresis = _number(spec.get('hysteresis', 0), f"{self.signal} hysteresis", minimum=0)
+        self._compare = OPERATORS[self.op]
+        self._active = False
+
+    def test(self, values, thresholds, is_stale):
+        if self.op == 'stale':
+            self._active = is_stale(self.signal)
+        else:
+            self._active = self.peek(values.get(self.signal), thresholds)
+        return self._active
+
+    def peek(self, value, thresholds):
+        """value로 test()를 하면 나올 결과 (hysteresis 상태는 바꾸지 않는다, op "stale" 제외)"""
+        if value is None:
+            return False
+        target = resolve(self.value, thresholds)
+        if self._active and self.hysteresis:
+            if self.op in ('>', '>='):
+                target -= self.hysteresis
+            elif self.op in ('<', '<='):
+                target += self.hysteresis
+        try:
+            return bool(self._compare(value, target))
+        except TypeError:
+            return False
+
+
+class Rule:
+    """조건을 모두 만족한 상태가 hold초 이상 유지되면 device를 action으로"""
+
+    __slots__ = ('id', 'device', 'action', 'priority', 'hold', 'reason', 'on_stale',
+                 'conditions', 'order', '_since', '_held')
+
+    def __init__(self, spec, order, thresholds, defaults=None):
+        try:
+            self.id = spec['id']
+            self.device = spec['device']
+            self.action = spec['action']
+        except (TypeError, KeyError) as e:
+            raise RuleConfigError(f"Rule #{order} is missing {e}")
+        if not isinstance(self.id, str) or not isinstance(self.device, str):
+            raise RuleConfigError(f"Rule #{order}: id and device must be strings")
+        self.reason = spec.get('reason', self.id)
+        if not isinstance(self.reason, str):
+            raise RuleConfigError(f"Rule {self.id}: reason must be a string")
+        self.on_stale = spec.get('on_stale', (defaults or {}).get('on_stale', 'ignore'))
+        if self.on_stale not in STALE_MODES:
+            raise RuleConfigError(f"Rule {self.id}: on_stale must be one of {STALE_MODES}")
+        when = spec.get('when', [])
+        if not isinstance(when, list):
+            raise RuleConfigError(f"Rule {self.id}: 'when' must be a list of conditions")
+        try:
+            self.priority = _number(spec.get('priority', 0), 'priority', integer=True)
+            self.hold = _number(spec.get('hold', 0), 'hold', thresholds, minimum=0)
+            self.conditions = [Condition(c, thresholds) for c in when]
+        except RuleConfigError as e:
+            raise RuleConfigError(f"Rule {self.id}: {e}")
+        self.order = order
+        self._since = None
+        self._held = False
+
+    @property
+    def signals(self):
+        return {c.signal for c in self.conditions}
+
+    def evaluate(self, values, thresholds, now, is_stale):
+        """(지금 만족하는지, hold가 끝나는 시각 또는 None)"""
+        if self.on_stale != 'ignore' and any(
+                c.op != 'stale' and is_stale(c.signal) for c in self.conditions):
+            if self.on_stale == 'hold':
+                return self._held, None
+            self._since = None
+            self._held = False
+            return False, None
+
+        # 모든 조건을 평가해 hysteresis 상태를 갱신한다
+        results = [c.test(values, thresholds, is_stale) for c in self.conditions]
+        self._held = False
+        if not all(results):
+            self._since = None
+            return False, None
+        if self._since is None:
+            self._since = now
+        hold_until = self._since + float(resolve(self.hold, thresholds))
+        if now >= hold_until:
+            self._held = True
+            return True, None
+        return False, hold_until
+
+    def format_reason(self, values, thresholds):
+        try:
+            return self.reason.format(**{**thresholds, **values})
+        except (KeyError, ValueError, TypeError, IndexError):
+            return self.reason
+
+    def describe(self):
+        return {
+            'id': self.id,
+            'device': self.device,
+            'action': self.action,
+            'priority': self.priority,
+            'hold': self.hold,
+            'on_stale': self.on_stale,
+            'when': [{'signal': c.signal, 'op': c.op, 'value': c.value, 'hysteresis': c.hysteresis}
+                     for c in self.conditions],
+        }
+
+
+class DeviceEvaluator:
+    """한 장치의 규칙들 - 만족한 규칙 중 priority가 가장 높은(같으면 먼저 정의된) 규칙의 action 적용
+
+    결정 엔진에 규칙 하나로 등록되며, 장치 규칙이 의존하는 신호가 바뀔 때만 실행된다.
+    """
+
+    def __init__(self, device, rules, ruleset):
+        self.device = device
+        self.rules = sorted(rules, key=lambda r: (-r.priority, r.order))
+        self.signals = set().union(*(r.signals for r in rules))
+        self.ruleset = ruleset
+        self.active = None      # 마지막으로 선택된 규칙 id
+
+    def __call__(self, engine):
+        ruleset = self.ruleset
+        values = ruleset.read_state()     # 평가 한 번은 한 시점의 상태와 한 버전의 임계값만 본다
+        thresholds = ruleset.thresholds().for_device(self.device)
+        now = engine.clock()
+        chosen = None
+        wake_at = None
+        for rule in self.rules:
+            satisfied, hold_until = rule.evaluate(values, thresholds, now, ruleset.is_stale)
+            if satisfied and chosen is None:
+                chosen = rule
+            if hold_until is not None and (wake_at is None or hold_until < wake_at):
+                wake_at = hold_until
+
+        if wake_at is not None:
+            engine.call_at(wake_at, self)
+        else:
+            engine.cancel(self)
+        if chosen is not None:
+            self.active = chosen.id
+            ruleset.actuate(self.device, chosen.action, chosen.format_reason(values, thresholds))
+
+
+class RuleSet:
+    """설정 dict를 장치별 평가기와 signal -> 규칙 색인으로 컴파일한 결과
+
+    read_state()는 신호 이름 -> 값 매핑(상태 스냅샷)을, is_stale(signal)은 그 신호 값이
+    오래됐는지를, thresholds()는 현재 임계값 스냅샷(ThresholdSnapshot)을 돌려준다.
+    """
+
+    def __init__(self, config, read_state, thresholds, actuate, devices=None, source=None,
+                 is_stale=None):
+        if not isinstance(config, dict) or not isinstance(config.get('rules'), list):
+            raise RuleConfigError("Rule config must be an object with a 'rules' list")
+        self.read_state = read_state
+        self.is_stale = is_stale or (lambda signal: False)
+        self.thresholds = thresholds
+        self.actuate = actuate
+        self.source = source
+
+        defaults = config.get('defaults', {})
+        if not isinstance(defaults, dict):
+            raise RuleConfigError("'defaults' must be an object")
+        known = thresholds().values
+        self.rules = [Rule(spec, order, known, defaults) for order, spec in enumerate(config['rules'])]
+        ids = [r.id for r in self.rules]
+        duplicates = sorted({i for i in ids if ids.count(i) > 1})
+        if duplicates:
+            raise RuleConfigError(f"Duplicate rule ids: {duplicates}")
+        if devices is not None:
+            unknown = sorted({r.device for r in self.rules} - set(devices))
+            if unknown:
+                raise RuleConfigError(f"Unknown devices: {unknown}")
+
+        by_device = {}
+        for rule in self.rules:
+            by_device.setdefault(rule.device, []).append(rule)
+        self.evaluators = [DeviceEvaluator(device, rules, self) for device, rules in by_device.items()]
+
+        self.signal_index = {}
+        for rule in self.rules:
+            for signal in rule.signals:
+                self.signal_index.setdefault(signal, []).append(rule.id)
+
+    def install(self, engine):
+        """결정 엔진의 규칙을 이 규칙 집합으로 교체하고 전체 재평가"""
+        engine.replace([(evaluator, evaluator.signals) for evaluator in self.evaluators])
+
+    def describe(self):
+        return {
+            'source': self.source,
+            'rules': [r.describe() for r in self.rules],
+            'active': {e.device: e.active for e in self.evaluators},
+            'signal_index': self.signal_index,
+        }
+
+
+def resolve(value, thresholds):
+    """"$이름"이면 현재 임계값, 아니면 그대로"""
+    if isinstance(value, str) and value.startswith('$'):
+        return thresholds[value[1:]]
+    return value
+
+
+def _check_reference(value, thresholds):
+    if isinstance(value, str) and value.startswith('$') and value[1:] not in thresholds:
+        raise RuleConfigError(f"Unknown threshold: {value}")
+
+
+def _number(value, what, thresholds=None, integer=False, minimum=None):
+    """규칙 설정의 숫자 검증/변환 (thresholds가 있으면 "$임계값" 참조도 허용) - 잘못되면 RuleConfigError
+
+    평가 중에 float()/int()가 실패하지 않도록 컴파일할 때 모두 걸러낸다.
+    """
+    if thresholds is not None and isinstance(value, str) and value.startswith('$'):
+        _check_reference(value, thresholds)
+        return value
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+        raise RuleConfigError(f"{what} must be a number, got {value!r}")
+    if integer and value != int(value):
+        raise RuleConfigError(f"{what} must be an integer, got {value!r}")
+    if minimum is not None and value < minimum:
+        raise RuleConfigError(f"{what} must be >= {minimum}, got {value!r}")
+    return int(value) if integer else value
+
+
+def load_rules(path, read_state, thresholds, actuate, devices=None, is_stale=None):
+    """규칙 파일을 읽어 RuleSet으로 컴파일"""
+    try:
+        with open(path, encoding='utf-8') as f:
+            config = json.load(f)
+    except ValueError as e:
+        raise RuleConfigError(f"Invalid JSON in {path}: {e}")
+    return RuleSet(config, read_state, thresholds, actuate, devices, source=path, is_stale=is_stale)
+
+
+class RuleReloader:
+    """규칙 파일을 컴파일해 설치, check()로 mtime이 바뀌었으면 다시 교체 (실패하면 기존 규칙 유지)"""
+
+    def __init__(self, engine, path, read_state, thresholds, actuate, devices=None,
+                 is_stale=None):
+        self.engine = engine
+        self.path = path
+        self.read_state = read_state
+        self.thresholds = thresholds
+        self.actuate = actuate
+        self.devices = devices
+        self.is_stale = is_stale
+        self.ruleset = None
+        self._mtime = None
+        self.stats = {'loads': 0, 'errors': 0, 'last_error': None}
+
+    def load(self):
+        """규칙 파일을 (다시) 읽어 설치, 성공하면 True"""
+        try:
+            mtime = os.path.getmtime(self.path)
+            ruleset = load_rules(self.path, self.read_state, self.thresholds, self.actuate,
+                                 self.devices, self.is_stale)
+        except (OSError, ValueError, TypeError) as e:
+            # RuleConfigError도 ValueError - 어떤 설정 오류든 기존 규칙을 그대로 둔다
+            self.stats['errors'] += 1
+            self.stats['last_error'] = str(e)
+            print(f"[RULES ERROR] {e}", flush=True)
+            return False
+        self._mtime = mtime
+        self.ruleset = ruleset
+        ruleset.install(self.engine)
+        self.stats['loads'] += 1
+        self.stats['last_error'] = None
+        print(f"[RULES] Loaded {len(ruleset.rules)} rules for "
+              f"{len(ruleset.evaluators)} devices from {self.path}", flush=True)
+        return True
+
+    def check(self):
+        """파일이 바뀌었으면 다시 읽는다"""
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return False
+        if mtime == self._mtime:
+            return False
+        self._mtime = mtime     # 잘못된 파일을 매번 다시 읽지 않도록 먼저 기록
+        return self.load()
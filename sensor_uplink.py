@@ -0,0 +1,261 @@
+import json
+import os
+import random
+import threading
+import time
+from collections import deque
+
+import requests
+
+# 업링크 설정
+UPLINK_BATCH_SIZE = int(os.getenv('UPLINK_BATCH_SIZE', '20'))         # 전송 실패 후: 이만큼 모이면 즉시 전송
+UPLINK_MAX_AGE = float(os.getenv('UPLINK_MAX_AGE', '0.5'))            # 전송 실패 후: 가장 오래된 측정값 대기 시간 (초)
+UPLINK_BUFFER_SIZE = int(os.getenv('UPLINK_BUFFER_SIZE', '1000'))     # 메모리 링 버퍼 크기
+UPLINK_SPOOL_DIR = os.getenv('UPLINK_SPOOL_DIR', 'spool')             # 서버 장애 시 디스크 보관 위치
+UPLINK_SPOOL_MAX_BYTES = int(os.getenv('UPLINK_SPOOL_MAX_BYTES', str(50 * 1024 * 1024)))
+UPLINK_REPLAY_CHUNK = int(os.getenv('UPLINK_REPLAY_CHUNK', '500'))    # 재전송 요청당 측정값 수
+UPLINK_TIMEOUT = float(os.getenv('UPLINK_TIMEOUT', '5'))
+UPLINK_BACKOFF_MAX = float(os.getenv('UPLINK_BACKOFF_MAX', '60'))
+# 센서가 설치된 방 (없으면 기본 방) - SENSOR_ROOM이 있으면 우선, 없으면 장치 에이전트와 같은 DEVICE_ROOM
+UPLINK_ROOM = os.getenv('SENSOR_ROOM') or os.getenv('DEVICE_ROOM') or None
+
+
+class SensorUplink:
+    """센서 측정값을 모아 /sensor/batch로 전송 (keep-alive 세션, 링 버퍼, 디스크 스풀, 지수 백오프)
+
+    측정값은 측정 시각(ts)을 달고 들어오며, 서버가 내려가 있는 동안의 값은 스풀 파일에
+    쌓였다가 복구 후 원래 순서대로 재전송된다.
+
+    직전 전송이 성공했으면 측정값은 기다리지 않고 바로 보낸다 (제어/신선도 판단 지연 방지).
+    전송 중에 들어온 값은 버퍼에 모였다가 다음 요청에 한꺼번에 가므로, 밀릴 때만 배치가 된다.
+    """
+
+    def __init__(self, server_url, name, room=UPLINK_ROOM,
+                 batch_size=UPLINK_BATCH_SIZE,
+                 max_age=UPLINK_MAX_AGE,
+                 buffer_size=UPLINK_BUFFER_SIZE,
+                 spool_dir=UPLINK_SPOOL_DIR,
+                 timeout=UPLINK_TIMEOUT,
+                 backoff_max=UPLINK_BACKOFF_MAX):
+        self.url = f"{server_url.rstrip('/')}/sensor/batch"
+        self.room = room
+        self.batch_size = batch_size
+        self.max_age = max_age
+        self.timeout = timeout
+        self.backoff_max = backoff_max
+        self.spool_path = os.path.join(spool_dir, f'{name}.jsonl')
+        os.makedirs(spool_dir, exist_ok=True)
+
+        self.session = requests.Session()
+        self._buffer = deque(maxlen=buffer_size)
+        self._cond = threading.Condition()
+        self._failures = 0
+        self._retry_at = 0.0
+        self._stopped = False
+        self._thread = None
+        self.stats = {'sent': 0, 'spooled': 0, 'replayed': 0, 'dropped': 0, 'failures': 0}
+
+    # --- 공개 API ---
+
+    def add(self, reading):
+        """측정값 한 건 추가 (ts가 없으면 지금 시각)"""
+        reading = dict(reading)
+        reading.setdefault('ts', time.time())
+        with self._cond:
+            if len(self._buffer) == self._buffer.maxlen:
+                # 링 버퍼가 가득 차면 잃어버리기 전에 디스크로 옮긴다
+                self._spill(list(self._buffer))
+                self._buffer.clear()
+            self._buffer.append(reading)
+            if self._failures == 0 or len(self._buffer) >= self.batch_size:
+                self._cond.notify()
+
+    def start(self):
+        """전송 스레드 시작"""
+        if self._thread is not None:
+            return self
+        self._thread = threading.Thread(target=self._run, name='sensor-uplink', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=10):
+        """남은 측정값을 한 번 더 전송해 보고, 실패하면 스풀에 남긴다"""
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        with self._cond:
+            pending = list(self._buffer)
+            self._buffer.clear()
+        if pending:
+            # 스풀이 남아 있으면 순서를 지키기 위해 뒤에 붙이기만 한다
+            with self._cond:
+                spooled = os.path.exists(self.spool_path)
+            if spooled or not self._post(pending):
+                with self._cond:
+                    self._spill(pending)
+        self.session.close()
+
+    def pending(self):
+        """메모리 버퍼 + 스풀에 남아 있는 측정값 수"""
+        with self._cond:
+            return len(self._buffer) + len(self._read_spool())
+
+    # --- 전송 루프 ---
+
+    def _due(self):
+        """지금 전송해야 하는지 (정상이면 바로, 실패 후에는 크기/나이 기준, 스풀 재전송)"""
+        if time.monotonic() < self._retry_at:
+            return False
+        if os.path.exists(self.spool_path):
+            return True
+        if not self._buffer:
+            return False
+        if self._failures == 0 or len(self._buffer) >= self.batch_size:
+            return True
+        return time.time() - self._buffer[0]['ts'] >= self.max_age
+
+    def _wait_time(self):
+        now = time.monotonic()
+        if now < self._retry_at:
+            return self._retry_at - now
+        if self._buffer:
+            return max(0.05, self.max_age - (time.time() - self._buffer[0]['ts']))
+        return self.max_age
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._stopped and not self._due():
+                    self._cond.wait(self._wait_time())
+                if self._stopped:
+                    return
+
+            # 스풀이 남아 있으면 그것부터 (순서 보장)
+            if os.path.exists(self.spool_path):
+                if not self._replay_spool():
+                    continue
+
+            with self._cond:
+                batch = list(self._buffer)
+                self._buffer.clear()
+            if not batch:
+                continue
+            if not self._post(batch):
+                with self._cond:
+                    # 전송 중에 버퍼가 넘쳐 더 새로운 값이 먼저 스풀됐을 수 있으므로 그 앞에 넣는다
+                    self._spill(batch, front=True)
+
+    def _post(self, readings):
+        """배치 전송 - 성공(또는 재시도해도 소용없는 4xx)이면 True"""
+        try:
+            body = {'readings': readings}
+            if self.room:
+                body['room'] = self.room
+            response = self.session.post(self.url, json=body, timeout=self.timeout)
+        except requests.exceptions.RequestException as e:
+            self._backoff(f"Cannot reach central server: {e.__class__.__name__}")
+            return False
+
+        if response.status_code >= 500:
+            self._backoff(f"Server error: {response.status_code}")
+            return False
+        if response.status_code >= 400:
+            # 잘못된 데이터는 다시 보내도 거부되므로 버린다 (무엇을 버렸는지는 남긴다)
+            stamps = [r.get('ts') for r in readings if isinstance(r, dict) and r.get('ts') is not None]
+            span = f", ts {min(stamps)}..{max(stamps)}" if stamps else ''
+            print(f"✗ Batch rejected ({response.status_code}), dropping {len(readings)} readings{span}: "
+                  f"{response.text[:200]}", flush=True)
+            self.stats['dropped'] += len(readings)
+        else:
+            self.stats['sent'] += len(readings)
+
+        self._failures = 0
+        self._retry_at = 0.0
+        return True
+
+    def _backoff(self, reason):
+        self._failures += 1
+        self.stats['failures'] += 1
+        delay = min(self.backoff_max, 2 ** min(self._failures, 16)) * random.uniform(0.5, 1.0)
+        self._retry_at = time.monotonic() + delay
+        print(f"✗ {reason} - retrying in {delay:.1f}s", flush=True)
+
+    # --- 디스크 스풀 ---
+
+    def _spill(self, readings, front=False):
+        """측정값을 스풀 파일 끝에 추가 (호출자가 _cond를 잡고 있어야 함)
+
+        front=True면 이미 스풀된 값들보다 앞에 넣는다 (실패한 전송분이 그사이 스풀된 더 새로운
+        값보다 먼저 재전송되도록) - 임시 파일에 새로 써서 교체한다.
+        """
+        try:
+            size = os.path.getsize(self.spool_path) if os.path.exists(self.spool_path) else 0
+            if size > UPLINK_SPOOL_MAX_BYTES:
+                self.stats['dropped'] += len(readings)
+                print(f"✗ Spool full, dropping {len(readings)} readings", flush=True)
+                return
+            if front and size:
+                tmp_path = self.spool_path + '.tmp'
+                with open(tmp_path, 'w') as f, open(self.spool_path) as spooled:
+                    for reading in readings:
+                        f.write(json.dumps(reading) + '\n')
+                    for line in spooled:
+                        f.write(line if line.endswith('\n') else line + '\n')
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, self.spool_path)
+            else:
+                with open(self.spool_path, 'a') as f:
+                    for reading in readings:
+                        f.write(json.dumps(reading) + '\n')
+                    f.flush()
+                    os.fsync(f.fileno())
+            self.stats['spooled'] += len(readings)
+        except OSError as e:
+            self.stats['dropped'] += len(readings)
+            print(f"✗ Cannot write spool: {e}", flush=True)
+
+    def _read_spool(self):
+        if not os.path.exists(self.spool_path):
+            return []
+        readings = []
+        with open(self.spool_path) as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    readings.append(json.loads(line))
+                except ValueError:
+                    pass  # 전원 차단 등으로 잘린 마지막 줄
+        return readings
+
+    def _replay_spool(self):
+        """스풀을 오래된 것부터 청크 단위로 재전송, 전부 보내면 True"""
+        with self._cond:
+            readings = self._read_spool()
+        sent = 0
+        while sent < len(readings):
+            chunk = readings[sent:sent + UPLINK_REPLAY_CHUNK]
+            if not self._post(chunk):
+                break
+            sent += len(chunk)
+
+        with self._cond:
+            # 재전송 중 새로 스풀된 값은 뒤에 그대로 남긴다
+            remaining = self._read_spool()[sent:]
+            if remaining:
+                tmp_path = self.spool_path + '.tmp'
+                with open(tmp_path, 'w') as f:
+                    for reading in remaining:
+                        f.write(json.dumps(reading) + '\n')
+                os.replace(tmp_path, self.spool_path)
+            else:
+                os.remove(self.spool_path)
+
+        if sent:
+            self.stats['replayed'] += sent
+            print(f"✓ Replayed {sent} spooled readings", flush=True)
+        return not remaining
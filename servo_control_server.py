@@ -1,7 +1,14 @@
 #!/usr/bin/env python3
 from flask import Flask, request, jsonify
+import os
 import time
 
+try:
+    from device_agent import DeviceAgent
+except ImportError as e:
+    print(f"Warning: device_agent not available ({e}) - not registering with the central server", flush=True)
+    DeviceAgent = None
+
 try:
     import RPi.GPIO as GPIO
     GPIO_AVAILABLE = True
@@ -127,6 +134,12 @@ if __name__ == '__main__':
         print(f"Servo Pin: {SERVO_PIN}")
         print(f"Server Port: 5001")
         print("=" * 60)
+
+        # 중앙 서버 장치 레지스트리에 등록 - 어떤 장치(창문 등)를 맡는지는 DEVICE_TYPE으로
+        if DeviceAgent is not None:
+            DeviceAgent('actuator', os.getenv('DEVICE_TYPE', 'motor'), port=5001, capabilities={
+                'actions': ['open', 'close'], 'state': False,
+            }).start()
         
         app.run(host='0.0.0.0', port=5001, debug=False)
         
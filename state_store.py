@@ -0,0 +1,76 @@
+import threading
+from collections import namedtuple
+from types import MappingProxyType
+
+from storage import now_ms
+
+# 한 시점의 일관된 상태 - values/timestamps/versions는 읽기 전용 매핑
+StateSnapshot = namedtuple('StateSnapshot', ['version', 'values', 'timestamps', 'versions'])
+
+
+class StateStore:
+    """최신 센서 상태 저장소 (스레드 안전, 버전 관리, copy-on-write 스냅샷)
+
+    update()는 여러 필드를 한 번에 원자적으로 바꾸고, 값이 실제로 바뀐 경우에만 버전을 올린다.
+    snapshot()은 잠금 없이 현재 스냅샷 참조를 돌려주므로 읽는 쪽은 항상 한 시점의 값만 본다.
+    구독자 fn(changed, version)은 변경 순서대로, 변경을 만든 스레드에서 호출된다.
+    """
+
+    def __init__(self, initial):
+        self._lock = threading.Lock()
+        self._subscribers = []
+        self._snapshot = StateSnapshot(0, MappingProxyType(dict(initial)),
+                                       MappingProxyType({}), MappingProxyType({}))
+
+    @property
+    def version(self):
+        return self._snapshot.version
+
+    def snapshot(self):
+        """현재 상태 스냅샷 (불변, 잠금 없음)"""
+        return self._snapshot
+
+    def get(self, key, default=None):
+        return self._snapshot.values.get(key, default)
+
+    def subscribe(self, fn):
+        """변경 구독 - fn(changed dict, version)"""
+        self._subscribers.append(fn)
+
+    def update(self, fields, ts=None):
+        """여러 필드를 한 번에 갱신, 바뀐 필드 dict 반환
+
+        ts(epoch ms)가 필드의 마지막 시각보다 오래됐으면 그 필드는 무시한다
+        (재전송된 과거 측정값이 더 최근 값을 덮어쓰지 않도록).
+        """
+        ts = now_ms() if ts is None else ts
+        with self._lock:
+            current = self._snapshot
+            timestamps = None
+            changed = {}
+            for key, value in fields.items():
+                if ts < current.timestamps.get(key, 0):
+                    continue
+                if timestamps is None:
+                    timestamps = dict(current.timestamps)
+                timestamps[key] = ts
+                if current.values.get(key) != value:
+                    changed[key] = value
+            if timestamps is None:
+                return {}
+
+            values, versions, version = current.values, current.versions, current.version
+            if changed:
+                version += 1
+                values = MappingProxyType({**current.values, **changed})
+                versions = MappingProxyType({**current.versions, **{key: version for key in changed}})
+            self._snapshot = StateSnapshot(version, values, MappingProxyType(timestamps), versions)
+
+            # 잠금 안에서 알려 구독자가 변경을 버전 순서대로 받게 한다 (구독자는 즉시 반환해야 함)
+            if changed:
+                for fn in self._subscribers:
+                    try:
+                        fn(changed, version)
+                    except Exception as e:
+                        print(f"[STATE ERROR] Subscriber failed: {e}", flush=True)
+        return changed
@@ -1,148 +1,238 @@
 // 서버 주소
 const SERVER_URL = 'http://192.168.168.187:5000';
 
+// 표시할 방 (?room=, 없으면 서버 기본 방)
+const ROOM = new URLSearchParams(window.location.search).get('room');
+
+function roomUrl(path, params = {}) {
+    const query = new URLSearchParams(params);
+    if (ROOM) query.set('room', ROOM);
+    const text = query.toString();
+    return `${SERVER_URL}${path}${text ? '?' + text : ''}`;
+}
+
 // 졸음 감지를 위한 변수 (움직임이 없는 시간)
 const DROWSY_TIMEOUT = 300; // 5분 (300초)
 let lastMotionTime = null;
 
-// 센서 데이터 가져오기
+// 스트림이 안 될 때 폴링 주기 (밀리초)
+const POLL_INTERVAL = 2000;
+
+// 화면에 표시 중인 전체 상태 (/status 또는 /stream 이벤트로 갱신)
+const state = { sensor_data: {}, raw: {}, stale: {}, thresholds: {}, devices: {} };
+let hasState = false;
+let pollTimer = null;
+let statusVersion = null;   // 폴링 모드에서 마지막으로 받은 /status 버전
+let statusInstance = null;
+
+// 받은 상태 반영 (snapshot이면 교체, change면 바뀐 필드만 덮어쓰기)
+function applyState(data, replace) {
+    for (const section of ['sensor_data', 'raw', 'stale', 'thresholds', 'devices']) {
+        if (data[section] === undefined) continue;
+        state[section] = replace ? data[section] : Object.assign({}, state[section], data[section]);
+    }
+    hasState = true;
+
+    // 마지막 업데이트 시간
+    document.getElementById('last-update').textContent = 
+        '마지막 업데이트: ' + new Date().toLocaleTimeString('ko-KR');
+}
+
+// 서버 연결 상태 표시
+function setConnected(connected) {
+    document.getElementById('server-status').style.color = connected ? '#4CAF50' : '#ff4444';
+}
+
+// 센서 데이터 가져오기 (폴링 모드) - 이전 버전 이후 바뀐 필드만 받는다
 async function fetchSensorData() {
     try {
-        const response = await fetch(`${SERVER_URL}/status`);
+        const params = statusVersion !== null ? { since: statusVersion, instance: statusInstance } : {};
+        const response = await fetch(roomUrl('/status', params));
+        if (response.status === 304) {
+            setConnected(true);
+            return;
+        }
         const data = await response.json();
-        
-        // 센서 데이터
-        const sensors = data.sensor_data;
-        
-        // 1. 온도
-        if (sensors.temperature !== null) {
-            document.getElementById('temperature').textContent = sensors.temperature.toFixed(1);
+        if (data.changes !== undefined) {
+            applyState(data.changes, false);
         } else {
-            document.getElementById('temperature').textContent = '--';
+            applyState(data, true);
+            statusInstance = data.instance;
         }
+        statusVersion = data.version;
+        render(state);
+        setConnected(true);
+    } catch (error) {
+        console.error('데이터 가져오기 실패:', error);
+        setConnected(false);
+    }
+}
+
+function startPolling() {
+    if (pollTimer !== null) return;
+    fetchSensorData();
+    pollTimer = setInterval(fetchSensorData, POLL_INTERVAL);
+}
+
+// 변경 푸시 스트림 - 연결 중에는 바뀐 필드만 받고, 사용할 수 없으면 폴링으로 전환
+function startStream() {
+    if (!window.EventSource) {
+        startPolling();
+        return;
+    }
+    const source = new EventSource(roomUrl('/stream'));
+    source.addEventListener('snapshot', (event) => {
+        applyState(JSON.parse(event.data), true);
+        render(state);
+        setConnected(true);
+    });
+    source.addEventListener('change', (event) => {
+        applyState(JSON.parse(event.data), false);
+        render(state);
+    });
+    source.onopen = () => setConnected(true);
+    source.onerror = () => {
+        setConnected(false);
+        // 브라우저가 재접속을 포기한 경우(서버가 스트림을 거부 등)에만 폴링으로 전환
+        if (source.readyState === EventSource.CLOSED) {
+            startPolling();
+        }
+    };
+}
+
+// 센서가 응답하지 않아 값이 오래됐으면 카드를 흐리게 표시
+function markStale(cardId, field, stale) {
+    document.getElementById(cardId).classList.toggle('stale', Boolean(stale[field]));
+}
+
+// 화면 갱신
+function render(data) {
+    // 센서 데이터
+    const sensors = data.sensor_data;
+    const stale = data.stale || {};
+    markStale('temperature-card', 'temperature', stale);
+    markStale('co2-card', 'co2_level', stale);
+    markStale('noise-card', 'noise_level', stale);
+    
+    // 1. 온도
+    if (sensors.temperature !== null) {
+        document.getElementById('temperature').textContent = sensors.temperature.toFixed(1);
+    } else {
+        document.getElementById('temperature').textContent = '--';
+    }
+    
+    // 2. CO2
+    const co2Card = document.getElementById('co2-card');
+    if (sensors.co2_level !== null) {
+        const co2Num = Number(sensors.co2_level);
+        const co2Value = co2Num.toFixed(0);
+        document.getElementById('co2').textContent = co2Value;
         
-        // 2. CO2
-        const co2Card = document.getElementById('co2-card');
-        if (sensors.co2_level !== null) {
-	    const co2Num = Number(sensors.co2_level);
-            const co2Value = co2Num.toFixed(0);
-            document.getElementById('co2').textContent = co2Value;
-            
-            // 임계값 초과 시 경고
-            if (sensors.co2_level > data.thresholds.co2_high) {
-                co2Card.classList.add('alert');
-            } else {
-                co2Card.classList.remove('alert');
-            }
+        // 임계값 초과 시 경고
+        if (sensors.co2_level > data.thresholds.co2_high) {
+            co2Card.classList.add('alert');
         } else {
-            document.getElementById('co2').textContent = '--';
+            co2Card.classList.remove('alert');
         }
+    } else {
+        document.getElementById('co2').textContent = '--';
+    }
+    
+    // 3. 소음
+    const noiseCard = document.getElementById('noise-card');
+    if (sensors.noise_level !== null) {
+        const noiseValue = sensors.noise_level.toFixed(1);
+        document.getElementById('noise').textContent = noiseValue;
         
-        // 3. 소음
-        const noiseCard = document.getElementById('noise-card');
-        if (sensors.noise_level !== null) {
-            const noiseValue = sensors.noise_level.toFixed(1);
-            document.getElementById('noise').textContent = noiseValue;
-            
-            // 임계값 초과 시 경고
-            if (sensors.noise_level > data.thresholds.noise_high) {
-                noiseCard.classList.add('alert');
-            } else {
-                noiseCard.classList.remove('alert');
-            }
+        // 임계값 초과 시 경고
+        if (sensors.noise_level > data.thresholds.noise_high) {
+            noiseCard.classList.add('alert');
         } else {
-            document.getElementById('noise').textContent = '--';
+            noiseCard.classList.remove('alert');
         }
+    } else {
+        document.getElementById('noise').textContent = '--';
+    }
+    
+    // 4. 졸음 감지 (움직임 기반)
+    const drowsyCard = document.getElementById('drowsy-card');
+    const drowsyStatus = document.getElementById('drowsy-status');
+    const drowsyTime = document.getElementById('drowsy-time');
+    
+    if (sensors.motion_detected) {
+        // 움직임 감지됨
+        lastMotionTime = new Date(sensors.motion_timestamp);
+        drowsyStatus.textContent = '졸음 감지 안됨';
+        drowsyTime.textContent = '활동 중';
+        drowsyCard.classList.remove('drowsy', 'alert');
+    } else if (sensors.motion_timestamp) {
+        // 마지막 움직임으로부터 시간 계산
+        lastMotionTime = new Date(sensors.motion_timestamp);
+        const now = new Date();
+        const timeSinceMotion = Math.floor((now - lastMotionTime) / 1000); // 초 단위
         
-        // 4. 졸음 감지 (움직임 기반)
-        const drowsyCard = document.getElementById('drowsy-card');
-        const drowsyStatus = document.getElementById('drowsy-status');
-        const drowsyTime = document.getElementById('drowsy-time');
-        
-        if (sensors.motion_detected) {
-            // 움직임 감지됨
-            lastMotionTime = new Date(sensors.motion_timestamp);
-            drowsyStatus.textContent = '졸음 감지 안됨';
-            drowsyTime.textContent = '활동 중';
-            drowsyCard.classList.remove('drowsy', 'alert');
-        } else if (sensors.motion_timestamp) {
-            // 마지막 움직임으로부터 시간 계산
-            lastMotionTime = new Date(sensors.motion_timestamp);
-            const now = new Date();
-            const timeSinceMotion = Math.floor((now - lastMotionTime) / 1000); // 초 단위
-            
-            if (timeSinceMotion > DROWSY_TIMEOUT) {
-                // 졸음 감지
-                drowsyStatus.textContent = '졸음 감지됨';
-                const minutes = Math.floor(timeSinceMotion / 60);
-                drowsyTime.textContent = `${minutes}분간 움직임 없음`;
-                drowsyCard.classList.add('drowsy', 'alert');
-            } else {
-                // 아직 정상
-                drowsyStatus.textContent = '졸음 감지 안됨';
-                const remainingTime = DROWSY_TIMEOUT - timeSinceMotion;
-                const remainingMinutes = Math.floor(remainingTime / 60);
-                drowsyTime.textContent = `${remainingMinutes}분 후 졸음 감지`;
-                drowsyCard.classList.remove('drowsy', 'alert');
-            }
+        if (timeSinceMotion > DROWSY_TIMEOUT) {
+            // 졸음 감지
+            drowsyStatus.textContent = '졸음 감지됨';
+            const minutes = Math.floor(timeSinceMotion / 60);
+            drowsyTime.textContent = `${minutes}분간 움직임 없음`;
+            drowsyCard.classList.add('drowsy', 'alert');
         } else {
-            // 데이터 없음
-            drowsyStatus.textContent = '대기 중';
-            drowsyTime.textContent = '-';
+            // 아직 정상
+            drowsyStatus.textContent = '졸음 감지 안됨';
+            const remainingTime = DROWSY_TIMEOUT - timeSinceMotion;
+            const remainingMinutes = Math.floor(remainingTime / 60);
+            drowsyTime.textContent = `${remainingMinutes}분 후 졸음 감지`;
             drowsyCard.classList.remove('drowsy', 'alert');
         }
+    } else {
+        // 데이터 없음
+        drowsyStatus.textContent = '대기 중';
+        drowsyTime.textContent = '-';
+        drowsyCard.classList.remove('drowsy', 'alert');
+    }
 
-        // 5. LED 상태 기반 에어컨/히터 상태 업데이트
-        const ledState = sensors.led_state;
-        const acCard = document.getElementById('ac-card');
-        const acStatusElement = document.getElementById('ac-status');
-        const heaterCard = document.getElementById('heater-card');
-        const heaterStatusElement = document.getElementById('heater-status');
-
-        let acStatus = 'OFF';
-        let heaterStatus = 'OFF';
-
-        if (ledState === 'BLUE') {
-            acStatus = 'ON';
-            heaterStatus = 'OFF';
-        } else if (ledState === 'RED') {
-            acStatus = 'OFF';
-            heaterStatus = 'ON';
-        }
+    // 5. LED 상태 기반 에어컨/히터 상태 업데이트
+    const ledState = sensors.led_state;
+    const acCard = document.getElementById('ac-card');
+    const acStatusElement = document.getElementById('ac-status');
+    const heaterCard = document.getElementById('heater-card');
+    const heaterStatusElement = document.getElementById('heater-status');
 
-        // 에어컨 상태 업데이트
-        acStatusElement.textContent = acStatus;
-        if (acStatus === 'ON') {
-            acCard.classList.add('on');
-        } else {
-            acCard.classList.remove('on');
-        }
+    let acStatus = 'OFF';
+    let heaterStatus = 'OFF';
 
-        // 히터 상태 업데이트
-        heaterStatusElement.textContent = heaterStatus;
-        if (heaterStatus === 'ON') {
-            heaterCard.classList.add('on');
-        } else {
-            heaterCard.classList.remove('on');
-        }
-        
-        // 마지막 업데이트 시간
-        document.getElementById('last-update').textContent = 
-            '마지막 업데이트: ' + new Date().toLocaleTimeString('ko-KR');
-        
-        // 서버 연결 정상
-        document.getElementById('server-status').style.color = '#4CAF50';
-        
-    } catch (error) {
-        console.error('데이터 가져오기 실패:', error);
-        document.getElementById('server-status').style.color = '#ff4444';
+    if (ledState === 'BLUE') {
+        acStatus = 'ON';
+        heaterStatus = 'OFF';
+    } else if (ledState === 'RED') {
+        acStatus = 'OFF';
+        heaterStatus = 'ON';
+    }
+
+    // 에어컨 상태 업데이트
+    acStatusElement.textContent = acStatus;
+    if (acStatus === 'ON') {
+        acCard.classList.add('on');
+    } else {
+        acCard.classList.remove('on');
+    }
+
+    // 히터 상태 업데이트
+    heaterStatusElement.textContent = heaterStatus;
+    if (heaterStatus === 'ON') {
+        heaterCard.classList.add('on');
+    } else {
+        heaterCard.classList.remove('on');
     }
 }
 
 // 초기화
 document.addEventListener('DOMContentLoaded', () => {
-    fetchSensorData();
-    
-    // 2초마다 센서 데이터 업데이트
-    setInterval(fetchSensorData, 2000);
+    startStream();
+
+    // 졸음 감지 경과 시간은 새 데이터가 없어도 흐르므로 화면만 주기적으로 다시 그린다
+    setInterval(() => {
+        if (hasState) render(state);
+    }, POLL_INTERVAL);
 });
@@ -0,0 +1,478 @@
+import os
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+# SQLite 연결/성능 설정
+SQLITE_SYNCHRONOUS = os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')           # WAL에서는 NORMAL로 충분
+SQLITE_CACHE_SIZE_KB = int(os.getenv('SQLITE_CACHE_SIZE_KB', '16384'))   # 연결당 페이지 캐시
+SQLITE_MMAP_SIZE = int(os.getenv('SQLITE_MMAP_SIZE', str(64 * 1024 * 1024)))
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', '5000'))
+SQLITE_STATEMENT_CACHE = int(os.getenv('SQLITE_STATEMENT_CACHE', '128'))
+SQLITE_POOL_SIZE = int(os.getenv('SQLITE_POOL_SIZE', '8'))
+
+# room을 지정하지 않은 센서/장치와 v6 이전 데이터가 속하는 방
+DEFAULT_ROOM = 'default'
+
+# 자주 쓰는 SQL 문 - 항상 같은 문자열을 써야 연결별 prepared statement 캐시가 재사용된다
+# ts 컬럼은 모두 UTC epoch 밀리초 정수
+INSERT_SENSOR_DATA = '''INSERT INTO sensor_data (ts, sensor_type_id, value)
+                        VALUES (?, ?, ?)'''
+INSERT_MOTION_LOG = '''INSERT INTO motion_log (ts, room, detected, is_drowsy_alert, idle_duration)
+                       VALUES (?, ?, ?, ?, ?)'''
+INSERT_NOISE_LOG = '''INSERT INTO noise_log (ts, room, noise_level, duration)
+                      VALUES (?, ?, ?, ?)'''
+INSERT_CONTROL_LOG = '''INSERT INTO control_log (ts, room, device, action, reason)
+                        VALUES (?, ?, ?, ?, ?)'''
+
+# ts를 ISO 문자열로 되돌려 기존 /logs 응답 형식(id, timestamp, ...)을 유지
+_ISO_TS = "strftime('%Y-%m-%dT%H:%M:%f', {col} / 1000.0, 'unixepoch')"
+
+LOG_QUERIES = {
+    'motion': f'''SELECT id, {_ISO_TS.format(col='ts')}, detected, is_drowsy_alert, idle_duration, room
+                  FROM motion_log ORDER BY ts DESC LIMIT ?''',
+    'noise': f'''SELECT id, {_ISO_TS.format(col='ts')}, noise_level, duration, room
+                 FROM noise_log ORDER BY ts DESC LIMIT ?''',
+    'control': f'''SELECT id, {_ISO_TS.format(col='ts')}, device, action, reason, room
+                   FROM control_log ORDER BY ts DESC LIMIT ?''',
+    'sensor': f'''SELECT d.id, {_ISO_TS.format(col='d.ts')}, t.name, d.value, t.unit, t.room
+                  FROM sensor_data d JOIN sensor_types t ON t.id = d.sensor_type_id
+                  ORDER BY d.ts DESC LIMIT ?''',
+}
+
+# ?room= 조회 - 로그 테이블은 (room, ts) 인덱스, 센서 데이터는 방별 sensor_type_id로 좁힌다
+LOG_QUERIES_BY_ROOM = {
+    'motion': f'''SELECT id, {_ISO_TS.format(col='ts')}, detected, is_drowsy_alert, idle_duration, room
+                  FROM motion_log WHERE room = ? ORDER BY ts DESC LIMIT ?''',
+    'noise': f'''SELECT id, {_ISO_TS.format(col='ts')}, noise_level, duration, room
+                 FROM noise_log WHERE room = ? ORDER BY ts DESC LIMIT ?''',
+    'control': f'''SELECT id, {_ISO_TS.format(col='ts')}, device, action, reason, room
+                   FROM control_log WHERE room = ? ORDER BY ts DESC LIMIT ?''',
+    'sensor': f'''SELECT d.id, {_ISO_TS.format(col='d.ts')}, t.name, d.value, t.unit, t.room
+                  FROM sensor_data d JOIN sensor_types t ON t.id = d.sensor_type_id
+                  WHERE t.room = ? ORDER BY d.ts DESC LIMIT ?''',
+}
+
+# 필터가 붙은 "최근 N건" 조회 - (sensor_type_id, ts) / (room, device, ts) 인덱스를 그대로 사용
+SENSOR_LOG_BY_TYPE_QUERY = f'''SELECT d.id, {_ISO_TS.format(col='d.ts')}, t.name, d.value, t.unit, t.room
+                               FROM sensor_data d JOIN sensor_types t ON t.id = d.sensor_type_id
+                               WHERE t.name = ? AND t.room = ? ORDER BY d.ts DESC LIMIT ?'''
+CONTROL_LOG_BY_DEVICE_QUERY = f'''SELECT id, {_ISO_TS.format(col='ts')}, device, action, reason, room
+                                  FROM control_log WHERE room = ? AND device = ? ORDER BY ts DESC LIMIT ?'''
+
+# ISO TEXT 타임스탬프 -> epoch 밀리초 변환식 (마이그레이션용, naive 값은 UTC로 간주)
+# 해석할 수 없는 값은 0(1970년)이 아니라 마이그레이션 시각으로 - 첫 보존 정리에 지워지지 않도록
+_TEXT_TO_MS = "CAST(ROUND((COALESCE(julianday({col}), julianday('now')) - 2440587.5) * 86400000) AS INTEGER)"
+
+# v2 마이그레이션 대상 (테이블, 옮겨지는 행 조건)
+_LEGACY_TABLES = [('sensor_data', 'sensor_type IS NOT NULL'), ('motion_log', '1'),
+                  ('noise_log', '1'), ('control_log', '1')]
+
+
+def _count_bad_timestamps(conn):
+    """v2 마이그레이션 전에 옮겨질 행 수와 타임스탬프를 해석할 수 없는 행 수를 기록"""
+    total = bad = 0
+    for table, where in _LEGACY_TABLES:
+        rows, unparseable = conn.execute(
+            f'SELECT COUNT(*), TOTAL(julianday(timestamp) IS NULL) FROM {table} WHERE {where}').fetchone()
+        total += rows
+        bad += int(unparseable)
+    if total:
+        print(f"✓ DB migration 2: rewriting {total} legacy rows to epoch ms"
+              + (f" ({bad} with unparseable timestamps stamped with the migration time)" if bad else ""),
+              flush=True)
+
+
+# 사전 집계(rollup) 해상도: (이름, 버킷 크기 ms) -> 테이블 sensor_rollup_<이름>
+ROLLUP_RESOLUTIONS = [('1m', 60 * 1000), ('1h', 3600 * 1000), ('1d', 86400 * 1000)]
+
+
+def _rollup_migration():
+    """rollup 테이블 생성 + 기존 원시 데이터로 채우기"""
+    statements = []
+    for name, bucket_ms in ROLLUP_RESOLUTIONS:
+        table = f'sensor_rollup_{name}'
+        statements += [
+            f'''CREATE TABLE {table}
+                (sensor_type_id INTEGER NOT NULL,
+                 bucket INTEGER NOT NULL,
+                 count INTEGER NOT NULL,
+                 sum REAL NOT NULL,
+                 min REAL,
+                 max REAL,
+                 last_ts INTEGER,
+                 last_value REAL,
+                 finalized INTEGER NOT NULL DEFAULT 0,
+                 PRIMARY KEY (sensor_type_id, bucket)) WITHOUT ROWID''',
+            f'''INSERT INTO {table} (sensor_type_id, bucket, count, sum, min, max, last_ts)
+                SELECT sensor_type_id, ts / {bucket_ms} * {bucket_ms}, COUNT(*), TOTAL(value),
+                       MIN(value), MAX(value), MAX(ts)
+                FROM sensor_data GROUP BY sensor_type_id, ts / {bucket_ms}''',
+            f'''UPDATE {table} SET last_value =
+                (SELECT value FROM sensor_data d
+                 WHERE d.sensor_type_id = {table}.sensor_type_id AND d.ts = {table}.last_ts
+                 LIMIT 1)''',
+            f'CREATE INDEX idx_{table}_open ON {table} (bucket) WHERE finalized = 0',
+        ]
+    return statements
+
+
+def _drop_rollup_finalized():
+    """rollup 테이블에서 아무도 읽지 않던 finalized 열과 부분 인덱스 제거 (테이블 재생성)"""
+    statements = []
+    for name, _ in ROLLUP_RESOLUTIONS:
+        table = f'sensor_rollup_{name}'
+        statements += [
+            f'''CREATE TABLE {table}_v2
+                (sensor_type_id INTEGER NOT NULL,
+                 bucket INTEGER NOT NULL,
+                 count INTEGER NOT NULL,
+                 sum REAL NOT NULL,
+                 min REAL,
+                 max REAL,
+                 last_ts INTEGER,
+                 last_value REAL,
+                 PRIMARY KEY (sensor_type_id, bucket)) WITHOUT ROWID''',
+            f'''INSERT INTO {table}_v2 (sensor_type_id, bucket, count, sum, min, max, last_ts, last_value)
+                SELECT sensor_type_id, bucket, count, sum, min, max, last_ts, last_value FROM {table}''',
+            f'DROP TABLE {table}',
+            f'ALTER TABLE {table}_v2 RENAME TO {table}',
+        ]
+    return statements
+
+
+# 스키마 마이그레이션 (버전, 설명, SQL 목록[, 트랜잭션 사용 여부]) - PRAGMA user_version으로 적용 여부 관리
+# SQL 목록에는 연결을 받아 실행할 함수도 넣을 수 있다 (검사/로그용)
+# VACUUM처럼 트랜잭션 안에서 실행할 수 없는 문은 네 번째 항목을 False로 둔다
+MIGRATIONS = [
+    (1, 'initial schema', [
+        '''CREATE TABLE IF NOT EXISTS sensor_data
+           (id INTEGER PRIMARY KEY AUTOINCREMENT,
+            timestamp TEXT,
+            sensor_type TEXT,
+            value REAL,
+            unit TEXT)''',
+        '''CREATE TABLE IF NOT EXISTS motion_log
+           (id INTEGER PRIMARY KEY AUTOINCREMENT,
+            timestamp TEXT,
+            detected BOOLEAN,
+            is_drowsy_alert BOOLEAN,
+            idle_duration REAL)''',
+        '''CREATE TABLE IF NOT EXISTS noise_log
+           (id INTEGER PRIMARY KEY AUTOINCREMENT,
+            timestamp TEXT,
+            noise_level REAL,
+            duration REAL)''',
+        '''CREATE TABLE IF NOT EXISTS control_log
+           (id INTEGER PRIMARY KEY AUTOINCREMENT,
+            timestamp TEXT,
+            device TEXT,
+            action TEXT,
+            reason TEXT)''',
+    ]),
+    (2, 'integer epoch timestamps, sensor type dictionary and indexes', [
+        _count_bad_timestamps,
+        '''CREATE TABLE sensor_types
+           (id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL UNIQUE,
+            unit TEXT)''',
+        '''INSERT INTO sensor_types (name, unit)
+           SELECT sensor_type, MAX(unit) FROM sensor_data
+           WHERE sensor_type IS NOT NULL GROUP BY sensor_type''',
+
+        '''CREATE TABLE sensor_data_v2
+           (id INTEGER PRIMARY KEY AUTOINCREMENT,
+            ts INTEGER NOT NULL,
+            sensor_type_id INTEGER NOT NULL REFERENCES sensor_types(id),
+            value REAL)''',
+        f'''INSERT INTO sensor_data_v2 (id, ts, sensor_type_id, value)
+            SELECT s.id, {_TEXT_TO_MS.format(col='s.timestamp')}, t.id, s.value
+            FROM sensor_data s JOIN sensor_types t ON t.name = s.sensor_type''',
+        'DROP TABLE sensor_data',
+        'ALTER TABLE sensor_data_v2 RENAME TO sensor_data',
+
+        '''CREATE TABLE motion_log_v2
+           (id INTEGER PRIMARY KEY AUTOINCREMENT,
+            ts INTEGER NOT NULL,
+            detected BOOLEAN,
+            is_drowsy_alert BOOLEAN,
+            idle_duration REAL)''',
+        f'''INSERT INTO motion_log_v2 (id, ts, detected, is_drowsy_alert, idle_duration)
+            SELECT id, {_TEXT_TO_MS.format(col='timestamp')}, detected, is_drowsy_alert, idle_duration
+            FROM motion_log''',
+        'DROP TABLE motion_log',
+        'ALTER TABLE motion_log_v2 RENAME TO motion_log',
+
+        '''CREATE TABLE noise_log_v2
+           (id INTEGER PRIMARY KEY AUTOINCREMENT,
+            ts INTEGER NOT NULL,
+            noise_level REAL,
+            duration REAL)''',
+        f'''INSERT INTO noise_log_v2 (id, ts, noise_level, duration)
+            SELECT id, {_TEXT_TO_MS.format(col='timestamp')}, noise_level, duration
+            FROM noise_log''',
+        'DROP TABLE noise_log',
+        'ALTER TABLE noise_log_v2 RENAME TO noise_log',
+
+        '''CREATE TABLE control_log_v2
+           (id INTEGER PRIMARY KEY AUTOINCREMENT,
+            ts INTEGER NOT NULL,
+            device TEXT,
+            action TEXT,
+            reason TEXT)''',
+        f'''INSERT INTO control_log_v2 (id, ts, device, action, reason)
+            SELECT id, {_TEXT_TO_MS.format(col='timestamp')}, device, action, reason
+            FROM control_log''',
+        'DROP TABLE control_log',
+        'ALTER TABLE control_log_v2 RENAME TO control_log',
+
+        'CREATE INDEX idx_sensor_data_type_ts ON sensor_data (sensor_type_id, ts)',
+        'CREATE INDEX idx_sensor_data_ts ON sensor_data (ts)',
+        'CREATE INDEX idx_motion_log_ts ON motion_log (ts)',
+        'CREATE INDEX idx_noise_log_ts ON noise_log (ts)',
+        'CREATE INDEX idx_control_log_device_ts ON control_log (device, ts)',
+        'CREATE INDEX idx_control_log_ts ON control_log (ts)',
+    ]),
+    (3, 'covering index for sensor history scans', [
+        'DROP INDEX idx_sensor_data_type_ts',
+        'CREATE INDEX idx_sensor_data_type_ts ON sensor_data (sensor_type_id, ts, value)',
+    ]),
+    (4, '1m/1h/1d sensor rollup tables', _rollup_migration()),
+    # 보존 기간 정리 후 파일 크기를 줄이려면 incremental auto_vacuum이 필요 (최초 1회 VACUUM)
+    (5, 'incremental auto-vacuum', [
+        'PRAGMA auto_vacuum=INCREMENTAL',
+        'VACUUM',
+    ], False),
+    # 센서 시계열은 방마다 별도 sensor_type_id를 받는다 - 기존 (sensor_type_id, ts, value) 인덱스와
+    # rollup 테이블이 그대로 방별 시계열 인덱스가 되므로 sensor_data에는 컬럼을 추가하지 않는다
+    (6, 'room namespace for sensor types and logs', [
+        f'''CREATE TABLE sensor_types_v2
+            (id INTEGER PRIMARY KEY,
+             name TEXT NOT NULL,
+             unit TEXT,
+             room TEXT NOT NULL DEFAULT '{DEFAULT_ROOM}',
+             UNIQUE (room, name))''',
+        'INSERT INTO sensor_types_v2 (id, name, unit) SELECT id, name, unit FROM sensor_types',
+        'DROP TABLE sensor_types',
+        'ALTER TABLE sensor_types_v2 RENAME TO sensor_types',
+        f"ALTER TABLE motion_log ADD COLUMN room TEXT NOT NULL DEFAULT '{DEFAULT_ROOM}'",
+        f"ALTER TABLE noise_log ADD COLUMN room TEXT NOT NULL DEFAULT '{DEFAULT_ROOM}'",
+        f"ALTER TABLE control_log ADD COLUMN room TEXT NOT NULL DEFAULT '{DEFAULT_ROOM}'",
+        'CREATE INDEX idx_motion_log_room_ts ON motion_log (room, ts)',
+        'CREATE INDEX idx_noise_log_room_ts ON noise_log (room, ts)',
+        'CREATE INDEX idx_control_log_room_ts ON control_log (room, ts)',
+        'DROP INDEX idx_control_log_device_ts',
+        'CREATE INDEX idx_control_log_room_device_ts ON control_log (room, device, ts)',
+    ]),
+    (7, 'device registry', [
+        '''CREATE TABLE devices
+           (id TEXT PRIMARY KEY,
+            kind TEXT NOT NULL,
+            room TEXT NOT NULL,
+            device TEXT NOT NULL,
+            url TEXT,
+            capabilities TEXT,
+            registered_at INTEGER NOT NULL,
+            last_seen INTEGER NOT NULL)''',
+    ]),
+    # 임계값 덮어쓰기 문서의 버전별 전체 사본 - 이력 조회와 되돌리기용으로 지우지 않는다
+    (8, 'versioned threshold configuration', [
+        '''CREATE TABLE threshold_config
+           (version INTEGER PRIMARY KEY,
+            ts INTEGER NOT NULL,
+            document TEXT NOT NULL,
+            changes TEXT NOT NULL,
+            source TEXT,
+            note TEXT)''',
+    ]),
+    # 늦게 온 샘플도 upsert로 버킷을 계속 고치므로 "닫힌 버킷" 표시는 의미가 없었다
+    (9, 'drop unused rollup finalized flag', _drop_rollup_finalized()),
+]
+
+
+def now_ms():
+    """현재 시각 (UTC epoch 밀리초)"""
+    return int(time.time() * 1000)
+
+
+def to_epoch_ms(value, default=None):
+    """epoch(초/밀리초) 숫자 또는 ISO 8601 문자열 -> epoch 밀리초
+
+    시간대가 없는 ISO 문자열은 서버 로컬 시간으로 해석한다 (컨테이너 기본값은 UTC).
+    잘못된 값이면 ValueError.
+    """
+    if value is None or value == '':
+        return default
+    if isinstance(value, bool):
+        raise ValueError(f"Invalid time: {value}")
+    if isinstance(value, str):
+        try:
+            number = float(value)
+        except ValueError:
+            try:
+                dt = datetime.fromisoformat(value.replace('Z', '+00:00'))
+            except ValueError:
+                raise ValueError(f"Invalid time: {value}")
+            return int(dt.timestamp() * 1000)
+    else:
+        number = float(value)
+    # 1e11 이상이면 밀리초, 미만이면 초 단위로 간주
+    return int(number if number >= 1e11 else number * 1000)
+
+
+class Storage:
+    """WAL 모드 SQLite 연결 풀과 스키마 마이그레이션 관리"""
+
+    def __init__(self, db_path, pool_size=SQLITE_POOL_SIZE):
+        self.db_path = db_path
+        self.pool_size = pool_size
+        self._pool = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+        self._connections = []
+        self._sensor_types = {}
+
+    def connect(self):
+        """PRAGMA가 적용된 새 연결 생성 (전용 스레드용)"""
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=SQLITE_BUSY_TIMEOUT_MS / 1000,
+            cached_statements=SQLITE_STATEMENT_CACHE,
+            check_same_thread=False,
+        )
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute(f'PRAGMA synchronous={SQLITE_SYNCHRONOUS}')
+        conn.execute(f'PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}')
+        conn.execute(f'PRAGMA mmap_size={SQLITE_MMAP_SIZE}')
+        conn.execute(f'PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}')
+        conn.execute('PRAGMA temp_store=MEMORY')
+        with self._lock:
+            self._connections.append(conn)
+        return conn
+
+    @contextmanager
+    def connection(self):
+        """풀에서 연결을 빌려 쓰고 반납"""
+        try:
+            conn = self._pool.get_nowait()
+        except queue.Empty:
+            conn = None
+            with self._lock:
+                can_create = self._created < self.pool_size
+                if can_create:
+                    self._created += 1
+            if can_create:
+                conn = self.connect()
+            else:
+                conn = self._pool.get()
+
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            self._pool.put(conn)
+
+    def query(self, sql, params=()):
+        """읽기 전용 쿼리 실행 후 전체 결과 반환"""
+        with self.connection() as conn:
+            return conn.execute(sql, params).fetchall()
+
+    def preload_sensor_types(self, types, rooms):
+        """방마다 (센서 종류, 단위)를 미리 등록하고 전체 sensor_types를 캐시에 올린다
+
+        수집 경로(이벤트 루프 포함)에서 sensor_type_id가 DB를 건드리지 않도록 시작 시 한 번 호출.
+        """
+        with self.connection() as conn:
+            with conn:
+                conn.executemany('INSERT OR IGNORE INTO sensor_types (name, unit, room) VALUES (?, ?, ?)',
+                                 [(name, unit, room) for room in rooms for name, unit in types])
+            rows = conn.execute('SELECT room, name, id FROM sensor_types').fetchall()
+        self._sensor_types.update(((room, name), type_id) for room, name, type_id in rows)
+        return len(rows)
+
+    def sensor_type_id(self, name, unit=None, room=DEFAULT_ROOM):
+        """(방, 센서 종류 이름) -> sensor_types.id (캐시에 없으면 등록 후 캐시 - 동기 DB 접근)"""
+        key = (room, name)
+        type_id = self._sensor_types.get(key)
+        if type_id is not None:
+            return type_id
+
+        with self.connection() as conn:
+            with conn:
+                conn.execute('INSERT OR IGNORE INTO sensor_types (name, unit, room) VALUES (?, ?, ?)',
+                             (name, unit, room))
+            type_id = conn.execute('SELECT id FROM sensor_types WHERE room = ? AND name = ?',
+                                   (room, name)).fetchone()[0]
+        self._sensor_types[key] = type_id
+        return type_id
+
+    def schema_version(self):
+        with self.connection() as conn:
+            return conn.execute('PRAGMA user_version').fetchone()[0]
+
+    def migrate(self):
+        """아직 적용되지 않은 마이그레이션을 순서대로 적용"""
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        conn = self.connect()
+        try:
+            current = conn.execute('PRAGMA user_version').fetchone()[0]
+            for version, description, statements, *options in MIGRATIONS:
+                if version <= current:
+                    continue
+                if options and not options[0]:
+                    for sql in statements:
+                        if callable(sql):
+                            sql(conn)
+                        else:
+                            conn.execute(sql)
+                    conn.execute(f'PRAGMA user_version={version}')
+                    print(f"✓ DB migration {version} applied: {description}", flush=True)
+                    current = version
+                    continue
+                # DDL도 한 트랜잭션으로 묶어 실패 시 버전 단위로 롤백
+                conn.execute('BEGIN')
+                try:
+                    for sql in statements:
+                        if callable(sql):
+                            sql(conn)
+                        else:
+                            conn.execute(sql)
+                    conn.execute(f'PRAGMA user_version={version}')
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    raise
+                print(f"✓ DB migration {version} applied: {description}", flush=True)
+                current = version
+        finally:
+            self._forget(conn)
+            conn.close()
+        return current
+
+    def close_all(self):
+        """열린 모든 연결 종료"""
+        with self._lock:
+            connections, self._connections = self._connections, []
+            self._created = 0
+        while True:
+            try:
+                self._pool.get_nowait()
+            except queue.Empty:
+                break
+        for conn in connections:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    def _forget(self, conn):
+        with self._lock:
+            if conn in self._connections:
+                self._connections.remove(conn)
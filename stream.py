@@ -0,0 +1,221 @@
+import asyncio
+import json
+import os
+import threading
+import time
+from collections import deque
+
+STREAM_BUFFER_SIZE = int(os.getenv('STREAM_BUFFER_SIZE', '1000'))   # 재접속 시 이어 보낼 수 있는 변경 수
+STREAM_HEARTBEAT = float(os.getenv('STREAM_HEARTBEAT', '15'))       # 변경이 없을 때 keep-alive 주기 (초)
+STREAM_RETRY_MS = int(os.getenv('STREAM_RETRY_MS', '3000'))         # 브라우저 재접속 대기 시간
+STREAM_MAX_CLIENTS = int(os.getenv('STREAM_MAX_CLIENTS', '50'))     # 동시 스트림 수 (각각 스레드 하나)
+
+
+class ChangeFeed:
+    """순번이 붙은 변경 이벤트 링 버퍼 - 스트림 구독자는 마지막으로 받은 순번 이후만 받는다
+
+    스레드 구독자는 wait(), asyncio 구독자는 wait_async()로 기다린다 (이벤트 루프당 깨우기 한 번).
+    """
+
+    def __init__(self, size=STREAM_BUFFER_SIZE):
+        self._events = deque(maxlen=size)      # (seq, {section: {field: value}})
+        self._seq = 0
+        self._cond = threading.Condition()
+        self._async_waiters = []               # (loop, future)
+        self.clients = 0
+
+    @property
+    def seq(self):
+        return self._seq
+
+    def attach(self):
+        with self._cond:
+            self.clients += 1
+
+    def detach(self):
+        with self._cond:
+            self.clients -= 1
+
+    def publish(self, changes):
+        """변경 {section: {field: value}} 추가, 새 순번 반환"""
+        with self._cond:
+            self._seq += 1
+            self._events.append((self._seq, changes))
+            self._cond.notify_all()
+            if self._async_waiters:
+                by_loop = {}
+                for loop, waiter in self._async_waiters:
+                    by_loop.setdefault(loop, []).append(waiter)
+                self._async_waiters = []
+                for loop, waiters in by_loop.items():
+                    loop.call_soon_threadsafe(_wake, waiters)
+            return self._seq
+
+    def since(self, seq):
+        """seq 이후의 이벤트 목록 - 버퍼에서 이미 밀려났으면 None (전체 스냅샷 필요)"""
+        with self._cond:
+            return self._since(seq)
+
+    def wait(self, seq, timeout):
+        """seq 이후 이벤트가 생길 때까지 최대 timeout초 대기"""
+        with self._cond:
+            if self._seq == seq:
+                self._cond.wait(timeout)
+            return self._since(seq)
+
+    async def wait_async(self, seq, timeout):
+        """wait()의 asyncio 버전 - 기다리는 동안 스레드를 차지하지 않는다"""
+        loop = asyncio.get_running_loop()
+        waiter = None
+        with self._cond:
+            if self._seq == seq:
+                waiter = loop.create_future()
+                self._async_waiters.append((loop, waiter))
+        if waiter is not None:
+            try:
+                await asyncio.wait_for(waiter, timeout)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                with self._cond:
+                    if (loop, waiter) in self._async_waiters:
+                        self._async_waiters.remove((loop, waiter))
+        with self._cond:
+            return self._since(seq)
+
+    def _since(self, seq):
+        if seq > self._seq:
+            return None                 # 서버 재시작 등으로 순번이 뒤로 갔다
+        if seq == self._seq:
+            return []
+        if not self._events or self._events[0][0] > seq + 1:
+            return None
+        return [event for event in self._events if event[0] > seq]
+
+
+def _wake(waiters):
+    for waiter in waiters:
+        if not waiter.done():
+            waiter.set_result(None)
+
+
+class CachedDocument:
+    """상태 버전(ChangeFeed 순번)이 바뀔 때만 다시 직렬화하는 JSON 문서
+
+    ETag는 서버 인스턴스 id와 버전으로 만들어 재시작 후 같은 버전 번호와 섞이지 않게 한다.
+    """
+
+    def __init__(self, feed, build):
+        self.feed = feed
+        self.build = build                  # version -> dict
+        self.instance = format(int(time.time() * 1000), 'x')
+        self._cached = (None, None, None)   # (version, body, etag)
+        self._lock = threading.Lock()
+        self.stats = {'builds': 0}
+
+    def get(self):
+        """(version, body bytes, etag)"""
+        version = self.feed.seq
+        cached = self._cached
+        if cached[0] == version:
+            return cached
+        with self._lock:
+            if self._cached[0] != version:
+                body = json.dumps(self.build(version), default=str).encode('utf-8')
+                self._cached = (version, body, self.etag(version))
+                self.stats['builds'] += 1
+            return self._cached
+
+    def etag(self, version):
+        return f'{self.instance}-{version}'
+
+
+def etag_matches(header, etag):
+    """If-None-Match 헤더 값이 etag와 맞는지 (약한 비교, *는 항상 일치)"""
+    if not header:
+        return False
+    for tag in header.split(','):
+        tag = tag.strip()
+        if tag == '*':
+            return True
+        if tag.startswith('W/'):
+            tag = tag[2:]
+        if tag.strip('"') == etag:
+            return True
+    return False
+
+
+def merge_changes(events):
+    """여러 변경 이벤트를 하나로 합친다 (같은 필드는 나중 값)"""
+    merged = {}
+    for _, changes in events:
+        for section, fields in changes.items():
+            merged.setdefault(section, {}).update(fields)
+    return merged
+
+
+def format_event(event, seq, data):
+    return f'id: {seq}\nevent: {event}\ndata: {json.dumps(data, default=str)}\n\n'
+
+
+def sse_stream(feed, last_id, snapshot, heartbeat=STREAM_HEARTBEAT):
+    """SSE 프레임 생성기
+
+    처음 접속하거나 last_id 이후 변경이 버퍼에 없으면 전체 상태(snapshot 이벤트)를 보내고,
+    그 뒤로는 바뀐 필드만 change 이벤트로 보낸다. 변경이 없으면 heartbeat 주석을 보낸다.
+    """
+    feed.attach()
+    try:
+        yield f'retry: {STREAM_RETRY_MS}\n\n'
+        seq = last_id
+        while True:
+            events = feed.since(seq) if seq is not None else None
+            if events is None:
+                # 순번을 먼저 읽고 스냅샷을 만든다 - 그 사이 변경은 다음 change로 다시 전달된다
+                seq = feed.seq
+                yield format_event('snapshot', seq, snapshot())
+                continue
+            if not events:
+                events = feed.wait(seq, heartbeat)
+                if events == []:
+                    yield ': heartbeat\n\n'
+                    continue
+                if events is None:
+                    continue
+            seq = events[-1][0]
+            yield format_event('change', seq, merge_changes(events))
+    finally:
+        feed.detach()
+
+
+async def sse_stream_async(feed, last_id, snapshot, heartbeat=STREAM_HEARTBEAT):
+    """sse_stream의 asyncio 버전 (ASGI 모드) - 연결마다 스레드를 쓰지 않는다"""
+    feed.attach()
+    try:
+        yield f'retry: {STREAM_RETRY_MS}\n\n'
+        seq = last_id
+        while True:
+            events = feed.since(seq) if seq is not None else None
+            if events is None:
+                seq = feed.seq
+                yield format_event('snapshot', seq, snapshot())
+                continue
+            if not events:
+                events = await feed.wait_async(seq, heartbeat)
+                if events == []:
+                    yield ': heartbeat\n\n'
+                    continue
+                if events is None:
+                    continue
+            seq = events[-1][0]
+            yield format_event('change', seq, merge_changes(events))
+    finally:
+        feed.detach()
+
+
+def parse_last_id(value):
+    """Last-Event-ID 헤더 또는 ?since= 값 -> 순번 (없거나 잘못되면 None)"""
+    try:
+        return int(value) if value not in (None, '') else None
+    except ValueError:
+        return None
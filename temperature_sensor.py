@@ -1,7 +1,9 @@
-import requests
 import time
 import os
 
+from sensor_uplink import SensorUplink
+from device_agent import DeviceAgent
+
 # BMP180 센서 초기화
 try:
     from smbus2 import SMBus
@@ -105,11 +107,17 @@ except Exception as e:
 
 # 중앙 서버의 주소
 CENTRAL_SERVER_URL = os.getenv('CENTRAL_SERVER_URL', 'http://127.0.0.1:5000')
-ENVIRONMENT_ENDPOINT = f"{CENTRAL_SERVER_URL}/sensor/environment"
 SEND_INTERVAL = 1  # 10초마다 데이터 전송
 
+# 측정값은 버퍼에 모아 /sensor/batch로 전송 (서버 장애 시 디스크 스풀 후 재전송)
+uplink = SensorUplink(CENTRAL_SERVER_URL, name='environment')
+
+# 중앙 서버 장치 레지스트리에 등록 + heartbeat
+agent = DeviceAgent('sensor', 'environment', server_url=CENTRAL_SERVER_URL, room=uplink.room,
+                    capabilities={'signals': ['temperature', 'pressure'], 'interval': SEND_INTERVAL})
+
 def send_sensor_data():
-    """센서 데이터를 중앙 서버로 전송"""
+    """센서 데이터를 읽어 업링크 버퍼에 추가"""
     if not SENSOR_AVAILABLE:
         print("[ERROR] Sensor not available, cannot send data.", flush=True)
         return
@@ -118,20 +126,15 @@ def send_sensor_data():
         temperature = bmp_sensor.read_temperature()
         pressure = bmp_sensor.read_pressure() / 100.0  # hPa 단위로 변환
 
-        payload = {
+        uplink.add({
+            'type': 'environment',
             'temperature': temperature,
             'pressure': pressure,
-        }
-
-        response = requests.post(ENVIRONMENT_ENDPOINT, json=payload, timeout=5)
-
-        if response.status_code == 200:
-            print(f"✓ Sent to server: Temp={temperature:.1f}°C, Pressure={pressure:.1f}hPa", flush=True)
-        else:
-            print(f"✗ Failed to send data. Status: {response.status_code}, Body: {response.text}", flush=True)
+            'ts': time.time(),
+        })
 
     except Exception as e:
-        print(f"[ERROR] An error occurred while sending data: {e}", flush=True)
+        print(f"[ERROR] An error occurred while reading sensor: {e}", flush=True)
 
 if __name__ == "__main__":
     if not SENSOR_AVAILABLE:
@@ -145,6 +148,14 @@ if __name__ == "__main__":
     print(f"Sending data every {SEND_INTERVAL} seconds...", flush=True)
     print("=" * 40, flush=True)
 
-    while True:
-        send_sensor_data()
-        time.sleep(SEND_INTERVAL)
+    uplink.start()
+    agent.start()
+    try:
+        while True:
+            send_sensor_data()
+            time.sleep(SEND_INTERVAL)
+    except KeyboardInterrupt:
+        print("\nShutting down...", flush=True)
+    finally:
+        agent.stop()
+        uplink.stop()
@@ -0,0 +1,71 @@
+import json
+import os
+import sys
+import tempfile
+import time
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# central_server는 import 시점에 환경 변수를 읽으므로 테스트용 값을 먼저 넣는다
+_SESSION_DIR = tempfile.mkdtemp(prefix='iot-tests-')
+TEST_ROOMS = {'default': {}, 'lab': {'thresholds': {'temp_high': 26}}, 'attic': {}, 'annex': {}}
+with open(os.path.join(_SESSION_DIR, 'rooms.json'), 'w') as f:
+    json.dump({'rooms': TEST_ROOMS}, f)
+
+os.environ.update({
+    'DB_PATH': os.path.join(_SESSION_DIR, 'iot.db'),
+    'ROOMS_PATH': os.path.join(_SESSION_DIR, 'rooms.json'),
+    'RULES_PATH': os.path.join(ROOT, 'config', 'rules.json'),
+    'FILTERS_PATH': os.path.join(ROOT, 'config', 'filters.json'),
+    'ARCHIVE_DIR': os.path.join(_SESSION_DIR, 'archive'),
+    'UPLINK_SPOOL_DIR': os.path.join(_SESSION_DIR, 'spool'),
+    'DB_FLUSH_INTERVAL': '0.02',
+    'ACTUATOR_PROBE_INTERVAL': '0',
+    'ACTUATOR_COALESCE': '0',
+    'ACTUATOR_TIMEOUT': '0.2',
+    'LOG_LEVEL': 'WARNING',
+})
+# 제어 명령은 바로 연결 거부되는 주소로 (실제 장치에 닿거나 타임아웃을 기다리지 않도록)
+for name in ('AC', 'HEATER', 'VENT', 'LIGHT', 'ALARM', 'LED', 'MOTOR'):
+    os.environ[f'{name}_ENDPOINT'] = 'http://127.0.0.1:9/control'
+
+
+def wait_for(predicate, timeout=3.0, interval=0.01):
+    """predicate()가 참이 될 때까지 기다린다 (백그라운드 스레드 결과 확인용)"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(interval)
+    return predicate()
+
+
+@pytest.fixture
+def storage(tmp_path):
+    """최신 스키마까지 마이그레이션된 빈 DB"""
+    from storage import Storage
+    store = Storage(str(tmp_path / 'test.db'), pool_size=2)
+    store.migrate()
+    yield store
+    store.close_all()
+
+
+@pytest.fixture(scope='session')
+def server():
+    """central_server 모듈 (세션 DB, 기록 스레드와 방 엔진 시작) - 방마다 상태가 남으므로 테스트는 서로 다른 방/값을 쓴다"""
+    import central_server
+    central_server.init_db()
+    central_server.db_writer.start()
+    central_server.thresholds.load()
+    central_server.rooms.start()
+    yield central_server
+    central_server.rooms.stop()
+    central_server.db_writer.stop()
+
+
+@pytest.fixture
+def client(server):
+    return server.app.test_client()
@@ -0,0 +1,302 @@
+import threading
+import time
+
+import requests
+
+from actuators import ActuatorDispatcher, ActuatorWorker, CircuitBreaker, parse_timeouts
+from conftest import wait_for
+
+
+class FakeResponse:
+    def __init__(self, status_code=200, body=None):
+        self.status_code = status_code
+        self.body = body
+
+    def json(self):
+        if self.body is None:
+            raise ValueError('no body')
+        return self.body
+
+
+class FakeSession:
+    """장치 대용 - 요청을 기록하고 respond(method, url, json)의 결과(응답 또는 예외)를 돌려준다"""
+
+    def __init__(self, respond=None, delay=0):
+        self.respond = respond or (lambda method, url, json: FakeResponse())
+        self.delay = delay
+        self.requests = []
+        self.lock = threading.Lock()
+
+    def request(self, method, url, timeout=None, json=None):
+        with self.lock:
+            self.requests.append((method, url, json))
+        if self.delay:
+            time.sleep(self.delay)
+        result = self.respond(method, url, json)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def close(self):
+        pass
+
+    def posts(self):
+        with self.lock:
+            return [body for method, _, body in self.requests if method == 'post']
+
+
+def dispatcher(sessions, on_result=None, **kwargs):
+    endpoints = {device: f'http://{device}.local:5000/control' for device in sessions}
+    d = ActuatorDispatcher(endpoints, on_result=on_result, probe_interval=0, **kwargs)
+    for device, session in sessions.items():
+        d.workers[device].session = session
+        d.workers[device].coalesce = 0
+    return d
+
+
+def test_parse_timeouts():
+    assert parse_timeouts('led=2, motor = 10,,bad') == {'led': 2.0, 'motor': 10.0}
+
+
+def test_per_device_timeouts_and_payload_keys():
+    d = ActuatorDispatcher({'led': 'http://a/control', 'motor': 'http://b/control'},
+                           timeouts={'motor': 9.0}, default_timeout=1.5, probe_interval=0)
+    assert d.workers['motor'].timeout == 9.0
+    assert d.workers['led'].timeout == 1.5
+    assert d.workers['led'].payload_key == 'color'
+    assert d.workers['motor'].payload_key == 'action'
+
+
+def test_slow_device_does_not_block_others():
+    slow, fast = FakeSession(delay=0.5), FakeSession()
+    results = []
+    d = dispatcher({'motor': slow, 'led': fast},
+                   on_result=lambda device, action, reason, ok, error: results.append((device, action, ok)))
+    d.start()
+    try:
+        started = time.monotonic()
+        assert d.dispatch('motor', 'OPEN', 'test')
+        assert d.dispatch('led', 'RED', 'test')
+        assert wait_for(lambda: ('led', 'RED', True) in results, timeout=1)
+        assert time.monotonic() - started < 0.4
+        assert fast.posts() == [{'color': 'RED'}]
+        assert wait_for(lambda: ('motor', 'OPEN', True) in results, timeout=2)
+    finally:
+        d.stop()
+
+
+def test_unknown_device_is_rejected():
+    d = dispatcher({})
+    assert not d.dispatch('toaster', 'ON', 'test')
+
+
+def test_failed_send_reports_the_error():
+    session = FakeSession(lambda method, url, json: requests.exceptions.ConnectionError())
+    results = []
+    d = dispatcher({'vent': session}, on_result=lambda *args: results.append(args))
+    d.start()
+    try:
+        d.dispatch('vent', 'ON', 'co2')
+        assert wait_for(lambda: results == [('vent', 'ON', 'co2', False, 'Cannot connect')])
+        assert d.states()['vent']['confirmed'] is None
+        assert d.states()['vent']['desired'] == 'ON'
+    finally:
+        d.stop()
+
+
+def test_add_replaces_the_worker_without_a_restart():
+    d = dispatcher({'led': FakeSession()})
+    d.start()
+    try:
+        old = d.workers['led']
+        d.add('led', 'http://new-led.local:5000/control')
+        assert d.workers['led'] is not old
+        assert d.workers['led'].url == 'http://new-led.local:5000/control'
+        assert d.remove('led')
+        assert not d.remove('led')
+    finally:
+        d.stop()
+
+
+def test_result_handler_errors_are_contained(capsys):
+    def broken(*args):
+        raise RuntimeError('handler failed')
+
+    worker = ActuatorWorker('led', 'http://led.local/control', 1, broken, coalesce=0)
+    worker.session = FakeSession()
+    worker.desired = ('ON', 'test')
+    worker._send_desired()
+    assert worker.confirmed == 'ON'
+    assert 'Result handler failed for led' in capsys.readouterr().out
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_breaker_opens_after_consecutive_failures():
+    clock = Clock()
+    breaker = CircuitBreaker('vent', failures=3, slow_ms=100, reset=30, clock=clock)
+    assert breaker.record(False, 1) is None
+    assert breaker.record(True, 1) is None          # 성공하면 연속 실패 수가 초기화된다
+    breaker.record(False, 1)
+    breaker.record(False, 1)
+    assert breaker.record(False, 1) == CircuitBreaker.OPEN
+    assert not breaker.allow()
+
+
+def test_slow_responses_count_as_failures():
+    breaker = CircuitBreaker('vent', failures=1, slow_ms=100, clock=Clock())
+    assert breaker.record(True, 250) == CircuitBreaker.OPEN
+
+
+def test_breaker_half_opens_then_closes_or_reopens():
+    clock = Clock()
+    breaker = CircuitBreaker('vent', failures=1, reset=30, clock=clock)
+    breaker.record(False, 1)
+    clock.now = 29
+    assert not breaker.allow()
+    clock.now = 30
+    assert breaker.allow()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+
+    # half-open에서 시험 요청이 실패하면 바로 다시 open
+    assert breaker.record(False, 1) == CircuitBreaker.OPEN
+    assert breaker.opened_at == 30
+    clock.now = 60
+    assert breaker.allow()
+    assert breaker.record(True, 1) == CircuitBreaker.CLOSED
+    assert breaker.failures == 0
+
+
+def test_open_circuit_records_desired_without_sending():
+    session = FakeSession()
+    worker = ActuatorWorker('vent', 'http://vent.local/control', 1, None, coalesce=0)
+    worker.session = session
+    worker.breaker = CircuitBreaker('vent', failures=1, reset=3600)
+    worker.breaker.record(False, 1)
+
+    worker.submit('ON', 'co2')
+    assert worker.stats['skipped'] == 1
+    assert worker.pending() == 0
+    assert worker.state() == {'desired': 'ON', 'confirmed': None, 'circuit': 'open'}
+    assert session.requests == []
+
+
+def test_healthy_probe_closes_the_circuit_and_reconciles():
+    clock = Clock()
+    session = FakeSession()
+    worker = ActuatorWorker('vent', 'http://vent.local:5000/control', 1, None, coalesce=0)
+    worker.session = session
+    worker.breaker = CircuitBreaker('vent', failures=1, reset=10, clock=clock)
+    worker.breaker.record(False, 1)
+    worker.submit('ON', 'co2')
+
+    clock.now = 10
+    worker.start()
+    try:
+        worker.probe()
+        assert wait_for(lambda: session.posts() == [{'action': 'ON'}])
+        assert wait_for(lambda: worker.confirmed == 'ON')
+        assert worker.breaker.state == CircuitBreaker.CLOSED
+        assert session.requests[0][:2] == ('get', 'http://vent.local:5000/state')
+    finally:
+        worker.stop()
+
+
+def test_failed_probe_keeps_the_circuit_open():
+    clock = Clock()
+    session = FakeSession(lambda method, url, json: requests.exceptions.Timeout())
+    worker = ActuatorWorker('vent', 'http://vent.local/control', 1, None, coalesce=0)
+    worker.session = session
+    worker.breaker = CircuitBreaker('vent', failures=1, reset=10, clock=clock)
+    worker.breaker.record(False, 1)
+    worker.submit('ON', 'co2')
+
+    clock.now = 10
+    worker._run_probe()
+    assert worker.breaker.state == CircuitBreaker.OPEN
+    assert worker.pending() == 0
+    assert worker.stats['last_error'] == 'Timeout after 1s'
+
+
+def state_device(state=None, state_status=200):
+    """/state에 state를 보고하는 장치 (state_status가 404면 /state 미지원)"""
+    def respond(method, url, json):
+        if url.endswith('/state'):
+            return FakeResponse(state_status, {'state': state} if state_status == 200 else None)
+        return FakeResponse()
+    return respond
+
+
+def test_flapping_within_the_coalesce_window_sends_only_the_last_state():
+    session = FakeSession()
+    worker = ActuatorWorker('ac', 'http://ac.local/control', 1, None, coalesce=0.1)
+    worker.session = session
+    worker.start()
+    try:
+        worker.submit('ON', 'hot')
+        worker.submit('OFF', 'normal')
+        worker.submit('ON', 'hot')
+        assert wait_for(lambda: worker.confirmed == 'ON')
+        assert session.posts() == [{'action': 'ON'}]
+
+        # confirmed와 같은 상태로 돌아오는 흔들림은 아무것도 보내지 않는다
+        worker.submit('OFF', 'normal')
+        worker.submit('ON', 'hot')
+        assert wait_for(lambda: worker.stats['coalesced'] == 1)
+        assert session.posts() == [{'action': 'ON'}]
+        assert worker.stats['requested'] == 5
+    finally:
+        worker.stop()
+
+
+def test_probe_corrects_a_device_that_drifted():
+    session = FakeSession(state_device('OFF'))
+    worker = ActuatorWorker('ac', 'http://ac.local/control', 1, None, coalesce=0)
+    worker.session = session
+    worker.desired = ('ON', 'hot')
+    worker.confirmed = 'ON'
+    worker.start()
+    try:
+        worker.probe()
+        assert wait_for(lambda: session.posts() == [{'action': 'ON'}])
+        assert worker.stats['corrected'] == 1
+    finally:
+        worker.stop()
+
+
+def test_unknown_state_leaves_confirmed_alone():
+    worker = ActuatorWorker('motor', 'http://motor.local/control', 1, None, coalesce=0)
+    worker.session = FakeSession(state_device(None))
+    worker.desired = ('OPEN', 'test')
+    worker.confirmed = 'OPEN'
+    worker._run_probe()
+    assert worker.confirmed == 'OPEN'
+    assert worker.pending() == 0        # 이미 그 위치인 장치를 다시 움직이지 않는다
+    assert worker.stats['corrected'] == 0
+
+
+def test_first_observation_is_not_a_correction():
+    worker = ActuatorWorker('motor', 'http://motor.local/control', 1, None, coalesce=0)
+    worker.session = FakeSession(state_device('CLOSE'))
+    worker._run_probe()
+    assert worker.confirmed == 'CLOSE'
+    assert worker.stats['corrected'] == 0
+
+
+def test_missing_state_endpoint_falls_back_to_health():
+    session = FakeSession(state_device(state_status=404))
+    worker = ActuatorWorker('led', 'http://led.local:5000/control', 1, None, coalesce=0)
+    worker.session = session
+    worker._run_probe()
+    worker._run_probe()
+    assert not worker.supports_state
+    assert [url for _, url, _ in session.requests] == ['http://led.local:5000/state',
+                                                       'http://led.local:5000/health',
+                                                       'http://led.local:5000/health']
+    assert worker.breaker.failures == 0     # 404는 장치 장애가 아니다
@@ -0,0 +1,164 @@
+import asyncio
+import json
+import time
+from urllib.parse import urlencode
+
+import msgpack
+import pytest
+
+from conftest import wait_for
+
+asgi_server = pytest.importorskip('asgi_server')
+if not asgi_server.ASGI_AVAILABLE:
+    pytest.skip('starlette/uvicorn are not installed', allow_module_level=True)
+
+
+class Result:
+    def __init__(self):
+        self.status = None
+        self.headers = {}
+        self.chunks = []
+
+    @property
+    def body(self):
+        return b''.join(self.chunks)
+
+    def json(self):
+        return json.loads(self.body)
+
+
+def call(method, path, query=None, body=b'', headers=None, chunks=None):
+    """ASGI 앱을 직접 호출 (httpx 없이) - chunks개의 본문 조각을 받으면 연결을 끊는다 (스트림용)"""
+    headers = dict(headers or {})
+    if body:
+        headers.setdefault('content-length', str(len(body)))
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+        'method': method, 'scheme': 'http', 'path': path, 'raw_path': path.encode(),
+        'root_path': '', 'query_string': urlencode(query or {}).encode(),
+        'headers': [(k.lower().encode(), v.encode()) for k, v in headers.items()],
+        'client': ('127.0.0.1', 50000), 'server': ('testserver', 5000),
+    }
+    result = Result()
+
+    async def run():
+        done = asyncio.Event()
+        sent = []
+
+        async def receive():
+            if not sent:
+                sent.append(True)
+                return {'type': 'http.request', 'body': body, 'more_body': False}
+            await done.wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                result.status = message['status']
+                result.headers = {k.decode(): v.decode() for k, v in message['headers']}
+            elif message['type'] == 'http.response.body':
+                if message.get('body'):
+                    result.chunks.append(message['body'])
+                if chunks is not None and len(result.chunks) >= chunks:
+                    done.set()
+                    raise asyncio.CancelledError
+
+        try:
+            await asyncio.wait_for(asgi_server.app(scope, receive, send), 5)
+        except asyncio.CancelledError:
+            pass
+
+    asyncio.run(run())
+    return result
+
+
+@pytest.fixture(autouse=True)
+def started(server):
+    """lifespan 대신 세션 서버(central_server)의 백그라운드 작업을 쓴다"""
+    return server
+
+
+def test_single_sensor_ingest(server):
+    resp = call('POST', '/sensor/co2', {'room': 'attic'}, json.dumps({'co2_level': 901}).encode(),
+                {'content-type': 'application/json'})
+    assert resp.status == 200
+    assert server.rooms.get('attic').raw_state.get('co2_level') == 901
+    assert call('POST', '/sensor/radon', body=b'{}').status == 404
+    assert call('POST', '/sensor/co2', body=b'not json').status == 400
+
+
+def test_batch_ingest_json_and_msgpack(server):
+    now = time.time()
+    body = msgpack.packb({'room': 'attic', 'readings': [[now, 'humidity', 44.0], [now, 'radon', 1]]})
+    resp = call('POST', '/sensor/batch', body=body, headers={'content-type': 'application/msgpack'})
+    assert resp.status == 200
+    assert (resp.json()['accepted'], resp.json()['rejected']) == (1, 1)
+    assert server.rooms.get('attic').raw_state.get('humidity') == 44.0
+
+    resp = call('POST', '/sensor/batch', body=b'{oops', headers={'content-type': 'application/json'})
+    assert resp.status == 400
+
+
+def test_full_queue_is_503_without_blocking_the_loop(server, monkeypatch):
+    calls = []
+
+    def submit_many(rows, block=None):
+        calls.append(block)
+        return False
+
+    monkeypatch.setattr(server.db_writer, 'submit_many', submit_many)
+    resp = call('POST', '/sensor/co2', {'room': 'attic'}, b'{"co2_level": 950}')
+    assert resp.status == 503
+    assert calls == [False]
+
+
+def test_status_etag_and_delta():
+    first = call('GET', '/status', {'room': 'attic'})
+    assert first.status == 200
+    assert first.json()['room'] == 'attic'
+    assert first.headers['cache-control'] == 'no-cache'
+
+    def not_modified():
+        etag = call('GET', '/status', {'room': 'attic'}).headers['etag']
+        return call('GET', '/status', {'room': 'attic'}, headers={'if-none-match': etag}).status == 304
+
+    # 시작 직후 규칙/장치 결과로 버전이 바뀌는 중일 수 있으므로 잠잠해질 때까지
+    assert wait_for(not_modified)
+
+    def delta_since(version):
+        doc = call('GET', '/status', {'room': 'attic'}).json()
+        return call('GET', '/status', {'room': 'attic', 'since': version, 'instance': doc['instance']})
+
+    assert wait_for(lambda: delta_since(call('GET', '/status', {'room': 'attic'}).json()['version']).status == 304)
+    delta = delta_since(0)
+    assert delta.status == 200
+    assert delta.json()['since'] == 0 or 'sensor_data' in delta.json()    # 버퍼에서 밀려났으면 전체 문서
+
+
+def test_unknown_room_errors_are_json():
+    resp = call('GET', '/status', {'room': 'nowhere'})
+    assert resp.status == 404
+    assert resp.json()['status'] == 'error'
+
+
+def test_other_workers_rooms_redirect(server, monkeypatch):
+    monkeypatch.setattr(server.rooms, 'worker_count', 2)
+    moved = next(f'room-{i}' for i in range(20) if not server.rooms.owns(f'room-{i}'))
+    resp = call('GET', '/status', {'room': moved})
+    assert resp.status == 307
+    assert resp.headers['location'] == f'http://testserver:{server.SERVER_PORT + 1}/status?room={moved}'
+
+
+def test_stream_starts_with_a_snapshot():
+    resp = call('GET', '/stream', {'room': 'attic'}, chunks=2)
+    assert resp.status == 200
+    assert resp.headers['content-type'].startswith('text/event-stream')
+    frames = resp.body.decode()
+    assert frames.startswith('retry: ')
+    assert 'event: snapshot' in frames
+
+
+def test_other_routes_fall_through_to_flask():
+    resp = call('GET', '/health')
+    assert resp.status == 200
+    assert resp.json() == {'status': 'healthy'}
@@ -0,0 +1,101 @@
+import json
+import time
+
+import msgpack
+import pytest
+
+import batch
+from batch import BatchError, decode_batch_body, normalize_reading
+
+
+def test_decodes_json_list_and_object_forms():
+    assert decode_batch_body(b'[[1, "co2", 800]]', 'application/json') == ([[1, 'co2', 800]], None)
+    body = json.dumps({'room': 'lab', 'readings': [[1, 'co2', 800]]}).encode()
+    assert decode_batch_body(body, 'application/json') == ([[1, 'co2', 800]], 'lab')
+
+
+def test_decodes_msgpack():
+    body = msgpack.packb({'readings': [[1.5, 'temperature', 21.0]]})
+    assert decode_batch_body(body, 'application/msgpack') == ([[1.5, 'temperature', 21.0]], None)
+
+
+@pytest.mark.parametrize('body, mimetype, status', [
+    (b'{not json', 'application/json', 400),
+    (b'\xc1', 'application/msgpack', 400),
+    (b'{"readings": 5}', 'application/json', 400),
+    (b'"text"', 'application/json', 400),
+])
+def test_decode_errors(body, mimetype, status):
+    with pytest.raises(BatchError) as info:
+        decode_batch_body(body, mimetype)
+    assert info.value.status == status
+
+
+def test_size_limits(monkeypatch):
+    monkeypatch.setattr(batch, 'BATCH_MAX_READINGS', 2)
+    with pytest.raises(BatchError) as info:
+        decode_batch_body(b'[1, 2, 3]', 'application/json')
+    assert info.value.status == 413
+
+    monkeypatch.setattr(batch, 'BATCH_MAX_BYTES', 4)
+    with pytest.raises(BatchError) as info:
+        decode_batch_body(b'[1, 2, 3]', 'application/json')
+    assert info.value.status == 413
+
+
+def test_msgpack_missing_is_unsupported_media_type(monkeypatch):
+    monkeypatch.setattr(batch, 'MSGPACK_AVAILABLE', False)
+    with pytest.raises(BatchError) as info:
+        decode_batch_body(b'\x90', 'application/x-msgpack')
+    assert info.value.status == 415
+
+
+@pytest.mark.parametrize('reading, expected', [
+    ([5, 'co2', 812], ('co2', {'co2_level': 812, 'ts': 5})),
+    ({'type': 'temperature', 'value': 21.5, 'ts': 7}, ('environment', {'temperature': 21.5, 'ts': 7, 'room': None})),
+    ({'type': 'noise', 'noise_level': 40}, ('noise', {'type': 'noise', 'noise_level': 40})),
+])
+def test_normalize_reading(reading, expected):
+    assert normalize_reading(reading) == expected
+
+
+@pytest.mark.parametrize('reading', [[1, 'radon', 3], {'type': 'radon'}, 'co2', [1, 'co2']])
+def test_normalize_rejects_unknown_shapes(reading):
+    with pytest.raises(BatchError):
+        normalize_reading(reading)
+
+
+def test_batch_endpoint_reports_partial_errors(client, server):
+    now = time.time()
+    body = {'room': 'annex', 'readings': [[now, 'co2', 811], [now, 'radon', 1], [now, 'co2', -5]]}
+    resp = client.post('/sensor/batch', json=body)
+    assert resp.status_code == 200
+    result = resp.get_json()
+    assert (result['accepted'], result['rejected']) == (1, 2)
+    assert server.rooms.get('annex').raw_state.get('co2_level') == 811
+
+
+def test_batch_endpoint_rejects_bad_body(client):
+    resp = client.post('/sensor/batch', data=b'{oops', content_type='application/json')
+    assert resp.status_code == 400
+
+
+def test_full_queue_returns_503_and_leaves_state_untouched(client, server, monkeypatch):
+    room = server.rooms.get('annex')
+    before = room.raw_state.version
+    monkeypatch.setattr(server.db_writer, 'submit_many', lambda rows, block=None: False)
+
+    resp = client.post('/sensor/co2?room=annex', json={'co2_level': 1234})
+    assert resp.status_code == 503
+    resp = client.post('/sensor/batch', json={'room': 'annex', 'readings': [[time.time(), 'co2', 1235]]})
+    assert resp.status_code == 503
+    assert room.raw_state.version == before
+    assert room.raw_state.get('co2_level') != 1234
+
+
+def test_single_endpoint_validates_before_writing(client, server, monkeypatch):
+    submitted = []
+    monkeypatch.setattr(server.db_writer, 'submit_many', lambda rows, block=None: submitted.append(rows) or True)
+    resp = client.post('/sensor/co2?room=annex', json={'co2_level': 'lots'})
+    assert resp.status_code == 400
+    assert not submitted
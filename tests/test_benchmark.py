@@ -0,0 +1,106 @@
+import time
+
+import pytest
+import requests
+
+import benchmark
+from benchmark import Recorder, StubActuator, db_size, percentile, seed_database, sensor_payload, summarize
+from storage import Storage
+
+
+def test_percentile_is_nearest_rank():
+    ordered = list(range(1, 101))
+    assert percentile(ordered, 50) == 50
+    assert percentile(ordered, 99) == 99
+    assert percentile(ordered, 100) == 100
+    assert percentile([7], 1) == 7
+    assert percentile([], 50) is None
+
+
+def test_summarize_reports_milliseconds():
+    summary = summarize([0.003, 0.001, 0.002], errors=2, duration=2)
+    assert summary == {'count': 3, 'errors': 2, 'per_second': 1.5,
+                       'p50_ms': 2.0, 'p95_ms': 3.0, 'p99_ms': 3.0, 'max_ms': 3.0}
+    empty = summarize([], errors=0, duration=0)
+    assert (empty['per_second'], empty['p50_ms'], empty['max_ms']) == (None, None, None)
+
+
+def test_recorder_drops_warmup_samples():
+    recorder = Recorder()
+    recorder.record('status', 0.5, True)            # 워밍업
+    recorder.measuring = True
+    recorder.record('status', 0.01, True)
+    recorder.record('status', 0.02, False)
+    recorder.record('logs', 0.03, False)
+    results = recorder.results(duration=1)
+    assert list(results) == ['logs', 'status']
+    assert (results['status']['count'], results['status']['errors']) == (1, 1)
+    assert (results['logs']['count'], results['logs']['errors']) == (0, 1)
+
+
+@pytest.mark.parametrize('kind, fields', [
+    ('environment', {'temperature', 'humidity', 'pressure'}),
+    ('co2', {'co2_level'}),
+    ('motion', {'motion_detected', 'idle_duration'}),
+    ('noise', {'noise_level', 'duration'}),
+])
+def test_sensor_payloads_stay_in_range(kind, fields):
+    state = {}
+    for _ in range(200):
+        payload = sensor_payload(kind, state)
+        assert set(payload) == fields
+        if kind == 'environment':
+            assert 19 <= payload['temperature'] <= 24
+        elif kind == 'co2':
+            assert 450 <= payload['co2_level'] <= 900
+
+
+def test_seed_database_fills_history(tmp_path):
+    path = str(tmp_path / 'bench.db')
+    seed_database(path, 40)
+    storage = Storage(path)
+    with storage.connection() as conn:
+        count, oldest = conn.execute('SELECT COUNT(*), MIN(ts) FROM sensor_data').fetchone()
+    storage.close_all()
+    assert count == 40
+    assert oldest < time.time() * 1000 - 30000
+    assert db_size(path) > 0
+    assert db_size(str(tmp_path / 'missing.db')) == 0
+
+
+@pytest.fixture
+def stub():
+    actuator = StubActuator('bench', 'led').start()
+    yield actuator
+    actuator.stop()
+
+
+def test_stub_actuator_records_commands(stub):
+    after = time.perf_counter()
+    resp = requests.post(stub.url, json={'led': 'ON'}, timeout=2)
+    assert resp.status_code == 200
+    assert stub.state == 'ON'
+    assert stub.wait_for('ON', after, timeout=1) >= after
+    assert stub.wait_for('OFF', after, timeout=0.05) is None
+    assert requests.get(stub.url.replace('/control', '/state'), timeout=2).json() == {'state': 'ON'}
+
+
+def test_stub_actuator_injects_failures(stub, monkeypatch):
+    stub.failures = 0.5
+    monkeypatch.setattr(benchmark.random, 'random', lambda: 0.1)
+    resp = requests.post(stub.url, json={'led': 'ON'}, timeout=2)
+    assert resp.status_code == 500
+    assert (stub.state, stub.injected_failures, stub.commands) == ('OFF', 1, [])
+
+
+def test_print_summary_compares_p99(capsys):
+    row = summarize([0.002], 0, 1)
+    results = {'mode': 'threaded', 'commit': 'new', 'duration_s': 1,
+               'ingest': {'accepted_per_second': 10, 'offered_per_second': 10},
+               'requests': {'status': row}, 'actuation': summarize([], 0, 1),
+               'db': {'start_bytes': 0, 'end_bytes': 100, 'bytes_per_reading': 10}}
+    baseline = dict(results, commit='old', requests={'status': summarize([0.001], 0, 1)})
+    benchmark.print_summary(results, baseline)
+    out = capsys.readouterr().out
+    assert '(p99 +100% vs old)' in out
+    assert 'actuation' in out and 'DB: 0 -> 100 bytes' in out
@@ -0,0 +1,97 @@
+import threading
+
+import pytest
+
+from conftest import wait_for
+from db_writer import WriteBehindWriter
+
+INSERT = 'INSERT INTO control_log (ts, room, device, action, reason) VALUES (?, ?, ?, ?, ?)'
+
+
+def rows_written(storage):
+    return storage.query('SELECT COUNT(*) FROM control_log')[0][0]
+
+
+def test_rejects_unknown_policy(storage):
+    with pytest.raises(ValueError):
+        WriteBehindWriter(storage, policy='spill')
+
+
+def test_batches_rows_into_few_transactions(storage):
+    writer = WriteBehindWriter(storage, flush_interval=0.05, batch_size=100)
+    writer.start()
+    for i in range(250):
+        assert writer.submit(INSERT, (i, 'default', 'led', 'ON', 'test'))
+    writer.stop()
+
+    assert rows_written(storage) == 250
+    stats = writer.stats()
+    assert stats['written'] == 250
+    assert stats['dropped'] == 0
+    # 250행이 한 줄씩이 아니라 batch_size 단위 트랜잭션으로
+    assert stats['flushes'] <= 5
+
+
+def test_submit_many_is_one_transaction(storage):
+    """한 항목 안의 행은 같은 트랜잭션 - 하나가 실패하면 모두 기록되지 않는다"""
+    writer = WriteBehindWriter(storage, flush_interval=0.01)
+    writer.start()
+    writer.submit_many([
+        (INSERT, (1, 'default', 'led', 'ON', 'ok')),
+        ('INSERT INTO no_such_table VALUES (?)', (1,)),
+    ])
+    writer.stop()
+    assert rows_written(storage) == 0
+    assert writer.stats()['failed'] == 2
+
+
+def test_flush_hook_runs_inside_the_batch(storage):
+    seen = []
+    writer = WriteBehindWriter(storage, flush_interval=0.01)
+    writer.add_flush_hook(lambda conn, grouped: seen.append(len(grouped.get(INSERT, []))))
+    writer.start()
+    writer.submit_many([(INSERT, (i, 'default', 'led', 'ON', 'x')) for i in range(3)])
+    writer.stop()
+    assert sum(seen) == 3
+
+
+def test_drop_policy_reports_full_queue(storage):
+    writer = WriteBehindWriter(storage, max_queue=2, policy='drop')    # 시작하지 않아 큐가 비지 않는다
+    assert writer.submit(INSERT, (1, 'default', 'led', 'ON', 'x'))
+    assert writer.submit(INSERT, (2, 'default', 'led', 'ON', 'x'))
+    assert not writer.submit(INSERT, (3, 'default', 'led', 'ON', 'x'))
+    assert writer.stats()['dropped'] == 1
+
+
+def test_block_policy_times_out_and_non_blocking_callers_never_wait(storage):
+    writer = WriteBehindWriter(storage, max_queue=1, policy='block', block_timeout=0.05)
+    assert writer.submit(INSERT, (1, 'default', 'led', 'ON', 'x'))
+    assert not writer.submit(INSERT, (2, 'default', 'led', 'ON', 'x'))
+    assert not writer.submit_many([(INSERT, (3, 'default', 'led', 'ON', 'x'))], block=False)
+
+
+def test_stop_drains_the_queue(storage):
+    writer = WriteBehindWriter(storage, flush_interval=10, batch_size=1000)
+    writer.start()
+    for i in range(20):
+        writer.submit(INSERT, (i, 'default', 'led', 'ON', 'x'))
+    writer.stop()
+    assert rows_written(storage) == 20
+    assert not writer.submit(INSERT, (99, 'default', 'led', 'ON', 'x'))
+
+
+def test_concurrent_producers(storage):
+    writer = WriteBehindWriter(storage, flush_interval=0.01)
+    writer.start()
+
+    def produce(offset):
+        for i in range(100):
+            writer.submit(INSERT, (offset + i, 'default', 'led', 'ON', 'x'))
+
+    threads = [threading.Thread(target=produce, args=(n * 1000,)) for n in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert wait_for(lambda: rows_written(storage) == 400)
+    writer.stop()
@@ -0,0 +1,109 @@
+from conftest import wait_for
+from decision_engine import DecisionEngine
+
+
+class Clock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def recorder(calls, name):
+    def rule(engine):
+        calls.append(name)
+    return rule
+
+
+def test_only_rules_depending_on_the_signal_run():
+    calls = []
+    engine = DecisionEngine()
+    engine.register(recorder(calls, 'co2'), ['co2_level'])
+    engine.register(recorder(calls, 'temp'), ['temperature'])
+    engine.notify('co2_level')
+    assert engine.run_pending() == 1
+    assert calls == ['co2']
+    assert engine.run_pending() == 0
+
+
+def test_rules_run_in_registration_order():
+    calls = []
+    engine = DecisionEngine()
+    for name in ('a', 'b', 'c'):
+        engine.register(recorder(calls, name), ['x'])
+    engine.notify('x')
+    engine.notify_all()
+    engine.run_pending()
+    assert calls == ['a', 'b', 'c']
+
+
+def test_call_at_keeps_only_the_latest_deadline():
+    clock = Clock()
+    calls = []
+    engine = DecisionEngine(clock=clock)
+    rule = recorder(calls, 'timer')
+    engine.register(rule, [])
+    engine.call_at(1010, rule)
+    engine.call_at(1020, rule)
+    assert engine.next_deadline() == 1020
+
+    clock.now = 1015
+    assert engine.run_pending() == 0
+    clock.now = 1020
+    assert engine.run_pending() == 1
+    assert engine.stats['timer_fires'] == 1
+    assert engine.next_deadline() is None
+
+
+def test_cancel_drops_the_timer():
+    clock = Clock()
+    calls = []
+    engine = DecisionEngine(clock=clock)
+    rule = recorder(calls, 'timer')
+    engine.register(rule, [])
+    engine.call_at(1001, rule)
+    engine.cancel(rule)
+    clock.now = 2000
+    assert engine.run_pending() == 0
+    assert engine.next_deadline() is None
+
+
+def test_failing_rule_does_not_stop_the_others(capsys):
+    calls = []
+
+    def broken(engine):
+        raise RuntimeError('boom')
+
+    engine = DecisionEngine()
+    engine.register(broken, ['x'])
+    engine.register(recorder(calls, 'ok'), ['x'])
+    engine.notify('x')
+    assert engine.run_pending() == 2
+    assert calls == ['ok']
+    assert '[DECISION ERROR] boom' in capsys.readouterr().out
+
+
+def test_replace_swaps_rules_and_drops_timers():
+    calls = []
+    engine = DecisionEngine()
+    old = recorder(calls, 'old')
+    engine.register(old, ['x'])
+    engine.call_at(0, old)
+    engine.replace([(recorder(calls, 'new'), ['x'])])
+    engine.notify('x')
+    engine.run_pending()
+    assert calls == ['new']
+
+
+def test_thread_reacts_to_notify():
+    calls = []
+    engine = DecisionEngine()
+    engine.register(recorder(calls, 'rule'), ['x'])
+    engine.start()
+    try:
+        assert wait_for(lambda: calls == ['rule'])     # 시작 시 전체 평가
+        engine.notify('x')
+        assert wait_for(lambda: calls == ['rule', 'rule'])
+    finally:
+        engine.stop()
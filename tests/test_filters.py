@@ -0,0 +1,92 @@
+import random
+
+import pytest
+
+from filters import FilterRejected, SignalFilter, SignalPipeline, load_filters
+
+
+def feed(f, samples):
+    """(ts ms, value) 목록을 넣고 샘플마다의 출력(f.output) 목록 반환"""
+    outputs = []
+    for ts, value in samples:
+        f.process(value, ts)
+        outputs.append(f.output)
+    return outputs
+
+
+def test_range_check_rejects_and_counts():
+    f = SignalFilter('co2_level', {'min': 400, 'max': 5000})
+    f.check_range(400)
+    with pytest.raises(FilterRejected):
+        f.check_range(399)
+    assert f.stats['out_of_range'] == 1
+
+
+def test_median_matches_a_full_sort():
+    f = SignalFilter('noise_level', {'median': 5})
+    values = []
+    rng = random.Random(7)
+    for i in range(200):
+        value = rng.randint(0, 100)
+        values.append(value)
+        f.process(value, i * 1000)
+        window = sorted(values[-5:])
+        assert f.output == window[len(window) // 2]
+    assert len(f._sorted) == 5
+
+
+def test_single_spike_is_dropped():
+    f = SignalFilter('temperature', {'max_rate': 1.0, 'median': 3})
+    outputs = feed(f, [(0, 20.0), (1000, 20.2), (2000, 35.0), (3000, 20.3)])
+    assert outputs == [20.0, 20.2, 20.2, 20.2]
+    assert f.stats['outliers'] == 1
+    assert f.stats['steps'] == 0
+
+
+def test_step_is_accepted_after_reject_limit_samples():
+    f = SignalFilter('temperature', {'max_rate': 1.0, 'median': 3, 'ema': 0.5},
+                     reject_limit=3, step_confirm=100)
+    outputs = feed(f, [(0, 30.0), (1000, 30.0), (2000, 22.0), (3000, 22.0), (4000, 22.0), (5000, 22.0)])
+    # 창과 EMA를 다시 맞추므로 받아들인 샘플에서 곧바로 새 수준
+    assert outputs == [30.0, 30.0, 30.0, 30.0, 30.0, 22.0]
+    assert f.stats['steps'] == 1
+
+
+def test_step_is_accepted_once_it_holds_for_step_confirm():
+    f = SignalFilter('temperature', {'max_rate': 1.0, 'median': 3}, reject_limit=100, step_confirm=1.0)
+    outputs = feed(f, [(0, 30.0), (500, 30.0), (1000, 22.0), (1500, 22.1), (2000, 22.0)])
+    assert outputs == [30.0, 30.0, 30.0, 30.0, 22.0]
+
+
+def test_inconsistent_spikes_are_not_a_step():
+    f = SignalFilter('temperature', {'max_rate': 1.0}, reject_limit=100, step_confirm=1.0)
+    samples = [(0, 20.0)] + [(i * 500, 40.0 if i % 2 else 0.0) for i in range(1, 10)]
+    assert set(feed(f, samples)) == {20.0}
+    assert f.stats['steps'] == 0
+
+
+def test_replayed_samples_do_not_enter_the_filter():
+    f = SignalFilter('co2_level', {'median': 3})
+    feed(f, [(1000, 800), (2000, 820)])
+    assert f.process(5000, 1500) is None
+    assert f.stats['samples'] == 2
+
+
+def test_deadband_suppresses_small_changes():
+    f = SignalFilter('co2_level', {'deadband': 5})
+    assert feed(f, [(0, 800), (1000, 803), (2000, 806)]) == [800, 800, 806]
+
+
+def test_pipeline_passes_unfiltered_fields_through():
+    pipeline = SignalPipeline({'_comment': 'x', 'co2_level': {'min': 400, 'deadband': 5}})
+    assert set(pipeline.filters) == {'co2_level'}
+    assert pipeline.process({'co2_level': 800, 'motion_detected': True}, 1000) == \
+        {'co2_level': 800, 'motion_detected': True}
+    assert pipeline.process({'co2_level': 802}, 2000) == {}
+    with pytest.raises(FilterRejected):
+        pipeline.validate({'co2_level': 10, 'motion_detected': False})
+
+
+def test_missing_config_disables_filtering(tmp_path):
+    pipeline = load_filters(str(tmp_path / 'missing.json'))
+    assert pipeline.filters == {}
@@ -0,0 +1,87 @@
+import pytest
+
+from freshness import FreshnessTracker
+
+
+def tracker(**kwargs):
+    options = dict(fields=['co2_level', 'temperature'], factor=3, alpha=0.5, min_ms=1000,
+                   default_ms=60000, max_interval_ms=600000)
+    options.update(kwargs)
+    return FreshnessTracker(**options)
+
+
+def test_limit_follows_the_observed_interval():
+    t = tracker()
+    assert t.limit_ms('co2_level') == 180000           # 간격을 모르면 기본값 기준
+    t.observe({'co2_level': 800}, 0)
+    t.observe({'co2_level': 800}, 2000)
+    assert t.limit_ms('co2_level') == 6000
+    t.observe({'co2_level': 800}, 6000)                 # EWMA: 0.5*4000 + 0.5*2000
+    assert t.limit_ms('co2_level') == 9000
+
+
+def test_limit_never_drops_below_the_minimum():
+    t = tracker(min_ms=5000)
+    t.observe({'co2_level': 1}, 0)
+    t.observe({'co2_level': 1}, 100)
+    assert t.limit_ms('co2_level') == 5000
+
+
+def test_check_reports_each_transition_once():
+    t = tracker()
+    t.observe({'co2_level': 800}, 0)
+    t.observe({'co2_level': 800}, 1000)
+    assert t.check(now=3500) == []
+    assert t.check(now=4001) == ['co2_level']
+    assert t.check(now=9000) == []
+    assert t.flagged('co2_level')
+    assert t.flags() == {'co2_level': True}
+
+
+def test_new_reading_recovers_a_stale_field():
+    t = tracker()
+    t.observe({'co2_level': 800}, 0)
+    t.observe({'co2_level': 800}, 1000)
+    t.check(now=10000)
+    assert t.observe({'co2_level': 810}, 10000) == ['co2_level']
+    assert not t.flagged('co2_level')
+
+
+def test_outage_gap_is_capped_in_the_interval_estimate():
+    t = tracker(max_interval_ms=10000)
+    t.observe({'co2_level': 1}, 0)
+    t.observe({'co2_level': 1}, 1000)
+    t.observe({'co2_level': 1}, 1000 + 3600000)        # 1시간 장애 뒤 복구
+    assert t.limit_ms('co2_level') == pytest.approx(3 * (0.5 * 10000 + 0.5 * 1000))
+
+
+def test_untracked_missing_and_replayed_readings_are_ignored():
+    t = tracker()
+    t.observe({'humidity': 40}, 0)
+    assert t.flags() == {}
+    assert not t.is_stale('temperature', now=10 ** 9)   # 한 번도 들어오지 않은 센서
+
+    t.observe({'temperature': 21}, 5000)
+    t.observe({'temperature': 20}, 1000)                # 재전송된 과거 값
+    assert t.status(now=6000)['temperature']['last_seen'] == 5000
+    assert t.status(now=6000)['temperature']['expected_interval_ms'] is None
+
+
+def test_next_expiry_skips_fields_already_stale():
+    t = tracker()
+    t.observe({'co2_level': 1, 'temperature': 20}, 0)
+    t.observe({'co2_level': 1}, 1000)
+    assert t.next_expiry() == 4000
+    t.check(now=5000)
+    assert t.next_expiry() == 180000
+
+
+def test_room_flags_silent_sensors_and_publishes_the_change(server):
+    room = server.rooms.get('attic')
+    seq = room.change_feed.seq
+    room.update_latest({'noise_level': 40.0}, 1000)
+    room.update_latest({'noise_level': 41.0}, 2000)     # 아주 오래전 측정값 - 다음 확인에서 stale
+    room.check_freshness()
+    assert room.freshness.flagged('noise_level')
+    assert room.snapshot()['stale']['noise_level'] is True
+    assert {'stale': {'noise_level': True}} in [changes for _, changes in room.change_feed.since(seq)]
@@ -0,0 +1,98 @@
+import pytest
+
+from history import HistoryError, auto_bucket, parse_bucket, parse_time, pick_source, query_history
+from storage import INSERT_SENSOR_DATA
+
+T0 = 1_700_000_000_000 - 1_700_000_000_000 % 3_600_000    # 정시
+
+
+def write(storage, samples, name='temperature', room='default'):
+    type_id = storage.sensor_type_id(name, '°C', room)
+    with storage.connection() as conn:
+        conn.executemany(INSERT_SENSOR_DATA, [(ts, type_id, value) for ts, value in samples])
+        conn.commit()
+    return type_id
+
+
+@pytest.mark.parametrize('text, seconds', [('30', 30), ('5m', 300), ('1h', 3600), ('1d', 86400), (' 2W ', 1209600)])
+def test_parse_bucket(text, seconds):
+    assert parse_bucket(text) == seconds
+
+
+@pytest.mark.parametrize('text', ['abc', '0.5', '0', 'm'])
+def test_parse_bucket_rejects_bad_values(text):
+    with pytest.raises(HistoryError):
+        parse_bucket(text)
+
+
+def test_parse_time_wraps_value_errors():
+    assert parse_time(None, 42) == 42
+    with pytest.raises(HistoryError):
+        parse_time('tomorrow', 0)
+
+
+def test_auto_bucket_targets_a_few_hundred_points():
+    assert auto_bucket(0, 60 * 1000) == 1
+    assert auto_bucket(0, 24 * 3600 * 1000) == 300
+    assert auto_bucket(0, 10 ** 12) == 7 * 86400
+
+
+def test_pick_source_uses_the_coarsest_dividing_rollup():
+    assert pick_source(30 * 1000) is None
+    assert pick_source(300 * 1000) == '1m'
+    assert pick_source(6 * 3600 * 1000) == '1h'
+    assert pick_source(7 * 86400 * 1000) == '1d'
+
+
+def test_raw_buckets_aggregate_min_max_avg_last(storage):
+    write(storage, [(T0 + 1000, 20.0), (T0 + 5000, 24.0), (T0 + 9000, 22.0),    # 첫 30초
+                    (T0 + 31000, 30.0)])
+    result = query_history(storage, 'temperature', start=T0, end=T0 + 60000, bucket='30')
+
+    assert result['source'] == 'raw'
+    assert result['unit'] == '°C'
+    assert result['t'] == [T0, T0 + 30000]
+    assert result['min'] == [20.0, 30.0]
+    assert result['max'] == [24.0, 30.0]
+    assert result['avg'] == [22.0, 30.0]
+    assert result['count'] == [3, 1]
+    assert result['last'] == [22.0, 30.0]
+
+
+def test_range_is_widened_to_bucket_boundaries(storage):
+    write(storage, [(T0 + 1000, 1.0), (T0 + 59000, 2.0)])
+    result = query_history(storage, 'temperature', start=T0 + 20000, end=T0 + 40000, bucket='30')
+    assert (result['start'], result['end']) == (T0, T0 + 60000)
+    assert result['count'] == [1, 1]
+
+
+def test_rooms_do_not_share_history(storage):
+    write(storage, [(T0 + 1000, 20.0)], room='default')
+    write(storage, [(T0 + 1000, 30.0)], room='lab')
+    lab = query_history(storage, 'temperature', start=T0, end=T0 + 30000, bucket='30', room='lab')
+    assert lab['room'] == 'lab'
+    assert lab['max'] == [30.0]
+
+
+def test_unknown_sensor_returns_none(storage):
+    assert query_history(storage, 'humidity', start=T0, end=T0 + 1000) is None
+
+
+def test_rejects_inverted_range_and_too_many_buckets(storage):
+    with pytest.raises(HistoryError):
+        query_history(storage, 'temperature', start=T0 + 1000, end=T0)
+    with pytest.raises(HistoryError):
+        query_history(storage, 'temperature', start=T0, end=T0 + 86400 * 1000, bucket='1')
+
+
+def test_history_endpoint(client, server):
+    type_id = server.storage.sensor_type_id('humidity', '%', 'annex')
+    with server.storage.connection() as conn:
+        conn.execute(INSERT_SENSOR_DATA, (T0 + 1000, type_id, 55.0))
+        conn.commit()
+
+    resp = client.get(f'/history?sensor_type=humidity&room=annex&start={T0}&end={T0 + 30000}&bucket=30')
+    assert resp.status_code == 200
+    assert resp.get_json()['max'] == [55.0]
+    assert client.get('/history?sensor_type=humidity&room=annex&bucket=abc').status_code == 400
+    assert client.get(f'/history?sensor_type=no_such_sensor&room=annex&start={T0}&end={T0 + 1000}').status_code == 404
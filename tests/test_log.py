@@ -0,0 +1,77 @@
+import io
+import json
+
+import log
+from log import Logger, get_logger
+
+
+class Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def logger(monkeypatch, **kwargs):
+    clock = Clock()
+    monkeypatch.setattr(log.time, 'monotonic', clock)
+    options = dict(level=20, rate=1, burst=2, fmt='text', stream=io.StringIO())
+    options.update(kwargs)
+    return Logger('CONTROL', **options), clock
+
+
+def lines(logger):
+    return logger.stream.getvalue().splitlines()
+
+
+def test_text_format_quotes_fields(monkeypatch):
+    lg, _ = logger(monkeypatch)
+    lg.info('control', 'Sent', device='led', error='Cannot connect', empty='')
+    lg.warning('control', 'Failed', action='a=b')
+    assert lines(lg) == ['[CONTROL] Sent device=led error="Cannot connect" empty=""',
+                         '[CONTROL WARNING] Failed action="a=b"']
+
+
+def test_json_format(monkeypatch):
+    lg, _ = logger(monkeypatch, fmt='json')
+    lg.error('control', 'Failed', device='led')
+    record = json.loads(lines(lg)[0])
+    assert {k: record[k] for k in ('level', 'tag', 'event', 'msg', 'device')} == \
+        {'level': 'ERROR', 'tag': 'CONTROL', 'event': 'control', 'msg': 'Failed', 'device': 'led'}
+
+
+def test_levels_below_the_threshold_are_dropped(monkeypatch):
+    lg, _ = logger(monkeypatch, level=30)
+    lg.debug('x', 'debug')
+    lg.info('x', 'info')
+    lg.warning('x', 'warning')
+    lg.error('x', 'error')
+    assert lines(lg) == ['[CONTROL WARNING] warning', '[CONTROL ERROR] error']
+    assert not lg.enabled('INFO') and lg.enabled('ERROR')
+
+
+def test_token_bucket_limits_each_event(monkeypatch):
+    lg, clock = logger(monkeypatch)
+    for i in range(5):
+        lg.info('reading', f'r{i}')
+    lg.info('control', 'other event has its own bucket')
+    assert lines(lg) == ['[CONTROL] r0', '[CONTROL] r1', '[CONTROL] other event has its own bucket']
+
+    clock.now += 1      # 초당 1줄 - 토큰 하나가 다시 찬다
+    lg.info('reading', 'r5')
+    lg.info('reading', 'r6')
+    assert lines(lg)[-1] == '[CONTROL] r5 suppressed=3'
+    assert len(lines(lg)) == 4
+
+
+def test_zero_rate_disables_limiting(monkeypatch):
+    lg, _ = logger(monkeypatch, rate=0)
+    for i in range(50):
+        lg.info('reading', 'r')
+    assert len(lines(lg)) == 50
+
+
+def test_get_logger_shares_one_logger_per_tag():
+    assert get_logger('TEST-LOG') is get_logger('TEST-LOG')
+    assert get_logger('TEST-LOG') is not get_logger('TEST-LOG-2')
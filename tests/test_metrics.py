@@ -0,0 +1,78 @@
+import pytest
+
+from metrics import CONTENT_TYPE, Counter, Gauge, Histogram, Registry
+
+
+def render(*metrics):
+    registry = Registry()
+    for metric in metrics:
+        registry.register(metric)
+    return registry.render().splitlines()
+
+
+def test_counter_exposition():
+    c = Counter('iot_readings_total', 'Sensor readings accepted', ('room', 'type'))
+    c.inc('lab', 'co2')
+    c.inc('lab', 'co2', amount=2)
+    c.inc('a"b', 'x\ny')
+    assert c.value('lab', 'co2') == 3
+    assert c.value('lab', 'noise') == 0
+    assert render(c) == [
+        '# HELP iot_readings_total Sensor readings accepted',
+        '# TYPE iot_readings_total counter',
+        'iot_readings_total{room="lab",type="co2"} 3',
+        'iot_readings_total{room="a\\"b",type="x\\ny"} 1',
+    ]
+
+
+def test_histogram_buckets_are_cumulative():
+    h = Histogram('iot_latency_seconds', 'Latency', ('device',), buckets=(0.1, 0.01, 1.0))
+    for value in (0.005, 0.01, 0.5, 3.0):
+        h.observe(value, 'led')
+    lines = render(h)
+    assert lines[2:] == [
+        'iot_latency_seconds_bucket{device="led",le="0.01"} 2',     # 경계값은 그 버킷에 들어간다
+        'iot_latency_seconds_bucket{device="led",le="0.1"} 2',
+        'iot_latency_seconds_bucket{device="led",le="1"} 3',
+        'iot_latency_seconds_bucket{device="led",le="+Inf"} 4',
+        'iot_latency_seconds_sum{device="led"} 3.515',
+        'iot_latency_seconds_count{device="led"} 4',
+    ]
+
+
+def test_gauge_reads_the_callback_at_scrape_time():
+    depth = {'value': 1}
+    plain = Gauge('iot_queue_depth', 'Queue depth', lambda: depth['value'])
+    labelled = Gauge('iot_pending', 'Pending', lambda: {('lab', 'led'): 2.0}, ('room', 'device'))
+    depth['value'] = 7
+    assert render(plain, labelled)[2] == 'iot_queue_depth 7'
+    assert render(plain, labelled)[-1] == 'iot_pending{room="lab",device="led"} 2'
+
+
+def test_failing_collector_does_not_break_the_scrape():
+    def broken():
+        raise RuntimeError('db gone')
+
+    ok = Counter('iot_ok_total', 'Ok')
+    ok.inc()
+    lines = render(Gauge('iot_broken', 'Broken', broken), ok)
+    assert lines[0] == '# iot_broken collection failed: db gone'
+    assert lines[-1] == 'iot_ok_total 1'
+
+
+def test_registering_twice_keeps_one_series():
+    registry = Registry()
+    first = registry.register(Counter('iot_x_total', 'X'))
+    assert registry.register(Counter('iot_x_total', 'X')) is first
+
+
+def test_metrics_endpoint(client):
+    client.post('/sensor/co2?room=annex', json={'co2_level': 700})
+    resp = client.get('/metrics')
+    assert resp.status_code == 200
+    assert resp.content_type == CONTENT_TYPE
+    text = resp.get_data(as_text=True)
+    assert '# TYPE iot_readings_total counter' in text
+    assert 'iot_readings_total{room="annex",type="co2"}' in text
+    assert 'iot_http_requests_total{endpoint="/sensor/co2",method="POST",status="200"}' in text
+    assert 'iot_db_queue_depth ' in text
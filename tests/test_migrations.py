@@ -0,0 +1,111 @@
+import sqlite3
+import time
+
+import pytest
+
+import storage as storage_module
+from storage import MIGRATIONS, Storage
+
+
+def legacy_db(path, sensor_rows=(), control_rows=()):
+    """v1(TEXT 타임스탬프) 스키마 DB"""
+    conn = sqlite3.connect(path)
+    for sql in MIGRATIONS[0][2]:
+        conn.execute(sql)
+    conn.execute('PRAGMA user_version=1')
+    conn.executemany('INSERT INTO sensor_data (timestamp, sensor_type, value, unit) VALUES (?, ?, ?, ?)',
+                     sensor_rows)
+    conn.executemany('INSERT INTO control_log (timestamp, device, action, reason) VALUES (?, ?, ?, ?)',
+                     control_rows)
+    conn.commit()
+    conn.close()
+
+
+def test_fresh_database_reaches_latest_version(tmp_path):
+    store = Storage(str(tmp_path / 'fresh.db'))
+    assert store.migrate() == MIGRATIONS[-1][0]
+    assert store.schema_version() == MIGRATIONS[-1][0]
+    # 다시 실행해도 아무것도 하지 않는다
+    assert store.migrate() == MIGRATIONS[-1][0]
+    store.close_all()
+
+
+def test_versions_are_strictly_increasing():
+    versions = [m[0] for m in MIGRATIONS]
+    assert versions == list(range(1, len(versions) + 1))
+
+
+def test_v2_converts_iso_timestamps_to_epoch_ms(tmp_path):
+    path = str(tmp_path / 'legacy.db')
+    legacy_db(path,
+              sensor_rows=[('2024-01-02T03:04:05', 'temperature', 21.5, '°C'),
+                           ('2024-01-02 03:04:05.250', 'co2', 800, 'ppm')],
+              control_rows=[('2024-01-02T03:04:06', 'led', 'ON', 'test')])
+    store = Storage(path)
+    store.migrate()
+
+    rows = store.query('''SELECT d.ts, t.name, t.unit, t.room, d.value
+                          FROM sensor_data d JOIN sensor_types t ON t.id = d.sensor_type_id ORDER BY d.id''')
+    assert rows == [(1704164645000, 'temperature', '°C', 'default', 21.5),
+                    (1704164645250, 'co2', 'ppm', 'default', 800.0)]
+    assert store.query('SELECT ts, room, device FROM control_log') == [(1704164646000, 'default', 'led')]
+    store.close_all()
+
+
+def test_v2_stamps_unparseable_timestamps_with_migration_time(tmp_path):
+    path = str(tmp_path / 'legacy.db')
+    legacy_db(path,
+              sensor_rows=[('garbage', 'temperature', 20, '°C'), (None, 'temperature', 21, '°C'),
+                           ('2024-01-02T03:04:05', 'temperature', 22, '°C')],
+              control_rows=[('??', 'led', 'OFF', 'test')])
+    before = int(time.time() * 1000)
+    store = Storage(path)
+    store.migrate()
+    after = int(time.time() * 1000)
+
+    stamps = [ts for ts, in store.query('SELECT ts FROM sensor_data ORDER BY id')]
+    assert all(before - 1000 <= ts <= after + 1000 for ts in stamps[:2])   # 1970년(0)이 아니다
+    assert stamps[2] == 1704164645000
+    control_ts = store.query('SELECT ts FROM control_log')[0][0]
+    assert before - 1000 <= control_ts <= after + 1000
+    store.close_all()
+
+
+def test_v2_logs_how_many_rows_were_rewritten(tmp_path, capsys):
+    path = str(tmp_path / 'legacy.db')
+    legacy_db(path, sensor_rows=[('garbage', 'temperature', 20, '°C'), ('2024-01-02T03:04:05', 'co2', 1, 'ppm')])
+    Storage(path).migrate()
+    out = capsys.readouterr().out
+    assert 'rewriting 2 legacy rows' in out
+    assert '1 with unparseable timestamps' in out
+
+
+def test_fresh_database_does_not_log_a_rewrite(tmp_path, capsys):
+    Storage(str(tmp_path / 'fresh.db')).migrate()
+    assert 'legacy rows' not in capsys.readouterr().out
+
+
+def test_failed_migration_rolls_back_to_previous_version(tmp_path, monkeypatch):
+    store = Storage(str(tmp_path / 'broken.db'))
+    broken = MIGRATIONS + [(len(MIGRATIONS) + 1, 'broken', ['CREATE TABLE ok_table (id INTEGER)',
+                                                             'THIS IS NOT SQL'])]
+    monkeypatch.setattr(storage_module, 'MIGRATIONS', broken)
+    with pytest.raises(sqlite3.OperationalError):
+        store.migrate()
+    assert store.schema_version() == MIGRATIONS[-1][0]
+    assert not store.query("SELECT name FROM sqlite_master WHERE name = 'ok_table'")
+    store.close_all()
+
+
+def test_history_scans_use_the_covering_index(storage):
+    plan = ' '.join(row[-1] for row in storage.query(
+        'EXPLAIN QUERY PLAN SELECT ts, value FROM sensor_data WHERE sensor_type_id = 1 AND ts >= 0 AND ts < 10'))
+    assert 'idx_sensor_data_type_ts' in plan
+    assert 'COVERING INDEX' in plan
+
+
+def test_rollup_tables_have_no_finalized_column(storage):
+    for name in ('1m', '1h', '1d'):
+        columns = [row[1] for row in storage.query(f'PRAGMA table_info(sensor_rollup_{name})')]
+        assert 'finalized' not in columns
+        assert columns[:2] == ['sensor_type_id', 'bucket']
@@ -0,0 +1,215 @@
+import pytest
+
+import device_agent
+from device_agent import AgentError, DeviceAgent
+from registry import DELETE_DEVICE, SAVE_DEVICE, UPDATE_DEVICE_SEEN, DeviceRegistry, RegistryError
+from storage import now_ms
+
+
+class FakeWriter:
+    def __init__(self):
+        self.rows = []
+
+    def submit(self, sql, params):
+        self.rows.append((sql, params))
+        return True
+
+    def submit_many(self, rows):
+        self.rows.extend(rows)
+        return True
+
+
+def actuator(device_id='led-1', room='lab', url='http://led-1:5000/control', **extra):
+    return dict(id=device_id, kind='actuator', device='led', room=room, url=url, **extra)
+
+
+def registry(**kwargs):
+    attached, detached = [], []
+    reg = DeviceRegistry(FakeWriter(), on_attach=attached.append, on_detach=detached.append,
+                         device_types={'led', 'vent'}, ttl_ms=1000, **kwargs)
+    return reg, attached, detached
+
+
+@pytest.mark.parametrize('spec, message', [
+    ('led', 'JSON object'),
+    (actuator(device_id='bad id'), 'Invalid device id'),
+    (dict(actuator(), kind='robot'), 'kind must be one of'),
+    (dict(actuator(), device=''), 'device is required'),
+    (actuator(capabilities=['x']), 'capabilities must be an object'),
+    (dict(actuator(), device='toaster'), 'Unknown actuator type'),
+    (actuator(url='ftp://led'), 'http\\(s\\) control url'),
+])
+def test_invalid_registrations(spec, message):
+    reg, attached, _ = registry()
+    with pytest.raises(RegistryError, match=message):
+        reg.register(spec)
+    assert attached == [] and len(reg) == 0
+
+
+def test_register_attaches_and_persists():
+    reg, attached, _ = registry()
+    record = reg.register(actuator())
+    assert attached == [record]
+    assert reg.writer.rows == [(SAVE_DEVICE, record.row())]
+    assert reg.devices(room='lab')[0]['url'] == 'http://led-1:5000/control'
+    assert reg.devices(room='default') == []
+
+
+def test_sensors_need_no_url():
+    reg, _, _ = registry()
+    record = reg.register({'id': 'co2-1', 'kind': 'sensor', 'device': 'co2'})
+    assert (record.room, record.url) == ('default', None)
+
+
+def test_reregistering_keeps_registered_at_and_detaches_the_old_url():
+    reg, attached, detached = registry()
+    first = reg.register(actuator())
+    second = reg.register(actuator(url='http://led-1b:5000/control'))
+    assert second.registered_at == first.registered_at
+    assert detached == [first]
+
+    reg.register(actuator(url='http://led-1b:5000/control'))    # 같은 주소로 다시 등록하면 떼지 않는다
+    assert detached == [first]
+
+
+def test_failed_attach_keeps_the_previous_registration():
+    def reject(record):
+        if record.room == 'nowhere':
+            raise RegistryError('Unknown room', 404)
+
+    reg = DeviceRegistry(FakeWriter(), on_attach=reject, device_types={'led'})
+    reg.register(actuator())
+    with pytest.raises(RegistryError):
+        reg.register(actuator(room='nowhere'))
+    assert reg.get('led-1').room == 'lab'
+
+
+def test_heartbeat_and_sweep():
+    reg, _, detached = registry()
+    record = reg.register(actuator())
+    reg.register(actuator(device_id='led-2'))
+    reg.writer.rows.clear()
+    assert reg.heartbeat('led-1')
+    assert not reg.heartbeat('ghost')
+    assert reg.stats['unknown_heartbeats'] == 1
+
+    record.last_seen = record.saved_seen + 500     # heartbeat로 바뀐 last_seen만 기록된다
+    reg.get('led-2').last_seen = now_ms() - 5000
+    assert reg.sweep() == ['led-2']
+    assert [d.id for d in detached] == ['led-2']
+    assert (UPDATE_DEVICE_SEEN, (record.last_seen, 'led-1')) in reg.writer.rows
+    assert (DELETE_DEVICE, ('led-2',)) in reg.writer.rows
+    assert reg.stats['evicted'] == 1
+
+
+def test_heartbeat_after_the_check_prevents_eviction():
+    reg, _, _ = registry()
+    record = reg.register(actuator())
+    now = now_ms()
+    record.last_seen = now - 1      # sweep이 본 시각보다 늦게 heartbeat가 들어왔다
+    assert not reg.remove('led-1', 'evicted', seen_before=now - 1000)
+    assert reg.get('led-1') is not None
+
+
+def test_load_restores_only_owned_rooms(storage):
+    reg, _, _ = registry()
+    with storage.connection() as conn:
+        conn.execute(SAVE_DEVICE, ('a', 'actuator', 'lab', 'led', 'http://a/control', '{}', 1, 1))
+        conn.execute(SAVE_DEVICE, ('b', 'actuator', 'attic', 'led', 'http://b/control', '{}', 1, 1))
+        conn.commit()
+    assert reg.load(storage, owns=lambda room: room == 'lab') == 1
+    assert reg.get('a').last_seen > 1       # 재시작 동안의 공백으로 바로 evict하지 않는다
+    assert reg.get('b') is None
+
+
+def test_registration_over_http(client, server):
+    spec = dict(actuator(device_id='vent-annex', room='annex', url='http://vent-annex:5000/control'),
+                device='ventilator')
+    resp = client.post('/devices/register', json=spec)
+    assert resp.status_code == 200
+    assert resp.get_json()['heartbeat_interval'] == server.registry.heartbeat_interval
+    assert server.rooms.get('annex').endpoints['ventilator'] == 'http://vent-annex:5000/control'
+
+    assert client.post('/devices/vent-annex/heartbeat').status_code == 200
+    assert client.post('/devices/ghost/heartbeat').status_code == 404
+    assert client.delete('/devices/vent-annex').status_code == 200
+    assert 'ventilator' not in server.rooms.get('annex').endpoints
+
+
+def test_registration_for_an_undeclared_room_is_404(client):
+    spec = dict(actuator(device_id='vent-x', room='garage'), device='ventilator')
+    assert client.post('/devices/register', json=spec).status_code == 404
+
+
+class FakeResponse:
+    def __init__(self, status_code, body=None):
+        self.status_code = status_code
+        self.body = body or {}
+        self.text = ''
+        self.history = []
+
+    def json(self):
+        return self.body
+
+
+class AgentSession:
+    def __init__(self, heartbeat_status):
+        self.heartbeat_status = heartbeat_status
+        self.calls = []
+
+    def post(self, url, json=None, timeout=None):
+        self.calls.append(url.rsplit('/', 1)[-1])
+        if url.endswith('/register'):
+            return FakeResponse(200, {'heartbeat_interval': 1})
+        return FakeResponse(self.heartbeat_status)
+
+
+class StopAfter:
+    """_stop 대용 - wait(delay)에 넘어온 대기 시간을 기록하고 n번째에 멈춘다"""
+
+    def __init__(self, n):
+        self.n = n
+        self.delays = []
+
+    def wait(self, delay):
+        self.delays.append(delay)
+        return len(self.delays) > self.n
+
+    def set(self):
+        pass
+
+
+def agent(status):
+    a = DeviceAgent('actuator', 'led', device_id='led-test', url='http://led:5000/control',
+                    server_url='http://central:5000', interval=1)
+    a.session = AgentSession(status)
+    return a
+
+
+def test_agent_backs_off_on_server_errors(monkeypatch, capsys):
+    monkeypatch.setattr(device_agent, 'AGENT_BACKOFF_MAX', 8)
+    a = agent(503)
+    a._stop = StopAfter(5)
+    a._run()
+    # 등록 -> heartbeat 실패 -> 백오프 후 재등록을 반복하며 대기 시간이 늘어난다
+    assert a._stop.delays == [0, 2, 4, 8, 8, 8]
+    assert a.session.calls[:4] == ['register', 'heartbeat', 'register', 'heartbeat']
+    assert not a.registered
+    out = capsys.readouterr().out
+    assert out.count('Heartbeat failed (503)') == 1
+    assert 'Cannot reach' not in out
+
+
+def test_agent_reregisters_immediately_when_forgotten():
+    a = agent(404)
+    a.registered = True
+    assert a._heartbeat() is False
+    assert not a.registered
+
+
+def test_agent_heartbeat_error_raises():
+    a = agent(500)
+    a.registered = True
+    with pytest.raises(AgentError):
+        a._heartbeat()
+    assert not a.registered
@@ -0,0 +1,151 @@
+import gzip
+import json
+
+import pytest
+
+import replay
+from replay import (Replay, archive_events, coalesce, db_events, diff_commands, group_events,
+                    parse_overrides, to_fields)
+from storage import INSERT_CONTROL_LOG, INSERT_MOTION_LOG, INSERT_NOISE_LOG, INSERT_SENSOR_DATA
+from thresholds import ThresholdConfig, ThresholdError
+
+BASE = 1700000000000
+
+VENT_RULES = {'rules': [
+    {'id': 'vent_on', 'device': 'ventilator', 'action': 'ON', 'priority': 10, 'hold': 10,
+     'when': [{'signal': 'co2_level', 'op': '>=', 'value': '$co2_high'}]},
+    {'id': 'vent_off', 'device': 'ventilator', 'action': 'OFF',
+     'when': [{'signal': 'co2_level', 'op': 'known'}]},
+]}
+
+
+@pytest.fixture
+def rules_path(tmp_path):
+    path = tmp_path / 'rules.json'
+    path.write_text(json.dumps(VENT_RULES))
+    return str(path)
+
+
+def make_replay(rules_path, tmp_path, co2_high=1000, **kwargs):
+    thresholds = ThresholdConfig()
+    thresholds.set_static('default', {'co2_high': co2_high})
+    return Replay(rules_path, thresholds, filters_path=str(tmp_path / 'no-filters.json'), **kwargs)
+
+
+def test_rows_become_the_same_fields_as_ingest():
+    assert to_fields('sensor_data', (BASE, 'co2', 812.0)) == (BASE, {'co2_level': 812.0})
+    assert to_fields('sensor_data', (BASE, 'radon', 1.0)) is None
+    assert to_fields('sensor_data', ('5', 'temperature', '')) is None     # CSV의 빈 값
+    ts, fields = to_fields('motion_log', (BASE, '1', 'false', '30'))
+    assert (fields['motion_detected'], fields['is_drowsy_alert'], fields['idle_duration']) == (True, False, 30.0)
+    assert to_fields('noise_log', (BASE, 48.5, 1))[1]['noise_level'] == 48.5
+
+
+def test_rows_with_the_same_timestamp_and_source_are_one_update():
+    sensor = [(1, 'sensor_data', {'temperature': 21.0}), (1, 'sensor_data', {'humidity': 40.0}),
+              (3, 'sensor_data', {'co2_level': 700.0})]
+    noise = [(1, 'noise_log', {'noise_level': 40.0}), (2, 'noise_log', {'noise_level': 41.0})]
+    assert list(group_events([iter(sensor), iter(noise)])) == [
+        (1, {'temperature': 21.0, 'humidity': 40.0}),
+        (1, {'noise_level': 40.0}),
+        (2, {'noise_level': 41.0}),
+        (3, {'co2_level': 700.0}),
+    ]
+
+
+def test_virtual_clock_fires_hold_timers_between_events(rules_path, tmp_path):
+    r = make_replay(rules_path, tmp_path)
+    events = [(BASE, {'co2_level': 800}), (BASE + 1000, {'co2_level': 1200}),
+              (BASE + 30000, {'co2_level': 1250})]
+    commands = r.run(events, end=BASE + 40000)
+    # hold 10초는 다음 측정값(30초 뒤)을 기다리지 않고 가상 시계로 바로 처리된다
+    assert [(ts - BASE, device, action) for ts, device, action, _ in commands] == [
+        (0, 'ventilator', 'OFF'), (11000, 'ventilator', 'ON')]
+    assert r.engine.stats['timer_fires'] >= 1
+    assert r.stats['events'] == 3
+
+
+def test_skipping_unchanged_signals_gives_the_same_commands(rules_path, tmp_path):
+    events = [(BASE + i * 1000, {'co2_level': 900 + (i % 7) * 40}) for i in range(200)]
+    fast = make_replay(rules_path, tmp_path)
+    slow = make_replay(rules_path, tmp_path, skip_unchanged=False)
+    assert fast.run(events, BASE + 300000) == slow.run(events, BASE + 300000)
+    assert fast.stats['skipped'] > 0
+    assert fast.engine.stats['evaluations'] < slow.engine.stats['evaluations']
+
+
+def test_threshold_override_changes_the_replayed_decisions(rules_path, tmp_path):
+    events = [(BASE, {'co2_level': 800}), (BASE + 1000, {'co2_level': 1200})]
+    assert len(make_replay(rules_path, tmp_path).run(events, BASE + 20000)) == 2
+    assert len(make_replay(rules_path, tmp_path, co2_high=1500).run(events, BASE + 20000)) == 1
+
+
+def test_db_and_archive_sources_yield_the_same_events(storage, tmp_path):
+    co2 = storage.sensor_type_id('co2', 'ppm')
+    with storage.connection() as conn:
+        conn.execute(INSERT_SENSOR_DATA, (BASE, co2, 800.0))
+        conn.execute(INSERT_SENSOR_DATA, (BASE + 2000, co2, 900.0))
+        conn.execute(INSERT_MOTION_LOG, (BASE + 1000, 'default', 1, 0, 5))
+        conn.execute(INSERT_NOISE_LOG, (BASE + 1000, 'lab', 60.0, 1))       # 다른 방
+        conn.commit()
+    from_db = list(db_events(storage, 'default', BASE, BASE + 10000))
+    assert [ts - BASE for ts, _ in from_db] == [0, 1000, 2000]
+
+    day = '2023-11-14'      # BASE의 UTC 날짜 - 보존 작업과 같은 열 구성
+    for table, header, rows in [
+        ('sensor_data', 'id,ts,room,sensor_type,value,unit',
+         [f'1,{BASE},default,co2,800.0,ppm', f'2,{BASE + 2000},default,co2,900.0,ppm']),
+        ('motion_log', 'id,ts,room,detected,is_drowsy_alert,idle_duration', [f'1,{BASE + 1000},default,1,0,5']),
+        ('noise_log', 'id,ts,room,noise_level,duration', [f'1,{BASE + 1000},lab,60.0,1']),
+    ]:
+        (tmp_path / table).mkdir()
+        with gzip.open(tmp_path / table / f'{table}-{day}.csv.gz', 'wt', encoding='utf-8') as f:
+            f.write('\n'.join([header] + rows) + '\n')
+    assert list(archive_events(str(tmp_path), 'default', BASE, BASE + 10000)) == from_db
+
+
+def test_coalesce_collapses_flaps_inside_the_window():
+    commands = [(0, 'led', 'ON', 'a'), (200, 'led', 'OFF', 'b'), (400, 'led', 'ON', 'c'),
+                (5000, 'led', 'OFF', 'd'), (5100, 'led', 'ON', 'e'), (5200, 'fan', 'ON', 'f')]
+    assert coalesce(commands, window_ms=1000) == [
+        (1000, 'led', 'ON', 'c'), (6200, 'fan', 'ON', 'f')]     # 5000~6000의 OFF->ON은 보내지 않는다
+
+
+def test_diff_pairs_commands_within_the_tolerance():
+    replayed = [(1000, 'led', 'ON', ''), (5000, 'led', 'OFF', ''), (9000, 'fan', 'ON', '')]
+    actual = [(900, 'led', 'OFF', ''), (1500, 'led', 'ON', ''), (20000, 'led', 'OFF', '')]
+    diff = diff_commands(replayed, actual, tolerance_ms=1000)
+    assert diff['matched'] == 1
+    assert diff['mean_lag_ms'] == 500
+    assert diff['only_replay'] == [(5000, 'led', 'OFF', ''), (9000, 'fan', 'ON', '')]
+    assert diff['only_actual'] == [(900, 'led', 'OFF', ''), (20000, 'led', 'OFF', '')]
+    assert diff['devices']['fan'] == {'replay': 1, 'actual': 0, 'matched': 0}
+
+
+def test_parse_overrides():
+    assert parse_overrides(['temp_high=26', 'heater.temp_low=16.5'], 'lab') == \
+        {'lab': {'temp_high': 26.0}, 'lab/heater': {'temp_low': 16.5}}
+    for bad in ('temp_high', 'temp_high=warm'):
+        with pytest.raises(ThresholdError):
+            parse_overrides([bad], 'lab')
+
+
+def test_main_replays_a_database_and_compares_with_control_log(storage, rules_path, tmp_path, capsys):
+    co2 = storage.sensor_type_id('co2', 'ppm')
+    with storage.connection() as conn:
+        conn.execute(INSERT_SENSOR_DATA, (BASE, co2, 800.0))
+        conn.execute(INSERT_CONTROL_LOG, (BASE + 100, 'default', 'ventilator', 'OFF', 'normal'))
+        conn.commit()
+    output = tmp_path / 'result.json'
+    code = replay.main(['--db', storage.db_path, '--rules', rules_path, '--rooms', str(tmp_path / 'none.json'),
+                        '--filters', str(tmp_path / 'none.json'), '--set', 'co2_high=1000',
+                        '--start', str(BASE), '--end', str(BASE + 10000), '--coalesce', '0',
+                        '--output', str(output)])
+    assert code == 0
+    result = json.loads(output.read_text())
+    assert [c['action'] for c in result['commands']] == ['OFF']
+    assert result['diff']['matched'] == 1
+    assert '1 matched' in capsys.readouterr().out
+
+    assert replay.main(['--db', str(tmp_path / 'missing.db')]) == 1
+    assert replay.main(['--db', storage.db_path, '--set', 'bogus']) == 2
@@ -0,0 +1,86 @@
+import csv
+import gzip
+import os
+
+import retention
+from retention import DAY_MS, RETENTION_TABLES, RetentionJob, archive_path
+from storage import INSERT_SENSOR_DATA
+
+NOW = 1_700_000_000_000 - 1_700_000_000_000 % DAY_MS + 12 * 3600 * 1000    # 정오
+
+
+def spec(table, days):
+    return dict(next(s for s in RETENTION_TABLES if s['table'] == table), days=days)
+
+
+def fill(storage, ages_in_days):
+    type_id = storage.sensor_type_id('temperature', '°C')
+    with storage.connection() as conn:
+        conn.executemany(INSERT_SENSOR_DATA,
+                         [(NOW - age * DAY_MS, type_id, float(i)) for i, age in enumerate(ages_in_days)])
+        conn.commit()
+
+
+def read_archive(path):
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        return list(csv.reader(f))
+
+
+def test_expired_days_are_archived_then_deleted(storage, tmp_path):
+    fill(storage, [40, 40, 35, 10, 0])
+    job = RetentionJob(storage, tables=[spec('sensor_data', 30)], archive_dir=str(tmp_path))
+
+    assert job.run_once(now=NOW) == {'sensor_data': 3}
+    assert storage.query('SELECT COUNT(*) FROM sensor_data')[0][0] == 2
+
+    files = sorted(os.listdir(tmp_path / 'sensor_data'))
+    assert len(files) == 2 and all(name.endswith('.csv.gz') for name in files)
+    rows = read_archive(tmp_path / 'sensor_data' / files[0])
+    assert rows[0] == ['id', 'ts', 'room', 'sensor_type', 'value', 'unit']
+    assert [r[3] for r in rows[1:]] == ['temperature', 'temperature']
+    assert job.stats['archived_rows'] == job.stats['deleted_rows'] == 3
+
+
+def test_second_run_is_a_no_op(storage, tmp_path):
+    fill(storage, [40, 0])
+    job = RetentionJob(storage, tables=[spec('sensor_data', 30)], archive_dir=str(tmp_path))
+    job.run_once(now=NOW)
+    assert job.run_once(now=NOW) == {}
+    assert job.stats['archive_files'] == 1
+
+
+def test_zero_days_keeps_everything(storage, tmp_path):
+    fill(storage, [400])
+    job = RetentionJob(storage, tables=[spec('sensor_data', 0)], archive_dir=str(tmp_path))
+    assert job.run_once(now=NOW) == {}
+    assert storage.query('SELECT COUNT(*) FROM sensor_data')[0][0] == 1
+
+
+def test_failed_archive_keeps_rows(storage, tmp_path, monkeypatch):
+    fill(storage, [40])
+
+    def fail(*args, **kwargs):
+        raise OSError('disk full')
+
+    monkeypatch.setattr(retention.gzip, 'open', fail)
+    job = RetentionJob(storage, tables=[spec('sensor_data', 30)], archive_dir=str(tmp_path))
+    assert job.run_once(now=NOW) == {}
+    assert storage.query('SELECT COUNT(*) FROM sensor_data')[0][0] == 1
+    assert job.stats['last_error'] == 'disk full'
+
+
+def test_delete_runs_in_chunks(storage, tmp_path, monkeypatch):
+    monkeypatch.setattr(retention, 'RETENTION_DELETE_CHUNK', 3)
+    fill(storage, [40] * 10)
+    table = retention._log_table('sensor_data', 30, spec('sensor_data', 30)['columns'],
+                                 spec('sensor_data', 30)['export'])
+    job = RetentionJob(storage, tables=[table], archive_dir=str(tmp_path))
+    assert job.run_once(now=NOW) == {'sensor_data': 10}
+
+
+def test_archive_path_never_overwrites(tmp_path):
+    first = archive_path(str(tmp_path), 'control_log', NOW)
+    open(first, 'w').close()
+    second = archive_path(str(tmp_path), 'control_log', NOW)
+    assert first.endswith('control_log-2023-11-14.csv.gz')
+    assert second.endswith('control_log-2023-11-14.1.csv.gz')
@@ -0,0 +1,77 @@
+from db_writer import WriteBehindWriter
+from history import query_history
+from rollups import Rollups, aggregate, ROLLUP_TABLES
+from storage import INSERT_SENSOR_DATA
+
+T0 = 1_700_000_000_000 - 1_700_000_000_000 % 86_400_000    # 자정
+
+
+def test_aggregate_math():
+    rows = [(T0 + 1000, 1, 20.0), (T0 + 2000, 1, 26.0), (T0 + 1500, 1, 18.0),
+            (T0 + 61000, 1, 5.0), (T0 + 3000, 2, 7.0), (T0 + 4000, 1, None)]
+    buckets = aggregate(rows, 60 * 1000)
+    # count, sum, min, max, last_ts, last_value - last는 도착 순서가 아니라 가장 늦은 ts
+    assert buckets[(1, T0)] == [3, 64.0, 18.0, 26.0, T0 + 2000, 26.0]
+    assert buckets[(1, T0 + 60000)] == [1, 5.0, 5.0, 5.0, T0 + 61000, 5.0]
+    assert buckets[(2, T0)] == [1, 7.0, 7.0, 7.0, T0 + 3000, 7.0]
+    assert len(buckets) == 3
+
+
+def flush(storage, rollups, samples):
+    with storage.connection() as conn:
+        conn.executemany(INSERT_SENSOR_DATA, samples)
+        rollups.on_flush(conn, {INSERT_SENSOR_DATA: samples})
+        conn.commit()
+
+
+def rollup_row(storage, name, type_id, bucket):
+    return storage.query(f'''SELECT count, sum, min, max, last_ts, last_value FROM {ROLLUP_TABLES[name]}
+                             WHERE sensor_type_id = ? AND bucket = ?''', (type_id, bucket))[0]
+
+
+def test_upserts_merge_across_flushes(storage):
+    type_id = storage.sensor_type_id('temperature', '°C')
+    rollups = Rollups()
+    flush(storage, rollups, [(T0 + 1000, type_id, 20.0), (T0 + 2000, type_id, 22.0)])
+    flush(storage, rollups, [(T0 + 3000, type_id, 30.0)])
+    # 스풀 재전송처럼 늦게 도착한 샘플 - 같은 버킷에 더해지지만 last는 바꾸지 않는다
+    flush(storage, rollups, [(T0 + 500, type_id, 10.0)])
+
+    for name in ROLLUP_TABLES:
+        assert rollup_row(storage, name, type_id, T0) == (4, 82.0, 10.0, 30.0, T0 + 3000, 30.0)
+    assert rollups.stats['upserts'] == 9
+
+
+def test_rollups_only_see_sensor_rows(storage):
+    rollups = Rollups()
+    with storage.connection() as conn:
+        rollups.on_flush(conn, {'INSERT INTO control_log ...': [(1,)]})
+    assert rollups.stats['upserts'] == 0
+
+
+def test_history_reads_rollups_for_coarse_buckets(storage):
+    type_id = storage.sensor_type_id('temperature', '°C')
+    rollups = Rollups()
+    samples = [(T0 + i * 30000, type_id, float(i)) for i in range(20)]    # 10분, 20개
+    flush(storage, rollups, samples)
+
+    raw = query_history(storage, 'temperature', start=T0, end=T0 + 600000, bucket='30')
+    rolled = query_history(storage, 'temperature', start=T0, end=T0 + 600000, bucket='5m')
+    assert raw['source'] == 'raw'
+    assert rolled['source'] == 'rollup_1m'
+    assert rolled['count'] == [10, 10]
+    assert rolled['min'] == [0.0, 10.0]
+    assert rolled['max'] == [9.0, 19.0]
+    assert rolled['avg'] == [4.5, 14.5]
+    assert rolled['last'] == [9.0, 19.0]
+
+
+def test_writer_flush_hook_keeps_rollups_in_step(storage):
+    type_id = storage.sensor_type_id('co2', 'ppm')
+    rollups = Rollups()
+    writer = WriteBehindWriter(storage, flush_interval=0.01)
+    writer.add_flush_hook(rollups.on_flush)
+    writer.start()
+    writer.submit_many([(INSERT_SENSOR_DATA, (T0 + i * 1000, type_id, 400.0 + i)) for i in range(5)])
+    writer.stop()
+    assert rollup_row(storage, '1m', type_id, T0) == (5, 2010.0, 400.0, 404.0, T0 + 4000, 404.0)
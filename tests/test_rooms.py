@@ -0,0 +1,132 @@
+import json
+import threading
+import zlib
+
+import pytest
+
+from conftest import wait_for
+from rooms import RoomError, RoomMoved, RoomRegistry, check_room_id, load_room_specs, room_owner
+from storage import now_ms
+from thresholds import ThresholdConfig
+
+
+def test_room_owner_is_a_stable_hash():
+    assert room_owner('lab', 1) == 0
+    for room_id in ('default', 'lab', 'attic', '방'):
+        assert room_owner(room_id, 4) == zlib.crc32(room_id.encode('utf-8')) % 4
+    assert len({room_owner(f'room-{i}', 4) for i in range(100)}) == 4
+
+
+@pytest.mark.parametrize('room_id', ['lab', 'Room_2', 'a-b', 'x' * 64])
+def test_valid_room_ids(room_id):
+    assert check_room_id(room_id) == room_id
+
+
+@pytest.mark.parametrize('room_id', ['', 'x' * 65, 'a b', '../etc', 'lab;drop', None, 5])
+def test_invalid_room_ids(room_id):
+    with pytest.raises(RoomError) as info:
+        check_room_id(room_id)
+    assert info.value.status == 400
+
+
+def test_room_specs_always_include_the_default_room(tmp_path):
+    assert load_room_specs(str(tmp_path / 'missing.json')) == {'default': {}}
+    path = tmp_path / 'rooms.json'
+    path.write_text(json.dumps({'rooms': {'lab': {'name': 'Lab'}}}))
+    assert load_room_specs(str(path)) == {'lab': {'name': 'Lab'}, 'default': {}}
+    path.write_text(json.dumps({'rooms': ['lab']}))
+    with pytest.raises(RoomError):
+        load_room_specs(str(path))
+
+
+def two_workers(index):
+    return RoomRegistry({}, ThresholdConfig(), worker_index=index, worker_count=2)
+
+
+def test_each_worker_only_takes_its_own_rooms():
+    ids = [f'room-{i}' for i in range(6)]
+    first, second = two_workers(0), two_workers(1)
+    for registry in (first, second):
+        for room_id in ids:
+            if registry.owns(room_id):
+                registry.add(room_id)
+    assert sorted(first.ids() + second.ids()) == sorted(ids)
+    assert not set(first.ids()) & set(second.ids())
+
+
+def test_other_workers_rooms_are_moved_and_unknown_rooms_are_404():
+    registry = two_workers(0)
+    theirs = next(f'room-{i}' for i in range(20) if room_owner(f'room-{i}', 2) == 1)
+    ours = next(f'room-{i}' for i in range(20) if room_owner(f'room-{i}', 2) == 0)
+    with pytest.raises(RoomMoved) as info:
+        registry.get(theirs)
+    assert (info.value.status, info.value.worker) == (307, 1)
+    with pytest.raises(RoomMoved):
+        registry.add(theirs)
+    with pytest.raises(RoomError) as info:
+        registry.get(ours)
+    assert info.value.status == 404
+
+
+def test_room_thresholds_come_from_the_room_spec():
+    thresholds = ThresholdConfig()
+    registry = RoomRegistry({}, thresholds)
+    registry.add('lab', {'thresholds': {'temp_high': 26}})
+    assert registry.get('lab').thresholds['temp_high'] == 26
+    with pytest.raises(RoomError):
+        registry.add('bad', {'actuators': ['http://x']})
+
+
+def test_maintenance_keeps_running_when_a_room_fails():
+    class FakeRoom:
+        def __init__(self, room_id, fail):
+            self.id = room_id
+            self.fail = fail
+            self.checks = 0
+
+        def check_freshness(self):
+            self.checks += 1
+            if self.fail:
+                raise RuntimeError('broken sensor state')
+
+    registry = RoomRegistry({}, ThresholdConfig())
+    broken, healthy = FakeRoom('broken', True), FakeRoom('healthy', False)
+    registry._rooms = {'broken': broken, 'healthy': healthy}
+    thread = threading.Thread(target=registry._run, args=(0.01, 3600), daemon=True)
+    thread.start()
+    try:
+        assert wait_for(lambda: broken.checks >= 3 and healthy.checks >= 3)
+        assert thread.is_alive()
+    finally:
+        registry._stop.set()
+        thread.join(1)
+
+
+def test_rooms_do_not_share_state(server):
+    server.rooms.get('lab').update_latest({'humidity': 61.0}, now_ms())
+    assert server.rooms.get('lab').raw_state.get('humidity') == 61.0
+    assert server.rooms.get('default').raw_state.get('humidity') != 61.0
+
+
+def test_unknown_and_invalid_rooms_over_http(client):
+    assert client.get('/status?room=nowhere').status_code == 404
+    assert client.get('/status?room=no%20spaces').status_code == 400
+
+
+def test_rules_reload_reports_bad_files(client, server, monkeypatch, tmp_path):
+    loader = server.rooms.get('annex').rule_loader
+    good = loader.ruleset
+    bad = tmp_path / 'rules.json'
+    bad.write_text('{"rules": [{"id": "x", "device": "vent", "action": "ON", "priority": "high"}]}')
+    monkeypatch.setattr(loader, 'path', str(bad))
+
+    resp = client.post('/rules/reload?room=annex')
+    assert resp.status_code == 400
+    assert 'priority must be a number' in resp.get_json()['message']['annex']
+    assert loader.ruleset is good
+
+
+def test_worker_url_points_at_the_owning_workers_port(server):
+    port = server.SERVER_PORT
+    assert server.worker_url('http://host:1234/status?room=lab', 2) == f'http://host:{port + 2}/status?room=lab'
+    assert server.worker_url('http://[::1]:1234/x', 1) == f'http://[::1]:{port + 1}/x'
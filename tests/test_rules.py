@@ -0,0 +1,175 @@
+import json
+import os
+
+import pytest
+
+from decision_engine import DecisionEngine
+from rules import Condition, RuleConfigError, RuleReloader, RuleSet
+from thresholds import ThresholdSnapshot
+
+THRESHOLDS = {'temp_high': 28.0, 'co2_delay': 10}
+
+
+class Harness:
+    """규칙 집합 하나와 수동 시계 - 값 바꾸고 evaluate()하면 적용된 제어 명령이 쌓인다"""
+
+    def __init__(self, rules, defaults=None, devices=None):
+        self.now = 1000.0
+        self.values = {}
+        self.stale = set()
+        self.commands = []
+        self.snapshot = ThresholdSnapshot(1, 'default', dict(THRESHOLDS), {})
+        self.engine = DecisionEngine(clock=lambda: self.now)
+        config = {'rules': rules, 'defaults': defaults or {}}
+        self.ruleset = RuleSet(config, lambda: self.values, lambda: self.snapshot, self.actuate,
+                               devices=devices, is_stale=self.stale.__contains__)
+        self.ruleset.install(self.engine)
+
+    def actuate(self, device, action, reason):
+        self.commands.append((device, action))
+
+    def step(self, now=None, **values):
+        if now is not None:
+            self.now = now
+        self.values.update(values)
+        self.engine.notify(*values)
+        self.engine.run_pending()
+        return self.commands[-1][1] if self.commands else None
+
+
+AC_RULES = [
+    {'id': 'on', 'device': 'ac', 'action': 'ON', 'priority': 10,
+     'when': [{'signal': 'temperature', 'op': '>', 'value': '$temp_high', 'hysteresis': 0.5}]},
+    {'id': 'off', 'device': 'ac', 'action': 'OFF',
+     'when': [{'signal': 'temperature', 'op': 'known'}]},
+]
+
+
+def test_hysteresis_keeps_the_rule_active_inside_the_band():
+    h = Harness(AC_RULES)
+    assert h.step(temperature=28.0) == 'OFF'
+    assert h.step(temperature=28.1) == 'ON'
+    assert h.step(temperature=27.6) == 'ON'       # 28 - 0.5 보다 높으면 유지
+    assert h.step(temperature=27.5) == 'OFF'
+    assert h.step(temperature=27.9) == 'OFF'      # 다시 켜지려면 28을 넘어야 한다
+
+
+def test_hold_waits_before_acting_and_schedules_a_timer():
+    h = Harness([
+        {'id': 'vent', 'device': 'vent', 'action': 'ON', 'hold': '$co2_delay',
+         'when': [{'signal': 'co2_level', 'op': '>=', 'value': 1000}]},
+    ])
+    assert h.step(co2_level=1200) is None
+    assert h.engine.next_deadline() == 1010
+    h.now = 1009.9
+    h.engine.run_pending()
+    assert h.commands == []
+    h.now = 1010
+    h.engine.run_pending()
+    assert h.commands == [('vent', 'ON')]
+
+
+def test_hold_restarts_when_the_condition_breaks():
+    h = Harness([
+        {'id': 'vent', 'device': 'vent', 'action': 'ON', 'hold': 10,
+         'when': [{'signal': 'co2_level', 'op': '>=', 'value': 1000}]},
+    ])
+    h.step(co2_level=1200)
+    h.step(now=1005, co2_level=900)
+    assert h.engine.next_deadline() is None
+    h.step(now=1008, co2_level=1100)
+    h.step(now=1015, co2_level=1150)
+    assert h.commands == []
+    h.step(now=1018, co2_level=1160)
+    assert h.commands == [('vent', 'ON')]
+
+
+def test_priority_then_definition_order_wins():
+    h = Harness([
+        {'id': 'low', 'device': 'led', 'action': 'DIM', 'priority': 1, 'when': [{'signal': 'x', 'op': 'known'}]},
+        {'id': 'first', 'device': 'led', 'action': 'ON', 'priority': 5, 'when': [{'signal': 'x', 'op': 'known'}]},
+        {'id': 'second', 'device': 'led', 'action': 'OFF', 'priority': 5, 'when': [{'signal': 'x', 'op': 'known'}]},
+    ])
+    assert h.step(x=1) == 'ON'
+    assert h.ruleset.describe()['active'] == {'led': 'first'}
+
+
+def test_stale_modes():
+    fail_safe = {'id': 'safe', 'device': 'ac', 'action': 'OFF', 'priority': 1,
+                 'when': [{'signal': 'temperature', 'op': 'stale'}]}
+    on = {'id': 'on', 'device': 'ac', 'action': 'ON', 'priority': 10,
+          'when': [{'signal': 'temperature', 'op': '>', 'value': 20}]}
+
+    drop = Harness([dict(on, on_stale='drop'), fail_safe])
+    assert drop.step(temperature=30) == 'ON'
+    drop.stale.add('temperature')
+    assert drop.step(temperature=30) == 'OFF'
+
+    hold = Harness([on], defaults={'on_stale': 'hold'})
+    assert hold.step(temperature=30) == 'ON'
+    hold.stale.add('temperature')
+    assert hold.step(temperature=10) == 'ON'      # 오래된 값으로는 상태를 바꾸지 않는다
+
+
+def test_reason_is_formatted_from_values_and_thresholds():
+    h = Harness([{'id': 'r', 'device': 'ac', 'action': 'ON', 'reason': '{temperature:.1f} > {temp_high}',
+                  'when': [{'signal': 'temperature', 'op': 'known'}]}])
+    rule = h.ruleset.rules[0]
+    assert rule.format_reason({'temperature': 29.04}, THRESHOLDS) == '29.0 > 28.0'
+    assert rule.format_reason({}, THRESHOLDS) == '{temperature:.1f} > {temp_high}'
+
+
+@pytest.mark.parametrize('rule, message', [
+    ({'device': 'ac', 'action': 'ON'}, 'missing'),
+    ({'id': 'r', 'device': 'ac', 'action': 'ON', 'priority': 'high'}, 'priority must be a number'),
+    ({'id': 'r', 'device': 'ac', 'action': 'ON', 'priority': 1.5}, 'priority must be an integer'),
+    ({'id': 'r', 'device': 'ac', 'action': 'ON', 'hold': -1}, 'hold must be >= 0'),
+    ({'id': 'r', 'device': 'ac', 'action': 'ON', 'hold': '$nope'}, 'Unknown threshold'),
+    ({'id': 'r', 'device': 'ac', 'action': 'ON', 'on_stale': 'panic'}, 'on_stale'),
+    ({'id': 'r', 'device': 'ac', 'action': 'ON', 'when': {'signal': 'x'}}, "'when' must be a list"),
+    ({'id': 'r', 'device': 'ac', 'action': 'ON', 'when': [{'signal': 'x', 'op': '>', 'value': 'hot'}]},
+     'must be a number'),
+    ({'id': 'r', 'device': 'ac', 'action': 'ON', 'when': [{'signal': 'x', 'op': '>', 'value': True}]},
+     'must be a number'),
+    ({'id': 'r', 'device': 'ac', 'action': 'ON', 'when': [{'signal': 'x', 'op': '~'}]}, 'Unknown operator'),
+    ({'id': 'r', 'device': 'ac', 'action': 'ON',
+      'when': [{'signal': 'x', 'op': '>', 'value': 1, 'hysteresis': -0.5}]}, 'hysteresis must be >= 0'),
+    ({'id': 'r', 'device': 'ac', 'action': 'ON', 'when': [{'signal': 'x', 'op': '==', 'value': [1]}]},
+     'must be a scalar'),
+])
+def test_invalid_rules_are_rejected(rule, message):
+    with pytest.raises(RuleConfigError, match=message):
+        Harness([rule])
+
+
+def test_duplicate_ids_and_unknown_devices_are_rejected():
+    rule = {'id': 'r', 'device': 'ac', 'action': 'ON'}
+    with pytest.raises(RuleConfigError, match='Duplicate'):
+        Harness([rule, rule])
+    with pytest.raises(RuleConfigError, match='Unknown devices'):
+        Harness([rule], devices={'heater'})
+
+
+def test_hysteresis_only_relaxes_ordering_operators():
+    cond = Condition({'signal': 'x', 'op': '==', 'value': 1, 'hysteresis': 5}, {})
+    assert cond.test({'x': 1}, {}, lambda s: False)
+    assert not cond.test({'x': 2}, {}, lambda s: False)
+
+
+def test_reloader_keeps_the_previous_rules_on_bad_config(tmp_path):
+    path = tmp_path / 'rules.json'
+    path.write_text(json.dumps({'rules': AC_RULES}))
+    snapshot = ThresholdSnapshot(1, 'default', dict(THRESHOLDS), {})
+    engine = DecisionEngine()
+    reloader = RuleReloader(engine, str(path), dict, lambda: snapshot, lambda *a: None)
+    assert reloader.load()
+    good = reloader.ruleset
+
+    for bad in ('{not json', json.dumps({'rules': [{'id': 'x', 'device': 'ac', 'action': 'ON', 'hold': 'soon'}]}),
+                json.dumps({'rules': 'none'})):
+        path.write_text(bad)
+        os.utime(path, (0, reloader._mtime + 1 if reloader._mtime else 1))
+        assert reloader.check() is False
+        assert reloader.ruleset is good
+    assert reloader.stats['errors'] == 3
+    assert reloader.check() is False        # 같은 잘못된 파일은 다시 읽지 않는다
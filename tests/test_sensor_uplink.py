@@ -0,0 +1,115 @@
+import threading
+
+import requests
+
+from conftest import wait_for
+from sensor_uplink import SensorUplink
+
+
+class FakeResponse:
+    def __init__(self, status_code, text=''):
+        self.status_code = status_code
+        self.text = text
+
+
+class FakeSession:
+    """요청 본문을 기록하고 정해진 응답(또는 예외)을 돌려주는 requests.Session 대용"""
+
+    def __init__(self, status=200):
+        self.status = status
+        self.bodies = []
+        self.lock = threading.Lock()
+
+    def post(self, url, json=None, timeout=None):
+        if isinstance(self.status, Exception):
+            raise self.status
+        with self.lock:
+            self.bodies.append(json)
+        return FakeResponse(self.status, 'bad reading')
+
+    def close(self):
+        pass
+
+    def sent(self):
+        with self.lock:
+            return [r['value'] for body in self.bodies for r in body['readings']]
+
+
+def uplink(tmp_path, session, **kwargs):
+    link = SensorUplink('http://central:5000/', 'test', spool_dir=str(tmp_path), **kwargs)
+    link.session = session
+    return link
+
+
+def test_sends_immediately_when_healthy(tmp_path):
+    session = FakeSession()
+    link = uplink(tmp_path, session, room='lab').start()
+    link.add({'type': 'co2', 'value': 1, 'ts': 1.0})
+    assert wait_for(lambda: session.sent() == [1], timeout=1)
+    link.stop()
+    assert session.bodies[0]['room'] == 'lab'
+    assert link.url == 'http://central:5000/sensor/batch'
+    assert link.stats['sent'] == 1
+
+
+def test_unreachable_server_spools_on_stop(tmp_path):
+    link = uplink(tmp_path, FakeSession(requests.exceptions.ConnectionError()))
+    for i in range(3):
+        link.add({'type': 'co2', 'value': i, 'ts': float(i)})
+    link.stop()
+    assert link.pending() == 3
+    assert [r['value'] for r in link._read_spool()] == [0, 1, 2]
+
+
+def test_spool_is_replayed_before_new_readings(tmp_path):
+    offline = uplink(tmp_path, FakeSession(requests.exceptions.ConnectionError()))
+    for i in range(3):
+        offline.add({'type': 'co2', 'value': i, 'ts': float(i)})
+    offline.stop()
+
+    session = FakeSession()
+    link = uplink(tmp_path, session).start()
+    link.add({'type': 'co2', 'value': 3, 'ts': 3.0})
+    assert wait_for(lambda: session.sent() == [0, 1, 2, 3], timeout=2)
+    link.stop()
+    assert link.pending() == 0
+    assert link.stats['replayed'] == 3
+
+
+def test_failed_batch_goes_ahead_of_newer_spooled_readings(tmp_path):
+    link = uplink(tmp_path, FakeSession())
+    # 전송 중 버퍼가 넘쳐 더 새로운 값이 먼저 스풀된 상황
+    link._spill([{'value': 3}, {'value': 4}])
+    link._spill([{'value': 1}, {'value': 2}], front=True)
+    assert [r['value'] for r in link._read_spool()] == [1, 2, 3, 4]
+
+
+def test_full_buffer_spills_to_disk(tmp_path):
+    link = uplink(tmp_path, FakeSession(), buffer_size=3)
+    for i in range(4):
+        link.add({'value': i, 'ts': float(i)})
+    assert [r['value'] for r in link._read_spool()] == [0, 1, 2]
+    assert link.pending() == 4
+
+
+def test_rejected_batch_is_dropped_and_logged(tmp_path, capsys):
+    link = uplink(tmp_path, FakeSession(status=400))
+    assert link._post([{'value': 1, 'ts': 10.0}, {'value': 2, 'ts': 12.0}])
+    assert link.stats['dropped'] == 2
+    out = capsys.readouterr().out
+    assert 'dropping 2 readings, ts 10.0..12.0' in out
+
+
+def test_server_error_backs_off(tmp_path):
+    link = uplink(tmp_path, FakeSession(status=503), backoff_max=60)
+    assert not link._post([{'value': 1, 'ts': 1.0}])
+    assert link._failures == 1
+    assert not link._due()      # 재시도 시각 전에는 보내지 않는다
+
+
+def test_truncated_spool_line_is_skipped(tmp_path):
+    link = uplink(tmp_path, FakeSession())
+    link._spill([{'value': 1}])
+    with open(link.spool_path, 'a') as f:
+        f.write('{"value": 2')
+    assert link._read_spool() == [{'value': 1}]
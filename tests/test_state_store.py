@@ -0,0 +1,68 @@
+import threading
+
+import pytest
+
+from state_store import StateStore
+
+
+def test_update_changes_several_fields_atomically():
+    store = StateStore({'temperature': None})
+    before = store.snapshot()
+    assert store.update({'temperature': 21.0, 'humidity': 40}, ts=1000) == {'temperature': 21.0, 'humidity': 40}
+
+    after = store.snapshot()
+    assert after.version == 1
+    assert dict(after.values) == {'temperature': 21.0, 'humidity': 40}
+    assert dict(after.versions) == {'temperature': 1, 'humidity': 1}
+    assert before.version == 0 and before.values['temperature'] is None    # 이전 스냅샷은 그대로
+
+
+def test_unchanged_values_do_not_bump_the_version():
+    store = StateStore({})
+    store.update({'co2_level': 800}, ts=1000)
+    assert store.update({'co2_level': 800}, ts=2000) == {}
+    assert store.version == 1
+    assert store.snapshot().timestamps['co2_level'] == 2000
+
+
+def test_older_readings_never_overwrite_newer_ones():
+    store = StateStore({})
+    store.update({'co2_level': 900}, ts=2000)
+    assert store.update({'co2_level': 700, 'noise_level': 40}, ts=1000) == {'noise_level': 40}
+    assert store.get('co2_level') == 900
+
+
+def test_snapshots_are_read_only():
+    store = StateStore({'x': 1})
+    with pytest.raises(TypeError):
+        store.snapshot().values['x'] = 2
+
+
+def test_subscribers_see_changes_in_version_order():
+    store = StateStore({})
+    seen = []
+    store.subscribe(lambda changed, version: seen.append(version))
+
+    def writer(offset):
+        for i in range(200):
+            store.update({f'signal_{offset}': i})
+
+    threads = [threading.Thread(target=writer, args=(n,)) for n in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert seen == list(range(1, store.version + 1))
+    assert store.version == 4 * 200
+
+
+def test_failing_subscriber_does_not_block_the_update(capsys):
+    store = StateStore({})
+
+    def broken(changed, version):
+        raise RuntimeError('boom')
+
+    store.subscribe(broken)
+    assert store.update({'x': 1}) == {'x': 1}
+    assert store.get('x') == 1
+    assert '[STATE ERROR] Subscriber failed: boom' in capsys.readouterr().out
@@ -0,0 +1,98 @@
+import threading
+
+import pytest
+
+from storage import Storage, to_epoch_ms
+
+
+def test_connections_use_wal(storage):
+    with storage.connection() as conn:
+        assert conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+
+
+def test_pool_reuses_connections(storage):
+    with storage.connection() as first:
+        pass
+    with storage.connection() as second:
+        assert second is first
+
+
+def test_pool_never_grows_past_its_size(tmp_path):
+    store = Storage(str(tmp_path / 'pool.db'), pool_size=2)
+    store.migrate()
+    borrowed = []
+    released = threading.Event()
+
+    def borrow():
+        with store.connection() as conn:
+            borrowed.append(conn)
+            released.wait(2)
+
+    threads = [threading.Thread(target=borrow) for _ in range(2)]
+    for t in threads:
+        t.start()
+    while len(borrowed) < 2:
+        pass
+    # 풀이 다 빌려졌으면 새 연결을 만들지 않고 반납을 기다린다
+    waiter = threading.Thread(target=borrow)
+    waiter.start()
+    waiter.join(0.1)
+    assert waiter.is_alive()
+    released.set()
+    for t in threads + [waiter]:
+        t.join()
+    assert len({id(conn) for conn in borrowed}) == 2
+    store.close_all()
+
+
+def test_open_transaction_is_rolled_back_on_return(storage):
+    with storage.connection() as conn:
+        conn.execute('BEGIN')
+        conn.execute("INSERT INTO control_log (ts, room, device, action) VALUES (1, 'default', 'led', 'ON')")
+    assert storage.query('SELECT COUNT(*) FROM control_log')[0][0] == 0
+
+
+def test_sensor_type_ids_are_per_room_and_cached(storage):
+    default_id = storage.sensor_type_id('co2', 'ppm')
+    lab_id = storage.sensor_type_id('co2', 'ppm', 'lab')
+    assert default_id != lab_id
+    assert storage.sensor_type_id('co2', 'ppm') == default_id
+
+
+def test_preload_fills_the_cache_so_ingest_never_queries(storage, monkeypatch):
+    count = storage.preload_sensor_types([('temperature', '°C'), ('co2', 'ppm')], ['default', 'lab'])
+    assert count == 4
+
+    def no_db():
+        raise AssertionError('sensor_type_id touched the database')
+
+    monkeypatch.setattr(storage, 'connection', no_db)
+    assert storage.sensor_type_id('co2', 'ppm', 'lab') == storage.sensor_type_id('co2', None, 'lab')
+    storage.sensor_type_id('temperature', '°C', 'default')
+
+
+def test_preload_is_idempotent(storage):
+    storage.preload_sensor_types([('co2', 'ppm')], ['default'])
+    first = storage.sensor_type_id('co2')
+    storage.preload_sensor_types([('co2', 'ppm')], ['default'])
+    assert storage.sensor_type_id('co2') == first
+    assert storage.query("SELECT COUNT(*) FROM sensor_types WHERE name = 'co2'")[0][0] == 1
+
+
+@pytest.mark.parametrize('value, expected', [
+    (1760000000, 1760000000000),              # 초
+    (1760000000.5, 1760000000500),
+    (1760000000123, 1760000000123),           # 밀리초
+    ('1760000000', 1760000000000),
+    ('2025-10-09T08:53:20Z', 1760000000000),
+    (None, None),
+    ('', None),
+])
+def test_to_epoch_ms(value, expected):
+    assert to_epoch_ms(value) == expected
+
+
+@pytest.mark.parametrize('value', ['yesterday', True, '2025-13-01T00:00:00'])
+def test_to_epoch_ms_rejects_bad_values(value):
+    with pytest.raises(ValueError):
+        to_epoch_ms(value)
@@ -0,0 +1,177 @@
+import asyncio
+import json
+import threading
+
+import pytest
+
+from conftest import wait_for
+from stream import CachedDocument, ChangeFeed, etag_matches, merge_changes, parse_last_id, sse_stream, sse_stream_async
+
+
+def parse_frame(frame):
+    fields = dict(line.split(': ', 1) for line in frame.strip().split('\n'))
+    return fields['event'], int(fields['id']), json.loads(fields['data'])
+
+
+def test_since_returns_only_newer_events():
+    feed = ChangeFeed(size=10)
+    feed.publish({'sensor_data': {'co2_level': 800}})
+    feed.publish({'sensor_data': {'co2_level': 900}})
+    assert feed.since(2) == []
+    assert feed.since(1) == [(2, {'sensor_data': {'co2_level': 900}})]
+    assert [seq for seq, _ in feed.since(0)] == [1, 2]
+
+
+def test_since_asks_for_a_snapshot_when_the_buffer_moved_on():
+    feed = ChangeFeed(size=2)
+    for i in range(5):
+        feed.publish({'sensor_data': {'x': i}})
+    assert feed.since(2) is None        # 3은 이미 밀려났다
+    assert feed.since(3) == [(4, {'sensor_data': {'x': 3}}), (5, {'sensor_data': {'x': 4}})]
+    assert feed.since(99) is None       # 서버 재시작 등으로 순번이 뒤로 갔다
+
+
+def test_merge_changes_keeps_the_latest_value_per_field():
+    events = [(1, {'sensor_data': {'a': 1, 'b': 1}}), (2, {'sensor_data': {'a': 2}, 'stale': {'b': True}})]
+    assert merge_changes(events) == {'sensor_data': {'a': 2, 'b': 1}, 'stale': {'b': True}}
+
+
+@pytest.mark.parametrize('value, expected', [('7', 7), (None, None), ('', None), ('abc', None)])
+def test_parse_last_id(value, expected):
+    assert parse_last_id(value) == expected
+
+
+def test_wait_wakes_on_publish():
+    feed = ChangeFeed()
+    timer = threading.Timer(0.05, feed.publish, args=({'sensor_data': {'x': 1}},))
+    timer.start()
+    assert feed.wait(0, timeout=2) == [(1, {'sensor_data': {'x': 1}})]
+    assert feed.wait(1, timeout=0.01) == []
+
+
+def test_stream_sends_snapshot_then_changes_then_heartbeat():
+    feed = ChangeFeed()
+    feed.publish({'sensor_data': {'x': 0}})
+    frames = sse_stream(feed, None, lambda: {'sensor_data': {'x': 0}}, heartbeat=0.01)
+
+    assert next(frames).startswith('retry: ')
+    assert parse_frame(next(frames)) == ('snapshot', 1, {'sensor_data': {'x': 0}})
+    assert feed.clients == 1
+    feed.publish({'sensor_data': {'x': 1}})
+    feed.publish({'sensor_data': {'x': 2}, 'stale': {'x': False}})
+    assert parse_frame(next(frames)) == ('change', 3, {'sensor_data': {'x': 2}, 'stale': {'x': False}})
+    assert next(frames) == ': heartbeat\n\n'
+    frames.close()
+    assert feed.clients == 0
+
+
+def test_stream_resumes_after_last_event_id():
+    feed = ChangeFeed()
+    for i in range(3):
+        feed.publish({'sensor_data': {'x': i}})
+    frames = sse_stream(feed, 2, lambda: pytest.fail('resume must not send a snapshot'))
+    next(frames)
+    assert parse_frame(next(frames)) == ('change', 3, {'sensor_data': {'x': 2}})
+    frames.close()
+
+
+def test_async_stream_is_woken_from_another_thread():
+    feed = ChangeFeed()
+
+    async def run():
+        frames = sse_stream_async(feed, 0, dict, heartbeat=2)
+        await frames.__anext__()
+        threading.Timer(0.05, feed.publish, args=({'sensor_data': {'x': 5}},)).start()
+        frame = await asyncio.wait_for(frames.__anext__(), 1)
+        await frames.aclose()
+        return frame
+
+    assert parse_frame(asyncio.run(run())) == ('change', 1, {'sensor_data': {'x': 5}})
+    assert feed.clients == 0
+    assert feed._async_waiters == []
+
+
+def test_stream_endpoint_is_server_sent_events(client):
+    resp = client.get('/stream?room=attic')
+    assert resp.status_code == 200
+    assert resp.mimetype == 'text/event-stream'
+    frames = resp.response
+    assert next(frames).decode().startswith('retry: ')
+    event, _, data = parse_frame(next(frames).decode())
+    assert event == 'snapshot'
+    assert data['room'] == 'attic'
+    resp.close()
+
+
+class Document:
+    """status_response()가 쓰는 방 속성만 가진 대용"""
+
+    def __init__(self):
+        self.change_feed = ChangeFeed()
+        self.builds = []
+        self.status_document = CachedDocument(self.change_feed, self.build)
+
+    def build(self, version):
+        self.builds.append(version)
+        return {'version': version}
+
+
+def test_cached_document_rebuilds_only_on_new_versions():
+    room = Document()
+    first = room.status_document.get()
+    assert room.status_document.get() is first
+    room.change_feed.publish({'sensor_data': {'x': 1}})
+    version, body, etag = room.status_document.get()
+    assert (version, json.loads(body)) == (1, {'version': 1})
+    assert etag == f'{room.status_document.instance}-1'
+    assert room.builds == [0, 1]
+
+
+@pytest.mark.parametrize('header, expected', [
+    ('"abc-1"', True), ('W/"abc-1"', True), ('"x", "abc-1"', True), ('*', True),
+    ('"abc-2"', False), (None, False), ('', False),
+])
+def test_etag_matches(header, expected):
+    assert etag_matches(header, 'abc-1') is expected
+
+
+def test_status_response_304_and_delta(server):
+    room = Document()
+    room.change_feed.publish({'sensor_data': {'co2_level': 800}})
+    body, etag, status = server.status_response(room, None, None, None)
+    assert status == 200 and json.loads(body)['version'] == 1
+    assert server.status_response(room, None, None, f'"{etag}"')[2] == 304
+
+    room.change_feed.publish({'sensor_data': {'co2_level': 900}})
+    room.change_feed.publish({'stale': {'temperature': True}})
+    instance = room.status_document.instance
+    delta, delta_etag, status = server.status_response(room, '1', instance, None)
+    assert status == 200
+    assert json.loads(delta) == {'version': 3, 'instance': instance, 'since': 1,
+                                 'changes': {'sensor_data': {'co2_level': 900}, 'stale': {'temperature': True}}}
+    assert server.status_response(room, '1', instance, f'"{delta_etag}"')[2] == 304
+    assert server.status_response(room, '3', instance, None)[2] == 304
+
+
+def test_status_response_falls_back_to_the_full_document(server):
+    room = Document()
+    room.change_feed.publish({'sensor_data': {'x': 1}})
+    # 다른 서버 인스턴스의 버전이면 전체 문서
+    body, _, status = server.status_response(room, '1', 'other-instance', None)
+    assert (status, json.loads(body)) == (200, {'version': 1})
+    # 버퍼에서 밀려난 버전도 전체 문서
+    room.change_feed._events.clear()
+    room.change_feed.publish({'sensor_data': {'x': 2}})
+    body, _, status = server.status_response(room, '0', room.status_document.instance, None)
+    assert (status, json.loads(body)) == (200, {'version': 2})
+
+
+def test_status_endpoint_revalidates_with_etag(client):
+    def not_modified():
+        resp = client.get('/status?room=attic')
+        assert resp.headers['Cache-Control'] == 'no-cache'
+        return client.get('/status?room=attic', headers={'If-None-Match': resp.headers['ETag']}).status_code == 304
+
+    # 시작 직후 규칙/장치 결과로 버전이 바뀌는 중일 수 있으므로 잠잠해질 때까지
+    assert wait_for(not_modified)
+    assert client.get('/status?room=attic', headers={'If-None-Match': '"stale-0"'}).status_code == 200
@@ -0,0 +1,143 @@
+import pytest
+
+from thresholds import DEFAULT_THRESHOLDS, ThresholdConfig, ThresholdError, check_scope, check_value
+
+
+@pytest.mark.parametrize('key, value, message', [
+    ('temp_hi', 30, 'unknown threshold'),
+    ('temp_high', '30', 'must be a number'),
+    ('temp_high', True, 'must be a number'),
+    ('temp_high', 90, 'outside \\[-40, 85\\]'),
+    ('motion_timeout', 1.5, 'whole number'),
+])
+def test_invalid_values(key, value, message):
+    with pytest.raises(ThresholdError, match=message):
+        check_value(key, value, 'lab')
+
+
+def test_values_take_the_schema_type():
+    assert check_value('temp_high', 30, 'lab') == 30.0
+    assert isinstance(check_value('motion_timeout', 60.0, 'lab'), int)
+
+
+@pytest.mark.parametrize('scope', ['*', 'lab', 'lab/heater'])
+def test_valid_scopes(scope):
+    assert check_scope(scope) == scope
+
+
+@pytest.mark.parametrize('scope', ['', 'lab/heater/x', '*/heater', 'a b', None])
+def test_invalid_scopes(scope):
+    with pytest.raises(ThresholdError):
+        check_scope(scope)
+
+
+def test_scopes_override_in_order():
+    config = ThresholdConfig()
+    config.set_static('lab', {'temp_high': 26})
+    assert config.resolve('lab')['temp_high'] == 26.0
+    config.update({'*': {'temp_high': 30, 'co2_high': 1200}, 'lab/heater': {'temp_high': 24}})
+    # 방 설정 파일 값이 전체(*)보다 우선, 장치 단계가 가장 우선
+    assert config.resolve('lab')['temp_high'] == 26.0
+    assert config.resolve('lab', 'heater')['temp_high'] == 24.0
+    assert config.resolve('attic')['temp_high'] == 30.0
+    assert config.resolve('lab')['co2_high'] == 1200.0
+    config.update({'lab': {'temp_high': 27}})
+    assert config.resolve('lab')['temp_high'] == 27.0
+
+    snapshot = config.snapshot('lab')
+    assert snapshot is config.snapshot('lab')               # 버전마다 한 번만 만든다
+    assert snapshot.for_device('heater')['temp_high'] == 24.0
+    assert snapshot.for_device('airconditioner')['temp_high'] == 27.0
+    with pytest.raises(TypeError):
+        snapshot.values['temp_high'] = 0
+
+
+def test_update_versions_and_notifies_changed_scopes():
+    config = ThresholdConfig()
+    seen = []
+    config.subscribe(seen.append)
+    assert config.update({'lab': {'temp_high': 27}}) == 1
+    assert config.update({'lab': {'temp_high': 27}}) == 1      # 바뀐 게 없으면 새 버전도 없다
+    assert config.update({'lab': {'temp_high': None}, 'attic': {'co2_high': 900}}) == 2
+    assert config.document() == {'attic': {'co2_high': 900.0}}
+    assert seen == [{'lab'}, {'lab', 'attic'}]
+
+
+def test_ordering_is_checked_at_every_scope():
+    config = ThresholdConfig()
+    config.update({'lab': {'temp_low': 20}})
+    with pytest.raises(ThresholdError, match='lab: temp_low .* must be below temp_high'):
+        config.update({'*': {'temp_high': 19}})
+    with pytest.raises(ThresholdError, match='lab/heater'):
+        config.update({'lab/heater': {'temp_high': 15}})
+    assert config.version == 1
+    assert config.stats['rejected'] == 2
+
+
+def test_expected_version_conflict_is_409():
+    config = ThresholdConfig()
+    config.update({'lab': {'temp_high': 27}})
+    with pytest.raises(ThresholdError) as info:
+        config.update({'lab': {'temp_high': 29}}, expected=0)
+    assert info.value.status == 409
+    assert config.update({'lab': {'temp_high': 29}}, expected=1) == 2
+
+
+def test_rollback_adds_a_new_version(storage):
+    config = ThresholdConfig(storage)
+    config.update({'lab': {'temp_high': 27}}, note='warm')
+    config.update({'lab': {'temp_high': 29}})
+    assert config.rollback(1) == 3
+    assert config.resolve('lab')['temp_high'] == 27.0
+    assert config.rollback(0) == 4
+    assert config.resolve('lab') == DEFAULT_THRESHOLDS
+    with pytest.raises(ThresholdError) as info:
+        config.rollback(99)
+    assert info.value.status == 404
+    history = config.history()
+    assert [h['version'] for h in history] == [4, 3, 2, 1]
+    assert (history[1]['source'], history[3]['note']) == ('rollback:1', 'warm')
+
+
+def test_rollback_without_storage_only_knows_the_current_version():
+    config = ThresholdConfig()
+    config.update({'lab': {'temp_high': 27}})
+    config.update({'lab': {'temp_high': 29}})
+    with pytest.raises(ThresholdError):
+        config.rollback(1)
+
+
+def test_other_workers_versions_are_loaded(storage):
+    writer, reader = ThresholdConfig(storage), ThresholdConfig(storage)
+    writer.update({'lab': {'co2_high': 900}})
+    assert reader.load()
+    assert reader.resolve('lab')['co2_high'] == 900.0
+    assert not reader.load()
+
+    # 같은 버전을 먼저 쓴 워커가 있으면 409, 따라잡은 뒤 다시 시도하면 된다
+    writer.update({'lab': {'co2_high': 950}})
+    with pytest.raises(ThresholdError) as info:
+        reader.update({'lab': {'co2_high': 1100}})
+    assert info.value.status == 409
+    assert reader.version == 2
+    assert reader.update({'lab': {'co2_high': 1100}}) == 3
+
+
+def test_thresholds_endpoint(client, server):
+    resp = client.post('/thresholds?room=annex&device=heater', json={'temp_low': 12})
+    assert resp.status_code == 200
+    body = resp.get_json()
+    assert (body['room'], body['device'], body['thresholds']['temp_low']) == ('annex', 'heater', 12.0)
+    assert client.get('/thresholds?room=annex').get_json()['temp_low'] == DEFAULT_THRESHOLDS['temp_low']
+    assert server.thresholds.document()['annex/heater'] == {'temp_low': 12.0}
+
+    assert client.post('/thresholds?room=annex', json={'temp_high': 'hot'}).status_code == 400
+    stale = server.thresholds.version - 1
+    assert client.post(f'/thresholds?room=annex&version={stale}', json={'temp_high': 30}).status_code == 409
+
+    resp = client.post('/config/thresholds', json={'changes': {'annex/heater': {'temp_low': None}}})
+    assert resp.status_code == 200
+    assert 'annex/heater' not in client.get('/config/thresholds').get_json()['document']
+    assert client.post('/config/thresholds/rollback', json={'version': 'x'}).status_code == 400
+    history = client.get('/config/thresholds/history?limit=2').get_json()['history']
+    assert history[0]['changes'] == {'annex/heater': {'temp_low': None}}
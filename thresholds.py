@@ -0,0 +1,376 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+from collections import namedtuple
+from types import MappingProxyType
+
+from storage import now_ms
+
+THRESHOLDS_RELOAD_INTERVAL = float(os.getenv('THRESHOLDS_RELOAD_INTERVAL', '2'))   # 다른 워커의 변경 확인 주기 (초)
+
+# 덮어쓰기 단계(scope): "*" 전체, "방", "방/장치"
+GLOBAL_SCOPE = '*'
+SCOPE_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,64}(/[A-Za-z0-9_-]{1,64})?$')
+
+ThresholdField = namedtuple('ThresholdField', ['type', 'default', 'min', 'max', 'unit', 'description'])
+
+# 임계값 스키마 - 형식과 허용 범위 (기본값은 환경 변수)
+THRESHOLD_SCHEMA = {
+    'temp_high': ThresholdField(float, float(os.getenv('TEMP_HIGH', '28.0')), -40, 85, '°C',
+                                'cooling on / heating off above'),
+    'temp_low': ThresholdField(float, float(os.getenv('TEMP_LOW', '18.0')), -40, 85, '°C',
+                               'heating on / cooling off below'),
+    'humidity_high': ThresholdField(float, float(os.getenv('HUMIDITY_HIGH', '70.0')), 0, 100, '%',
+                                    'ventilation on above'),
+    'co2_high': ThresholdField(float, float(os.getenv('CO2_HIGH', '1000.0')), 400, 5000, 'ppm',
+                               'ventilation on / window open above'),
+    'noise_high': ThresholdField(float, float(os.getenv('NOISE_HIGH', '70.0')), 0, 140, 'dB',
+                                 'alarm on above'),
+    'motion_timeout': ThresholdField(int, int(os.getenv('MOTION_TIMEOUT', '300')), 0, 86400, 's',
+                                     'light off after no motion for'),
+}
+
+# 모든 방의 기본 임계값
+DEFAULT_THRESHOLDS = {key: field.default for key, field in THRESHOLD_SCHEMA.items()}
+
+# 값 사이의 제약 - (작은 쪽, 큰 쪽)은 어느 단계에서 풀어 써도 작은 쪽이 더 작아야 한다
+THRESHOLD_ORDER = [('temp_low', 'temp_high')]
+
+SAVE_VERSION = '''INSERT INTO threshold_config (version, ts, document, changes, source, note)
+                  VALUES (?, ?, ?, ?, ?, ?)'''
+LATEST_VERSION = 'SELECT version, document FROM threshold_config ORDER BY version DESC LIMIT 1'
+VERSION_QUERY = 'SELECT version, document FROM threshold_config WHERE version = ?'
+HISTORY_QUERY = '''SELECT version, ts, changes, source, note
+                   FROM threshold_config ORDER BY version DESC LIMIT ?'''
+
+
+class ThresholdError(ValueError):
+    """잘못된 임계값 또는 설정 변경 요청"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def check_scope(scope):
+    if scope != GLOBAL_SCOPE and (not isinstance(scope, str) or not SCOPE_PATTERN.match(scope)):
+        raise ThresholdError(f"Invalid scope: {scope!r} (use \"*\", \"room\" or \"room/device\")")
+    return scope
+
+
+def check_value(key, value, where):
+    """값 하나를 스키마 형식으로 - 문자열/bool은 받지 않는다 (비교식이 조용히 깨지지 않도록)"""
+    field = THRESHOLD_SCHEMA.get(key)
+    if field is None:
+        raise ThresholdError(f"{where}: unknown threshold {key!r} (known: {', '.join(sorted(THRESHOLD_SCHEMA))})")
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ThresholdError(f"{where}: {key} must be a number, got {value!r}")
+    if field.type is int:
+        if value != int(value):
+            raise ThresholdError(f"{where}: {key} must be a whole number, got {value!r}")
+        value = int(value)
+    else:
+        value = float(value)
+    if not field.min <= value <= field.max:
+        raise ThresholdError(f"{where}: {key}={value} is outside [{field.min}, {field.max}] {field.unit}")
+    return value
+
+
+def check_values(values, where, allow_delete=False):
+    """{key: value} 검증 -> 형식을 맞춘 dict (allow_delete면 None은 그 단계의 덮어쓰기 해제)"""
+    if not isinstance(values, dict):
+        raise ThresholdError(f"{where}: thresholds must be an object of name -> value")
+    checked = {}
+    for key, value in values.items():
+        if value is None and allow_delete:
+            if key not in THRESHOLD_SCHEMA:
+                raise ThresholdError(f"{where}: unknown threshold {key!r}")
+            checked[key] = None
+        else:
+            checked[key] = check_value(key, value, where)
+    return checked
+
+
+def resolve_values(document, static, room=None, device=None):
+    """기본값 <- 전체(*) <- 방 설정 파일 <- 방 <- 방/장치 순서로 덮어쓴 값"""
+    values = dict(DEFAULT_THRESHOLDS)
+    values.update(document.get(GLOBAL_SCOPE, {}))
+    if room is not None:
+        values.update(static.get(room, {}))
+        values.update(document.get(room, {}))
+        if device is not None:
+            values.update(document.get(f'{room}/{device}', {}))
+    return values
+
+
+def changed_scopes(old, new):
+    return {scope for scope in set(old) | set(new) if old.get(scope) != new.get(scope)}
+
+
+def diff_documents(old, new):
+    """old 문서를 new로 바꾸는 변경 {scope: {name: value 또는 None}}"""
+    changes = {}
+    for scope in changed_scopes(old, new):
+        before, after = old.get(scope, {}), new.get(scope, {})
+        changes[scope] = {key: after.get(key) for key in sorted(set(before) | set(after))
+                          if before.get(key) != after.get(key)}
+    return changes
+
+
+class ThresholdSnapshot:
+    """방 하나의 한 버전 임계값 (불변) - 규칙 평가 한 번은 스냅샷 하나만 본다"""
+
+    __slots__ = ('version', 'room', 'values', 'devices')
+
+    def __init__(self, version, room, values, devices):
+        self.version = version
+        self.room = room
+        self.values = MappingProxyType(values)
+        self.devices = MappingProxyType({device: MappingProxyType({**values, **overrides})
+                                         for device, overrides in devices.items()})
+
+    def for_device(self, device):
+        """장치별 덮어쓰기까지 반영한 값"""
+        return self.devices.get(device, self.values)
+
+
+class _ConfigVersion:
+    """현재 설정 (불변) - 문서와 방 설정 파일 값, 방별 스냅샷 캐시를 한 참조로 바꾼다"""
+
+    __slots__ = ('version', 'document', 'static', 'snapshots')
+
+    def __init__(self, version, document, static):
+        self.version = version
+        self.document = document
+        self.static = static
+        self.snapshots = {}
+
+
+class ThresholdConfig:
+    """임계값 설정 - 기본값 <- 전체(*) <- 방 설정 파일 <- 방 <- 방/장치 순으로 덮어쓴다
+
+    변경은 검증한 뒤 새 버전 문서로 threshold_config 테이블에 추가하고(이력), 현재 버전 참조 하나를
+    바꿔 적용한다. 읽는 쪽(결정 엔진)은 snapshot(room)으로 한 버전의 불변 값만 보므로 잠금이 없다.
+    되돌리기도 과거 버전 문서를 새 버전으로 추가한다. 구독자 fn(scopes)은 바뀐 단계 집합을 받는다.
+
+    워커가 여럿이면 다른 워커가 쓴 버전을 interval마다 읽어 온다. storage가 없으면 메모리에만 둔다.
+    """
+
+    def __init__(self, storage=None, interval=THRESHOLDS_RELOAD_INTERVAL):
+        self.storage = storage
+        self.interval = interval
+        self._current = _ConfigVersion(0, {}, {})
+        self._listeners = []
+        self._lock = threading.Lock()       # 쓰기끼리만 - 읽기는 _current 참조만 본다
+        self._stop = threading.Event()
+        self._thread = None
+        self.stats = {'updates': 0, 'rollbacks': 0, 'reloads': 0, 'rejected': 0}
+
+    @property
+    def version(self):
+        return self._current.version
+
+    def subscribe(self, fn):
+        self._listeners.append(fn)
+
+    def snapshot(self, room):
+        """방의 현재 임계값 스냅샷 (잠금 없음, 버전마다 한 번 만든다)"""
+        current = self._current
+        snapshot = current.snapshots.get(room)
+        if snapshot is None:
+            prefix = f'{room}/'
+            devices = {scope[len(prefix):]: overrides for scope, overrides in current.document.items()
+                       if scope.startswith(prefix)}
+            snapshot = current.snapshots.setdefault(room, ThresholdSnapshot(
+                current.version, room, resolve_values(current.document, current.static, room), devices))
+        return snapshot
+
+    def resolve(self, room=None, device=None):
+        current = self._current
+        return resolve_values(current.document, current.static, room, device)
+
+    def set_static(self, room, values):
+        """방 설정 파일(rooms.json)의 임계값 - 검증해 방 단계 아래에 둔다 (이력에는 남기지 않음)"""
+        checked = check_values(values, f'Room {room}')
+        with self._lock:
+            current = self._current
+            static = {**current.static, room: checked}
+            self._validate(current.document, static)
+            self._current = _ConfigVersion(current.version, current.document, static)
+
+    def update(self, changes, source='api', note=None, expected=None):
+        """{scope: {name: value 또는 None}}을 한 버전으로 적용, 적용된 버전 번호 반환
+
+        None은 그 단계의 덮어쓰기를 지운다. expected가 있으면 현재 버전이 그 번호일 때만 바꾼다.
+        """
+        if not isinstance(changes, dict) or not changes:
+            raise ThresholdError("changes must be a non-empty object of scope -> thresholds")
+        checked = {check_scope(scope): check_values(values, scope, allow_delete=True)
+                   for scope, values in changes.items()}
+        try:
+            with self._lock:
+                current = self._current
+                if expected is not None and expected != current.version:
+                    raise ThresholdError(f"Configuration is at version {current.version}, not {expected}", 409)
+                document = dict(current.document)
+                for scope, values in checked.items():
+                    merged = {key: value for key, value in {**document.get(scope, {}), **values}.items()
+                              if value is not None}
+                    if merged:
+                        document[scope] = merged
+                    else:
+                        document.pop(scope, None)
+                if document == current.document:
+                    return current.version
+                self._validate(document, current.static)
+                scopes = self._commit(current, document, source, note)
+        except ThresholdError as e:
+            self._rejected(e)
+            raise
+        self.stats['updates'] += 1
+        self._notify(scopes)
+        return self.version
+
+    def rollback(self, version, note=None):
+        """version의 문서를 새 버전으로 다시 적용 (0이면 덮어쓰기 없이 기본값으로), 새 버전 번호 반환"""
+        document = self.document(version)
+        if document is None:
+            raise ThresholdError(f"Unknown configuration version: {version}", 404)
+        document = {check_scope(scope): check_values(values, f'v{version} {scope}')
+                    for scope, values in document.items()}
+        try:
+            with self._lock:
+                current = self._current
+                if document == current.document:
+                    return current.version
+                self._validate(document, current.static)
+                scopes = self._commit(current, document, f'rollback:{version}', note)
+        except ThresholdError as e:
+            self._rejected(e)
+            raise
+        self.stats['rollbacks'] += 1
+        self._notify(scopes)
+        return self.version
+
+    def document(self, version=None):
+        """version(기본: 현재)의 덮어쓰기 문서 {scope: {name: value}}, 없는 버전이면 None"""
+        current = self._current
+        if version is None or version == current.version:
+            return current.document
+        if version == 0:
+            return {}
+        if self.storage is None:
+            return None
+        with self.storage.connection() as conn:
+            row = conn.execute(VERSION_QUERY, (version,)).fetchone()
+        return json.loads(row[1]) if row else None
+
+    def history(self, limit=50):
+        """최근 변경 이력 (새 버전부터)"""
+        if self.storage is None:
+            return []
+        with self.storage.connection() as conn:
+            rows = conn.execute(HISTORY_QUERY, (limit,)).fetchall()
+        return [{'version': version, 'ts': ts, 'changes': json.loads(changes), 'source': source, 'note': note}
+                for version, ts, changes, source, note in rows]
+
+    def describe(self):
+        current = self._current
+        return {
+            'version': current.version,
+            'document': current.document,
+            'rooms_config': current.static,
+            'defaults': DEFAULT_THRESHOLDS,
+            'schema': {key: {'type': field.type.__name__, 'min': field.min, 'max': field.max,
+                             'unit': field.unit, 'description': field.description}
+                       for key, field in THRESHOLD_SCHEMA.items()},
+        }
+
+    def load(self):
+        """DB의 최신 버전 적용 (서버 시작, 다른 워커의 변경) - 바뀌었으면 True
+
+        지금 스키마에 맞지 않는 항목(삭제된 이름, 범위 밖 값)은 버리고 경고만 남긴다.
+        """
+        with self.storage.connection() as conn:
+            row = conn.execute(LATEST_VERSION).fetchone()
+        if row is None or row[0] == self._current.version:
+            return False
+        version, document = row[0], {}
+        for scope, values in json.loads(row[1]).items():
+            kept = {}
+            for key, value in values.items():
+                try:
+                    kept[key] = check_value(key, value, f'v{version} {scope}')
+                except ThresholdError as e:
+                    print(f"[CONFIG ERROR] Ignoring stored threshold: {e}", flush=True)
+            if kept:
+                document[scope] = kept
+        with self._lock:
+            current = self._current
+            if version <= current.version:
+                return False
+            self._current = _ConfigVersion(version, document, current.static)
+        self.stats['reloads'] += 1
+        print(f"[CONFIG] Loaded thresholds v{version}", flush=True)
+        self._notify(changed_scopes(current.document, document))
+        return True
+
+    def start(self):
+        if self.storage is None or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name='threshold-config', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.load()
+            except sqlite3.Error as e:
+                print(f"[CONFIG ERROR] Failed to reload thresholds: {e}", flush=True)
+
+    def _validate(self, document, static):
+        """풀어 쓴 값이 THRESHOLD_ORDER를 지키는지 모든 단계에서 확인"""
+        rooms = set(static) | {scope.split('/')[0] for scope in document if scope != GLOBAL_SCOPE}
+        targets = [(None, None)] + [(room, None) for room in sorted(rooms)] + sorted(
+            tuple(scope.split('/')) for scope in document if '/' in scope)
+        for room, device in targets:
+            values = resolve_values(document, static, room, device)
+            for low, high in THRESHOLD_ORDER:
+                if not values[low] < values[high]:
+                    where = GLOBAL_SCOPE if room is None else room if device is None else f'{room}/{device}'
+                    raise ThresholdError(f"{where}: {low} ({values[low]}) must be below {high} ({values[high]})")
+
+    def _rejected(self, error):
+        self.stats['rejected'] += 1
+        if error.status == 409 and self.storage is not None:
+            self.load()     # 다른 워커의 버전을 따라잡아 다음 시도가 성공하도록
+
+    def _commit(self, current, document, source, note):
+        """호출자가 _lock을 잡고 있어야 함 - DB에 새 버전을 쓴 뒤에 현재 참조를 바꾼다"""
+        version = current.version + 1
+        changes = diff_documents(current.document, document)
+        if self.storage is not None:
+            with self.storage.connection() as conn:
+                try:
+                    conn.execute(SAVE_VERSION, (version, now_ms(), json.dumps(document, sort_keys=True),
+                                                json.dumps(changes, sort_keys=True), source, note))
+                    conn.commit()
+                except sqlite3.IntegrityError:
+                    # 다른 워커가 먼저 같은 버전을 썼다
+                    raise ThresholdError(f"Configuration version {version} was written by another worker, "
+                                         f"retry", 409)
+        self._current = _ConfigVersion(version, document, current.static)
+        print(f"[CONFIG] Thresholds v{version} ({source}): {json.dumps(changes, sort_keys=True)}", flush=True)
+        return changed_scopes(current.document, document)
+
+    def _notify(self, scopes):
+        for fn in self._listeners:
+            try:
+                fn(scopes)
+            except Exception as e:
+                print(f"[CONFIG ERROR] Listener failed: {e}", flush=True)